@@ -0,0 +1,98 @@
+"""
+Hold hundreds of concurrent tool-loop conversations in one process with AsyncLLM.
+
+Every conversation runs a scripted three-iteration tool loop (two tool rounds and
+a final answer) against the local fake Messages server. The report shows how
+many conversations were in flight at the server at once and how many OS threads
+the process needed to get there.
+
+    python benchmarks/bench_async_sessions.py --sessions 500 --latency 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+import anthropic
+
+from benchmarks.fake_server import FakeAnthropicServer, tool_loop_responder
+from src.async_llm import AsyncLLM
+
+
+async def lookup_order(order_id: str) -> dict:
+    # An I/O bound tool: waits without holding a thread
+    await asyncio.sleep(0.01)
+    return {"order_id": order_id, "status": "shipped"}
+
+
+def format_receipt(order_id: str) -> dict:
+    # A plain tool: runs in the default executor
+    return {"order_id": order_id, "receipt": f"Receipt for {order_id}"}
+
+
+async def run(sessions: int, latency: float) -> dict:
+    responder = tool_loop_responder([
+        {"name": "lookup_order", "input": {"order_id": "A-1"}},
+        [
+            {"name": "lookup_order", "input": {"order_id": "A-2"}},
+            {"name": "format_receipt", "input": {"order_id": "A-1"}}
+        ]
+    ])
+    
+    with FakeAnthropicServer(responder, latency=latency) as server:
+        llm = AsyncLLM(api_key="fake", max_tool_workers=4)
+        llm.client = anthropic.AsyncAnthropic(api_key="fake", base_url=server.base_url)
+        llm.register_tool("lookup_order", lookup_order, "Look up an order")
+        llm.register_tool("format_receipt", format_receipt, "Format a receipt")
+        
+        peak_threads = threading.active_count()
+        
+        async def watch_threads():
+            nonlocal peak_threads
+            while True:
+                peak_threads = max(peak_threads, threading.active_count())
+                await asyncio.sleep(0.01)
+        
+        watcher = asyncio.create_task(watch_threads())
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            llm.generate_with_tools(f"Where is my order? ({i})", max_iterations=5)
+            for i in range(sessions)
+        ))
+        elapsed = time.perf_counter() - started
+        watcher.cancel()
+        await llm.client.close()
+    
+    completed = sum(1 for result in results if result["response"] == "Done.")
+    return {
+        "benchmark": "async_sessions",
+        "sessions": sessions,
+        "completed": completed,
+        "server_latency_s": latency,
+        "api_requests": len(server.requests),
+        "max_concurrent_requests": server.max_in_flight,
+        "peak_threads": peak_threads,
+        "wall_time_s": round(elapsed, 3),
+        # A purely sequential client would need at least this long
+        "sequential_lower_bound_s": round(sessions * 3 * latency, 3),
+        "sessions_per_s": round(sessions / elapsed, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.1, help="fake server latency per request (s)")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.sessions, args.latency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
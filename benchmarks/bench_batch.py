@@ -0,0 +1,92 @@
+"""
+Run a set of independent prompts three ways against the local fake Messages server.
+
+    sequential  LLM.generate in a Python loop, one blocking request at a time
+    local       LLM.generate_batch(mode="local"), a bounded pool of concurrent requests
+    batch       LLM.generate_batch(mode="batch"), the Message Batches API
+
+The fake server answers each regular request after --latency seconds and ends
+each message batch --batch-latency seconds after it was created. Every mode
+must return one answer per prompt; the report shows wall time, HTTP requests
+and (for batches) status polls.
+
+    python benchmarks/bench_batch.py --prompts 200 --latency 0.05 --workers 16
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+import anthropic
+
+from benchmarks.fake_server import FakeAnthropicServer, make_message
+from src.llm import LLM
+
+
+def classify(request: dict) -> dict:
+    text = request["messages"][0]["content"][0]["text"]
+    label = "positive" if len(text) % 2 else "negative"
+    return make_message([{"type": "text", "text": label}])
+
+
+def run_mode(mode: str, prompts: list, args) -> dict:
+    with FakeAnthropicServer(classify, latency=args.latency, batch_latency=args.batch_latency) as server:
+        llm = LLM(api_key="fake")
+        llm.client = anthropic.Anthropic(api_key="fake", base_url=server.base_url)
+        
+        answers = [None] * len(prompts)
+        first_result = None
+        started = time.perf_counter()
+        if mode == "sequential":
+            for index, prompt in enumerate(prompts):
+                answers[index] = llm.generate(prompt, temperature=0)["response"]
+                if first_result is None:
+                    first_result = time.perf_counter() - started
+        else:
+            for item in llm.generate_batch(prompts, temperature=0, mode=mode, max_workers=args.workers,
+                                           batch_size=args.batch_size, poll_interval=args.poll_interval):
+                answers[item["index"]] = item.get("response")
+                if first_result is None:
+                    first_result = time.perf_counter() - started
+        elapsed = time.perf_counter() - started
+        
+        return {
+            "answered": sum(1 for answer in answers if answer is not None),
+            "wall_time_s": round(elapsed, 3),
+            "first_result_s": round(first_result, 3),
+            "prompts_per_s": round(len(prompts) / elapsed, 1),
+            "model_requests": len(server.requests),
+            "batches": len(server.batches),
+            "status_polls": server.batch_polls
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake server latency per request (s)")
+    parser.add_argument("--batch-latency", type=float, default=1.0, help="time until a message batch ends (s)")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent requests in local mode")
+    parser.add_argument("--batch-size", type=int, default=100, help="requests per message batch")
+    parser.add_argument("--poll-interval", type=float, default=0.1)
+    args = parser.parse_args()
+    
+    prompts = [f"Classify the sentiment of review #{i}: {'great ' * (i % 7)}product" for i in range(args.prompts)]
+    report = {
+        "benchmark": "batch",
+        "prompts": args.prompts,
+        "server_latency_s": args.latency,
+        "batch_latency_s": args.batch_latency
+    }
+    for mode in ("sequential", "local", "batch"):
+        report[mode] = run_mode(mode, prompts, args)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Memory and time per long session: list-copying history vs. Conversation.
+
+Replays the history bookkeeping of a tool-loop session (user prompt, tool_use
+turn, tool_result, final answer) for the given number of turns, without any
+network traffic, in two ways:
+
+    before  the previous code: messages = history + [user_message] on every call
+            and SDK ContentBlock objects from response.content kept in the history
+    after   a Conversation: forked per call, appended in place, compact dict blocks
+
+Memory is measured with tracemalloc while the SDK response objects are created
+turn by turn: "retained" is what the finished session's history holds on to,
+"peak" the high-water mark while it ran. Time is measured separately with the
+responses built up front, so it covers only the history bookkeeping. The fork
+section branches many alternative next turns off one long session.
+
+    python benchmarks/bench_conversation.py --turns 1000 --forks 100
+"""
+
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from anthropic.types import Message
+
+from benchmarks.fake_server import make_message
+from src.conversation import Conversation
+
+
+def responses(turn: int):
+    """The two API responses of one tool-loop turn, as SDK objects."""
+    tool_turn = Message.model_validate(make_message([
+        {"type": "text", "text": f"Let me look up order {turn}."},
+        {"type": "tool_use", "id": f"toolu_{turn:06d}", "name": "lookup_order", "input": {"order_id": f"A-{turn}"}}
+    ], stop_reason="tool_use"))
+    final_turn = Message.model_validate(make_message([
+        {"type": "text", "text": f"Order A-{turn} has shipped and should arrive on Tuesday."}
+    ]))
+    return tool_turn, final_turn
+
+
+def tool_result(turn: int) -> dict:
+    return {
+        "type": "tool_result",
+        "tool_use_id": f"toolu_{turn:06d}",
+        "content": json.dumps({"order_id": f"A-{turn}", "status": "shipped"})
+    }
+
+
+def session_before(turn_responses):
+    history = []
+    for turn, (tool_turn, final_turn) in enumerate(turn_responses):
+        messages = history + [{"role": "user", "content": f"Where is order A-{turn}?"}]
+        messages.append({"role": "assistant", "content": tool_turn.content})
+        messages.append({"role": "user", "content": [tool_result(turn)]})
+        messages.append({"role": "assistant", "content": final_turn.content})
+        history = messages
+    return history
+
+
+def session_after(turn_responses):
+    history = Conversation()
+    for turn, (tool_turn, final_turn) in enumerate(turn_responses):
+        conversation = Conversation.of(history)
+        conversation.add_user(f"Where is order A-{turn}?")
+        conversation.as_list()
+        conversation.add_assistant(tool_turn.content)
+        conversation.add_user([tool_result(turn)])
+        conversation.as_list()
+        conversation.add_assistant(final_turn.content)
+        history = conversation
+    return history
+
+
+def measure(build, turns: int, prebuilt: list) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    history = build(responses(turn) for turn in range(turns))
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    started = time.perf_counter()
+    build(prebuilt)
+    elapsed = time.perf_counter() - started
+    return {
+        "messages": len(history),
+        "retained_kb": round(retained / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "time_ms": round(elapsed * 1000, 1)
+    }
+
+
+def forks_before(history, forks: int):
+    return [history + [{"role": "user", "content": f"Alternative {i}"}] for i in range(forks)]
+
+
+def forks_after(history, forks: int):
+    branches = []
+    for i in range(forks):
+        branch = Conversation.of(history)
+        branch.add_user(f"Alternative {i}")
+        branches.append(branch)
+    return branches
+
+
+def measure_forks(build, history, forks: int) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    branches = build(history, forks)
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del branches
+    return {
+        "retained_kb": round(retained / 1024, 1),
+        "time_ms": round(elapsed * 1000, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--forks", type=int, default=100)
+    args = parser.parse_args()
+    
+    prebuilt = [responses(turn) for turn in range(args.turns)]
+    before = measure(session_before, args.turns, prebuilt)
+    after = measure(session_after, args.turns, prebuilt)
+    
+    history_before = session_before(prebuilt)
+    history_after = session_after(prebuilt)
+    
+    report = {
+        "benchmark": "conversation",
+        "turns": args.turns,
+        "session": {
+            "before": before,
+            "after": after,
+            "retained_ratio": round(before["retained_kb"] / after["retained_kb"], 2),
+            "time_ratio": round(before["time_ms"] / after["time_ms"], 2)
+        },
+        "forks": {
+            "count": args.forks,
+            "before": measure_forks(forks_before, history_before, args.forks),
+            "after": measure_forks(forks_after, history_after, args.forks)
+        }
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
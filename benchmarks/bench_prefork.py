@@ -0,0 +1,121 @@
+"""
+Pre-fork serving: turn throughput with 1..N worker processes on a CPU-heavy toolset.
+
+A PreforkServer (sessions in a temporary SQLite file) runs against the fake
+Messages server. Every turn calls score_patient, a pure-Python tool that
+burns about --work-ms of CPU, and then answers. For each worker count in
+--workers, --sessions simulated users send streamed turns back to back for
+--duration seconds (see bench_server.py). The report shows turns per second,
+p50 / p99 turn latency, and the speedup and scaling efficiency (speedup per
+worker) relative to one worker. Workers beyond the machine's CPU count can
+not add throughput, so the default goes up to os.cpu_count().
+
+    python benchmarks/bench_prefork.py --workers 1,2,4 --sessions 16 --work-ms 30
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.bench_server import patient_responder, run_level
+from benchmarks.fake_server import FakeAnthropicServer, count_tool_rounds, make_message
+from src.client import close_clients
+from src.llm import LLM
+from src.prefork import PreforkServer
+
+
+def calibrate(work_ms: float) -> int:
+    """Loop iterations of score_patient that take about work_ms on this machine."""
+    iterations = 100000
+    started = time.perf_counter()
+    score(iterations)
+    elapsed = time.perf_counter() - started
+    return max(1, int(iterations * work_ms / 1000 / elapsed))
+
+
+def score(iterations: int) -> int:
+    total = 0
+    for number in range(iterations):
+        total = (total * 31 + number * number) % 1000003
+    return total
+
+
+def scoring_responder(request: dict) -> dict:
+    """Score the patient named in the prompt, then answer."""
+    if count_tool_rounds(request) >= 1:
+        return make_message([{"type": "text", "text": "The patient was scored."}])
+    message = patient_responder(request)
+    message["content"][0].update(name="score_patient")
+    return message
+
+
+def llm_factory(base_url: str, iterations: int):
+    def create_llm() -> LLM:
+        llm = LLM(api_key="fake", client_options={"base_url": base_url}, prompt_caching=False)
+        llm.register_tool(
+            name="score_patient",
+            function=lambda name: {"name": name, "score": score(iterations)},
+            description="Compute the study risk score of a patient",
+            input_schema={"type": "object", "properties": {"name": {"type": "string"}}, "required": ["name"]}
+        )
+        return llm
+    return create_llm
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    default_workers = ",".join(str(count) for count in sorted({1, 2, 4, 8, cpus}) if count <= cpus)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", default=default_workers, help="comma-separated worker counts")
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of load per worker count")
+    parser.add_argument("--work-ms", type=float, default=30.0, help="CPU time of one score_patient call (ms)")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake server latency per model request (s)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="turn deadline (s)")
+    args = parser.parse_args()
+    
+    iterations = calibrate(args.work_ms)
+    directory = tempfile.mkdtemp(prefix="bench-prefork-")
+    runs = []
+    try:
+        with FakeAnthropicServer(scoring_responder, latency=args.latency) as fake:
+            for workers in (int(count) for count in args.workers.split(",")):
+                with PreforkServer(llm_factory(fake.base_url, iterations), workers=workers,
+                                   sessions_db=os.path.join(directory, f"sessions-{workers}.db"), port=0,
+                                   max_concurrent=args.sessions, max_queue=args.sessions,
+                                   default_timeout=args.timeout) as server:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        level = run_level(server, args.sessions, args)
+                level.pop("sessions")
+                runs.append({"workers": workers, **level})
+            close_clients()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    
+    baseline = runs[0]["turns_per_s"] / runs[0]["workers"] if runs and runs[0]["turns_per_s"] else None
+    for run in runs:
+        if baseline:
+            run["speedup"] = round(run["turns_per_s"] / baseline, 2)
+            run["efficiency"] = round(run["speedup"] / run["workers"], 2)
+    report = {
+        "benchmark": "prefork",
+        "cpus": cpus,
+        "sessions": args.sessions,
+        "tool_work_ms": args.work_ms,
+        "runs": runs
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
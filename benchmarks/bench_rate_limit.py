@@ -0,0 +1,140 @@
+"""
+Batch and interactive traffic sharing one rate limit, with and without RateLimiter.
+
+The fake Messages server enforces a requests-per-minute limit with a token
+bucket and answers requests beyond it with 429 and a retry-after header, like
+the API. A local batch (generate_batch(mode="local")) floods the limit while an
+interactive caller sends one generate every --interactive-interval seconds on
+another thread. Two configurations:
+
+    retry_only  no client-side limiting, 429s are retried by the RetryPolicy
+    limiter     a shared RateLimiter set to the server's limit; the batch runs
+                at "batch" priority, the interactive caller at "interactive"
+
+The report shows wall time, the 429s the server sent, retries, interactive
+latency percentiles and the queue wait the limiter reported per priority.
+
+    python benchmarks/bench_rate_limit.py --rpm 600 --prompts 80 --workers 16
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.fake_server import FakeAnthropicServer, make_message
+from src.client import RetryPolicy, close_clients
+from src.llm import LLM
+from src.rate_limiter import RateLimiter
+
+
+def server_limit(rpm: float, burst_seconds: float):
+    """A faults function that enforces rpm with a token bucket of burst_seconds."""
+    rate = rpm / 60.0
+    capacity = max(1.0, rate * burst_seconds)
+    state = {"level": capacity, "updated": time.monotonic()}
+    
+    def faults(request: dict):
+        now = time.monotonic()
+        state["level"] = min(capacity, state["level"] + (now - state["updated"]) * rate)
+        state["updated"] = now
+        if state["level"] >= 1:
+            state["level"] -= 1
+            return None
+        return 429, {"retry-after": f"{(1 - state['level']) / rate:.3f}"}
+    
+    return faults
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_mode(mode: str, args) -> dict:
+    responder = lambda request: make_message([{"type": "text", "text": "ok"}])
+    faults = server_limit(args.rpm, args.burst_seconds)
+    with FakeAnthropicServer(responder, latency=args.latency, faults=faults) as server:
+        limiter = None
+        if mode == "limiter":
+            limiter = RateLimiter(requests_per_minute=args.rpm, burst_seconds=args.burst_seconds)
+        options = {"client_options": {"base_url": server.base_url}, "rate_limiter": limiter,
+                   "retry_policy": RetryPolicy(max_retries=20)}
+        batch_llm = LLM(api_key="fake", priority="batch", **options)
+        interactive_llm = LLM(api_key="fake", **options)
+        
+        usages = []
+        latencies = []
+        done = threading.Event()
+        
+        def interactive():
+            turn = 0
+            while not done.is_set():
+                started = time.perf_counter()
+                result = interactive_llm.generate(f"Interactive turn {turn}")
+                latencies.append(time.perf_counter() - started)
+                usages.append(result["usage"])
+                turn += 1
+                done.wait(args.interactive_interval)
+        
+        started = time.perf_counter()
+        thread = threading.Thread(target=interactive)
+        thread.start()
+        prompts = [f"Batch prompt {i}" for i in range(args.prompts)]
+        failed = 0
+        for item in batch_llm.generate_batch(prompts, mode="local", max_workers=args.workers):
+            if "error" in item:
+                failed += 1
+            else:
+                usages.append(item["usage"])
+        elapsed = time.perf_counter() - started
+        done.set()
+        thread.join()
+        close_clients()
+        
+        report = {
+            "wall_time_s": round(elapsed, 3),
+            "batch_failed": failed,
+            "rate_limited_429": server.faults_sent,
+            "retries": sum(usage["retries"] for usage in usages),
+            "interactive_turns": len(latencies),
+            "interactive_p50_s": round(statistics.median(latencies), 3),
+            "interactive_p95_s": round(percentile(latencies, 0.95), 3)
+        }
+        if limiter is not None:
+            report["queue_wait"] = {
+                priority: {name: round(value, 3) for name, value in stats.items()}
+                for priority, stats in limiter.stats()["priorities"].items()
+            }
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rpm", type=float, default=600, help="requests per minute the server allows")
+    parser.add_argument("--burst-seconds", type=float, default=1.0, help="seconds' worth of the limit usable at once")
+    parser.add_argument("--prompts", type=int, default=80, help="prompts in the local batch")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent batch requests")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake server latency per request (s)")
+    parser.add_argument("--interactive-interval", type=float, default=0.3, help="pause between interactive turns (s)")
+    args = parser.parse_args()
+    
+    report = {
+        "benchmark": "rate_limit",
+        "rpm": args.rpm,
+        "prompts": args.prompts,
+        "workers": args.workers
+    }
+    for mode in ("retry_only", "limiter"):
+        report[mode] = run_mode(mode, args)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Tool-loop sessions against a local fake Messages server that injects faults.
+
+Every session creates its own LLM instance (as a request handler would) and runs
+a scripted two-round tool loop. A share of the model requests fails with 429,
+529 or a dropped connection, all with a short retry-after. Sessions run on a
+thread pool in three configurations:
+
+    before      a new anthropic.Anthropic client per instance with the SDK's
+                default timeouts and retries
+    no_retry    the shared client from get_client, RetryPolicy(max_retries=0)
+    retry       the shared client from get_client, the default RetryPolicy
+
+The report shows how many sessions completed, the retries counted in their
+usage, the TCP connections the server accepted and the wall time.
+
+    python benchmarks/bench_retries.py --sessions 200 --fault-rate 0.2 --workers 16
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+import anthropic
+
+from benchmarks.fake_server import FakeAnthropicServer, random_faults, tool_loop_responder
+from src.client import RetryPolicy, close_clients
+from src.llm import LLM
+
+
+def lookup_order(order_id: str) -> dict:
+    return {"order_id": order_id, "status": "shipped"}
+
+
+def run_session(mode: str, server: FakeAnthropicServer, session: int) -> dict:
+    if mode == "before":
+        llm = LLM(api_key="fake", retry_policy=RetryPolicy(max_retries=0))
+        llm.client = anthropic.Anthropic(api_key="fake", base_url=server.base_url)
+    else:
+        retry_policy = RetryPolicy(max_retries=0) if mode == "no_retry" else RetryPolicy()
+        llm = LLM(api_key="fake", client_options={"base_url": server.base_url}, retry_policy=retry_policy)
+    llm.register_tool("lookup_order", lookup_order, "Look up an order")
+    try:
+        result = llm.generate_with_tools(f"Where is order A-{session}?", temperature=0)
+    except anthropic.APIError as e:
+        return {"ok": False, "retries": 0, "error": type(e).__name__}
+    return {"ok": True, "retries": result["usage"]["retries"]}
+
+
+def run_mode(mode: str, args) -> dict:
+    responder = tool_loop_responder([
+        {"name": "lookup_order", "input": {"order_id": "A-1"}},
+        {"name": "lookup_order", "input": {"order_id": "A-2"}}
+    ])
+    faults = random_faults(args.fault_rate, statuses=(429, 529, 0), retry_after=args.retry_after)
+    with FakeAnthropicServer(responder, latency=args.latency, faults=faults) as server:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            outcomes = list(executor.map(lambda session: run_session(mode, server, session), range(args.sessions)))
+        elapsed = time.perf_counter() - started
+        close_clients()
+        
+        errors = {}
+        for outcome in outcomes:
+            if not outcome["ok"]:
+                errors[outcome["error"]] = errors.get(outcome["error"], 0) + 1
+        return {
+            "completed": sum(1 for outcome in outcomes if outcome["ok"]),
+            "failed": dict(sorted(errors.items())),
+            "retries_reported": sum(outcome["retries"] for outcome in outcomes),
+            "faults_injected": server.faults_sent,
+            "model_requests": len(server.requests),
+            "connections_opened": server.connections_opened,
+            "wall_time_s": round(elapsed, 3)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=16, help="sessions running at once")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake server latency per request (s)")
+    parser.add_argument("--fault-rate", type=float, default=0.2, help="share of model requests that fail")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="retry-after sent with each fault (s)")
+    args = parser.parse_args()
+    
+    report = {
+        "benchmark": "retries",
+        "sessions": args.sessions,
+        "fault_rate": args.fault_rate,
+        "server_latency_s": args.latency
+    }
+    for mode in ("before", "no_retry", "retry"):
+        report[mode] = run_mode(mode, args)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
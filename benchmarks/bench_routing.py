@@ -0,0 +1,137 @@
+"""
+Model routing: latency, escalations and token cost with and without a ModelRouter.
+
+The fake Messages server replays the patient workflow (create a patient, add
+gender and age in parallel, check eligibility, send a message, answer) for
+--sessions sessions of --turns generate_with_tools calls. Requests to the
+default model take --latency seconds, requests to the fast model
+--fast-latency. The fast model gets a tool call wrong (leaves out its required
+input) in --fast-failure-rate of its tool_use responses, which the router
+escalates. Input tokens are reported as the request size / 4.
+
+    default      no router, every request goes to the LLM's model
+    rules        ModelRouter() with its built-in rules
+    classifier   ModelRouter(classifier=...) that only trusts the fast model
+                 with tool loop follow-ups
+
+    python benchmarks/bench_routing.py --sessions 10 --turns 4 --latency 0.08 --fast-latency 0.03
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.fake_server import FakeAnthropicServer, make_message, tool_loop_responder
+from src.client import close_clients
+from src.llm import LLM
+from src.routing import ModelRouter
+from src.telemetry import _percentile
+from src.utils.patient_workflow import sample_tools
+
+DEFAULT_MODEL = "claude-3-7-sonnet-20250219"
+FAST_MODEL = "claude-3-5-haiku-20241022"
+
+SCRIPT = [
+    {"name": "create_patient", "input": {"name": "Ada Lovelace"}},
+    [
+        {"name": "add_patient_gender", "input": {"name": "Ada Lovelace", "gender": "female"}},
+        {"name": "add_patient_age", "input": {"name": "Ada Lovelace", "age": 16}}
+    ],
+    {"name": "is_eligible_for_study", "input": {"name": "Ada Lovelace"}},
+    {"name": "send_message_to_patient", "input": {"name": "Ada Lovelace", "message": "You are eligible."}}
+]
+
+
+def routing_responder(failure_rate: float, seed: int):
+    scripted = tool_loop_responder(SCRIPT, final_text="Ada Lovelace is eligible and has been notified.")
+    rng = random.Random(seed)
+    
+    def respond(request: dict) -> dict:
+        response = scripted(request)
+        if request["model"] == FAST_MODEL and response["stop_reason"] == "tool_use" and rng.random() < failure_rate:
+            for block in response["content"]:
+                block["input"] = {}
+        input_tokens = len(json.dumps(request, separators=(",", ":"))) // 4
+        return make_message(response["content"], stop_reason=response["stop_reason"], model=request["model"],
+                            input_tokens=input_tokens, output_tokens=40 * len(response["content"]))
+    return respond
+
+
+def follow_ups_only(features: dict) -> float:
+    return 0.9 if features["tool_results_only"] and not features["tool_errors"] else 0.1
+
+
+def run_mode(mode: str, args) -> dict:
+    router = None
+    if mode == "rules":
+        router = ModelRouter(fast_model=FAST_MODEL)
+    elif mode == "classifier":
+        router = ModelRouter(fast_model=FAST_MODEL, classifier=follow_ups_only)
+    
+    responder = routing_responder(args.fast_failure_rate, args.seed)
+    model_latency = {DEFAULT_MODEL: args.latency, FAST_MODEL: args.fast_latency}
+    with FakeAnthropicServer(responder, model_latency=model_latency) as server:
+        llm = LLM(api_key="fake", model=DEFAULT_MODEL, max_tool_workers=2,
+                  client_options={"base_url": server.base_url}, router=router)
+        for tool in sample_tools:
+            llm.register_tool(**tool)
+        
+        turn_times = []
+        totals = {"input_tokens": 0, "output_tokens": 0, "escalations": 0, "failed_tool_calls": 0}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for session in range(args.sessions):
+                history = None
+                for turn in range(args.turns):
+                    started = time.perf_counter()
+                    result = llm.generate_with_tools(f"Register Ada Lovelace ({session}.{turn})", history=history)
+                    turn_times.append(time.perf_counter() - started)
+                    history = result["history"]
+                    for key in ("input_tokens", "output_tokens", "escalations"):
+                        totals[key] += result["usage"][key]
+                    totals["failed_tool_calls"] += sum(1 for usage in result["tool_usage"] if "error" in usage)
+        close_clients()
+    
+    turn_times.sort()
+    report = {
+        "model_requests": len(server.requests),
+        "turn_ms": {
+            "mean": round(sum(turn_times) / len(turn_times) * 1000, 3),
+            "p95": round(_percentile(turn_times, 0.95) * 1000, 3)
+        },
+        **totals
+    }
+    if router is not None:
+        report["router"] = router.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=4, help="generate_with_tools calls per session")
+    parser.add_argument("--latency", type=float, default=0.08, help="default model latency per request (s)")
+    parser.add_argument("--fast-latency", type=float, default=0.03, help="fast model latency per request (s)")
+    parser.add_argument("--fast-failure-rate", type=float, default=0.1,
+                        help="share of fast model tool_use responses with missing input")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    report = {
+        "benchmark": "routing",
+        "sessions": args.sessions,
+        "turns": args.turns,
+        "modes": {mode: run_mode(mode, args) for mode in ("default", "rules", "classifier")}
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Multi-session server: sustained sessions per core and turn latency under load.
+
+An LLMServer with the patient workflow tools runs against the fake Messages
+server (--latency seconds per model request). For each level in --levels that
+many simulated users each open a session and send streamed turns back to back
+for --duration seconds; every turn makes one tool call, so it takes two model
+requests. The report shows, per level, the completed turns per second, the
+p50 / p99 turn latency seen by the clients, and the turns rejected with 503
+(backpressure), 504 (deadline) or failed otherwise.
+
+"Sustained" sessions are those of the highest level whose p99 stays under
+--slo-ms without rejected or failed turns; divided by the machine's CPU count
+that gives sessions per core.
+
+    python benchmarks/bench_server.py --levels 1,4,16,64 --duration 5 --latency 0.2
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.fake_server import FakeAnthropicServer, count_tool_rounds, make_message
+from src.client import close_clients
+from src.llm import LLM
+from src.server import LLMServer
+from src.telemetry import _percentile
+from src.utils import patient_workflow
+
+
+def patient_responder(request: dict) -> dict:
+    """Create the patient named in the prompt, then confirm."""
+    if count_tool_rounds(request) >= 1:
+        return make_message([{"type": "text", "text": "The patient was created."}])
+    prompt = next(message["content"] for message in reversed(request["messages"])
+                  if message["role"] == "user" and isinstance(message["content"], str))
+    return make_message([{"type": "tool_use", "id": f"toolu_{abs(hash(prompt)):x}", "name": "create_patient",
+                          "input": {"name": prompt.rsplit(": ", 1)[1]}}], stop_reason="tool_use")
+
+
+def post(connection: http.client.HTTPConnection, path: str, body: dict) -> http.client.HTTPResponse:
+    connection.request("POST", path, body=json.dumps(body), headers={"Content-Type": "application/json"})
+    return connection.getresponse()
+
+
+def user(address, user_number: int, stop_at: float, timeout: float, results: list) -> None:
+    """One simulated user: a session and streamed turns until stop_at."""
+    connection = http.client.HTTPConnection(*address)
+    response = post(connection, "/v1/sessions", {})
+    session_id = json.loads(response.read())["session_id"]
+    connection.close()
+    turn = 0
+    while time.monotonic() < stop_at:
+        turn += 1
+        connection = http.client.HTTPConnection(*address)
+        started = time.perf_counter()
+        try:
+            response = post(connection, f"/v1/sessions/{session_id}/turns",
+                            {"prompt": f"Create patient: User {user_number} #{turn}", "timeout": timeout})
+            body = response.read().decode("utf-8")
+        except OSError:
+            results.append(("failed", time.perf_counter() - started))
+            continue
+        finally:
+            connection.close()
+        elapsed = time.perf_counter() - started
+        if response.status == 503:
+            results.append(("rejected", elapsed))
+            time.sleep(float(response.getheader("Retry-After", "1")))
+        elif response.status != 200:
+            results.append(("failed", elapsed))
+        elif "event: done" in body:
+            results.append(("completed", elapsed))
+        elif '"status": 504' in body:
+            results.append(("expired", elapsed))
+        else:
+            results.append(("failed", elapsed))
+
+
+def run_level(server: LLMServer, sessions: int, args) -> dict:
+    address = urlparse(server.base_url)
+    address = (address.hostname, address.port)
+    results = []
+    stop_at = time.monotonic() + args.duration
+    started = time.perf_counter()
+    users = [threading.Thread(target=user, args=(address, number, stop_at, args.timeout, results))
+             for number in range(sessions)]
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies = sorted(duration for outcome, duration in results if outcome == "completed")
+    report = {
+        "sessions": sessions,
+        "turns_per_s": round(len(latencies) / elapsed, 2),
+        "completed": len(latencies),
+        "rejected": sum(1 for outcome, _ in results if outcome == "rejected"),
+        "expired": sum(1 for outcome, _ in results if outcome == "expired"),
+        "failed": sum(1 for outcome, _ in results if outcome == "failed")
+    }
+    if latencies:
+        report["turn_ms"] = {
+            "p50": round(_percentile(latencies, 0.50) * 1000, 1),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 1)
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--levels", default="1,4,16,64", help="comma-separated numbers of concurrent sessions")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of load per level")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake server latency per model request (s)")
+    parser.add_argument("--max-concurrent", type=int, default=64, help="server turns that run at the same time")
+    parser.add_argument("--max-queue", type=int, default=64, help="server turns that may wait for a worker")
+    parser.add_argument("--timeout", type=float, default=30.0, help="turn deadline (s)")
+    parser.add_argument("--slo-ms", type=float, default=2000.0, help="p99 turn latency a sustained level stays under")
+    args = parser.parse_args()
+    
+    levels = []
+    with FakeAnthropicServer(patient_responder, latency=args.latency) as fake:
+        llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False)
+        for tool in patient_workflow.sample_tools:
+            llm.register_tool(**tool)
+        with LLMServer(llm, system="You register patients.", max_concurrent=args.max_concurrent,
+                       max_queue=args.max_queue, default_timeout=args.timeout, port=0) as server:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for sessions in (int(level) for level in args.levels.split(",")):
+                    levels.append(run_level(server, sessions, args))
+            server_stats = server.stats()
+        close_clients()
+    
+    sustained = [level["sessions"] for level in levels
+                 if level["completed"] and not level["rejected"] and not level["expired"] and not level["failed"]
+                 and level["turn_ms"]["p99"] <= args.slo_ms]
+    cpus = os.cpu_count() or 1
+    report = {
+        "benchmark": "server",
+        "cpus": cpus,
+        "model_latency_ms": args.latency * 1000,
+        "slo_p99_ms": args.slo_ms,
+        "levels": levels,
+        "sustained_sessions": max(sustained, default=0),
+        "sessions_per_core": round(max(sustained, default=0) / cpus, 2),
+        "server": server_stats
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Session store: resume latency, save cost and resident memory per 10k sessions.
+
+--sessions sessions, each with --turns tool-loop turns of history (prompt,
+tool_use, tool_result, answer) and patient records in its tool state, are
+saved to a SQLiteBackend in a temporary directory. The report shows:
+
+    save        saves per second, serialized (compressed) bytes per session and
+                database size
+    resume      get() latency of a session that is in memory (warm) and of one
+                loaded from SQLite after a restart (cold)
+    memory      traced Python memory after every session was used once, with all
+                of them resident vs. a SessionStore with max_sessions=--budget
+
+    python benchmarks/bench_session_store.py --sessions 10000 --turns 5 --budget 1000
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from src.session_store import Session, SessionStore
+from src.telemetry import _percentile
+
+
+def make_session(number: int, turns: int) -> Session:
+    """A session after turns patient-registration turns."""
+    history = []
+    patients = {}
+    for turn in range(turns):
+        name = f"Patient {number}-{turn}"
+        tool_id = f"toolu_{number:06d}{turn:04d}"
+        history.append({"role": "user", "content": f"Please register {name}, aged {20 + turn}, and check the study."})
+        history.append({"role": "assistant", "content": [
+            {"type": "text", "text": f"I'll create the record for {name} first."},
+            {"type": "tool_use", "id": tool_id, "name": "create_patient", "input": {"name": name}}
+        ]})
+        history.append({"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": tool_id, "content": json.dumps({"status": "created", "name": name})}
+        ]})
+        history.append({"role": "assistant", "content": [
+            {"type": "text", "text": f"{name} is registered. They are {20 + turn}, so they are not eligible."}
+        ]})
+        patients[name] = {"age": 20 + turn, "gender": "female"}
+    return Session(f"session-{number:06d}", history, {"patients": patients}, turns)
+
+
+def milliseconds(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50": round(_percentile(samples, 0.50) * 1000, 4),
+        "p99": round(_percentile(samples, 0.99) * 1000, 4)
+    }
+
+
+def save_all(path: str, args) -> dict:
+    store = SessionStore(path, max_sessions=args.sessions, ttl=None)
+    sizes = []
+    elapsed = 0.0
+    for number in range(args.sessions):
+        session = make_session(number, args.turns)
+        started = time.perf_counter()
+        store.save(session)
+        elapsed += time.perf_counter() - started
+        sizes.append(session.size)
+    store.close()
+    database_bytes = sum(os.path.getsize(os.path.join(os.path.dirname(path), name))
+                         for name in os.listdir(os.path.dirname(path)))
+    return {
+        "saves_per_s": round(args.sessions / elapsed),
+        "save_ms": round(elapsed / args.sessions * 1000, 4),
+        "stored_bytes_per_session": round(sum(sizes) / len(sizes)),
+        "database_mb": round(database_bytes / 1e6, 2)
+    }
+
+
+def resume(path: str, args) -> dict:
+    ids = [f"session-{number:06d}" for number in range(args.sessions)]
+    picks = random.Random(0).sample(ids, min(args.samples, len(ids)))
+    store = SessionStore(path, max_sessions=args.sessions, ttl=None)
+    cold, warm = [], []
+    for session_id in picks:
+        started = time.perf_counter()
+        store.get(session_id)
+        cold.append(time.perf_counter() - started)
+    for session_id in picks:
+        started = time.perf_counter()
+        store.get(session_id)
+        warm.append(time.perf_counter() - started)
+    store.close()
+    return {"cold_ms": milliseconds(cold), "warm_ms": milliseconds(warm)}
+
+
+def resident_memory(path: str, max_sessions: int, args) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    store = SessionStore(path, max_sessions=max_sessions, ttl=None)
+    for number in range(args.sessions):
+        store.get(f"session-{number:06d}")
+    gc.collect()
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = store.stats()
+    store.close()
+    return {
+        "resident_sessions": stats["resident"],
+        "resident_mb": round(traced / 1e6, 2),
+        "resident_mb_per_10k_resident_sessions": round(traced / 1e6 * 10000 / max(stats["resident"], 1), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=5, help="tool-loop turns of history per session")
+    parser.add_argument("--budget", type=int, default=1000, help="max_sessions of the budgeted store")
+    parser.add_argument("--samples", type=int, default=2000, help="sessions resumed for the latency figures")
+    args = parser.parse_args()
+    
+    directory = tempfile.mkdtemp(prefix="bench-sessions-")
+    path = os.path.join(directory, "sessions.db")
+    try:
+        report = {
+            "benchmark": "session_store",
+            "sessions": args.sessions,
+            "turns_per_session": args.turns,
+            "save": save_all(path, args),
+            "resume": resume(path, args),
+            "memory": {
+                "all_resident": resident_memory(path, args.sessions, args),
+                f"max_sessions_{args.budget}": resident_memory(path, args.budget, args)
+            }
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Startup: import time of src.main and cold start of the REPL to its first prompt.
+
+Each measurement runs in a fresh interpreter, --repeats times (the report shows
+the median), in two modes:
+
+    lazy        the tree as it is: toolsets and the Anthropic SDK are imported
+                when the LLM is created and when the first request is sent
+    eager       the same program with everything the REPL used to import at
+                startup (the SDK, requests, the cassette module and the tool
+                module) imported up front, as before the lazy loading
+
+The report shows:
+
+    import      `python -X importtime -c "import src.main"`: total import time,
+                whether the SDK was imported and the modules with the highest
+                self time
+    cold_start  wall time from launching `python src/main.py` until it prints
+                the "You:" prompt (the target metric), and from sending the
+                first prompt (--think-time seconds later, as a user would) until
+                the answer is printed and it prompts again, against the fake
+                Messages server. The REPL creates the client in the background
+                while it waits for the prompt; with --think-time 0 the first
+                answer pays for importing the SDK.
+
+    python benchmarks/bench_startup.py --repeats 5 --top 10
+"""
+
+import argparse
+import json
+import os
+import select
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.fake_server import FakeAnthropicServer
+
+# What src/main.py imported at startup before toolsets and the SDK were loaded lazily
+EAGER_IMPORTS = ["anthropic", "requests", "src.cassette", "src.utils.patient_workflow"]
+PROMPT = b"You: "
+
+
+def eager_prelude() -> str:
+    """Python source importing EAGER_IMPORTS (skipping any that are not installed)."""
+    return "".join(f"try:\n    import {name}\nexcept ImportError:\n    pass\n" for name in EAGER_IMPORTS)
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """The (name, depth, self_us, cumulative_us) entries of -X importtime output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append({"name": name.strip(), "depth": depth,
+                        "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return entries
+
+
+def measure_imports(source: str, startup: set, args) -> Dict:
+    """Median import time of source, over the modules the bare interpreter does not import."""
+    totals, runs = [], []
+    for _ in range(args.repeats):
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", source], cwd=project_root,
+                                   capture_output=True, text=True, check=True)
+        entries = [entry for entry in parse_importtime(completed.stderr) if entry["name"] not in startup]
+        totals.append(sum(entry["cumulative_us"] for entry in entries if entry["depth"] == 0))
+        runs.append(entries)
+    entries = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    names = {entry["name"] for entry in entries}
+    return {
+        "import_ms": round(statistics.median(totals) / 1000, 1),
+        "modules": len(names),
+        "sdk_imported": "anthropic" in names,
+        "slowest": [{"module": entry["name"], "self_ms": round(entry["self_us"] / 1000, 1)}
+                    for entry in sorted(entries, key=lambda entry: -entry["self_us"])[:args.top]]
+    }
+
+
+def read_until(process: subprocess.Popen, marker: bytes, timeout: float) -> bytes:
+    """Read the process's stdout until marker appears."""
+    output = b""
+    deadline = time.monotonic() + timeout
+    while marker not in output:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([process.stdout], [], [], remaining)[0]:
+            raise TimeoutError(f"no {marker!r} within {timeout}s: {output[-200:]!r}")
+        chunk = os.read(process.stdout.fileno(), 65536)
+        if not chunk:
+            raise RuntimeError(f"the REPL exited: {output[-200:]!r}")
+        output += chunk
+    return output
+
+
+def cold_start(command: List[str], base_url: str, args) -> Dict:
+    """Median time to the first prompt and to the first answer of a fresh REPL."""
+    env = dict(os.environ, ANTHROPIC_API_KEY="fake", ANTHROPIC_BASE_URL=base_url, LLM_TOOLSETS=args.toolsets)
+    for name in ("LLM_TRACE_FILE", "LLM_RECORD_FILE", "LLM_REPLAY_FILE"):
+        env.pop(name, None)
+    to_prompt, to_answer = [], []
+    for _ in range(args.repeats):
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=project_root, env=env, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            read_until(process, PROMPT, args.timeout)
+            to_prompt.append(time.perf_counter() - started)
+            time.sleep(args.think_time)
+            sent = time.perf_counter()
+            process.stdin.write(b"Hello\n")
+            process.stdin.flush()
+            read_until(process, PROMPT, args.timeout)
+            to_answer.append(time.perf_counter() - sent)
+            process.stdin.write(b"exit\n")
+            process.stdin.flush()
+            process.wait(args.timeout)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+    return {
+        "to_first_prompt_ms": round(statistics.median(to_prompt) * 1000, 1),
+        "first_answer_ms": round(statistics.median(to_answer) * 1000, 1),
+        "to_first_answer_ms": round((statistics.median(to_prompt) + statistics.median(to_answer)) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to list")
+    parser.add_argument("--toolsets", default="patient_workflow", help="LLM_TOOLSETS of the REPL")
+    parser.add_argument("--think-time", type=float, default=1.0, help="seconds before sending the first prompt")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for the REPL")
+    args = parser.parse_args()
+    
+    bare = subprocess.run([sys.executable, "-X", "importtime", "-c", "pass"], cwd=project_root,
+                          capture_output=True, text=True, check=True)
+    startup = {entry["name"] for entry in parse_importtime(bare.stderr)}
+    repl = str(project_root / "src" / "main.py")
+    modes = {
+        "lazy": ("import src.main", [sys.executable, repl]),
+        "eager": (eager_prelude() + "import src.main",
+                  [sys.executable, "-c", eager_prelude() + f"import runpy\nrunpy.run_path({repl!r}, run_name='__main__')"])
+    }
+    report = {"benchmark": "startup", "repeats": args.repeats, "toolsets": args.toolsets,
+              "think_time_s": args.think_time}
+    with FakeAnthropicServer() as fake:
+        for mode, (source, command) in modes.items():
+            report[mode] = {
+                "import": measure_imports(source, startup, args),
+                "cold_start": cold_start(command, fake.base_url, args)
+            }
+    lazy, eager = report["lazy"]["cold_start"], report["eager"]["cold_start"]
+    if lazy["to_first_prompt_ms"]:
+        report["to_first_prompt_speedup"] = round(eager["to_first_prompt_ms"] / lazy["to_first_prompt_ms"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
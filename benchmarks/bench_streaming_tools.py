@@ -0,0 +1,96 @@
+"""
+Compare generate_with_tools with stream_with_tools on multi-tool turns.
+
+The patient workflow tools are wrapped with a fixed simulated I/O latency and the
+fake server takes --block-latency seconds to "generate" each content block. The
+non-streaming loop only starts the tools once the whole turn has been received;
+the streaming loop starts each tool as soon as its tool_use block is complete.
+
+    python benchmarks/bench_streaming_tools.py --block-latency 0.2 --tool-latency 0.2
+"""
+
+import argparse
+import functools
+import json
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+import anthropic
+
+from benchmarks.fake_server import FakeAnthropicServer, tool_loop_responder
+from src.llm import LLM
+from src.utils.patient_workflow import sample_tools as patient_tools
+
+SCRIPT = [
+    [
+        {"name": "create_patient", "input": {"name": "Ann"}},
+        {"name": "add_patient_age", "input": {"name": "Ann", "age": 16}},
+        {"name": "add_patient_gender", "input": {"name": "Ann", "gender": "female"}}
+    ],
+    [
+        {"name": "is_eligible_for_study", "input": {"name": "Ann"}},
+        {"name": "send_message_to_patient", "input": {"name": "Ann", "message": "You are eligible."}}
+    ]
+]
+
+
+def with_latency(function, seconds):
+    @functools.wraps(function)
+    def wrapper(**kwargs):
+        time.sleep(seconds)
+        return function(**kwargs)
+    return wrapper
+
+
+def build_llm(base_url: str, tool_latency: float) -> LLM:
+    llm = LLM(api_key="fake")
+    llm.client = anthropic.Anthropic(api_key="fake", base_url=base_url)
+    for tool in patient_tools:
+        llm.register_tool(**dict(tool, function=with_latency(tool["function"], tool_latency)))
+    return llm
+
+
+def run(block_latency: float, tool_latency: float, repeat: int) -> dict:
+    responder = tool_loop_responder(SCRIPT, final_text="Ann is eligible and has been notified.")
+    timings = {"generate_with_tools": [], "stream_with_tools": []}
+    
+    with FakeAnthropicServer(responder, block_latency=block_latency) as server:
+        llm = build_llm(server.base_url, tool_latency)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            llm.generate_with_tools("Register Ann, 16, female, and check the study.")
+            timings["generate_with_tools"].append(time.perf_counter() - started)
+            
+            started = time.perf_counter()
+            stream = llm.stream_with_tools("Register Ann, 16, female, and check the study.")
+            for _ in stream:
+                pass
+            timings["stream_with_tools"].append(time.perf_counter() - started)
+    
+    best = {name: min(values) for name, values in timings.items()}
+    return {
+        "benchmark": "streaming_tools",
+        "block_latency_s": block_latency,
+        "tool_latency_s": tool_latency,
+        "iterations_per_turn": len(SCRIPT) + 1,
+        "generate_with_tools_s": round(best["generate_with_tools"], 3),
+        "stream_with_tools_s": round(best["stream_with_tools"], 3),
+        "speedup": round(best["generate_with_tools"] / best["stream_with_tools"], 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--block-latency", type=float, default=0.2)
+    parser.add_argument("--tool-latency", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.block_latency, args.tool_latency, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Overhead of the telemetry hooks, and the metrics they produce for a tool loop.
+
+Runs the same scripted tool loop (two tool rounds, one of them with two
+parallel calls, then a final answer) against the local fake Messages server
+with three sinks:
+
+    noop     the default TelemetrySink, spans are a shared no-op object
+    metrics  MetricsSink, in-memory histograms
+    jsonl    JsonlSink, one JSON line per span in a temporary file
+
+The report shows the mean wall time per call for each sink and, for the
+metrics sink, the p50/p95/p99 of model latency, tool time and iterations.
+
+    python benchmarks/bench_telemetry.py --calls 300 --latency 0.0 --tool-time 0.002
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.fake_server import FakeAnthropicServer, tool_loop_responder
+from src.llm import LLM
+from src.telemetry import JsonlSink, MetricsSink, TelemetrySink
+
+
+def run_sink(name: str, sink: TelemetrySink, server: FakeAnthropicServer, args) -> dict:
+    def lookup_order(order_id: str) -> dict:
+        time.sleep(args.tool_time)
+        return {"order_id": order_id, "status": "shipped"}
+    
+    llm = LLM(api_key="fake", max_tool_workers=4, client_options={"base_url": server.base_url}, telemetry=sink)
+    llm.register_tool("lookup_order", lookup_order, "Look up an order")
+    
+    llm.generate_with_tools("Warm up")
+    if isinstance(sink, MetricsSink):
+        sink.reset()
+    started = time.perf_counter()
+    for call in range(args.calls):
+        llm.generate_with_tools(f"Where are my orders? ({call})")
+    elapsed = time.perf_counter() - started
+    return {"mean_call_ms": round(elapsed / args.calls * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake server latency per request (s)")
+    parser.add_argument("--tool-time", type=float, default=0.002, help="seconds each tool call sleeps")
+    args = parser.parse_args()
+    
+    responder = tool_loop_responder([
+        {"name": "lookup_order", "input": {"order_id": "A-1"}},
+        [
+            {"name": "lookup_order", "input": {"order_id": "A-2"}},
+            {"name": "lookup_order", "input": {"order_id": "A-3"}}
+        ]
+    ])
+    metrics = MetricsSink()
+    trace_path = os.path.join(tempfile.mkdtemp(), "spans.jsonl")
+    jsonl = JsonlSink(trace_path, flush_every=100)
+    
+    report = {"benchmark": "telemetry", "calls": args.calls}
+    with FakeAnthropicServer(responder, latency=args.latency) as server:
+        for name, sink in (("noop", TelemetrySink()), ("metrics", metrics), ("jsonl", jsonl)):
+            report[name] = run_sink(name, sink, server, args)
+    jsonl.close()
+    with open(trace_path, encoding="utf-8") as file:
+        report["jsonl"]["spans_written"] = sum(1 for _ in file)
+    
+    summary = metrics.summary()
+    report["metrics_summary"] = {
+        key: {stat: round(summary["histograms"][key][stat], 4) for stat in ("p50", "p95", "p99")}
+        for key in ("llm.turn.duration", "llm.model_call.duration", "llm.tool_call.duration", "llm.turn.iterations")
+    }
+    report["metrics_summary"]["counters"] = summary["counters"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Preflight token accounting: counting cost per request and max_tokens truncation of tool calls.
+
+Counting: a tool-loop conversation grows by --turns turns and before every
+request its input tokens are estimated in two ways:
+
+    serialize   the previous estimate, json.dumps of the whole history
+    counter     TokenCounter, each message estimated once and the cached numbers summed
+
+Truncation: the fake Messages server answers with a tool_use cut off by
+max_tokens (stop_reason "max_tokens", incomplete input) whenever a request's
+max_tokens is below --tool-output tokens, like a long tool input would be.
+generate_with_tools runs --calls times:
+
+    before      no TokenCounter, max_tokens=1000: the cut-off tool call fails and
+                costs an iteration
+    fixed       a TokenCounter, max_tokens=1000: the counter never raises an
+                explicit limit, but resends each cut-off request with a larger one
+    counter     a TokenCounter, max_tokens=None: the counter picks the limit from
+                the output lengths it has seen, so requests are sent with enough
+
+    python benchmarks/bench_token_counter.py --turns 300 --calls 50 --tool-output 1500
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.fake_server import FakeAnthropicServer, count_tool_rounds, make_message
+from src.client import close_clients
+from src.conversation import Conversation
+from src.llm import LLM
+from src.token_counter import TokenCounter
+
+
+def counting(turns: int) -> dict:
+    conversation = Conversation()
+    counter = TokenCounter()
+    timings = {"serialize": 0.0, "counter": 0.0}
+    for turn in range(turns):
+        conversation.add_user(f"Where is order A-{turn}? " + "Some context. " * 20)
+        conversation.add_assistant([
+            {"type": "text", "text": "Let me look that up."},
+            {"type": "tool_use", "id": f"toolu_{turn:06d}", "name": "lookup_order", "input": {"order_id": f"A-{turn}"}}
+        ])
+        conversation.add_user([{
+            "type": "tool_result", "tool_use_id": f"toolu_{turn:06d}",
+            "content": json.dumps({"order_id": f"A-{turn}", "status": "shipped", "items": list(range(20))})
+        }])
+        conversation.add_assistant(f"Order A-{turn} has shipped.")
+        
+        started = time.perf_counter()
+        int(len(json.dumps(list(conversation), separators=(",", ":"))) / 4.0)
+        timings["serialize"] += time.perf_counter() - started
+        started = time.perf_counter()
+        counter.count_messages(conversation)
+        timings["counter"] += time.perf_counter() - started
+    return {name: round(total / turns * 1e6, 1) for name, total in timings.items()}
+
+
+def truncating_responder(tool_output: int):
+    def respond(request: dict) -> dict:
+        if count_tool_rounds(request) >= 1:
+            return make_message([{"type": "text", "text": "Order A-1 has shipped."}])
+        if request["max_tokens"] < tool_output:
+            return make_message([
+                {"type": "text", "text": "Let me look that up."},
+                {"type": "tool_use", "id": "toolu_cut", "name": "lookup_order", "input": {}}
+            ], stop_reason="max_tokens", output_tokens=request["max_tokens"])
+        return make_message([
+            {"type": "tool_use", "id": "toolu_full", "name": "lookup_order", "input": {"order_id": "A-1"}}
+        ], stop_reason="tool_use", output_tokens=tool_output)
+    return respond
+
+
+def truncation(mode: str, args) -> dict:
+    def lookup_order(order_id: str) -> dict:
+        return {"order_id": order_id, "status": "shipped"}
+    
+    with FakeAnthropicServer(truncating_responder(args.tool_output), latency=args.latency) as server:
+        counter = TokenCounter() if mode != "before" else None
+        llm = LLM(api_key="fake", client_options={"base_url": server.base_url}, token_counter=counter)
+        llm.register_tool("lookup_order", lookup_order, "Look up an order")
+        started = time.perf_counter()
+        failed_tool_calls = 0
+        resent = 0
+        output_tokens = 0
+        for call in range(args.calls):
+            max_tokens = None if mode == "counter" else 1000
+            result = llm.generate_with_tools(f"Where is order A-1? ({call})", max_tokens=max_tokens)
+            failed_tool_calls += sum(1 for usage in result["tool_usage"] if "error" in usage)
+            resent += result["usage"]["max_tokens_retries"]
+            output_tokens += result["usage"]["output_tokens"]
+        elapsed = time.perf_counter() - started
+        close_clients()
+        return {
+            "model_requests": len(server.requests),
+            "failed_tool_calls": failed_tool_calls,
+            "max_tokens_retries": resent,
+            "output_tokens": output_tokens,
+            "wall_time_s": round(elapsed, 3)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=300, help="turns of the counted conversation")
+    parser.add_argument("--calls", type=int, default=50, help="generate_with_tools calls in the truncation test")
+    parser.add_argument("--tool-output", type=int, default=1500, help="output tokens a complete tool call needs")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake server latency per request (s)")
+    args = parser.parse_args()
+    
+    report = {
+        "benchmark": "token_counter",
+        "turns": args.turns,
+        "count_us_per_request": counting(args.turns),
+        "truncation": {mode: truncation(mode, args) for mode in ("before", "fixed", "counter")}
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
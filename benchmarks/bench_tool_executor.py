@@ -0,0 +1,166 @@
+"""
+Tool execution backends: dispatch cost, CPU-heavy parallel calls and hung tools.
+
+Three measurements against the fake Messages server:
+
+    dispatch     cost of one ToolExecutor.run of a trivial tool per backend,
+                 minus calling the function directly (microseconds)
+    cpu_bound    a turn whose model requests --parallel score calls of about
+                 --work-ms of pure-Python CPU each (max_tool_workers=--parallel),
+                 with the tool on the thread vs. the process backend. Threads
+                 share one GIL; processes can use --parallel cores, so the
+                 speedup is bounded by the machine's CPU count.
+    hung_tool    a turn whose tool sleeps --hang seconds: without a timeout the
+                 turn waits for it, with timeout=--timeout (thread and process
+                 backends) the model gets a timeout error instead, and with a
+                 turn timeout the pending call is cancelled at the deadline
+
+Each run also reports the executor's stats() for its backend (queue depth,
+execution and queue wait times).
+
+    python benchmarks/bench_tool_executor.py --parallel 4 --work-ms 50 --hang 3 --timeout 0.25
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.fake_server import FakeAnthropicServer, tool_loop_responder
+from src.client import close_clients
+from src.llm import LLM
+from src.tool_executor import BACKENDS, ToolExecutor
+
+
+# Tools are module-level functions so that the process backend can pickle them
+def add(a: int, b: int) -> int:
+    return a + b
+
+
+def score(iterations: int) -> int:
+    total = 0
+    for number in range(iterations):
+        total = (total * 31 + number * number) % 1000003
+    return total
+
+
+def hang(seconds: float) -> str:
+    time.sleep(seconds)
+    return "done"
+
+
+def calibrate(work_ms: float) -> int:
+    """Iterations of score that take about work_ms on this machine."""
+    iterations = 100000
+    started = time.perf_counter()
+    score(iterations)
+    elapsed = time.perf_counter() - started
+    return max(1, int(iterations * work_ms / 1000 / elapsed))
+
+
+def dispatch(calls: int) -> dict:
+    started = time.perf_counter()
+    for _ in range(calls):
+        add(a=1, b=2)
+    direct = (time.perf_counter() - started) / calls
+    report = {"direct_us": round(direct * 1e6, 3)}
+    executor = ToolExecutor()
+    try:
+        for backend in BACKENDS:
+            # Start the thread / worker process before timing
+            executor.run(add, {"a": 1, "b": 2}, backend)
+            count = calls if backend != "process" else max(1, calls // 10)
+            started = time.perf_counter()
+            for _ in range(count):
+                executor.run(add, {"a": 1, "b": 2}, backend)
+            elapsed = (time.perf_counter() - started) / count
+            report[f"{backend}_overhead_us"] = round((elapsed - direct) * 1e6, 3)
+    finally:
+        executor.shutdown()
+    return report
+
+
+def make_llm(base_url: str, function, backend: str, timeout=None, max_tool_workers: int = 1) -> LLM:
+    llm = LLM(api_key="fake", client_options={"base_url": base_url}, prompt_caching=False,
+              max_tool_workers=max_tool_workers)
+    llm.register_tool(name=function.__name__, function=function, description=f"The {function.__name__} tool",
+                      backend=backend, timeout=timeout)
+    return llm
+
+
+def run_turn(llm: LLM, timeout=None) -> dict:
+    started = time.perf_counter()
+    result = llm.generate_with_tools("Go", timeout=timeout)
+    elapsed = time.perf_counter() - started
+    outcome = {
+        "turn_s": round(elapsed, 3),
+        "tool_errors": sum(1 for usage in result["tool_usage"] if "error" in usage),
+        "timed_out": sum(1 for usage in result["tool_usage"] if usage.get("timed_out"))
+    }
+    if "warning" in result:
+        outcome["warning"] = result["warning"]
+    return outcome
+
+
+def backend_stats(llm: LLM, backend: str) -> dict:
+    stats = llm.tool_executor.stats()[backend]
+    return {key: value for key, value in stats.items() if key in (
+        "calls", "timeouts", "cancelled", "abandoned", "killed", "max_queued",
+        "execution_p50", "execution_p99", "queue_wait_p50", "queue_wait_p99")}
+
+
+def cpu_bound(base_url: str, args) -> dict:
+    report = {"cpus": os.cpu_count() or 1, "parallel_calls": args.parallel, "work_ms": args.work_ms}
+    for backend in ("thread", "process"):
+        llm = make_llm(base_url, score, backend, max_tool_workers=args.parallel)
+        run_turn(llm)  # start the threads / worker processes
+        turns = [run_turn(llm)["turn_s"] for _ in range(args.turns)]
+        report[backend] = {"turn_s": round(sorted(turns)[len(turns) // 2], 3), **backend_stats(llm, backend)}
+        llm.tool_executor.shutdown()
+    if report["process"]["turn_s"]:
+        report["process_speedup"] = round(report["thread"]["turn_s"] / report["process"]["turn_s"], 2)
+    return report
+
+
+def hung_tool(base_url: str, args) -> dict:
+    report = {"hang_s": args.hang, "timeout_s": args.timeout}
+    runs = [
+        ("no_timeout", "thread", None, None),
+        ("thread_timeout", "thread", args.timeout, None),
+        ("process_timeout", "process", args.timeout, None),
+        ("turn_timeout", "thread", None, args.timeout)
+    ]
+    for name, backend, timeout, turn_timeout in runs:
+        llm = make_llm(base_url, hang, backend, timeout=timeout)
+        report[name] = {**run_turn(llm, turn_timeout), **backend_stats(llm, backend)}
+        llm.tool_executor.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000, help="calls per backend for the dispatch cost")
+    parser.add_argument("--parallel", type=int, default=4, help="parallel score calls per turn")
+    parser.add_argument("--work-ms", type=float, default=50.0, help="CPU time of one score call (ms)")
+    parser.add_argument("--turns", type=int, default=5, help="CPU-bound turns per backend")
+    parser.add_argument("--hang", type=float, default=3.0, help="seconds the hung tool sleeps")
+    parser.add_argument("--timeout", type=float, default=0.25, help="tool and turn timeout of the hung tool (s)")
+    args = parser.parse_args()
+    
+    report = {"benchmark": "tool_executor", "dispatch": dispatch(args.calls)}
+    score_calls = [{"name": "score", "input": {"iterations": calibrate(args.work_ms)}}] * args.parallel
+    with FakeAnthropicServer(tool_loop_responder([score_calls])) as fake:
+        report["cpu_bound"] = cpu_bound(fake.base_url, args)
+    with FakeAnthropicServer(tool_loop_responder([{"name": "hang", "input": {"seconds": args.hang}}])) as fake:
+        report["hung_tool"] = hung_tool(fake.base_url, args)
+    close_clients()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Tool subsetting: request size, latency and recall with and without a ToolIndex.
+
+All six toolsets from src/utils are registered together with --extra-tools
+generated tools (an internal "catalog" of entity/action tools). For each of
+the PROMPTS the fake Messages server calls the tool the prompt is about, even
+when it was not offered (the index then adds it), and then answers.
+
+    all      every registered tool is sent with every request
+    index    ToolIndex(top_k=--top-k) offers the best matches for the prompt
+
+Besides the tool loop, the report shows the index's recall (prompts whose
+tool was among the offered ones) and the cost of one selection.
+
+    python benchmarks/bench_tool_index.py --extra-tools 200 --top-k 8 --repeat 5
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.fake_server import FakeAnthropicServer, count_tool_rounds, make_message
+from src.client import close_clients
+from src.llm import LLM
+from src.telemetry import _percentile
+from src.tool_index import ToolIndex
+
+TOOLSETS = {
+    "src.utils.patient_workflow": "sample_tools",
+    "src.utils.pokemon_tools": "pokemon_tools",
+    "src.utils.obsidian_tools": "obsidian_tools",
+    "src.utils.unit_calculator_tools": "unit_calculator_tools",
+    "src.utils.sample_tools": "sample_tools",
+    "src.utils.magic_tools": "magic_tools"
+}
+
+# (prompt, tool the model calls, its input)
+PROMPTS = [
+    ("Create a new patient record for Ada Lovelace", "create_patient", {"name": "Ada Lovelace"}),
+    ("Add the age 36 to Ada Lovelace's record", "add_patient_age", {"name": "Ada Lovelace", "age": 36}),
+    ("Check whether Ada Lovelace is eligible for the study", "is_eligible_for_study", {"name": "Ada Lovelace"}),
+    ("Send Ada Lovelace a message that she was accepted", "send_message_to_patient",
+     {"name": "Ada Lovelace", "message": "You were accepted."}),
+    ("Which Pokemon types are there?", "list_pokemon_types", {}),
+    ("Which type has an advantage against Water?", "get_advantageous_type", {"pokemon_type": "Water"}),
+    ("Which Pokemon does trainer Misty have?", "list_trainer_pokemon", {"trainer_name": "Misty"}),
+    ("Write a markdown note called groceries with eggs and milk", "create_markdown_file",
+     {"filename": "groceries", "content": "- eggs\n- milk"}),
+    ("Read my groceries note from the vault", "read_markdown_file", {"filepath": "groceries"}),
+    ("I run a dishwasher 2 hours per day", "add_or_update_appliance_usage",
+     {"name": "Dishwasher", "hours_per_day": 2, "count": 1}),
+    ("How much do my appliances cost per month?", "calculate_monthly_appliance_cost", {}),
+    ("What time is it?", "get_current_time", {}),
+    ("What's the weather like in Lisbon?", "get_weather", {"location": "Lisbon"}),
+    ("Disarm Draco with a spell", "disarm", {"person_name": "Draco"})
+]
+
+ENTITIES = ["invoice", "customer", "shipment", "ticket", "contract", "employee", "warehouse", "supplier",
+            "campaign", "subscription", "refund", "lead", "asset", "license", "payroll", "budget",
+            "incident", "release", "server", "certificate"]
+ACTIONS = [("create", "Create a new {e} in the {s} system"),
+           ("lookup", "Look up a {e} by its id in the {s} system"),
+           ("search", "Search {e} records matching a query in the {s} system"),
+           ("update", "Update the fields of an existing {e} in the {s} system"),
+           ("archive", "Archive a {e} that is no longer active in the {s} system"),
+           ("export", "Export {e} records to CSV from the {s} system"),
+           ("approve", "Approve a pending {e} in the {s} system"),
+           ("assign", "Assign a {e} to an owner in the {s} system"),
+           ("comment", "Add a comment to a {e} in the {s} system"),
+           ("report", "Summarize {e} statistics for a period in the {s} system")]
+SYSTEMS = ["billing", "crm", "logistics", "helpdesk", "legal", "hr", "finance", "ops"]
+
+
+def catalog_tools(count: int) -> list:
+    """Generate count internal tools with realistic names, descriptions and schemas."""
+    tools = []
+    for number in range(count):
+        entity = ENTITIES[number % len(ENTITIES)]
+        action, description = ACTIONS[(number // len(ENTITIES)) % len(ACTIONS)]
+        system = SYSTEMS[number % len(SYSTEMS)]
+        name = f"{system}_{action}_{entity}" + (f"_{number}" if number >= len(ENTITIES) * len(ACTIONS) else "")
+        tools.append({
+            "name": name,
+            "function": lambda **kwargs: {"ok": True},
+            "description": description.format(e=entity, s=system),
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    f"{entity}_id": {"type": "string", "description": f"The id of the {entity}"},
+                    "fields": {"type": "object", "description": f"The {entity} fields to set"}
+                },
+                "required": [f"{entity}_id"]
+            }
+        })
+    return tools
+
+
+def prompt_responder():
+    calls = {prompt: (tool, tool_input) for prompt, tool, tool_input in PROMPTS}
+    
+    def respond(request: dict) -> dict:
+        input_tokens = len(json.dumps(request, separators=(",", ":"))) // 4
+        if count_tool_rounds(request) >= 1:
+            return make_message([{"type": "text", "text": "Done."}], input_tokens=input_tokens)
+        prompt = request["messages"][-1]["content"]
+        prompt = prompt if isinstance(prompt, str) else prompt[-1]["text"]
+        tool, tool_input = calls[prompt.split(" (")[0]]
+        return make_message([{"type": "tool_use", "id": f"toolu_{abs(hash(prompt)):x}", "name": tool,
+                              "input": tool_input}], stop_reason="tool_use", input_tokens=input_tokens)
+    return respond
+
+
+def make_llm(server, tool_index, tools) -> LLM:
+    llm = LLM(api_key="fake", client_options={"base_url": server.base_url}, tool_index=tool_index)
+    for tool in tools:
+        llm.register_tool(**tool)
+    return llm
+
+
+def recall(tools: list, top_k: int, repeat: int) -> dict:
+    """Offline: prompts whose tool is offered, mean tools offered and selection time."""
+    with FakeAnthropicServer() as server:
+        llm = make_llm(server, ToolIndex(top_k=top_k), tools)
+        manifest = llm.tool_manifest()
+        found = 0
+        offered = 0
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for prompt, tool, _ in PROMPTS:
+                selected = llm.tool_index.select(manifest, prompt)
+                found += any(definition["name"] == tool for definition in selected)
+                offered += len(selected)
+        elapsed = time.perf_counter() - started
+        close_clients()
+    selections = repeat * len(PROMPTS)
+    return {
+        "recall": round(found / selections, 3),
+        "mean_offered": round(offered / selections, 2),
+        "select_us": round(elapsed / selections * 1e6, 1)
+    }
+
+
+def tool_loop(mode: str, tools: list, args) -> dict:
+    with FakeAnthropicServer(prompt_responder(), latency=args.latency) as server:
+        tool_index = ToolIndex(top_k=args.top_k) if mode == "index" else None
+        llm = make_llm(server, tool_index, tools)
+        turn_times = []
+        failed = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for round_number in range(args.repeat):
+                for prompt, _, _ in PROMPTS:
+                    started = time.perf_counter()
+                    result = llm.generate_with_tools(f"{prompt} ({round_number})")
+                    turn_times.append(time.perf_counter() - started)
+                    failed += sum(1 for usage in result["tool_usage"] if "error" in usage)
+        close_clients()
+    sizes = [len(json.dumps(request, separators=(",", ":"))) for request in server.requests]
+    turn_times.sort()
+    report = {
+        "model_requests": len(server.requests),
+        "request_kb": round(sum(sizes) / len(sizes) / 1024, 2),
+        "input_tokens_per_request": round(sum(sizes) / len(sizes) / 4),
+        "turn_ms": {
+            "mean": round(sum(turn_times) / len(turn_times) * 1000, 3),
+            "p95": round(_percentile(turn_times, 0.95) * 1000, 3)
+        },
+        "failed_tool_calls": failed
+    }
+    if tool_index is not None:
+        report["index"] = tool_index.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--extra-tools", type=int, default=200, help="generated catalog tools to register")
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the prompts")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake server latency per request (s)")
+    args = parser.parse_args()
+    
+    vault = tempfile.mkdtemp(prefix="bench-vault-")
+    importlib.import_module("src.utils.obsidian_tools").OBSIDIAN_VAULT_PATH = vault
+    tools = []
+    for module_name, attribute in TOOLSETS.items():
+        tools.extend(getattr(importlib.import_module(module_name), attribute))
+    tools.extend(catalog_tools(args.extra_tools))
+    
+    try:
+        report = {
+            "benchmark": "tool_index",
+            "registered_tools": len(tools),
+            "prompts": len(PROMPTS),
+            "selection": recall(tools, args.top_k, args.repeat),
+            "tool_loop": {mode: tool_loop(mode, tools, args) for mode in ("all", "index")}
+        }
+    finally:
+        shutil.rmtree(vault, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
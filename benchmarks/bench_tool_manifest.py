@@ -0,0 +1,86 @@
+"""
+Micro-benchmark for the cached tool manifest.
+
+Registers --tools tools without explicit schemas and compares:
+  * building the "tools" request array from the registry on every call (the
+    previous behaviour) against reusing the cached ToolManifest, and
+  * deriving input schemas with inspect.signature on every registration against
+    the per-function schema cache.
+    
+    python benchmarks/bench_tool_manifest.py --tools 300
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from src.llm import LLM
+
+
+def make_tool(index: int):
+    def tool(city: str, days: int = 1, metric: bool = True) -> dict:
+        return {"city": city, "days": days, "metric": metric}
+    tool.__name__ = f"tool_{index}"
+    return tool
+
+
+def rebuild_tool_definitions(llm: LLM) -> list:
+    # The per-call rebuild generate_with_tools used to do
+    tools = []
+    for name, tool_info in llm.tools.items():
+        tools.append({
+            "name": name,
+            "description": tool_info["description"],
+            "input_schema": tool_info["input_schema"]
+        })
+    return tools
+
+
+def run(tool_count: int, number: int) -> dict:
+    functions = [make_tool(i) for i in range(tool_count)]
+    llm = LLM(api_key="fake")
+    for i, function in enumerate(functions):
+        llm.register_tool(f"tool_{i}", function, f"Tool number {i}")
+    
+    rebuild = timeit.timeit(lambda: rebuild_tool_definitions(llm), number=number) / number
+    cached = timeit.timeit(llm._tool_definitions, number=number) / number
+    
+    # Schemas: signature inspection on every registration vs. the shared cache
+    inspect_each = timeit.timeit(
+        lambda: [llm._input_schema_from_signature(function) for function in functions], number=10
+    ) / 10
+    from_cache = timeit.timeit(
+        lambda: [llm._generate_input_schema(function) for function in functions], number=10
+    ) / 10
+    
+    first = llm.tool_manifest().json
+    assert llm.tool_manifest().json == first, "manifest must be stable between calls"
+    
+    return {
+        "benchmark": "tool_manifest",
+        "tools": tool_count,
+        "tool_definitions_rebuild_us": round(rebuild * 1e6, 2),
+        "tool_definitions_cached_us": round(cached * 1e6, 2),
+        "tool_definitions_speedup": round(rebuild / cached, 1),
+        "schemas_inspect_us": round(inspect_each * 1e6, 2),
+        "schemas_cached_us": round(from_cache * 1e6, 2),
+        "schemas_speedup": round(inspect_each / from_cache, 1),
+        "manifest_bytes": len(first.encode("utf-8"))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tools", type=int, default=300)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.tools, args.number), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Loop overhead, tool dispatch cost, history growth and memory for each shipped toolset.
+
+For every toolset in src/utils the fake Messages server replays a scripted
+tool_use sequence that exercises its tools (including parallel calls where the
+tools allow it), then a final answer. Each session carries its history through
+--turns calls of generate_with_tools. A MetricsSink collects the spans, so for
+every toolset the report shows:
+
+    turn_ms             mean and p95 wall time of one generate_with_tools call
+    model_call_ms       time spent in API requests per turn (includes --latency)
+    tool_ms             time spent in tool calls per turn
+    loop_overhead_ms    what is left: history, manifest, parsing and dispatch
+    dispatch_us         per tool, the mean tool span minus calling the function directly
+    history             messages and serialized bytes after the first and last turn
+    memory_kb           tracemalloc peak and retained size of one session
+
+Obsidian notes are written to a temporary vault. Output the tools print is
+discarded. Use --output to also write the report to a file, e.g. for
+benchmarks/run_suite.py --baseline.
+
+    python benchmarks/bench_toolsets.py --sessions 10 --turns 8 --latency 0.0
+"""
+
+import argparse
+import contextlib
+import gc
+import importlib
+import io
+import json
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.fake_server import FakeAnthropicServer, tool_loop_responder
+from src.client import close_clients
+from src.llm import LLM
+from src.telemetry import MetricsSink
+
+# Toolset name -> (module, list of tools, scripted assistant turns)
+TOOLSETS = {
+    "patient": ("src.utils.patient_workflow", "sample_tools", [
+        {"name": "create_patient", "input": {"name": "Ada Lovelace"}},
+        [
+            {"name": "add_patient_gender", "input": {"name": "Ada Lovelace", "gender": "female"}},
+            {"name": "add_patient_age", "input": {"name": "Ada Lovelace", "age": 16}}
+        ],
+        {"name": "is_eligible_for_study", "input": {"name": "Ada Lovelace"}},
+        {"name": "send_message_to_patient", "input": {"name": "Ada Lovelace", "message": "You are eligible."}}
+    ]),
+    "pokemon": ("src.utils.pokemon_tools", "pokemon_tools", [
+        {"name": "list_pokemon_types", "input": {}},
+        {"name": "have_pokemon", "input": {"pokemon_name": "Charmander", "pokemon_type": "Fire", "trainer_name": "Ash"}},
+        [
+            {"name": "get_advantageous_type", "input": {"pokemon_type": "Fire"}},
+            {"name": "list_trainer_pokemon", "input": {"trainer_name": "Ash"}}
+        ]
+    ]),
+    "obsidian": ("src.utils.obsidian_tools", "obsidian_tools", [
+        {"name": "create_markdown_file", "input": {"filename": "benchmark", "content": "# Benchmark\n\nFirst draft."}},
+        {"name": "read_markdown_file", "input": {"filepath": "benchmark"}},
+        {"name": "update_markdown_file", "input": {"filename": "benchmark", "content": "# Benchmark\n\nSecond draft."}}
+    ]),
+    "unit_calculator": ("src.utils.unit_calculator_tools", "unit_calculator_tools", [
+        [
+            {"name": "add_or_update_appliance_usage", "input": {"name": "Refrigerator", "hours_per_day": 24, "count": 1}},
+            {"name": "add_or_update_appliance_usage", "input": {"name": "Laptop", "hours_per_day": 6, "count": 2}}
+        ],
+        {"name": "calculate_monthly_appliance_cost", "input": {}},
+        {"name": "list_user_appliances", "input": {}}
+    ]),
+    "sample": ("src.utils.sample_tools", "sample_tools", [
+        {"name": "get_current_time", "input": {}},
+        {"name": "get_weather", "input": {"location": "Paris", "units": "metric"}}
+    ]),
+    "magic": ("src.utils.magic_tools", "magic_tools", [
+        [
+            {"name": "disarm", "input": {"person_name": "Draco"}},
+            {"name": "disarm", "input": {"person_name": "Lucius"}}
+        ]
+    ])
+}
+
+
+def scripted_calls(script: list) -> list:
+    """Flatten the scripted turns into the individual tool calls."""
+    calls = []
+    for turn in script:
+        calls.extend(turn if isinstance(turn, list) else [turn])
+    return calls
+
+
+def history_size(history) -> dict:
+    return {
+        "messages": len(history),
+        "bytes": len(json.dumps(list(history), default=str))
+    }
+
+
+def run_session(llm: LLM, session: int, turns: int, sizes: list = None):
+    """Run one session of turns calls that share their history."""
+    history = None
+    for turn in range(turns):
+        result = llm.generate_with_tools(f"Session {session}, request {turn}", history=history)
+        history = result["history"]
+        if sizes is not None:
+            sizes.append(history_size(history))
+    return history
+
+
+def direct_call_us(tools: dict, calls: list, repeat: int) -> dict:
+    """Mean microseconds per tool when its function is called directly with the scripted input."""
+    totals = {}
+    counts = {}
+    for _ in range(repeat):
+        for call in calls:
+            started = time.perf_counter()
+            tools[call["name"]]["function"](**call["input"])
+            totals[call["name"]] = totals.get(call["name"], 0.0) + time.perf_counter() - started
+            counts[call["name"]] = counts.get(call["name"], 0) + 1
+    return {name: totals[name] / counts[name] * 1e6 for name in totals}
+
+
+def session_memory(llm: LLM, turns: int) -> dict:
+    """Peak and retained tracemalloc size of one session, in KB."""
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    history = run_session(llm, -1, turns)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del history
+    return {
+        "peak": round((peak - baseline) / 1024, 1),
+        "retained": round((current - baseline) / 1024, 1)
+    }
+
+
+def run_toolset(name: str, args) -> dict:
+    module_name, attribute, script = TOOLSETS[name]
+    module = importlib.import_module(module_name)
+    tools = {tool["name"]: tool for tool in getattr(module, attribute)}
+    calls = scripted_calls(script)
+    
+    metrics = MetricsSink()
+    with FakeAnthropicServer(tool_loop_responder(script), latency=args.latency) as server:
+        llm = LLM(api_key="fake", max_tool_workers=args.tool_workers,
+                  client_options={"base_url": server.base_url}, telemetry=metrics)
+        for tool in tools.values():
+            llm.register_tool(**tool)
+        
+        run_session(llm, -1, 1)
+        metrics.reset()
+        sizes = []
+        for session in range(args.sessions):
+            run_session(llm, session, args.turns, sizes if session == 0 else None)
+        summary = metrics.summary()
+        
+        llm.telemetry = MetricsSink()
+        memory = session_memory(llm, args.turns)
+        close_clients()
+    direct = direct_call_us(tools, calls, args.direct_repeat)
+    
+    histograms = summary["histograms"]
+    turns = histograms["llm.turn.duration"]["count"]
+    
+    def total_ms(key: str) -> float:
+        histogram = histograms.get(key)
+        return histogram["count"] * histogram["mean"] * 1000 if histogram else 0.0
+    
+    turn_ms = total_ms("llm.turn.duration") / turns
+    model_call_ms = total_ms("llm.model_call.duration") / turns
+    tool_ms = total_ms("llm.tool_call.duration") / turns
+    dispatch_us = {}
+    for tool_name, direct_us in sorted(direct.items()):
+        span = histograms[f"llm.tool_call.duration[tool={tool_name}]"]
+        dispatch_us[tool_name] = round(span["mean"] * 1e6 - direct_us, 1)
+    
+    return {
+        "tools": len(tools),
+        "tool_calls_per_turn": len(calls),
+        "model_requests_per_turn": len(script) + 1,
+        "turn_ms": {
+            "mean": round(turn_ms, 3),
+            "p95": round(histograms["llm.turn.duration"]["p95"] * 1000, 3)
+        },
+        "model_call_ms": round(model_call_ms, 3),
+        "tool_ms": round(tool_ms, 3),
+        "loop_overhead_ms": round(turn_ms - model_call_ms - tool_ms, 3),
+        "dispatch_us": dispatch_us,
+        "tool_cache_hits": summary["counters"].get("llm.tool_call.cache_hit", 0),
+        "history": {
+            "first_turn": sizes[0],
+            "last_turn": sizes[-1],
+            "bytes_per_turn": round((sizes[-1]["bytes"] - sizes[0]["bytes"]) / max(1, len(sizes) - 1))
+        },
+        "memory_kb": memory
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=8, help="generate_with_tools calls per session")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake server latency per request (s)")
+    parser.add_argument("--tool-workers", type=int, default=1, help="max_tool_workers of the LLM")
+    parser.add_argument("--direct-repeat", type=int, default=200, help="direct calls per scripted tool call")
+    parser.add_argument("--toolsets", default=",".join(TOOLSETS), help="comma-separated toolsets to run")
+    parser.add_argument("--output", help="also write the report to this JSON file")
+    args = parser.parse_args()
+    
+    vault = tempfile.mkdtemp(prefix="bench-vault-")
+    obsidian = importlib.import_module("src.utils.obsidian_tools")
+    obsidian.OBSIDIAN_VAULT_PATH = vault
+    
+    report = {
+        "benchmark": "toolsets",
+        "sessions": args.sessions,
+        "turns": args.turns,
+        "server_latency_s": args.latency,
+        "toolsets": {}
+    }
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name in args.toolsets.split(","):
+                report["toolsets"][name] = run_toolset(name.strip(), args)
+    finally:
+        shutil.rmtree(vault, ignore_errors=True)
+    
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
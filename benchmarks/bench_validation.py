@@ -0,0 +1,165 @@
+"""
+Tool input validation: iterations per task on fault-injected runs, and validator cost.
+
+A simulated model registers --tasks patients with the patient workflow tools
+(create, add gender and age, check eligibility, send a message). On the first
+attempt of each step it sends a bad input with probability --fault-rate:
+
+    create_patient            name is a number: stored, later lookups fail
+    add_patient_age           age is a word: stored, the eligibility check fails
+    is_eligible_for_study     an extra property: the call fails
+    send_message_to_patient   message is a number: goes through unnoticed
+
+After a failed step the model retries it with a correct input; after a second
+failure in a row it starts the task over. Runs with the tools registered
+with validate=False (inputs go straight to the function) and validate=True
+(the compiled input_schema validator rejects bad inputs before the call).
+
+    python benchmarks/bench_validation.py --tasks 200 --fault-rate 0.3
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.fake_server import FakeAnthropicServer, make_message
+from src.client import close_clients
+from src.llm import LLM
+from src.utils import patient_workflow
+from src.validation import compile_schema
+
+
+def steps(name: str) -> list:
+    """The tool calls of each step of a task: (correct inputs, faulty inputs)."""
+    return [
+        [("create_patient", {"name": name}, {"name": 7})],
+        [("add_patient_gender", {"name": name, "gender": "female"}, {"name": name, "gender": "female"}),
+         ("add_patient_age", {"name": name, "age": 16}, {"name": name, "age": "sixteen"})],
+        [("is_eligible_for_study", {"name": name}, {"name": name, "strict": True})],
+        [("send_message_to_patient", {"name": name, "message": "You are eligible."}, {"name": name, "message": 42})]
+    ]
+
+
+def task_rounds(messages: list) -> list:
+    """The (tool_use blocks, tool_result blocks) rounds since the task's prompt."""
+    start = max(index for index, message in enumerate(messages)
+                if message["role"] == "user" and isinstance(message["content"], str))
+    rounds = []
+    for index in range(start + 1, len(messages) - 1, 2):
+        rounds.append((messages[index]["content"], messages[index + 1]["content"]))
+    return rounds
+
+
+def simulated_model(fault_rate: float):
+    def respond(request: dict) -> dict:
+        messages = request["messages"]
+        prompt = next(message["content"] for message in reversed(messages)
+                      if message["role"] == "user" and isinstance(message["content"], str))
+        name = prompt.split(": ", 1)[1]
+        plan = steps(name)
+        step, failures, attempted, restarted = 0, 0, set(), False
+        for _, results in task_rounds(messages):
+            attempted.add(step)
+            if any(block.get("is_error") for block in results):
+                failures += 1
+                if failures >= 2:
+                    step, failures, restarted = 0, 0, True
+            else:
+                step, failures = step + 1, 0
+        if step == len(plan):
+            return make_message([{"type": "text", "text": f"{name} is registered."}])
+        
+        faulty = not restarted and step not in attempted and \
+            random.Random(f"{name}/{step}").random() < fault_rate
+        content = [
+            {"type": "tool_use", "id": f"toolu_{random.getrandbits(64):016x}", "name": tool,
+             "input": bad if faulty else good}
+            for tool, good, bad in plan[step]
+        ]
+        return make_message(content, stop_reason="tool_use")
+    return respond
+
+
+def run_mode(validate: bool, args) -> dict:
+    with FakeAnthropicServer(simulated_model(args.fault_rate)) as server:
+        llm = LLM(api_key="fake", client_options={"base_url": server.base_url}, prompt_caching=False)
+        for tool in patient_workflow.sample_tools:
+            llm.register_tool(**tool, validate=validate)
+        completed = 0
+        tool_errors = 0
+        bad_inputs_run = 0
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for task in range(args.tasks):
+                name = f"Patient {task}"
+                result = llm.generate_with_tools(f"Register and notify: {name}", max_iterations=args.max_iterations)
+                completed += "warning" not in result
+                good_inputs = [good for step in steps(name) for _, good, _ in step]
+                for usage in result["tool_usage"]:
+                    if "error" in usage:
+                        tool_errors += 1
+                    elif usage["input"] not in good_inputs:
+                        bad_inputs_run += 1
+        elapsed = time.perf_counter() - started
+        close_clients()
+    return {
+        "model_requests": len(server.requests),
+        "iterations_per_task": round(len(server.requests) / args.tasks, 3),
+        "completed_tasks": completed,
+        "tool_errors": tool_errors,
+        "bad_inputs_run": bad_inputs_run,
+        "wall_time_s": round(elapsed, 3)
+    }
+
+
+def validator_cost(repeat: int) -> dict:
+    """Microseconds to compile each patient tool's schema and to validate one input."""
+    inputs = {tool: good for step in steps("Ada Lovelace") for tool, good, _ in step}
+    report = {}
+    for tool in patient_workflow.sample_tools:
+        if tool["name"] not in inputs:
+            continue
+        started = time.perf_counter()
+        validator = compile_schema(tool["input_schema"], additional_properties=False)
+        compiled = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(repeat):
+            validator(inputs[tool["name"]])
+        report[tool["name"]] = {
+            "compile_us": round(compiled * 1e6, 1),
+            "validate_us": round((time.perf_counter() - started) / repeat * 1e6, 3)
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--fault-rate", type=float, default=0.3, help="chance of a bad input on a step's first attempt")
+    parser.add_argument("--max-iterations", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=100000, help="validations per tool for the validator cost")
+    args = parser.parse_args()
+    
+    report = {
+        "benchmark": "validation",
+        "tasks": args.tasks,
+        "fault_rate": args.fault_rate,
+        "modes": {
+            "unvalidated": run_mode(False, args),
+            "validated": run_mode(True, args)
+        },
+        "validator": validator_cost(args.repeat)
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+"""
+A local stand-in for the Anthropic Messages API.
+
+The server speaks just enough HTTP/1.1 (keep-alive, Content-Length bodies and
+chunked server-sent events) for the anthropic SDK to talk to it, and answers
+POST /v1/messages with whatever a responder function returns for the decoded
+request body, either as one JSON document or, for "stream": true requests, as
+the equivalent message stream events. The Message Batches endpoints (create,
+retrieve, results and cancel) answer every request of a batch with the same
+responder; a batch ends batch_latency seconds after it was created. A faults
+function can make POST /v1/messages fail with API errors (429, 529, 500, ...)
+or dropped connections. It runs its own event loop on a background thread so
+both LLM and AsyncLLM clients can use it.
+"""
+
+import asyncio
+import datetime
+import json
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+Responder = Callable[[Dict[str, Any]], Dict[str, Any]]
+# Maps a request body to None (answer it) or to the (status, headers) of an error to send instead
+Faults = Callable[[Dict[str, Any]], Optional[Tuple[int, Dict[str, str]]]]
+
+ERROR_TYPES = {
+    400: "invalid_request_error",
+    408: "timeout_error",
+    429: "rate_limit_error",
+    500: "api_error",
+    503: "api_error",
+    529: "overloaded_error"
+}
+
+
+def make_message(content: List[Dict[str, Any]],
+                 stop_reason: str = "end_turn",
+                 model: str = "fake-model",
+                 input_tokens: int = 10,
+                 output_tokens: int = 10) -> Dict[str, Any]:
+    """
+    Build a Messages API response body.
+    
+    Args:
+        content: The response content blocks
+        stop_reason: The stop reason to report
+        model: The model name to echo back
+        input_tokens: Input tokens to report in usage
+        output_tokens: Output tokens to report in usage
+    
+    Returns:
+        A dictionary in the shape of an API message
+    """
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens
+        }
+    }
+
+
+def count_tool_rounds(request: Dict[str, Any]) -> int:
+    """Count the tool_result messages sent since the last plain user prompt."""
+    rounds = 0
+    for message in reversed(request.get("messages", [])):
+        if message["role"] != "user":
+            continue
+        content = message["content"]
+        if isinstance(content, list) and content and content[0].get("type") == "tool_result":
+            rounds += 1
+        else:
+            break
+    return rounds
+
+
+def tool_loop_responder(tool_calls: List[Dict[str, Any]], final_text: str = "Done.") -> Responder:
+    """
+    Build a stateless responder that replays a scripted tool_use sequence.
+    
+    Every entry of tool_calls is one assistant turn: either a single
+    {"name": ..., "input": ...} call or a list of them for parallel calls. Once
+    all turns have been answered with tool results the responder returns
+    final_text. Because progress is read from the request itself, one responder
+    can serve any number of concurrent conversations.
+    
+    Args:
+        tool_calls: The scripted assistant turns
+        final_text: The text of the final answer
+    
+    Returns:
+        A responder function for FakeAnthropicServer
+    """
+    def respond(request: Dict[str, Any]) -> Dict[str, Any]:
+        rounds = count_tool_rounds(request)
+        if rounds >= len(tool_calls):
+            return make_message([{"type": "text", "text": final_text}])
+        
+        turn = tool_calls[rounds]
+        if isinstance(turn, dict):
+            turn = [turn]
+        content = [
+            {
+                "type": "tool_use",
+                "id": f"toolu_{uuid.uuid4().hex[:24]}",
+                "name": call["name"],
+                "input": call.get("input", {})
+            }
+            for call in turn
+        ]
+        return make_message(content, stop_reason="tool_use")
+    
+    return respond
+
+
+def random_faults(rate: float,
+                  statuses: Sequence[int] = (429, 529),
+                  retry_after: Optional[float] = None,
+                  seed: Optional[int] = 0) -> Faults:
+    """
+    Build a faults function that fails a random share of requests.
+    
+    Args:
+        rate: Probability (0-1) that a request fails
+        statuses: Error statuses to pick from; 0 drops the connection without a response
+        retry_after: Optional seconds to send in a retry-after header
+        seed: Seed for the random generator, so runs are repeatable
+    
+    Returns:
+        A faults function for FakeAnthropicServer
+    """
+    rng = random.Random(seed)
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    
+    def faults(request: Dict[str, Any]) -> Optional[Tuple[int, Dict[str, str]]]:
+        if rng.random() >= rate:
+            return None
+        return rng.choice(list(statuses)), headers
+    
+    return faults
+
+
+class FakeAnthropicServer:
+    """
+    A minimal local HTTP server that answers Messages API requests.
+    
+    Usage:
+        with FakeAnthropicServer(responder, latency=0.05) as server:
+            client = anthropic.Anthropic(api_key="fake", base_url=server.base_url)
+    """
+    
+    def __init__(self,
+                 responder: Optional[Responder] = None,
+                 latency: float = 0.0,
+                 block_latency: float = 0.0,
+                 batch_latency: float = 0.0,
+                 faults: Optional[Faults] = None,
+                 model_latency: Optional[Dict[str, float]] = None,
+                 host: str = "127.0.0.1",
+                 port: int = 0):
+        """
+        Initialize the server.
+        
+        Args:
+            responder: Function mapping a decoded request body to a response body.
+                Defaults to a plain text reply.
+            latency: Seconds to wait before answering each request
+            block_latency: Seconds it takes to "generate" each content block. Streamed
+                responses emit blocks as they finish; JSON responses wait for all of them.
+            batch_latency: Seconds after which a message batch ends
+            faults: Optional function that decides, per POST /v1/messages request, to
+                fail it with an error status and headers instead; see random_faults
+            model_latency: Optional latency per model name, replacing latency for
+                requests to those models
+            host: Interface to bind to
+            port: Port to bind to; 0 picks a free one
+        """
+        self.responder = responder or (lambda request: make_message([{"type": "text", "text": "Hello!"}]))
+        self.latency = latency
+        self.block_latency = block_latency
+        self.batch_latency = batch_latency
+        self.faults = faults
+        self.model_latency = model_latency or {}
+        self.host = host
+        self.port = port
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.batches = {}
+        self.batch_polls = 0
+        self.faults_sent = 0
+        self.connections_opened = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._connections = set()
+        self._started = threading.Event()
+    
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+    
+    def start(self) -> "FakeAnthropicServer":
+        """Start serving on a background thread."""
+        self._thread = threading.Thread(target=self._run, name="fake-anthropic", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+    
+    def stop(self) -> None:
+        """Stop the server and wait for its thread to exit."""
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+    
+    async def _shutdown(self) -> None:
+        self._server.close()
+        for task in self._connections:
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+    
+    def __enter__(self) -> "FakeAnthropicServer":
+        return self.start()
+    
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+    
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle_connection, self.host, self.port, backlog=4096)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.close()
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        self.connections_opened += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, value = line.decode("latin-1").split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+                
+                body = b""
+                if "content-length" in headers:
+                    body = await reader.readexactly(int(headers["content-length"]))
+                
+                await self._handle_request(method, path, headers, body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+    
+    async def _handle_request(self, method: str, path: str, headers: Dict[str, str],
+                              body: bytes, writer: asyncio.StreamWriter) -> None:
+        path = path.split("?", 1)[0]
+        if path.startswith("/v1/messages/batches"):
+            await self._handle_batch_request(method, path, body, writer)
+            return
+        if method != "POST" or path != "/v1/messages":
+            await self._send_not_found(writer, f"{method} {path} is not supported")
+            return
+        
+        request = json.loads(body or b"{}")
+        self.requests.append(request)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            latency = self.model_latency.get(request.get("model"), self.latency)
+            if latency:
+                await asyncio.sleep(latency)
+            fault = self.faults(request) if self.faults else None
+            if fault is not None:
+                await self._send_fault(writer, *fault)
+                return
+            try:
+                response = self.responder(request)
+            except Exception as e:
+                # A failing responder becomes an API error instead of a dropped connection
+                await self._send_json(writer, 500, {
+                    "type": "error",
+                    "error": {"type": "api_error", "message": str(e)}
+                })
+                return
+            if request.get("stream"):
+                await self._send_stream(writer, response)
+            else:
+                if self.block_latency:
+                    await asyncio.sleep(self.block_latency * len(response["content"]))
+                await self._send_json(writer, 200, response)
+        finally:
+            self.in_flight -= 1
+    
+    async def _handle_batch_request(self, method: str, path: str, body: bytes,
+                                    writer: asyncio.StreamWriter) -> None:
+        parts = path[len("/v1/messages/batches"):].strip("/").split("/")
+        batch_id = parts[0]
+        action = parts[1] if len(parts) > 1 else None
+        
+        if method == "POST" and not batch_id:
+            batch = self._create_batch(json.loads(body or b"{}"))
+            await self._send_json(writer, 200, self._batch_object(batch))
+            return
+        
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            await self._send_not_found(writer, f"Message batch {batch_id} not found")
+        elif method == "GET" and action is None:
+            self.batch_polls += 1
+            await self._send_json(writer, 200, self._batch_object(batch))
+        elif method == "GET" and action == "results" and self._batch_ended(batch):
+            lines = [
+                {"custom_id": custom_id, "result": {"type": "canceled"} if batch["canceled"] else result}
+                for custom_id, result in batch["results"]
+            ]
+            data = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+            await self._send_body(writer, 200, data, "application/binary")
+        elif method == "POST" and action == "cancel":
+            if not self._batch_ended(batch):
+                batch["canceled"] = True
+                batch["ended_at"] = time.time()
+            await self._send_json(writer, 200, self._batch_object(batch))
+        else:
+            await self._send_not_found(writer, f"{method} {path} is not supported")
+    
+    def _create_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer every request of a new batch right away; the answers are released when the batch ends."""
+        results = []
+        for entry in body.get("requests", []):
+            self.requests.append(entry["params"])
+            try:
+                message = self.responder(entry["params"])
+            except Exception as e:
+                result = {"type": "errored", "error": {
+                    "type": "error", "error": {"type": "api_error", "message": str(e)}
+                }}
+            else:
+                result = {"type": "succeeded", "message": message}
+            results.append((entry["custom_id"], result))
+        
+        batch = {
+            "id": f"msgbatch_{uuid.uuid4().hex[:24]}",
+            "created_at": time.time(),
+            "ended_at": None,
+            "canceled": False,
+            "results": results
+        }
+        self.batches[batch["id"]] = batch
+        return batch
+    
+    def _batch_ended(self, batch: Dict[str, Any]) -> bool:
+        if batch["ended_at"] is None and time.time() - batch["created_at"] >= self.batch_latency:
+            batch["ended_at"] = time.time()
+        return batch["ended_at"] is not None
+    
+    def _batch_object(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        def timestamp(seconds: Optional[float]) -> Optional[str]:
+            if seconds is None:
+                return None
+            return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat()
+        
+        ended = self._batch_ended(batch)
+        counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        for _, result in batch["results"]:
+            if not ended:
+                counts["processing"] += 1
+            elif batch["canceled"]:
+                counts["canceled"] += 1
+            else:
+                counts[result["type"]] += 1
+        
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": counts,
+            "created_at": timestamp(batch["created_at"]),
+            "ended_at": timestamp(batch["ended_at"]),
+            "expires_at": timestamp(batch["created_at"] + 86400),
+            "archived_at": None,
+            "cancel_initiated_at": timestamp(batch["ended_at"]) if batch["canceled"] else None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch['id']}/results" if ended else None
+        }
+    
+    async def _send_fault(self, writer: asyncio.StreamWriter, status: int, headers: Dict[str, str]) -> None:
+        self.faults_sent += 1
+        if status == 0:
+            raise ConnectionResetError("injected connection drop")
+        await self._send_json(writer, status, {
+            "type": "error",
+            "error": {"type": ERROR_TYPES.get(status, "api_error"), "message": f"Injected {status} error"}
+        }, headers)
+    
+    async def _send_not_found(self, writer: asyncio.StreamWriter, message: str) -> None:
+        await self._send_json(writer, 404, {
+            "type": "error",
+            "error": {"type": "not_found_error", "message": message}
+        })
+    
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any],
+                         extra_headers: Optional[Dict[str, str]] = None) -> None:
+        await self._send_body(writer, status, json.dumps(payload).encode("utf-8"), "application/json", extra_headers)
+    
+    async def _send_body(self, writer: asyncio.StreamWriter, status: int, data: bytes, content_type: str,
+                         extra_headers: Optional[Dict[str, str]] = None) -> None:
+        head = [
+            f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(data)}",
+            f"request-id: req_{uuid.uuid4().hex[:24]}"
+        ]
+        for key, value in (extra_headers or {}).items():
+            head.append(f"{key}: {value}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+    
+    async def _send_stream(self, writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+        head = [
+            "HTTP/1.1 200 OK",
+            "Content-Type: text/event-stream",
+            "Transfer-Encoding: chunked",
+            f"request-id: req_{uuid.uuid4().hex[:24]}"
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        
+        async def send(event_type: str, data: Dict[str, Any]) -> None:
+            payload = f"event: {event_type}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+            writer.write(f"{len(payload):x}\r\n".encode("latin-1") + payload + b"\r\n")
+            await writer.drain()
+        
+        start = dict(message, content=[], stop_reason=None)
+        start["usage"] = dict(message["usage"], output_tokens=1)
+        await send("message_start", {"type": "message_start", "message": start})
+        
+        for index, block in enumerate(message["content"]):
+            if block["type"] == "text":
+                await send("content_block_start", {
+                    "type": "content_block_start", "index": index,
+                    "content_block": {"type": "text", "text": ""}
+                })
+                words = block["text"].split(" ")
+                for position, word in enumerate(words):
+                    if self.block_latency:
+                        await asyncio.sleep(self.block_latency / len(words))
+                    text = word if position == len(words) - 1 else word + " "
+                    await send("content_block_delta", {
+                        "type": "content_block_delta", "index": index,
+                        "delta": {"type": "text_delta", "text": text}
+                    })
+            else:
+                await send("content_block_start", {
+                    "type": "content_block_start", "index": index,
+                    "content_block": dict(block, input={})
+                })
+                if self.block_latency:
+                    await asyncio.sleep(self.block_latency)
+                await send("content_block_delta", {
+                    "type": "content_block_delta", "index": index,
+                    "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"])}
+                })
+            await send("content_block_stop", {"type": "content_block_stop", "index": index})
+        
+        await send("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+            "usage": {"output_tokens": message["usage"]["output_tokens"]}
+        })
+        await send("message_stop", {"type": "message_stop"})
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
@@ -0,0 +1,143 @@
+"""
+Run the offline benchmarks and collect their reports in one JSON file.
+
+Every benchmarks/bench_*.py runs in its own process with its default settings
+(or the names given with --only), and its JSON report is stored under its
+name together with the Python version, platform and git commit of the run:
+
+    {"suite": "benchmarks", "commit": ..., "python": ..., "platform": ...,
+     "started": ..., "results": {"toolsets": {...}, "telemetry": {...}, ...}}
+
+With --baseline, the numeric results are compared to an earlier report. Time
+and size metrics (keys ending in _ms, _us, _s, _kb, bytes, peak, retained, mean or pNN)
+that grew by more than --threshold are listed as regressions, those that
+shrank by more as improvements; the exit status is 1 if there are regressions.
+
+    python benchmarks/run_suite.py --only toolsets,telemetry --output results.json
+    python benchmarks/run_suite.py --only toolsets --baseline results.json --threshold 0.2
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict
+
+benchmarks_dir = Path(__file__).parent.absolute()
+project_root = benchmarks_dir.parent
+
+# Metrics where lower is better, matched on the last part of their key
+LOWER_IS_BETTER = ("_ms", "_us", "_s", "_kb", "bytes", "peak", "retained", "mean", "p50", "p95", "p99")
+
+
+def available_benchmarks() -> Dict[str, Path]:
+    return {path.stem[len("bench_"):]: path for path in sorted(benchmarks_dir.glob("bench_*.py"))}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=project_root,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(path: Path) -> Dict[str, Any]:
+    """Run one benchmark script and parse the JSON report it prints."""
+    completed = subprocess.run([sys.executable, str(path)], cwd=project_root, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+    output = completed.stdout
+    try:
+        return json.loads(output[output.index("{"):])
+    except ValueError:
+        return {"error": "no JSON report in the output"}
+
+
+def flatten(report: Any, prefix: str = "") -> Dict[str, float]:
+    """Map the dotted path of every numeric leaf of a report to its value."""
+    if isinstance(report, dict):
+        values = {}
+        for key, value in report.items():
+            values.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+        return values
+    if isinstance(report, (int, float)) and not isinstance(report, bool):
+        return {prefix: float(report)}
+    return {}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    """
+    Compare the numeric results of two suite runs.
+    
+    Args:
+        results: The "results" of this run
+        baseline: The "results" of the earlier run
+        threshold: Relative change (e.g. 0.1 for 10%) below which differences are ignored
+    
+    Returns:
+        Dictionary with the "regressions" and "improvements", each mapping a metric
+        to its baseline value, current value and relative change
+    """
+    current = flatten(results)
+    previous = flatten(baseline)
+    comparison = {"regressions": {}, "improvements": {}}
+    for key, value in sorted(current.items()):
+        if key not in previous or not key.rsplit(".", 1)[-1].endswith(LOWER_IS_BETTER):
+            continue
+        before = previous[key]
+        if before == 0:
+            continue
+        change = (value - before) / abs(before)
+        if abs(change) <= threshold:
+            continue
+        bucket = "regressions" if change > 0 else "improvements"
+        comparison[bucket][key] = {"baseline": before, "current": value, "change": round(change, 3)}
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", help="comma-separated benchmark names, e.g. toolsets,telemetry")
+    parser.add_argument("--output", help="write the suite report to this JSON file")
+    parser.add_argument("--baseline", help="an earlier suite report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported by --baseline")
+    args = parser.parse_args()
+    
+    benchmarks = available_benchmarks()
+    names = [name.strip() for name in args.only.split(",")] if args.only else list(benchmarks)
+    unknown = [name for name in names if name not in benchmarks]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)} (available: {', '.join(benchmarks)})")
+    
+    report = {
+        "suite": "benchmarks",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": datetime.datetime.now().isoformat(timespec="seconds"),
+        "results": {}
+    }
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        report["results"][name] = run_benchmark(benchmarks[name])
+    
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        shared = {name: result for name, result in baseline.get("results", {}).items() if name in report["results"]}
+        report["comparison"] = {"baseline_commit": baseline.get("commit"), "threshold": args.threshold}
+        report["comparison"].update(compare(report["results"], shared, args.threshold))
+    
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    print(output)
+    if args.baseline and report["comparison"]["regressions"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
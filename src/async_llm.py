@@ -0,0 +1,632 @@
+import asyncio
+import inspect
+import time
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, AsyncIterator, Callable
+
+from src.client import RetryPolicy, anthropic
+from src.conversation import Conversation, History
+from src.history import HistoryManager
+from src.llm import LLM, _SerialToolLane
+from src.rate_limiter import Priority, RateLimiter
+from src.routing import ModelRouter
+from src.telemetry import Span, TelemetrySink
+from src.token_counter import TokenCounter
+from src.response_cache import ResponseCache
+from src.tool_executor import ToolExecutor, ToolTimeoutError
+from src.tool_index import ToolIndex
+
+if TYPE_CHECKING:
+    from src.cassette import Cassette
+
+# Error of the streaming methods AsyncLLM inherits from LLM but cannot run on AsyncAnthropic
+_STREAMING_UNSUPPORTED = ("AsyncLLM.{method} is not supported: streaming needs the synchronous client. "
+                          "Use LLM for streaming, or await generate / generate_with_tools.")
+
+
+class _AsyncSerialToolLane(_SerialToolLane):
+    """The serial lane of an AsyncLLM turn, whose thread_safe=False tools also take turns on the event loop."""
+    
+    def __init__(self):
+        super().__init__()
+        # Created within the turn, so that it binds to the running event loop
+        self.turn = asyncio.Lock()
+
+
+class AsyncLLM(LLM):
+    """
+    An asyncio-native counterpart of LLM built on anthropic.AsyncAnthropic.
+    
+    Tool registration works exactly like LLM.register_tool. Tools may be plain
+    functions or `async def` coroutines; plain functions run in a thread pool
+    executor so they never block the event loop. generate and generate_with_tools
+    are coroutines returning the same result dictionaries as their LLM equivalents.
+    Streaming (generate(stream=True) and stream_with_tools) is only available on LLM.
+    """
+    
+    _asynchronous = True
+    
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 model: str = "claude-3-7-sonnet-20250219",
+                 max_tool_workers: int = 1,
+                 prompt_caching: bool = True,
+                 response_cache: Optional[ResponseCache] = None,
+                 history_manager: Optional[HistoryManager] = None,
+                 client_options: Optional[Dict[str, Any]] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 priority: Priority = "interactive",
+                 telemetry: Optional[TelemetrySink] = None,
+                 cassette: Optional["Cassette"] = None,
+                 token_counter: Optional[TokenCounter] = None,
+                 router: Optional[ModelRouter] = None,
+                 tool_index: Optional[ToolIndex] = None,
+                 tool_timeout: Optional[float] = None,
+                 tool_executor: Optional[ToolExecutor] = None):
+        """
+        Initialize the AsyncLLM with API key and default model.
+        
+        Args:
+            api_key: The API key for Anthropic. If None, will use ANTHROPIC_API_KEY from environment.
+            model: The model to use for generation. Defaults to claude-3-7-sonnet.
+            max_tool_workers: Maximum number of tool calls from one assistant turn that may run
+                concurrently. 1 (the default) runs them one after another.
+            prompt_caching: Whether to mark the tools, the system prompt and the end of the
+                conversation as prompt-cache breakpoints on every request.
+            response_cache: Optional ResponseCache that answers repeated requests without
+                calling the API (by default only requests with temperature 0).
+            history_manager: Optional HistoryManager that keeps the history passed to each
+                call under a token budget.
+            client_options: Optional connection settings (base_url, pool size, keep-alive,
+                timeouts) passed to get_client; instances with the same settings share a client.
+            retry_policy: How to retry rate-limited, overloaded and failed requests.
+                Defaults to RetryPolicy().
+            rate_limiter: Optional RateLimiter, shared by all instances using the same API key,
+                that queues requests to stay within the requests / input / output tokens per minute.
+            priority: Priority of this instance's requests in the rate limiter's queue:
+                "interactive", "default", "batch" or an int (lower is sooner). Local batches
+                always use "batch".
+            telemetry: Optional TelemetrySink that receives a span for every call ("llm.turn"),
+                API request ("llm.model_call") and tool execution ("llm.tool_call").
+                Defaults to a no-op sink.
+            cassette: Optional Cassette that records every API request and response, or
+                replays them instead of calling the API (and optionally stubs the tools).
+            token_counter: Optional TokenCounter that counts every request's input tokens
+                before it is sent, rejects requests that cannot fit in the context window,
+                adapts max_tokens and resends requests whose tool_use was cut off by max_tokens.
+            router: Optional ModelRouter that sends simple requests (e.g. tool loop follow-ups)
+                to a faster model and escalates them to `model` if the fast model fails.
+            tool_index: Optional ToolIndex that offers each tool-use call only the registered
+                tools relevant to its prompt, plus the tools already used in the conversation.
+            tool_timeout: Default timeout in seconds of the tools registered without one.
+                Coroutine tools are awaited with it; plain tools run on the "thread" backend
+                unless they choose another.
+            tool_executor: Optional ToolExecutor that runs the plain tools. Defaults to a new one.
+        """
+        super().__init__(api_key=api_key, model=model, max_tool_workers=max_tool_workers,
+                         prompt_caching=prompt_caching, response_cache=response_cache,
+                         history_manager=history_manager, client_options=client_options,
+                         retry_policy=retry_policy, rate_limiter=rate_limiter, priority=priority,
+                         telemetry=telemetry, cassette=cassette, token_counter=token_counter,
+                         router=router, tool_index=tool_index, tool_timeout=tool_timeout,
+                         tool_executor=tool_executor)
+    
+    async def _aexecute_tool_call(self, tool_call: Dict[str, Any], parent: Optional[Span] = None,
+                                  deadline: Optional[float] = None,
+                                  lane: Optional[_AsyncSerialToolLane] = None) -> tuple:
+        """
+        Execute a single tool call without blocking the event loop.
+        
+        Args:
+            tool_call: Dictionary with the tool "name", "input" and "id"
+            parent: Optional span of the call the tool runs in
+            deadline: Optional time.monotonic() of the turn's deadline, when the call is cancelled
+            lane: The turn's serial lane, which plain tools registered with thread_safe=False take turns on
+        
+        Returns:
+            A (tool_usage entry, tool_result content block) tuple
+        """
+        tool_name = tool_call["name"]
+        
+        with self._span("llm.tool_call", parent, tool=tool_name) as span:
+            stubbed = self._stubbed_tool_call(tool_call)
+            if stubbed is not None:
+                span.set(stubbed=True, is_error="error" in stubbed[0])
+                return stubbed
+            
+            if tool_name not in self.tools:
+                # Tool not found
+                span.set(is_error=True)
+                return self._tool_error(tool_call, f"Tool {tool_name} not found")
+        
+            tool_info = self.tools[tool_name]
+            tool_cache = tool_info["cache"]
+            cache_hit = False
+            input_dict = self._parse_tool_input(tool_call["input"])
+            invalid = self._invalid_tool_input(tool_name, tool_info, input_dict)
+            if invalid is not None:
+                span.set(is_error=True, invalid_input=True)
+                return self._tool_error(tool_call, invalid)
+            try:
+                tool_function = tool_info["function"]
+            
+                if inspect.iscoroutinefunction(tool_function):
+                    tool_function = self._atool_function(tool_info, deadline)
+                    if tool_cache is not None:
+                        tool_result, cache_hit = await tool_cache.acall(tool_function, input_dict)
+                    else:
+                        tool_result = await tool_function(**input_dict)
+                else:
+                    # Plain tools run on their backend, with their timeout and the turn's deadline
+                    tool_function = self._aplain_tool_function(tool_info, deadline, lane)
+                    if tool_cache is not None:
+                        call = tool_cache.acall(tool_function, input_dict)
+                    else:
+                        call = tool_function(**input_dict)
+                    if tool_info["thread_safe"] or lane is None:
+                        outcome = await call
+                    else:
+                        async with lane.turn:
+                            outcome = await call
+                    if tool_cache is not None:
+                        tool_result, cache_hit = outcome
+                    else:
+                        tool_result = outcome
+            except ToolTimeoutError as e:
+                return self._tool_timeout(tool_call, e, span)
+            except Exception as e:
+                # Handle tool execution errors
+                span.set(is_error=True)
+                return self._tool_error(tool_call, self._tool_exception(tool_name, e))
+        
+            usage, block = self._tool_success(tool_call, tool_result)
+            if tool_cache is not None:
+                self._record_cache_hit(usage, tool_cache, cache_hit, span)
+            return usage, block
+    
+    def _atool_function(self, tool_info: Dict[str, Any], deadline: Optional[float] = None) -> Callable:
+        """A coroutine tool's function, awaited for at most its timeout and until the turn's deadline."""
+        function, timeout = tool_info["function"], tool_info["timeout"]
+        if timeout is None and deadline is None:
+            return function
+        
+        async def call(**arguments):
+            limit, deadline_exceeded = timeout, False
+            if deadline is not None and (limit is None or deadline - time.monotonic() < limit):
+                limit, deadline_exceeded = max(0.0, deadline - time.monotonic()), True
+            try:
+                return await asyncio.wait_for(function(**arguments), limit)
+            except asyncio.TimeoutError:
+                raise ToolTimeoutError(timeout, deadline_exceeded)
+        
+        return call
+    
+    def _aplain_tool_function(self, tool_info: Dict[str, Any], deadline: Optional[float] = None,
+                              lane: Optional[_AsyncSerialToolLane] = None) -> Callable:
+        """
+        A plain tool's function as a coroutine function awaiting its ToolExecutor call.
+        
+        Thread backend calls are awaited on the executor's own future (see ToolExecutor.arun),
+        so they do not also hold a thread of the event loop's default executor.
+        """
+        function, backend, timeout = tool_info["function"], tool_info["backend"], tool_info["timeout"]
+        exclusive = lane.lock if lane is not None and not tool_info["thread_safe"] else None
+        executor = self.tool_executor
+        
+        async def call(**arguments):
+            return await executor.arun(function, arguments, backend, timeout, deadline, exclusive)
+        
+        return call
+    
+    async def _aexecute_tool_calls(self, tool_calls: List[Dict[str, Any]], parent: Optional[Span] = None,
+                                   deadline: Optional[float] = None,
+                                   lane: Optional[_AsyncSerialToolLane] = None) -> tuple:
+        """
+        Execute all tool calls from one assistant turn, at most max_tool_workers at a time.
+        
+        Args:
+            tool_calls: Tool calls in the order the model requested them
+            parent: Optional span of the call the tools run in
+            deadline: Optional time.monotonic() of the turn's deadline
+            lane: The turn's serial lane (see _aexecute_tool_call)
+        
+        Returns:
+            A (tool_usage entries, tool_result content blocks) tuple, in request order
+        """
+        if self.max_tool_workers == 1 or len(tool_calls) == 1:
+            outcomes = [await self._aexecute_tool_call(tool_call, parent, deadline, lane) for tool_call in tool_calls]
+        else:
+            semaphore = asyncio.Semaphore(self.max_tool_workers)
+            
+            async def bounded(tool_call):
+                async with semaphore:
+                    return await self._aexecute_tool_call(tool_call, parent, deadline, lane)
+            
+            outcomes = await asyncio.gather(*(bounded(tool_call) for tool_call in tool_calls))
+        
+        return [usage for usage, _ in outcomes], [block for _, block in outcomes]
+    
+    async def _apreflight(self, message_params: Dict[str, Any], span: Span) -> tuple:
+        """Coroutine version of LLM._preflight."""
+        if self.token_counter is None:
+            if message_params["max_tokens"] is None:
+                raise ValueError("max_tokens=None needs a token_counter to choose the limit")
+            return message_params, None
+        counts = self.token_counter.count(message_params)
+        if counts["near_limit"]:
+            try:
+                exact = await self.client.messages.count_tokens(**self.token_counter.exact_params(message_params))
+                counts = self.token_counter.record_exact(counts, exact.input_tokens)
+            except anthropic.APIError:
+                pass
+        return self._fit_max_tokens(message_params, counts, span), counts
+    
+    async def _asend_message(self, request_params: Dict[str, Any], usage: Optional[Dict[str, int]],
+                             priority: Optional[Priority], counts: Optional[Dict[str, Any]] = None,
+                             deadline: Optional[float] = None):
+        """Coroutine version of LLM._send_message."""
+        reservation = None
+        if self.rate_limiter is not None:
+            input_tokens = counts["input_tokens"] if counts is not None else None
+            reservation = await self.rate_limiter.aacquire(request_params, priority or self.priority, input_tokens)
+            if usage is not None:
+                usage["queue_wait"] += reservation["queue_wait"]
+        response = None
+        try:
+            response = await self.client.messages.create(**request_params, **self._request_timeout(deadline))
+        finally:
+            self._settle(reservation, response.usage if response is not None else None)
+        return response
+    
+    async def _asend_fitted(self, message_params: Dict[str, Any], usage: Dict[str, int],
+                            priority: Optional[Priority], span: Span, deadline: Optional[float] = None):
+        """Coroutine version of LLM._send_fitted."""
+        message_params, counts = await self._apreflight(message_params, span)
+        while True:
+            request_params = self._with_cache_control(message_params)
+            response = await self.retry_policy.acall(
+                lambda: self._asend_message(request_params, usage, priority, counts, deadline), usage, deadline
+            )
+            regrown = self._regrow_truncated(message_params, counts, response, usage)
+            if regrown is None:
+                return response
+            message_params = regrown
+    
+    async def _asend_routed(self, message_params: Dict[str, Any], usage: Dict[str, int],
+                            priority: Optional[Priority], span: Span, deadline: Optional[float] = None):
+        """Coroutine version of LLM._send_routed."""
+        started = time.perf_counter()
+        try:
+            response = await self._asend_fitted(message_params, usage, priority, span, deadline)
+        except anthropic.APIError:
+            if message_params["model"] == self.model:
+                self._check_routed(message_params, None, started)
+                raise
+            response = None
+        reason = self._check_routed(message_params, response, started)
+        if reason is None:
+            return response
+        
+        self._escalate(reason, response, usage, span)
+        message_params = dict(message_params, model=self.model)
+        started = time.perf_counter()
+        try:
+            response = await self._asend_fitted(message_params, usage, priority, span, deadline)
+        except anthropic.APIError:
+            self._check_routed(message_params, None, started)
+            raise
+        self._check_routed(message_params, response, started)
+        return response
+    
+    async def _acreate_message(self, message_params: Dict[str, Any], usage: Optional[Dict[str, int]] = None,
+                               priority: Optional[Priority] = None, parent: Optional[Span] = None,
+                               deadline: Optional[float] = None):
+        """
+        Send a Messages API request, answering it from the response cache if possible.
+        
+        Every attempt waits for the rate limiter (if any); transient errors are
+        retried according to the retry policy. With a router, the request may go to
+        the router's fast model and be escalated to the instance's model.
+        
+        Args:
+            message_params: The request parameters
+            usage: Optional usage tally that counts the retries and the queue wait
+            priority: Priority in the rate limiter's queue; defaults to the instance's
+            parent: Optional span of the call the request belongs to
+            deadline: Optional time.monotonic() of the turn's deadline, which ends the request
+                (raising the SDK's timeout error) and its retries
+        
+        Returns:
+            The API response
+        """
+        if usage is None:
+            usage = self._new_usage()
+        message_params, route = self._route(message_params, usage)
+        with self._span("llm.model_call", parent, model=message_params["model"], stream=False) as span:
+            if route is not None:
+                span.set(route=route)
+            key, response = self._cached_response(message_params)
+            if response is not None:
+                usage["cached_responses"] += 1
+                span.set(response_cached=True)
+                return response
+            
+            retries, queue_wait = usage["retries"], usage["queue_wait"]
+            if route is None:
+                response = await self._asend_fitted(message_params, usage, priority, span, deadline)
+            else:
+                response = await self._asend_routed(message_params, usage, priority, span, deadline)
+            self._store_response(key, response)
+            self._trace_response(span, response, usage, retries, queue_wait)
+            return response
+    
+    async def _acompact_history(self, history: List[Dict[str, Any]]) -> tuple:
+        """Coroutine version of LLM._compact_history."""
+        if self.history_manager is None:
+            return history, None
+        return await self.history_manager.acompact(self, history)
+    
+    async def generate(self,
+                       prompt: str,
+                       system: Optional[str] = None,
+                       max_tokens: Optional[int] = 1000,
+                       temperature: float = 1.0,
+                       history: Optional[History] = None,
+                       stream: bool = False) -> Dict[str, Any]:
+        """
+        Generate a response from the language model.
+        
+        Args:
+            prompt: The user prompt to send to the model
+            system: Optional system prompt to control model behavior
+            max_tokens: Maximum number of tokens to generate; None lets the token counter
+                choose it (see TokenCounter.max_tokens)
+            temperature: Controls randomness (0-1)
+            history: Optional conversation history from previous calls: the Conversation
+                returned in a previous result, or a list of messages
+            stream: Not supported; streaming is only available on LLM
+        
+        Returns:
+            Dictionary containing the response, token usage and updated conversation history
+        
+        Raises:
+            TypeError: If stream is True
+        """
+        if stream:
+            raise TypeError(_STREAMING_UNSUPPORTED.format(method="generate(stream=True)"))
+        if history is None:
+            history = []
+        history, compaction = await self._acompact_history(history)
+        
+        user_message = {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt
+                }
+            ]
+        }
+        conversation = Conversation.of(history)
+        conversation.append(user_message)
+        
+        message_params = {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": conversation.as_list()
+        }
+        
+        if system:
+            message_params["system"] = system
+        
+        usage = self._new_usage()
+        with self._span("llm.turn", method="generate", model=self.model) as turn:
+            response = await self._acreate_message(message_params, usage, parent=turn)
+            result = self._generate_result(conversation, response, usage)
+            return self._end_turn(turn, self._report_compaction(result, compaction), 1)
+    
+    def generate_batch(self,
+                       prompts: List[str],
+                       system: Optional[str] = None,
+                       max_tokens: int = 1000,
+                       temperature: float = 1.0,
+                       mode: str = "batch",
+                       max_workers: int = 8,
+                       batch_size: int = 10000,
+                       poll_interval: float = 1.0,
+                       max_poll_interval: float = 60.0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate responses for many independent prompts.
+        
+        Works like LLM.generate_batch but returns an async iterator; in "local" mode
+        at most max_workers requests are in flight at once on the event loop.
+        
+        Usage:
+            async for item in llm.generate_batch(prompts, temperature=0):
+                answers[item["index"]] = item.get("response")
+        
+        Args:
+            prompts: The user prompts, one request each
+            system: Optional system prompt shared by all requests
+            max_tokens: Maximum number of tokens to generate per request
+            temperature: Controls randomness (0-1)
+            mode: "batch" for the Message Batches API, "local" for concurrent regular requests
+            max_workers: Maximum number of concurrent requests in local mode
+            batch_size: Maximum number of requests per message batch
+            poll_interval: Initial seconds between status checks of running batches
+            max_poll_interval: Maximum seconds between status checks
+        
+        Returns:
+            An async iterator of result dictionaries, see LLM.generate_batch
+        """
+        if mode not in ("batch", "local"):
+            raise ValueError(f"Unknown batch mode: {mode!r}. Use 'batch' or 'local'.")
+        
+        requests = [
+            (index, self._batch_params(prompt, system, max_tokens, temperature))
+            for index, prompt in enumerate(prompts)
+        ]
+        if mode == "local":
+            return self._alocal_batch(requests, max_workers)
+        return self._amessage_batches(requests, batch_size, poll_interval, max_poll_interval)
+    
+    async def _alocal_batch(self, requests: List[tuple], max_workers: int) -> AsyncIterator[Dict[str, Any]]:
+        """Async generator behind generate_batch(mode="local")."""
+        semaphore = asyncio.Semaphore(max(1, max_workers))
+        
+        async def run(index, message_params):
+            async with semaphore:
+                usage = self._new_usage()
+                try:
+                    response = await self._acreate_message(message_params, usage, priority="batch")
+                except Exception as e:
+                    return self._batch_item(index, message_params, error=str(e))
+                return self._batch_item(index, message_params, response, usage=usage)
+        
+        tasks = [asyncio.ensure_future(run(index, message_params)) for index, message_params in requests]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Don't send the remaining requests if the caller stopped early
+            for task in tasks:
+                task.cancel()
+    
+    async def _amessage_batches(self, requests: List[tuple], batch_size: int,
+                                poll_interval: float, max_poll_interval: float) -> AsyncIterator[Dict[str, Any]]:
+        """Async generator behind generate_batch(mode="batch")."""
+        cached_items, pending = self._pending_batch_requests(requests)
+        for item in cached_items:
+            yield item
+        
+        batches = self.client.messages.batches
+        running = []
+        try:
+            for chunk in self._batch_chunks(pending, batch_size):
+                batch = await self.retry_policy.acall(lambda: batches.create(requests=chunk))
+                running.append(batch.id)
+            
+            interval = poll_interval
+            while running:
+                for batch_id in list(running):
+                    batch = await self.retry_policy.acall(lambda: batches.retrieve(batch_id))
+                    if batch.processing_status != "ended":
+                        continue
+                    running.remove(batch_id)
+                    async for entry in await self.retry_policy.acall(lambda: batches.results(batch_id)):
+                        item = self._batch_result_item(pending, entry)
+                        if item is not None:
+                            yield item
+                if running:
+                    await asyncio.sleep(interval)
+                    interval = min(interval * 2, max_poll_interval)
+        finally:
+            # Don't leave batches running if the caller stopped early
+            for batch_id in running:
+                try:
+                    await batches.cancel(batch_id)
+                except anthropic.APIError:
+                    pass
+    
+    async def generate_with_tools(self,
+                                  prompt: str,
+                                  system: Optional[str] = None,
+                                  max_tokens: Optional[int] = 1000,
+                                  temperature: float = 0.7,
+                                  max_iterations: int = 5,
+                                  history: Optional[History] = None,
+                                  timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Generate a response with tool use capability.
+        
+        Args:
+            prompt: The user prompt to send to the model
+            system: Optional system prompt to control model behavior
+            max_tokens: Maximum number of tokens to generate; None lets the token counter
+                choose it (see TokenCounter.max_tokens)
+            temperature: Controls randomness (0-1)
+            max_iterations: Maximum number of tool use iterations
+            history: Optional conversation history from previous calls: the Conversation
+                returned in a previous result, or a list of messages
+            timeout: Optional seconds the whole call may take (see LLM.generate_with_tools)
+        
+        Returns:
+            Dictionary containing the final response, tool usage history, token usage, and updated conversation history
+        """
+        if not self.tools:
+            # If no tools are registered, fall back to regular generation
+            return await self.generate(prompt, system, max_tokens, temperature, history)
+        
+        if history is None:
+            history = []
+        history, compaction = await self._acompact_history(history)
+        tools = self._tool_definitions(prompt, history)
+        
+        conversation = Conversation.of(history)
+        conversation.add_user(prompt)
+        
+        tool_usage = []
+        usage = self._new_usage()
+        iterations = 0
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        lane = _AsyncSerialToolLane()
+        
+        with self._span("llm.turn", method="generate_with_tools", model=self.model) as turn:
+            while iterations < max_iterations:
+                if iterations and self._deadline_passed(deadline):
+                    break
+                iterations += 1
+            
+                message_params = {
+                    "model": self.model,
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                    "messages": conversation.as_list(),
+                    "tools": tools
+                }
+            
+                if system:
+                    message_params["system"] = system
+            
+                response = await self._acreate_message(message_params, usage, parent=turn, deadline=deadline)
+                self._add_usage(usage, response.usage)
+            
+                tool_calls = self._extract_tool_calls(response)
+                conversation.append({
+                    "role": "assistant",
+                    "content": response.content
+                })
+            
+                if not tool_calls:
+                    return self._end_turn(turn, self._report_compaction({
+                        "response": self._extract_text(response),
+                        "tool_usage": tool_usage,
+                        "history": conversation,
+                        "usage": usage
+                    }, compaction), iterations)
+            
+                turn_usage, tool_results = await self._aexecute_tool_calls(tool_calls, turn, deadline, lane)
+                tool_usage.extend(turn_usage)
+                conversation.append({
+                    "role": "user",
+                    "content": tool_results
+                })
+                tools = self._expand_tools(tools, tool_calls)
+        
+            return self._end_turn(turn, self._report_compaction({
+                "response": self._extract_text(response),
+                "tool_usage": tool_usage,
+                "history": conversation,
+                "usage": usage,
+                "warning": self._loop_warning(deadline)
+            }, compaction), iterations)
+    
+    def stream_with_tools(self, *args, **kwargs):
+        """
+        Not supported: streaming is only available on LLM.
+        
+        Raises:
+            TypeError: Always
+        """
+        raise TypeError(_STREAMING_UNSUPPORTED.format(method="stream_with_tools"))
@@ -0,0 +1,407 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+# Response headers that describe the transfer rather than the response; bodies are stored decoded
+_TRANSFER_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection", "keep-alive", "date"}
+
+# Body chunks that arrive closer together than this are stored as one
+_CHUNK_MERGE_SECONDS = 0.001
+
+
+def interaction_key(method: str, path: str, body: bytes) -> str:
+    """
+    Hash a request for matching it against a cassette.
+    
+    JSON bodies are canonicalized (sorted keys, no whitespace) first, so the key
+    does not depend on how the SDK serialized them. The host is not part of the
+    key, so a cassette recorded against the API replays against any base_url.
+    
+    Args:
+        method: The HTTP method
+        path: The URL path, e.g. "/v1/messages"
+        body: The request body
+    
+    Returns:
+        A hex sha256 digest
+    """
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        pass
+    digest = hashlib.sha256(f"{method} {path}\n".encode("utf-8"))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_cassette(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read the interactions recorded in a cassette file.
+    
+    Args:
+        path: The cassette file (JSON Lines, gzip-compressed if it ends in .gz)
+    
+    Returns:
+        An iterator of interaction dictionaries, in the order they completed
+    """
+    with _open(path, "rt") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _request_summary(body: bytes) -> Optional[Dict[str, Any]]:
+    """The parts of a Messages request kept in the cassette: the model and the newest message."""
+    try:
+        params = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(params, dict) or not params.get("messages"):
+        return None
+    return {
+        "model": params.get("model"),
+        "message_count": len(params["messages"]),
+        "last_message": params["messages"][-1]
+    }
+
+
+class _RecordingStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Passes a response body through while noting when each chunk arrived."""
+    
+    def __init__(self, stream, started: float, finish):
+        self.stream = stream
+        self.started = started
+        self.finish = finish
+        self.chunks: List[list] = []
+        self._finished = False
+    
+    def _add(self, chunk: bytes) -> None:
+        offset = time.monotonic() - self.started
+        text = chunk.decode("utf-8", errors="surrogateescape")
+        if self.chunks and offset - self.chunks[-1][0] < _CHUNK_MERGE_SECONDS:
+            self.chunks[-1][1] += text
+        else:
+            self.chunks.append([round(offset, 6), text])
+    
+    def _done(self) -> None:
+        if not self._finished:
+            self._finished = True
+            self.finish(self.chunks)
+    
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self.stream:
+            self._add(chunk)
+            yield chunk
+    
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self._add(chunk)
+            yield chunk
+    
+    def close(self) -> None:
+        try:
+            self.stream.close()
+        finally:
+            self._done()
+    
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            self._done()
+
+
+class _ReplayStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Plays back recorded body chunks at their recorded offsets, divided by speed."""
+    
+    def __init__(self, chunks: List[list], started: float, speed: float):
+        self.chunks = chunks
+        self.started = started
+        self.speed = speed
+    
+    def _delay(self, offset: float) -> float:
+        if not self.speed:
+            return 0.0
+        return self.started + offset / self.speed - time.monotonic()
+    
+    def __iter__(self) -> Iterator[bytes]:
+        for offset, text in self.chunks:
+            delay = self._delay(offset)
+            if delay > 0:
+                time.sleep(delay)
+            yield text.encode("utf-8", errors="surrogateescape")
+    
+    async def __aiter__(self):
+        for offset, text in self.chunks:
+            delay = self._delay(offset)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield text.encode("utf-8", errors="surrogateescape")
+
+
+class _CassetteTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """An httpx transport that records through another transport or replays from a cassette."""
+    
+    def __init__(self, cassette: "Cassette", inner=None):
+        self.cassette = cassette
+        self.inner = inner
+    
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        started = time.monotonic()
+        if self.cassette.mode == "record":
+            request.headers["accept-encoding"] = "identity"
+            response = self.inner.handle_request(request)
+            return self.cassette._recording_response(request, body, response, started)
+        
+        interaction = self.cassette._lookup(request, body)
+        if interaction is None:
+            return self.cassette._miss_response(request)
+        delay = self.cassette._delay(interaction, started)
+        if delay > 0:
+            time.sleep(delay)
+        return self.cassette._replay_response(interaction, started)
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        started = time.monotonic()
+        if self.cassette.mode == "record":
+            request.headers["accept-encoding"] = "identity"
+            response = await self.inner.handle_async_request(request)
+            return self.cassette._recording_response(request, body, response, started)
+        
+        interaction = self.cassette._lookup(request, body)
+        if interaction is None:
+            return self.cassette._miss_response(request)
+        delay = self.cassette._delay(interaction, started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self.cassette._replay_response(interaction, started)
+    
+    def close(self) -> None:
+        if self.inner is not None:
+            self.inner.close()
+    
+    async def aclose(self) -> None:
+        if self.inner is not None:
+            await self.inner.aclose()
+
+
+class Cassette:
+    """
+    Records API traffic to a file, or replays it without calling the API.
+    
+    In "record" mode every request an LLM / AsyncLLM sends goes to the API as
+    usual, and the response is appended to the cassette as one JSON line: the
+    request hash, the status, headers and body, when the headers and each body
+    chunk arrived, and a summary of the request (model, message count and the
+    newest message). Streaming responses keep their event timing, so replays
+    reproduce time-to-first-token. Files ending in .gz are gzip-compressed.
+    
+    In "replay" mode requests are answered from the cassette, matched by the hash
+    of their method, path and body. A request recorded several times gets its
+    recordings in order. Responses are delayed like the originals, divided by
+    speed (0 replays without any delay). With strict=False, a request that was
+    not recorded (e.g. because a live tool returned a different result) gets the
+    next unplayed recording for the same endpoint; otherwise it fails with a 404
+    error. With stub_tools=True, tool calls are not executed: their results are
+    taken from the tool_result blocks of the recorded requests.
+    
+    Usage:
+        recorder = Cassette("traffic.jsonl.gz", mode="record")
+        LLM(cassette=recorder).generate_with_tools("What's the weather in Paris?")
+        recorder.close()
+        
+        replay = Cassette("traffic.jsonl.gz", speed=10, stub_tools=True)
+        LLM(cassette=replay).generate_with_tools("What's the weather in Paris?")
+        replay.stats()
+    """
+    
+    def __init__(self,
+                 path: str,
+                 mode: str = "replay",
+                 speed: float = 1.0,
+                 stub_tools: bool = False,
+                 strict: bool = False):
+        """
+        Open a cassette.
+        
+        Args:
+            path: The cassette file; record mode appends to it
+            mode: "record" or "replay"
+            speed: Replay speed: 1 keeps the recorded timing, 10 is ten times faster,
+                0 answers immediately
+            stub_tools: In replay mode, answer tool calls with their recorded results
+                instead of running the tools
+            strict: In replay mode, fail requests that were not recorded instead of
+                answering them with the next recording for the same endpoint
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode!r}. Use 'record' or 'replay'.")
+        if speed < 0:
+            raise ValueError("speed must not be negative")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.stub_tools = stub_tools
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._opened = time.monotonic()
+        self._file = None
+        self._recorded = 0
+        self._by_key: Dict[str, deque] = {}
+        self._unplayed: Dict[str, deque] = {}
+        self._tool_results: Dict[str, Dict[str, Any]] = {}
+        self._counts = {"exact": 0, "fallback": 0, "misses": 0}
+        
+        if mode == "record":
+            self._file = _open(path, "at")
+            return
+        self.interactions = list(read_cassette(path))
+        for interaction in self.interactions:
+            interaction["played"] = False
+            self._by_key.setdefault(interaction["key"], deque()).append(interaction)
+            self._unplayed.setdefault(f"{interaction['method']} {interaction['path']}", deque()).append(interaction)
+            request = interaction.get("request") or {}
+            content = (request.get("last_message") or {}).get("content")
+            if isinstance(content, list):
+                for block in content:
+                    if isinstance(block, dict) and block.get("type") == "tool_result":
+                        self._tool_results[block["tool_use_id"]] = block
+    
+    def transport(self, asynchronous: bool = False, limits: Optional[httpx.Limits] = None):
+        """
+        Build the httpx transport that get_client installs for this cassette.
+        
+        Args:
+            asynchronous: Build a transport for an async client
+            limits: Connection pool limits of the network transport used for recording
+        
+        Returns:
+            An httpx transport
+        """
+        inner = None
+        if self.mode == "record":
+            limits = limits or httpx.Limits()
+            inner = httpx.AsyncHTTPTransport(limits=limits) if asynchronous else httpx.HTTPTransport(limits=limits)
+        return _CassetteTransport(self, inner)
+    
+    def _recording_response(self, request: httpx.Request, body: bytes, response: httpx.Response,
+                            started: float) -> httpx.Response:
+        headers_at = time.monotonic() - started
+        
+        def finish(chunks: List[list]) -> None:
+            self._record({
+                "key": interaction_key(request.method, request.url.path, body),
+                "method": request.method,
+                "path": request.url.path,
+                "started": round(started - self._opened, 6),
+                "status": response.status_code,
+                "headers": {
+                    name: value for name, value in response.headers.items()
+                    if name.lower() not in _TRANSFER_HEADERS
+                },
+                "headers_at": round(headers_at, 6),
+                "chunks": chunks,
+                "request": _request_summary(body)
+            })
+        
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, started, finish),
+            extensions=response.extensions
+        )
+    
+    def _record(self, interaction: Dict[str, Any]) -> None:
+        line = json.dumps(interaction, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None or self._file.closed:
+                return
+            self._file.write(line)
+            self._file.flush()
+            self._recorded += 1
+    
+    def _lookup(self, request: httpx.Request, body: bytes) -> Optional[Dict[str, Any]]:
+        key = interaction_key(request.method, request.url.path, body)
+        with self._lock:
+            recorded = self._by_key.get(key)
+            if recorded:
+                interaction = recorded.popleft() if len(recorded) > 1 else recorded[0]
+                self._counts["exact"] += 1
+            else:
+                interaction = None
+                if not self.strict:
+                    unplayed = self._unplayed.get(f"{request.method} {request.url.path}", deque())
+                    while unplayed and unplayed[0]["played"]:
+                        unplayed.popleft()
+                    if unplayed:
+                        interaction = unplayed.popleft()
+                        self._counts["fallback"] += 1
+                if interaction is None:
+                    self._counts["misses"] += 1
+                    return None
+            interaction["played"] = True
+            return interaction
+    
+    def _delay(self, interaction: Dict[str, Any], started: float) -> float:
+        """Seconds left to wait before the replayed response headers are returned."""
+        if not self.speed:
+            return 0.0
+        return started + interaction["headers_at"] / self.speed - time.monotonic()
+    
+    def _replay_response(self, interaction: Dict[str, Any], started: float) -> httpx.Response:
+        return httpx.Response(
+            status_code=interaction["status"],
+            headers=interaction["headers"],
+            stream=_ReplayStream(interaction["chunks"], started, self.speed)
+        )
+    
+    def _miss_response(self, request: httpx.Request) -> httpx.Response:
+        message = f"No recorded response for {request.method} {request.url.path} in cassette {self.path}"
+        return httpx.Response(404, json={"type": "error", "error": {"type": "not_found_error", "message": message}})
+    
+    def tool_result(self, tool_use_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the recorded tool_result block for a tool call.
+        
+        Args:
+            tool_use_id: The id of the tool_use block
+        
+        Returns:
+            The tool_result content block, or None if the cassette has none for it
+        """
+        return self._tool_results.get(tool_use_id)
+    
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cassette counters.
+        
+        Returns:
+            In record mode, the number of "recorded" interactions. In replay mode, the
+            number of "interactions" in the file and how many requests were answered by an
+            "exact" match, by a "fallback" to the next recording or not at all ("misses").
+        """
+        with self._lock:
+            if self.mode == "record":
+                return {"recorded": self._recorded}
+            return {"interactions": len(self.interactions), **self._counts}
+    
+    def close(self) -> None:
+        """Finish writing the cassette; requests still streaming afterwards are not recorded."""
+        with self._lock:
+            if self._file is not None and not self._file.closed:
+                self._file.close()
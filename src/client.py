@@ -0,0 +1,279 @@
+import os
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional, TypeVar, Union
+
+from src.lazy_import import LazyModule
+
+if TYPE_CHECKING:
+    from src.cassette import Cassette
+
+# The SDK (and httpx with it) is imported when the first client is created
+anthropic = LazyModule("anthropic")
+httpx = LazyModule("httpx")
+# Only the asynchronous clients need asyncio, so synchronous programs never import it
+asyncio = LazyModule("asyncio")
+
+T = TypeVar("T")
+
+# Clients shared by every LLM / AsyncLLM instance in the process, keyed by their settings
+_clients: Dict[tuple, Union["anthropic.Anthropic", "anthropic.AsyncAnthropic"]] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key: str,
+               base_url: Optional[str] = None,
+               asynchronous: bool = False,
+               max_connections: int = 100,
+               max_keepalive_connections: int = 20,
+               keepalive_expiry: float = 30.0,
+               connect_timeout: float = 5.0,
+               read_timeout: float = 600.0,
+               write_timeout: float = 30.0,
+               pool_timeout: float = 10.0,
+               cassette: Optional["Cassette"] = None) -> Union["anthropic.Anthropic", "anthropic.AsyncAnthropic"]:
+    """
+    Get the process-wide Anthropic client for a set of connection settings.
+    
+    Every call with the same arguments returns the same client, so all LLM
+    instances share one connection pool. Asynchronous clients are also keyed by
+    the running event loop (if any), since their connections belong to the loop
+    that opened them; the clients of loops that have been closed since are
+    dropped whenever a new client is created, so every asyncio.run() does not
+    leave one behind. The SDK's own retries are disabled; the LLM classes retry
+    through a RetryPolicy instead.
+    
+    Args:
+        api_key: The API key
+        base_url: Optional API base URL, e.g. a local stub server
+        asynchronous: Return an AsyncAnthropic client instead of an Anthropic one
+        max_connections: Maximum number of open connections
+        max_keepalive_connections: Maximum number of idle connections kept open
+        keepalive_expiry: Seconds an idle connection is kept open
+        connect_timeout: Seconds to wait for a connection to be established
+        read_timeout: Seconds to wait for each chunk of the response
+        write_timeout: Seconds to wait for each chunk of the request to be sent
+        pool_timeout: Seconds to wait for a free connection from the pool
+        cassette: Optional Cassette that records the client's traffic or replays it
+            instead of using the network
+    
+    Returns:
+        The shared client
+    """
+    loop = None
+    if asynchronous:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+    key = (api_key, base_url, asynchronous, loop, max_connections, max_keepalive_connections,
+           keepalive_expiry, connect_timeout, read_timeout, write_timeout, pool_timeout, cassette)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            _forget_closed_loops()
+            limits = httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            )
+            timeout = httpx.Timeout(
+                connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout
+            )
+            http_options = {"limits": limits, "timeout": timeout}
+            if cassette is not None:
+                http_options["transport"] = cassette.transport(asynchronous, limits)
+            if asynchronous:
+                client = anthropic.AsyncAnthropic(
+                    api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0,
+                    http_client=anthropic.DefaultAsyncHttpxClient(**http_options)
+                )
+            else:
+                client = anthropic.Anthropic(
+                    api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0,
+                    http_client=anthropic.DefaultHttpxClient(**http_options)
+                )
+            _clients[key] = client
+        return client
+
+
+def _forget_closed_loops() -> None:
+    """Drop the asynchronous clients whose event loop is closed (lock held)."""
+    for key in [key for key in _clients if key[3] is not None and key[3].is_closed()]:
+        del _clients[key]
+
+
+def close_clients() -> None:
+    """Close the shared synchronous clients and forget all shared clients."""
+    with _clients_lock:
+        for client in _clients.values():
+            if isinstance(client, anthropic.Anthropic):
+                client.close()
+        _clients.clear()
+
+
+def _forget_clients_after_fork() -> None:
+    """A forked process (e.g. a PreforkServer worker) must not share the parent's connection pools."""
+    global _clients_lock
+    _clients_lock = threading.Lock()
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_clients_after_fork)
+
+
+class RetryPolicy:
+    """
+    Retries Messages API calls that failed with a transient error.
+    
+    Rate limits (429), overload (529), server errors and dropped connections are
+    retried with exponential backoff and full jitter. A retry-after header from
+    the server takes precedence over the computed delay, and an x-should-retry
+    header overrides the status-based decision, as the API documents.
+    
+    Usage:
+        llm = LLM(retry_policy=RetryPolicy(max_retries=6, max_backoff=60))
+        result = llm.generate("Hello")
+        result["usage"]["retries"]
+    """
+    
+    RETRY_STATUSES = (408, 409, 429, 500, 502, 503, 504, 529)
+    
+    def __init__(self,
+                 max_retries: int = 4,
+                 initial_backoff: float = 0.5,
+                 max_backoff: float = 30.0,
+                 jitter: bool = True,
+                 max_retry_after: float = 60.0):
+        """
+        Initialize the policy.
+        
+        Args:
+            max_retries: Maximum number of retries per call; 0 disables retrying
+            initial_backoff: Delay before the first retry, doubled for every further retry
+            max_backoff: Maximum delay computed by the backoff
+            jitter: Wait a random delay between 0 and the backoff ("full jitter")
+            max_retry_after: Upper bound for delays requested through retry-after headers
+        """
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.max_retry_after = max_retry_after
+    
+    def should_retry(self, error: Exception) -> bool:
+        """
+        Decide whether a failed call may be retried.
+        
+        Args:
+            error: The exception raised by the call
+        
+        Returns:
+            True if the error is transient
+        """
+        if isinstance(error, anthropic.APIStatusError):
+            should_retry = error.response.headers.get("x-should-retry")
+            if should_retry in ("true", "false"):
+                return should_retry == "true"
+            return error.status_code in self.RETRY_STATUSES
+        return isinstance(error, anthropic.APIConnectionError)
+    
+    def _retry_after(self, error: Exception) -> Optional[float]:
+        """The delay the server asked for, in seconds, if any."""
+        if not isinstance(error, anthropic.APIStatusError):
+            return None
+        headers = error.response.headers
+        try:
+            if "retry-after-ms" in headers:
+                return float(headers["retry-after-ms"]) / 1000
+            if "retry-after" in headers:
+                value = headers["retry-after"]
+                try:
+                    return float(value)
+                except ValueError:
+                    from email.utils import parsedate_to_datetime
+                    date = parsedate_to_datetime(value)
+                    return date.timestamp() - time.time()
+        except (TypeError, ValueError):
+            pass
+        return None
+    
+    def delay(self, retry: int, error: Exception) -> float:
+        """
+        Compute how long to wait before a retry.
+        
+        Args:
+            retry: The number of the retry, starting at 0
+            error: The exception raised by the failed call
+        
+        Returns:
+            The delay in seconds
+        """
+        retry_after = self._retry_after(error)
+        if retry_after is not None and retry_after >= 0:
+            return min(retry_after, self.max_retry_after)
+        backoff = min(self.max_backoff, self.initial_backoff * (2 ** retry))
+        return random.uniform(0, backoff) if self.jitter else backoff
+    
+    def _retry_delay(self, retry: int, error: Exception, deadline: Optional[float]) -> Optional[float]:
+        """The delay before retrying a failed call, or None if it must not be retried."""
+        if retry >= self.max_retries or not self.should_retry(error):
+            return None
+        delay = self.delay(retry, error)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+    
+    def call(self, function: Callable[[], T], usage: Optional[Dict[str, Any]] = None,
+             deadline: Optional[float] = None) -> T:
+        """
+        Call a function, retrying it after transient errors.
+        
+        Args:
+            function: The API call to make
+            usage: Optional usage tally; its "retries" entry is incremented for every retry
+            deadline: Optional time.monotonic() after which no retry is started
+        
+        Returns:
+            The function's result
+        """
+        retry = 0
+        while True:
+            try:
+                return function()
+            except Exception as e:
+                delay = self._retry_delay(retry, e, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+            retry += 1
+            if usage is not None:
+                usage["retries"] = usage.get("retries", 0) + 1
+    
+    async def acall(self, function: Callable[[], Awaitable[T]], usage: Optional[Dict[str, Any]] = None,
+                    deadline: Optional[float] = None) -> T:
+        """
+        Coroutine version of call.
+        
+        Args:
+            function: Returns the awaitable API call to make
+            usage: Optional usage tally; its "retries" entry is incremented for every retry
+            deadline: Optional time.monotonic() after which no retry is started
+        
+        Returns:
+            The awaited result
+        """
+        retry = 0
+        while True:
+            try:
+                return await function()
+            except Exception as e:
+                delay = self._retry_delay(retry, e, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            retry += 1
+            if usage is not None:
+                usage["retries"] = usage.get("retries", 0) + 1
@@ -0,0 +1,186 @@
+import threading
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+
+def compact_block(block: Any) -> Dict[str, Any]:
+    """
+    Convert a content block to the plain dictionary the Messages API accepts.
+    
+    SDK model objects (e.g. the TextBlock and ToolUseBlock instances in
+    response.content) are dumped without their unset fields; plain dictionaries
+    are returned unchanged.
+    
+    Args:
+        block: An SDK content block or a dictionary
+    
+    Returns:
+        The block as a dictionary
+    """
+    if isinstance(block, dict):
+        return block
+    if block.type == "text":
+        return {"type": "text", "text": block.text}
+    if block.type == "tool_use":
+        return {"type": "tool_use", "id": block.id, "name": block.name, "input": block.input}
+    return block.model_dump(mode="json", exclude_none=True)
+
+
+def compact_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a message whose content blocks are plain dictionaries."""
+    content = message["content"]
+    if isinstance(content, str) or all(isinstance(block, dict) for block in content):
+        return message
+    return {"role": message["role"], "content": [compact_block(block) for block in content]}
+
+
+class Conversation(Sequence):
+    """
+    An append-only list of messages with cheap forks.
+    
+    Forks share the messages they have in common. A conversation owns a slice
+    of a buffer list (the first _length entries) and may sit on top of a
+    read-only parent that holds the earlier messages. fork() is O(1): the fork
+    shares the buffer and parent. The first fork to append extends the shared
+    buffer in place, so appends are amortized O(1). A fork that appends after
+    another fork already did keeps its current messages as its parent and
+    starts a new buffer, so no messages are copied either way.
+    
+    Messages are stored as plain dictionaries; SDK content blocks are converted
+    on append. Stored messages must not be modified.
+    
+    Usage:
+        result = llm.generate_with_tools("What's the weather in Paris?")
+        history = result["history"]  # a Conversation
+        rome = llm.generate_with_tools("And in Rome?", history=history)
+        london = llm.generate_with_tools("And in London?", history=history)  # shares the prefix
+    """
+    
+    # Makes the check-and-append in append() atomic for forks used from different threads
+    _append_lock = threading.Lock()
+    # Parent chains longer than this are flattened into one list on the next divergence
+    _max_depth = 16
+    
+    def __init__(self, messages: Optional[Iterable[Dict[str, Any]]] = None):
+        """
+        Initialize the conversation.
+        
+        Args:
+            messages: Optional messages to start with, e.g. a history list from an earlier call
+        """
+        self._parent: Optional[Conversation] = None
+        self._offset = 0
+        self._depth = 0
+        self._buffer: List[Dict[str, Any]] = [compact_message(message) for message in messages or ()]
+        self._length = len(self._buffer)
+    
+    @classmethod
+    def of(cls, history: Union["Conversation", Iterable[Dict[str, Any]], None]) -> "Conversation":
+        """
+        Get a conversation for the history passed to a call.
+        
+        A Conversation is forked, so the caller's conversation is never extended;
+        a list (or None) is converted.
+        
+        Args:
+            history: A Conversation, a list of messages or None
+        
+        Returns:
+            A Conversation the call may append to
+        """
+        if isinstance(history, Conversation):
+            return history.fork()
+        return cls(history)
+    
+    def __len__(self) -> int:
+        return self._offset + self._length
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.as_list()[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("conversation index out of range")
+        if index < self._offset:
+            return self._parent[index]
+        return self._buffer[index - self._offset]
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        if self._parent is not None:
+            yield from self._parent
+        buffer = self._buffer
+        for index in range(self._length):
+            yield buffer[index]
+    
+    def __repr__(self) -> str:
+        return f"Conversation({len(self)} messages)"
+    
+    def append(self, message: Dict[str, Any]) -> None:
+        """
+        Append a message.
+        
+        Args:
+            message: A message dictionary with "role" and "content"
+        """
+        message = compact_message(message)
+        with self._append_lock:
+            if len(self._buffer) != self._length:
+                # Another fork has appended to the shared buffer
+                self._diverge()
+            self._buffer.append(message)
+            self._length += 1
+    
+    def _diverge(self) -> None:
+        """Move the current messages into a read-only parent and start an empty buffer."""
+        if self._depth >= self._max_depth:
+            self._buffer = list(self)
+            self._length = len(self._buffer)
+            self._parent, self._offset, self._depth = None, 0, 0
+            return
+        parent = self.fork()
+        self._parent, self._offset, self._depth = parent, len(parent), parent._depth + 1
+        self._buffer = []
+        self._length = 0
+    
+    def add_user(self, content: Union[str, List[Any]]) -> None:
+        """Append a user message."""
+        self.append({"role": "user", "content": content})
+    
+    def add_assistant(self, content: Union[str, List[Any]]) -> None:
+        """Append an assistant message."""
+        self.append({"role": "assistant", "content": content})
+    
+    def fork(self) -> "Conversation":
+        """
+        Create a conversation that shares all current messages with this one.
+        
+        Returns:
+            A new Conversation; appending to either one does not affect the other
+        """
+        fork = Conversation.__new__(Conversation)
+        fork._parent = self._parent
+        fork._offset = self._offset
+        fork._depth = self._depth
+        fork._buffer = self._buffer
+        fork._length = self._length
+        return fork
+    
+    def as_list(self) -> List[Dict[str, Any]]:
+        """
+        Return the messages for the "messages" request parameter.
+        
+        For a conversation without a parent whose buffer no other fork has
+        extended, this is the buffer itself, so sending a request does not copy
+        the history. The list must be treated as read-only and not kept beyond
+        the request.
+        """
+        if self._parent is None:
+            if len(self._buffer) == self._length:
+                return self._buffer
+            return self._buffer[:self._length]
+        return list(self)
+
+
+# The history argument accepted by LLM and AsyncLLM calls
+History = Union[Conversation, List[Dict[str, Any]]]
@@ -0,0 +1,281 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.token_counter import TokenCounter
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below so that it can replace the original messages. "
+    "Keep names, numbers, identifiers, decisions, tool results the assistant relied on "
+    "and open questions. Write plain prose, no preamble."
+)
+
+
+def _block_dict(block: Any) -> Dict[str, Any]:
+    """Return a content block as a plain dictionary (SDK blocks are model objects)."""
+    if hasattr(block, "model_dump"):
+        return block.model_dump(mode="json", exclude_none=True)
+    return block
+
+
+def _blocks(message: Dict[str, Any]) -> List[Any]:
+    """Return the content of a message as a list of blocks."""
+    content = message["content"]
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    return list(content)
+
+
+def _is_tool_result_message(message: Dict[str, Any]) -> bool:
+    content = message["content"]
+    return (
+        message["role"] == "user"
+        and not isinstance(content, str)
+        and bool(content)
+        and all(_block_dict(block).get("type") == "tool_result" for block in content)
+    )
+
+
+class HistoryManager:
+    """
+    Keeps a conversation under a token budget.
+    
+    The manager is applied to the history passed to LLM.generate,
+    generate_with_tools and stream_with_tools before the new prompt is added.
+    While the history fits in max_tokens it is left untouched, so the prompt
+    cache prefix stays stable. Once it grows beyond max_tokens it is compacted
+    in two steps, stopping as soon as it fits again:
+    
+    1. The content of tool_result blocks outside the most recent turns is
+       replaced by a short stub. The blocks themselves stay, so every tool_use
+       still has its tool_result.
+    2. The oldest whole turns are replaced by a summary written by a cheap
+       model, until the kept turns fit in target_tokens. The summary is merged
+       into the first kept user message, so roles still alternate. With
+       summarize=False those turns are dropped instead.
+    
+    A turn starts at a user message that carries a prompt (as opposed to tool
+    results), so tool_use/tool_result pairs never straddle a cut. Token counts
+    are estimated locally from the size of the serialized messages, once per
+    message, by a TokenCounter; pass the LLM's counter to share its calibration.
+    
+    Usage:
+        llm = LLM(history_manager=HistoryManager(max_tokens=20000))
+        result = llm.generate_with_tools(prompt, history=history)
+        result["history_compaction"]  # present when the history was compacted
+    """
+    
+    def __init__(self,
+                 max_tokens: int = 50000,
+                 target_tokens: Optional[int] = None,
+                 keep_recent_turns: int = 2,
+                 summarize: bool = True,
+                 summary_model: str = "claude-3-5-haiku-20241022",
+                 summary_max_tokens: int = 1000,
+                 stub_chars: int = 200,
+                 chars_per_token: float = 4.0,
+                 token_counter: Optional[TokenCounter] = None):
+        """
+        Initialize the manager.
+        
+        Args:
+            max_tokens: Compact the history once its estimated size exceeds this
+            target_tokens: Size to compact down to, leaving headroom so that compaction
+                (which invalidates the prompt cache) happens rarely. Defaults to half of max_tokens.
+            keep_recent_turns: Number of most recent turns that are never stubbed or summarized
+            summarize: Summarize old turns with summary_model; if False they are dropped
+            summary_model: Model used to write summaries
+            summary_max_tokens: Maximum length of a summary
+            stub_chars: Number of characters of an old tool result kept in its stub
+            chars_per_token: Characters per token used by the local estimate
+            token_counter: Optional TokenCounter for the estimates, e.g. the one given to
+                the LLM; defaults to a private one using chars_per_token
+        """
+        self.max_tokens = max_tokens
+        self.target_tokens = target_tokens if target_tokens is not None else max_tokens // 2
+        self.keep_recent_turns = max(1, keep_recent_turns)
+        self.summarize = summarize
+        self.summary_model = summary_model
+        self.summary_max_tokens = summary_max_tokens
+        self.stub_chars = stub_chars
+        self.chars_per_token = chars_per_token
+        self.token_counter = token_counter or TokenCounter(chars_per_token=chars_per_token)
+    
+    def estimate_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Estimate the number of input tokens of a list of messages.
+        
+        Args:
+            messages: A Conversation or a list of Messages API messages
+        
+        Returns:
+            The estimated token count
+        """
+        return self.token_counter.count_messages(messages)
+    
+    def _split_turns(self, messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Split messages into turns, each starting at a user message with a prompt."""
+        turns = []
+        for message in messages:
+            if not turns or (message["role"] == "user" and not _is_tool_result_message(message)):
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+    
+    def _stub_tool_results(self, turns: List[List[Dict[str, Any]]]) -> Tuple[List[List[Dict[str, Any]]], int]:
+        """Replace the content of tool results in the given turns by stubs."""
+        stubbed = 0
+        new_turns = []
+        for turn in turns:
+            new_turn = []
+            for message in turn:
+                if not _is_tool_result_message(message):
+                    new_turn.append(message)
+                    continue
+                blocks = []
+                for block in message["content"]:
+                    block = _block_dict(block)
+                    content = block.get("content")
+                    if (isinstance(content, str) and len(content) > self.stub_chars
+                            and not content.startswith("[elided ")):
+                        content = f"[elided {len(content)} chars] {content[:self.stub_chars]}"
+                        block = dict(block, content=content)
+                        stubbed += 1
+                    blocks.append(block)
+                new_turn.append({"role": message["role"], "content": blocks})
+            new_turns.append(new_turn)
+        return new_turns, stubbed
+    
+    def _transcript(self, messages: List[Dict[str, Any]]) -> str:
+        """Render messages as plain text for the summary request."""
+        lines = []
+        for message in messages:
+            for block in _blocks(message):
+                block = _block_dict(block)
+                kind = block.get("type")
+                if kind == "text":
+                    lines.append(f"{message['role']}: {block['text']}")
+                elif kind == "tool_use":
+                    lines.append(f"assistant called {block['name']}({json.dumps(block.get('input'), default=str)})")
+                elif kind == "tool_result":
+                    lines.append(f"tool result: {block.get('content')}")
+        return "\n".join(lines)
+    
+    def _summary_params(self, old_messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the request that summarizes old_messages."""
+        return {
+            "model": self.summary_model,
+            "max_tokens": self.summary_max_tokens,
+            "temperature": 0,
+            "system": SUMMARY_PROMPT,
+            "messages": [{"role": "user", "content": self._transcript(old_messages)}]
+        }
+    
+    def _with_summary(self, summary: str, kept: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Prepend the summary to the first kept user message."""
+        first = kept[0]
+        summary_block = {"type": "text", "text": f"[Summary of the earlier conversation]\n{summary}"}
+        return [{"role": first["role"], "content": [summary_block] + _blocks(first)}] + kept[1:]
+    
+    def _plan(self, messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Run the steps that need no model call.
+        
+        Returns:
+            (messages, old_messages, report): old_messages is empty when nothing
+            has to be summarized; otherwise they must be replaced by a summary
+            and messages holds the turns to keep
+        """
+        before = self.estimate_tokens(messages)
+        report = {
+            "tokens_before": before,
+            "tokens_after": before,
+            "stubbed_tool_results": 0,
+            "summarized_messages": 0,
+            "dropped_messages": 0
+        }
+        if before <= self.max_tokens:
+            return messages, [], report
+        
+        turns = self._split_turns(messages)
+        recent = len(turns) - self.keep_recent_turns
+        if recent <= 0:
+            return messages, [], report
+        
+        # Step 1: stub old tool results
+        stubbed_turns, report["stubbed_tool_results"] = self._stub_tool_results(turns[:recent])
+        stubbed_turns += turns[recent:]
+        stubbed = [message for turn in stubbed_turns for message in turn]
+        report["tokens_after"] = self.estimate_tokens(stubbed)
+        if report["tokens_after"] <= self.max_tokens:
+            return stubbed, [], report
+        
+        # Step 2: keep the newest turns that fit in target_tokens, replace the rest.
+        # The summary is written from the original turns, not from the stubs.
+        turn_tokens = [self.estimate_tokens(turn) for turn in stubbed_turns]
+        keep = self.keep_recent_turns
+        kept_tokens = sum(turn_tokens[-keep:])
+        while keep < len(turns) and kept_tokens + turn_tokens[-(keep + 1)] <= self.target_tokens:
+            kept_tokens += turn_tokens[-(keep + 1)]
+            keep += 1
+        old = [message for turn in turns[:-keep] for message in turn]
+        kept = [message for turn in stubbed_turns[-keep:] for message in turn]
+        return kept, old, report
+    
+    def _finish(self, kept: List[Dict[str, Any]], old: List[Dict[str, Any]],
+                summary: Optional[str], report: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Merge the summary (if any) into the kept turns and complete the report."""
+        if summary is not None:
+            kept = self._with_summary(summary, kept)
+            report["summarized_messages"] = len(old)
+        else:
+            report["dropped_messages"] = len(old)
+        report["tokens_after"] = self.estimate_tokens(kept)
+        return kept
+    
+    def compact(self, llm, messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Compact a history if it exceeds the budget.
+        
+        Args:
+            llm: The LLM used for summary requests
+            messages: The conversation history
+        
+        Returns:
+            A (messages, report) tuple. The report holds tokens_before, tokens_after,
+            the number of stubbed tool results and of summarized or dropped messages,
+            and the token usage of the summary request if one was made.
+        """
+        kept, old, report = self._plan(messages)
+        if not old:
+            return kept, report
+        
+        summary = None
+        if self.summarize:
+            report["summary_usage"] = llm._new_usage()
+            response = llm._create_message(self._summary_params(old), report["summary_usage"])
+            summary = llm._extract_text(response)
+            llm._add_usage(report["summary_usage"], response.usage)
+        return self._finish(kept, old, summary, report), report
+    
+    async def acompact(self, llm, messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Coroutine version of compact for AsyncLLM.
+        
+        Args:
+            llm: The AsyncLLM used for summary requests
+            messages: The conversation history
+        
+        Returns:
+            A (messages, report) tuple, see compact
+        """
+        kept, old, report = self._plan(messages)
+        if not old:
+            return kept, report
+        
+        summary = None
+        if self.summarize:
+            report["summary_usage"] = llm._new_usage()
+            response = await llm._acreate_message(self._summary_params(old), report["summary_usage"])
+            summary = llm._extract_text(response)
+            llm._add_usage(report["summary_usage"], response.usage)
+        return self._finish(kept, old, summary, report), report
@@ -0,0 +1,37 @@
+import importlib
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule:
+    """
+    A module that is imported the first time one of its attributes is used.
+    
+    Lets a module name a heavy dependency without paying for its import at
+    startup: after anthropic = LazyModule("anthropic"), the SDK is imported by
+    the first anthropic.Anthropic(...) call, and `except anthropic.APIError:`
+    only looks the name up once an exception is raised. Annotations that
+    mention the module must be strings, or they would import it right away.
+    
+    Usage:
+        anthropic = LazyModule("anthropic")
+        client = anthropic.Anthropic()  # imports the SDK
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+    
+    def _load(self) -> ModuleType:
+        module = self._module
+        if module is None:
+            # importlib's per-module import locks make concurrent first uses safe
+            module = self._module = importlib.import_module(self._name)
+        return module
+    
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self._load(), attribute)
+    
+    def __repr__(self) -> str:
+        state = "imported" if self._module is not None else "not imported"
+        return f"<LazyModule {self._name!r} ({state})>"
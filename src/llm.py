@@ -1,30 +1,186 @@
-import anthropic
+import contextvars
+import inspect
 import os
 import json
-from typing import List, Dict, Any, Optional, Union, Callable
+import pickle
+import threading
+import time
+import weakref
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Union, Callable, Iterator
+
+from src.client import RetryPolicy, anthropic, get_client
+from src.conversation import Conversation, History
+from src.history import HistoryManager
+from src.rate_limiter import Priority, RateLimiter
+from src.response_cache import ResponseCache
+from src.routing import ModelRouter
+from src.streaming import ResponseStream
+from src.telemetry import Span, TelemetrySink
+from src.token_counter import TokenCounter
+from src.tool_cache import CachePolicy, ToolResultCache
+from src.tool_executor import BACKENDS, ToolExecutor, ToolTimeoutError
+from src.tool_index import ToolIndex
+from src.tool_manifest import ToolManifest
+from src.validation import Validator, compile_schema
+
+if TYPE_CHECKING:
+    from src.cassette import Cassette
+
+# Input schemas derived from function signatures, shared by all LLM instances
+_input_schema_cache = weakref.WeakKeyDictionary()
+
+# Longest tool error message sent back to the model
+MAX_TOOL_ERROR_CHARS = 500
+
+# Warnings of tool loops that stopped before the model's final answer
+MAX_ITERATIONS_WARNING = "Maximum number of tool use iterations reached"
+TIMEOUT_WARNING = "Turn timeout exceeded"
+
+
+class _SerialToolLane:
+    """
+    Runs one turn's thread_safe=False tool calls one at a time, in the order they were submitted.
+    
+    A session runs one turn at a time, so serializing per turn keeps the
+    session's tool state (see SessionLocal) consistent while a slow tool in one
+    session's turn never holds up the tools of another session. The lane's lock
+    is held by the running call until its function returns, even after a
+    timeout abandoned it, so the next call cannot overlap with it.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._pool = None
+    
+    def submit(self, function: Callable, *args) -> Future:
+        """Run function(*args) after the calls submitted before it, in a copy of the caller's context."""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-tool-serial")
+        return self._pool.submit(contextvars.copy_context().run, function, *args)
+    
+    def close(self) -> None:
+        """Let the lane's thread exit once its calls are done."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
 
 class LLM:
     """
     A class to handle interactions with Language Models (specifically Anthropic's Claude).
     """
     
-    def __init__(self, api_key: Optional[str] = None, model: str = "claude-3-7-sonnet-20250219"):
+    # Whether client is an AsyncAnthropic client
+    _asynchronous = False
+    
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 model: str = "claude-3-7-sonnet-20250219",
+                 max_tool_workers: int = 1,
+                 prompt_caching: bool = True,
+                 response_cache: Optional[ResponseCache] = None,
+                 history_manager: Optional[HistoryManager] = None,
+                 client_options: Optional[Dict[str, Any]] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 priority: Priority = "interactive",
+                 telemetry: Optional[TelemetrySink] = None,
+                 cassette: Optional["Cassette"] = None,
+                 token_counter: Optional[TokenCounter] = None,
+                 router: Optional[ModelRouter] = None,
+                 tool_index: Optional[ToolIndex] = None,
+                 tool_timeout: Optional[float] = None,
+                 tool_executor: Optional[ToolExecutor] = None):
         """
         Initialize the LLM with API key and default model.
         
         Args:
             api_key: The API key for Anthropic. If None, will use ANTHROPIC_API_KEY from environment.
             model: The model to use for generation. Defaults to claude-3-7-sonnet.
+            max_tool_workers: Maximum number of tool calls from one assistant turn that may run
+                concurrently. 1 (the default) runs them one after another.
+            prompt_caching: Whether to mark the tools, the system prompt and the end of the
+                conversation as prompt-cache breakpoints on every request.
+            response_cache: Optional ResponseCache that answers repeated requests without
+                calling the API (by default only requests with temperature 0).
+            history_manager: Optional HistoryManager that keeps the history passed to each
+                call under a token budget.
+            client_options: Optional connection settings (base_url, pool size, keep-alive,
+                timeouts) passed to get_client; instances with the same settings share a client.
+            retry_policy: How to retry rate-limited, overloaded and failed requests.
+                Defaults to RetryPolicy().
+            rate_limiter: Optional RateLimiter, shared by all instances using the same API key,
+                that queues requests to stay within the requests / input / output tokens per minute.
+            priority: Priority of this instance's requests in the rate limiter's queue:
+                "interactive", "default", "batch" or an int (lower is sooner). Local batches
+                always use "batch".
+            telemetry: Optional TelemetrySink that receives a span for every call ("llm.turn"),
+                API request ("llm.model_call") and tool execution ("llm.tool_call").
+                Defaults to a no-op sink.
+            cassette: Optional Cassette that records every API request and response, or
+                replays them instead of calling the API (and optionally stubs the tools).
+            token_counter: Optional TokenCounter that counts every request's input tokens
+                before it is sent, rejects requests that cannot fit in the context window,
+                adapts max_tokens and resends requests whose tool_use was cut off by max_tokens.
+            router: Optional ModelRouter that sends simple requests (e.g. tool loop follow-ups)
+                to a faster model and escalates them to `model` if the fast model fails.
+            tool_index: Optional ToolIndex that offers each tool-use call only the registered
+                tools relevant to its prompt, plus the tools already used in the conversation.
+            tool_timeout: Default timeout in seconds of the tools registered without one; tools
+                with a timeout run on the "thread" backend unless they choose another.
+            tool_executor: Optional ToolExecutor that runs the tools (and whose thread pool and
+                worker processes may be shared with other instances). Defaults to a new one.
         """
         self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
         if not self.api_key:
             raise ValueError("API key must be provided either directly or via ANTHROPIC_API_KEY environment variable")
         
         self.model = model
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        self.cassette = cassette
+        self.token_counter = token_counter
+        self.router = router
+        self.tool_index = tool_index
+        self.client_options = client_options or {}
+        self._client = None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.priority = priority
+        self.telemetry = telemetry or TelemetrySink()
         self.tools = {}
+        self.max_tool_workers = max(1, max_tool_workers)
+        self.prompt_caching = prompt_caching
+        self.response_cache = response_cache
+        self.history_manager = history_manager
+        self._tool_manifest = None
+        self.tool_timeout = tool_timeout
+        self.tool_executor = tool_executor or ToolExecutor(max_threads=max(8, self.max_tool_workers))
+        self._tool_pool = None
+        self._tool_pool_lock = threading.Lock()
+    
+    @property
+    def client(self):
+        """The shared Anthropic client for client_options, created (and the SDK imported) on first use."""
+        if self._client is None:
+            self._client = get_client(self.api_key, asynchronous=self._asynchronous, cassette=self.cassette,
+                                      **self.client_options)
+        return self._client
+    
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
     
-    def register_tool(self, name: str, function: Callable, description: str, input_schema: Dict[str, Any] = None):
+    def register_tool(self,
+                      name: str,
+                      function: Callable,
+                      description: str,
+                      input_schema: Dict[str, Any] = None,
+                      thread_safe: bool = True,
+                      cache: Optional[CachePolicy] = None,
+                      validate: bool = True,
+                      backend: Optional[str] = None,
+                      timeout: Optional[float] = None):
         """
         Register a tool that the LLM can use.
         
@@ -33,25 +189,156 @@ class LLM:
             function: The function to call when the tool is used
             description: A description of what the tool does
             input_schema: JSON schema for the tool's input parameters
+            thread_safe: Whether the tool may run concurrently with other tool calls.
+                Tools that mutate shared module state should pass False; they run one at
+                a time, in the order the model requested them (see _execute_tool_calls).
+            cache: Optional result caching policy for pure or read-only tools: "pure",
+                {"ttl": seconds} or {"mtime": path_for_input}. See ToolResultCache.
+            validate: Whether to check every input against input_schema (compiled once, here)
+                before calling the tool; invalid inputs are returned to the model as errors.
+            backend: Where the function runs (see ToolExecutor): "inline" on the thread handling
+                the tool call, "thread" on the executor's thread pool, or "process" in a worker
+                process for CPU-heavy tools (the function must be picklable). Defaults to
+                "thread" for tools with a timeout and "inline" otherwise.
+            timeout: Seconds a call may take before the model gets a timeout error instead of
+                its result; defaults to the LLM's tool_timeout. Inline tools cannot time out.
         """
+        timeout = timeout if timeout is not None else self.tool_timeout
+        backend = backend or ("thread" if timeout is not None and not inspect.iscoroutinefunction(function)
+                              else "inline")
+        self._check_backend(name, function, backend, timeout)
+        input_schema = input_schema or self._generate_input_schema(function)
         self.tools[name] = {
             "function": function,
             "description": description,
-            "input_schema": input_schema or self._generate_input_schema(function)
+            "input_schema": input_schema,
+            "thread_safe": thread_safe,
+            "cache": ToolResultCache(cache) if cache is not None else None,
+            "validator": self._compile_validator(function, input_schema) if validate else None,
+            "backend": backend,
+            "timeout": timeout
         }
+        self._tool_manifest = None
+    
+    def unregister_tool(self, name: str):
+        """
+        Remove a registered tool.
+        
+        Args:
+            name: The name of the tool
+        """
+        if name not in self.tools:
+            raise ValueError(f"Tool {name} is not registered")
+        del self.tools[name]
+        self._tool_manifest = None
+    
+    def replace_tool(self,
+                     name: str,
+                     function: Optional[Callable] = None,
+                     description: Optional[str] = None,
+                     input_schema: Optional[Dict[str, Any]] = None):
+        """
+        Update parts of a registered tool, keeping its position in the tool list.
+        
+        Args:
+            name: The name of the tool
+            function: The new function, if it changes
+            description: The new description, if it changes
+            input_schema: The new input schema, if it changes
+        """
+        if name not in self.tools:
+            raise ValueError(f"Tool {name} is not registered")
+        tool_info = self.tools[name]
+        if function is not None:
+            self._check_backend(name, function, tool_info["backend"], tool_info["timeout"])
+            tool_info["function"] = function
+        if description is not None:
+            tool_info["description"] = description
+        if input_schema is not None:
+            tool_info["input_schema"] = input_schema
+        if tool_info["validator"] is not None:
+            tool_info["validator"] = self._compile_validator(tool_info["function"], tool_info["input_schema"])
+        self._tool_manifest = None
+    
+    def _check_backend(self, name: str, function: Callable, backend: str, timeout: Optional[float]) -> None:
+        """Reject execution settings a tool cannot run with."""
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r} for tool {name}; expected one of {', '.join(BACKENDS)}")
+        if timeout is not None and timeout <= 0:
+            raise ValueError(f"The timeout of tool {name} must be positive")
+        if inspect.iscoroutinefunction(function):
+            if backend != "inline":
+                raise ValueError(f"Tool {name} is a coroutine function and must use the inline backend")
+            return
+        if backend == "inline" and timeout is not None:
+            raise ValueError(f"Tool {name} runs inline, where it cannot time out; use the thread or process backend")
+        if backend == "process":
+            try:
+                pickle.dumps(function)
+            except Exception as e:
+                raise ValueError(f"Tool {name} cannot run in a process: its function is not picklable ({e})")
+    
+    def _compile_validator(self, function: Callable, input_schema: Dict[str, Any]) -> Validator:
+        """
+        Compile a tool's input schema into a validator.
+        
+        Properties the schema does not list are rejected unless it says otherwise or
+        the function takes **kwargs, since the call would fail with a TypeError anyway.
+        """
+        try:
+            parameters = inspect.signature(function).parameters.values()
+            accepts_kwargs = any(parameter.kind is inspect.Parameter.VAR_KEYWORD for parameter in parameters)
+        except (TypeError, ValueError):
+            accepts_kwargs = True
+        return compile_schema(input_schema, additional_properties=accepts_kwargs)
+    
+    def tool_manifest(self) -> ToolManifest:
+        """
+        Get the manifest of registered tools, rebuilding it only if the registry changed.
+        
+        Returns:
+            The current ToolManifest
+        """
+        manifest = self._tool_manifest
+        if manifest is None or manifest.prompt_caching != self.prompt_caching:
+            manifest = ToolManifest(self.tools, prompt_caching=self.prompt_caching)
+            self._tool_manifest = manifest
+        return manifest
     
     def _generate_input_schema(self, function: Callable) -> Dict[str, Any]:
         """
         Generate a basic input schema for a function based on its signature.
         
+        Schemas are cached per function, so registering the same function again
+        (for example on another LLM instance) does not inspect it a second time.
+        
         Args:
             function: The function to generate a schema for
             
         Returns:
             A JSON schema for the function's parameters
         """
-        import inspect
+        try:
+            schema = _input_schema_cache.get(function)
+        except TypeError:
+            # Not weak-referenceable (e.g. a builtin); always inspect
+            return self._input_schema_from_signature(function)
+        
+        if schema is None:
+            schema = self._input_schema_from_signature(function)
+            _input_schema_cache[function] = schema
+        return schema
+    
+    def _input_schema_from_signature(self, function: Callable) -> Dict[str, Any]:
+        """
+        Build an input schema by inspecting a function's signature.
         
+        Args:
+            function: The function to generate a schema for
+            
+        Returns:
+            A JSON schema for the function's parameters
+        """
         # Get function signature
         sig = inspect.signature(function)
         
@@ -94,28 +381,808 @@ class LLM:
         
         return schema
     
+    def _parse_tool_input(self, tool_input: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Turn the input of a tool_use block into keyword arguments for the tool.
+        
+        Args:
+            tool_input: The tool input as sent by the model
+            
+        Returns:
+            A dictionary of keyword arguments
+        """
+        if isinstance(tool_input, str):
+            try:
+                return json.loads(tool_input)
+            except json.JSONDecodeError:
+                return {"input": tool_input}
+        return tool_input
+    
+    def _invalid_tool_input(self, tool_name: str, tool_info: Dict[str, Any], input_dict: Any) -> Optional[str]:
+        """Check a tool input with the tool's compiled validator; returns the error message, if any."""
+        if not isinstance(input_dict, dict):
+            return f"Invalid input for tool {tool_name}: expected an object, got {type(input_dict).__name__}"
+        validator = tool_info["validator"]
+        if validator is None:
+            return None
+        error = validator(input_dict)
+        if error is None:
+            return None
+        return f"Invalid input for tool {tool_name}: {error}"
+    
+    def _tool_exception(self, tool_name: str, error: Exception) -> str:
+        """A concise message for an exception raised by a tool."""
+        message = f"Error executing tool {tool_name}: {type(error).__name__}: {error}"
+        if len(message) > MAX_TOOL_ERROR_CHARS:
+            message = message[:MAX_TOOL_ERROR_CHARS - 3] + "..."
+        return message
+    
+    def _tool_success(self, tool_call: Dict[str, Any], tool_result: Any) -> tuple:
+        """Build the (tool_usage entry, tool_result block) pair for a successful tool call."""
+        return (
+            {"tool": tool_call["name"], "input": tool_call["input"], "output": tool_result, "id": tool_call["id"]},
+            {"type": "tool_result", "tool_use_id": tool_call["id"], "content": json.dumps(tool_result)}
+        )
+    
+    def _tool_error(self, tool_call: Dict[str, Any], error_message: str) -> tuple:
+        """Build the (tool_usage entry, tool_result block) pair for a failed tool call."""
+        return (
+            {"tool": tool_call["name"], "input": tool_call["input"], "error": error_message, "id": tool_call["id"]},
+            {"type": "tool_result", "tool_use_id": tool_call["id"], "content": error_message, "is_error": True}
+        )
+    
+    def _stubbed_tool_call(self, tool_call: Dict[str, Any]) -> Optional[tuple]:
+        """
+        Answer a tool call from the cassette when it stubs tools.
+        
+        Args:
+            tool_call: Dictionary with the tool "name", "input" and "id"
+        
+        Returns:
+            A (tool_usage entry, tool_result content block) tuple with the recorded
+            result, or None if the tool should run
+        """
+        if self.cassette is None or not self.cassette.stub_tools:
+            return None
+        block = self.cassette.tool_result(tool_call["id"])
+        if block is None:
+            return self._tool_error(tool_call, f"No recorded result for tool call {tool_call['id']}")
+        usage = {"tool": tool_call["name"], "input": tool_call["input"], "id": tool_call["id"], "stubbed": True}
+        if block.get("is_error"):
+            usage["error"] = block.get("content")
+        else:
+            try:
+                usage["output"] = json.loads(block.get("content"))
+            except (TypeError, ValueError):
+                usage["output"] = block.get("content")
+        # The recorded block may carry the request's prompt-cache breakpoint; the history must not
+        return usage, {key: value for key, value in block.items() if key != "cache_control"}
+    
+    def _execute_tool_call(self, tool_call: Dict[str, Any], parent: Optional[Span] = None,
+                           deadline: Optional[float] = None, lane: Optional[_SerialToolLane] = None) -> tuple:
+        """
+        Execute a single tool call requested by the model.
+        
+        Args:
+            tool_call: Dictionary with the tool "name", "input" and "id"
+            parent: Optional span of the call the tool runs in
+            deadline: Optional time.monotonic() of the turn's deadline, when the call is cancelled
+            lane: The turn's serial lane, whose lock a tool registered with thread_safe=False holds
+            
+        Returns:
+            A (tool_usage entry, tool_result content block) tuple
+        """
+        tool_name = tool_call["name"]
+        
+        with self._span("llm.tool_call", parent, tool=tool_name) as span:
+            stubbed = self._stubbed_tool_call(tool_call)
+            if stubbed is not None:
+                span.set(stubbed=True, is_error="error" in stubbed[0])
+                return stubbed
+            
+            if tool_name not in self.tools:
+                # Tool not found
+                span.set(is_error=True)
+                return self._tool_error(tool_call, f"Tool {tool_name} not found")
+        
+            tool_info = self.tools[tool_name]
+            tool_cache = tool_info["cache"]
+            input_dict = self._parse_tool_input(tool_call["input"])
+            invalid = self._invalid_tool_input(tool_name, tool_info, input_dict)
+            if invalid is not None:
+                span.set(is_error=True, invalid_input=True)
+                return self._tool_error(tool_call, invalid)
+            try:
+                # Execute the tool on its backend, or reuse a cached result
+                tool_function = self._tool_function(tool_info, deadline, lane)
+                if tool_cache is not None:
+                    tool_result, cache_hit = tool_cache.call(tool_function, input_dict)
+                else:
+                    tool_result = tool_function(**input_dict)
+            except ToolTimeoutError as e:
+                return self._tool_timeout(tool_call, e, span)
+            except Exception as e:
+                # Handle tool execution errors
+                span.set(is_error=True)
+                return self._tool_error(tool_call, self._tool_exception(tool_name, e))
+            
+            usage, block = self._tool_success(tool_call, tool_result)
+            if tool_cache is not None:
+                self._record_cache_hit(usage, tool_cache, cache_hit, span)
+            return usage, block
+        
+    def _tool_function(self, tool_info: Dict[str, Any], deadline: Optional[float] = None,
+                       lane: Optional[_SerialToolLane] = None) -> Callable:
+        """
+        The tool's function, wrapped to run on its backend with its timeout and the turn's deadline.
+        
+        A tool registered with thread_safe=False holds the lock of the turn's lane while it runs.
+        """
+        function, backend, timeout = tool_info["function"], tool_info["backend"], tool_info["timeout"]
+        exclusive = lane.lock if lane is not None and not tool_info["thread_safe"] else None
+        executor = self.tool_executor
+        return lambda **arguments: executor.run(function, arguments, backend, timeout, deadline, exclusive)
+    
+    def _tool_timeout(self, tool_call: Dict[str, Any], error: ToolTimeoutError, span: Optional[Span] = None) -> tuple:
+        """Build the (tool_usage entry, tool_result block) pair for a tool call that timed out."""
+        if span is not None:
+            span.set(is_error=True, timed_out=True)
+        usage, block = self._tool_error(tool_call, f"Tool {tool_call['name']} {error}")
+        usage["timed_out"] = True
+        return usage, block
+    
+    def _record_cache_hit(self, usage: Dict[str, Any], tool_cache: ToolResultCache, cache_hit: bool,
+                          span: Optional[Span] = None) -> None:
+        """Annotate a tool_usage entry (and the tool's span) with the cache outcome and running hit rate."""
+        usage["cache_hit"] = cache_hit
+        usage["cache_hit_rate"] = tool_cache.stats()["hit_rate"]
+        if span is not None:
+            span.set(cache_hit=cache_hit)
+    
+    def tool_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get result cache counters for every tool registered with a cache policy.
+        
+        Returns:
+            A dictionary mapping tool names to their hits, misses, coalesced calls and hit_rate
+        """
+        return {
+            name: tool_info["cache"].stats()
+            for name, tool_info in self.tools.items()
+            if tool_info["cache"] is not None
+        }
+    
+    def _submit_tool_call(self, tool_call: Dict[str, Any], parent: Optional[Span] = None,
+                          deadline: Optional[float] = None, lane: Optional[_SerialToolLane] = None) -> Future:
+        """
+        Start a tool call in the background.
+        
+        Thread-safe tools go to the shared tool pool (bounded by max_tool_workers).
+        Tools registered with thread_safe=False go to the turn's serial lane so
+        they still run one at a time, in the order they were submitted. Either way
+        the tool runs in a copy of the caller's context, so context variables such
+        as the session's tool state (see SessionLocal) carry over.
+        
+        Args:
+            tool_call: Dictionary with the tool "name", "input" and "id"
+            parent: Optional span of the call the tool runs in
+            deadline: Optional time.monotonic() of the turn's deadline
+            lane: The turn's serial lane; required for tools registered with thread_safe=False
+        
+        Returns:
+            A future resolving to a (tool_usage entry, tool_result content block) tuple
+        """
+        tool_info = self.tools.get(tool_call["name"])
+        if tool_info is None or tool_info["thread_safe"]:
+            return self._shared_tool_pool().submit(contextvars.copy_context().run, self._execute_tool_call,
+                                                   tool_call, parent, deadline)
+        return lane.submit(self._execute_tool_call, tool_call, parent, deadline, lane)
+    
+    def _shared_tool_pool(self) -> ThreadPoolExecutor:
+        """The thread pool of the thread-safe tools, created on first use."""
+        with self._tool_pool_lock:
+            if self._tool_pool is None:
+                self._tool_pool = ThreadPoolExecutor(
+                    max_workers=self.max_tool_workers,
+                    thread_name_prefix="llm-tool"
+                )
+            return self._tool_pool
+    
+    def _execute_tool_calls(self, tool_calls: List[Dict[str, Any]], parent: Optional[Span] = None,
+                            deadline: Optional[float] = None, lane: Optional[_SerialToolLane] = None) -> tuple:
+        """
+        Execute all tool calls from one assistant turn.
+        
+        Thread-safe tools are dispatched to a shared thread pool (bounded by
+        max_tool_workers) while tools registered with thread_safe=False run on the
+        calling thread, in request order, holding the lock of the turn's serial lane.
+        (stream_with_tools does not come through here: it submits each call as soon
+        as it is streamed, and its unsafe tools run on the lane's thread instead; see
+        _submit_tool_call.) Results are always returned in the order of tool_calls.
+        
+        Args:
+            tool_calls: Tool calls in the order the model requested them
+            parent: Optional span of the call the tools run in
+            deadline: Optional time.monotonic() of the turn's deadline
+            lane: The turn's serial lane (see _execute_tool_call)
+            
+        Returns:
+            A (tool_usage entries, tool_result content blocks) tuple
+        """
+        concurrent = self.max_tool_workers > 1 and len(tool_calls) > 1
+        if not concurrent:
+            outcomes = [self._execute_tool_call(tool_call, parent, deadline, lane) for tool_call in tool_calls]
+        else:
+            pending = []
+            for tool_call in tool_calls:
+                tool_info = self.tools.get(tool_call["name"])
+                if tool_info is not None and tool_info["thread_safe"]:
+                    pending.append(self._submit_tool_call(tool_call, parent, deadline))
+                else:
+                    pending.append(None)
+            
+            # Run the tools that opted out of concurrency in request order while
+            # the others make progress in the pool
+            outcomes = [None] * len(tool_calls)
+            for index, future in enumerate(pending):
+                if future is None:
+                    outcomes[index] = self._execute_tool_call(tool_calls[index], parent, deadline, lane)
+            for index, future in enumerate(pending):
+                if future is not None:
+                    outcomes[index] = future.result()
+        
+        return [usage for usage, _ in outcomes], [block for _, block in outcomes]
+    
+    def _tool_definitions(self, prompt: Optional[str] = None, history: Optional[History] = None) -> List[Dict[str, Any]]:
+        """
+        Prepare the registered tools in the format expected by Claude.
+        
+        Args:
+            prompt: The prompt of the call; with a tool index, only the tools relevant
+                to it (and those used in history) are returned
+            history: The conversation history of the call
+        
+        Returns:
+            A list of tool definitions for the "tools" request parameter, taken
+            from the cached tool manifest
+        """
+        if self.tool_index is None or prompt is None:
+            return self.tool_manifest().as_list()
+        return self.tool_index.select(self.tool_manifest(), prompt, history)
+    
+    def _expand_tools(self, tools: List[Dict[str, Any]], tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Offer the tools the model called although the tool index left them out (or their best matches)."""
+        if self.tool_index is None:
+            return tools
+        return self.tool_index.expand(self.tool_manifest(), tools, tool_calls)
+    
+    def _extract_tool_calls(self, response) -> List[Dict[str, Any]]:
+        """
+        Collect the tool_use blocks of a response.
+        
+        Args:
+            response: A Messages API response
+            
+        Returns:
+            A list of tool calls with their "name", "input" and "id"
+        """
+        tool_calls = []
+        for content_block in response.content:
+            if hasattr(content_block, 'type') and content_block.type == "tool_use":
+                tool_calls.append({
+                    "name": content_block.name,
+                    "input": content_block.input,
+                    "id": content_block.id
+                })
+        return tool_calls
+    
+    def _extract_text(self, response) -> str:
+        """
+        Concatenate the text blocks of a response.
+        
+        Args:
+            response: A Messages API response
+            
+        Returns:
+            The response text
+        """
+        final_response = ""
+        for content_block in response.content:
+            if hasattr(content_block, 'type') and content_block.type == "text":
+                final_response += content_block.text
+        return final_response
+    
+    def _new_usage(self) -> Dict[str, int]:
+        """
+        Create an empty usage tally: token counts, retried requests, seconds spent in the
+        rate limiter's queue, requests resent because max_tokens cut off a tool_use,
+        requests escalated from the router's fast model and requests answered by the
+        response cache (whose tokens are not counted, since they were not billed again).
+        """
+        return {
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "retries": 0,
+            "queue_wait": 0.0,
+            "max_tokens_retries": 0,
+            "escalations": 0,
+            "cached_responses": 0
+        }
+    
+    def _add_usage(self, totals: Dict[str, int], usage) -> None:
+        """
+        Add the usage reported by one API response to a running tally.
+        
+        Args:
+            totals: The tally created by _new_usage
+            usage: The `usage` object of a Messages API response
+        """
+        for key in totals:
+            totals[key] += getattr(usage, key, None) or 0
+    
+    def _span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        """Start a span as a child of parent, or as a new trace in the telemetry sink."""
+        if parent is not None:
+            return parent.child(name, **attributes)
+        return self.telemetry.start_span(name, **attributes)
+    
+    def _trace_response(self, span: Span, response, usage: Dict[str, int], retries: int, queue_wait: float) -> None:
+        """Add the token usage, stop reason, retries and queue wait of an API request to its span."""
+        span.set(
+            stop_reason=response.stop_reason,
+            input_tokens=response.usage.input_tokens,
+            output_tokens=response.usage.output_tokens,
+            cache_creation_input_tokens=getattr(response.usage, "cache_creation_input_tokens", None) or 0,
+            cache_read_input_tokens=getattr(response.usage, "cache_read_input_tokens", None) or 0,
+            retries=usage["retries"] - retries,
+            queue_wait=usage["queue_wait"] - queue_wait
+        )
+    
+    def _deadline_passed(self, deadline: Optional[float]) -> bool:
+        return deadline is not None and time.monotonic() >= deadline
+    
+    def _loop_warning(self, deadline: Optional[float]) -> str:
+        """The warning of a tool loop that ended without the model's final answer."""
+        return TIMEOUT_WARNING if self._deadline_passed(deadline) else MAX_ITERATIONS_WARNING
+    
+    def _end_turn(self, turn: Span, result: Dict[str, Any], iterations: int) -> Dict[str, Any]:
+        """Add the outcome of a call to its "llm.turn" span and return the result."""
+        timing = result.get("timing") or {}
+        turn.set(
+            iterations=iterations,
+            tool_calls=len(result.get("tool_usage", ())),
+            max_iterations_reached=result.get("warning") == MAX_ITERATIONS_WARNING,
+            timed_out=result.get("warning") == TIMEOUT_WARNING,
+            **result["usage"]
+        )
+        if timing.get("time_to_first_token") is not None:
+            turn.set(ttft=timing["time_to_first_token"])
+        return result
+    
+    def _with_cache_control(self, message_params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Add prompt-cache breakpoints to a request.
+        
+        Breakpoints go on the last tool definition, on the system prompt (its last
+        block, unless the caller placed one already) and on the last content block
+        of the conversation, three of the API's four. The conversation breakpoint moves
+        forward with every request, so each iteration of a tool loop reads the prefix
+        written by the one before it. The caller's messages are never modified; only
+        the blocks that receive a breakpoint are copied.
+        
+        Args:
+            message_params: The request parameters
+            
+        Returns:
+            A copy of the request parameters with cache_control markers
+        """
+        if not self.prompt_caching:
+            return message_params
+        
+        cache_control = {"type": "ephemeral"}
+        params = dict(message_params)
+        
+        # Tools from the manifest already carry their breakpoint
+        tools = params.get("tools")
+        if tools and "cache_control" not in tools[-1]:
+            tools = list(tools)
+            tools[-1] = dict(tools[-1], cache_control=cache_control)
+            params["tools"] = tools
+        
+        system = params.get("system")
+        if isinstance(system, str) and system:
+            params["system"] = [{"type": "text", "text": system, "cache_control": cache_control}]
+        elif isinstance(system, list) and system and not any("cache_control" in block for block in system):
+            params["system"] = system[:-1] + [dict(system[-1], cache_control=cache_control)]
+        
+        messages = params.get("messages")
+        if messages:
+            last_message = messages[-1]
+            content = last_message["content"]
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}] if content else []
+            else:
+                content = list(content)
+            if content:
+                last_block = content[-1]
+                if not isinstance(last_block, dict):
+                    last_block = last_block.model_dump(exclude_none=True)
+                content[-1] = dict(last_block, cache_control=cache_control)
+                messages = list(messages)
+                messages[-1] = dict(last_message, content=content)
+                params["messages"] = messages
+        
+        return params
+    
+    def _cached_response(self, message_params: Dict[str, Any]) -> tuple:
+        """
+        Look a request up in the response cache.
+        
+        Args:
+            message_params: The request parameters
+            
+        Returns:
+            A (cache key, cached response) tuple. The key is None if the request is
+            not cacheable; the response is None on a miss. A cached response reports
+            zero usage, as answering it consumed no tokens.
+        """
+        cache = self.response_cache
+        if cache is None or not cache.applies_to(message_params):
+            return None, None
+        
+        key = cache.key(message_params)
+        cached = cache.get(key)
+        if cached is None:
+            return key, None
+        return key, anthropic.types.Message.model_validate(
+            dict(cached, usage={"input_tokens": 0, "output_tokens": 0})
+        )
+    
+    def _store_response(self, key: Optional[str], response) -> None:
+        """Store a fresh API response under the key returned by _cached_response."""
+        if key is not None:
+            self.response_cache.put(key, response.model_dump(mode="json"))
+    
+    def _admit(self, request_params: Dict[str, Any], usage: Optional[Dict[str, int]],
+               priority: Optional[Priority], counts: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Wait for the rate limiter, if any, to admit a request; returns its reservation."""
+        if self.rate_limiter is None:
+            return None
+        input_tokens = counts["input_tokens"] if counts is not None else None
+        reservation = self.rate_limiter.acquire(request_params, priority or self.priority, input_tokens)
+        if usage is not None:
+            usage["queue_wait"] += reservation["queue_wait"]
+        return reservation
+    
+    def _settle(self, reservation: Optional[Dict[str, Any]], response_usage=None) -> None:
+        """Report the actual usage of an admitted request (None if it failed) to the rate limiter."""
+        if reservation is not None:
+            self.rate_limiter.settle(reservation, response_usage)
+    
+    def _preflight(self, message_params: Dict[str, Any], span: Span) -> tuple:
+        """
+        Count a request's input tokens and fit its max_tokens to them, before it is sent.
+        
+        Requests near the context window are counted exactly with the count_tokens
+        endpoint; if that fails, the estimate is used.
+        
+        Args:
+            message_params: The request parameters
+            span: The request's span
+        
+        Returns:
+            A (request parameters, token counts or None) tuple
+        
+        Raises:
+            ValueError: If the request cannot fit in the context window, or max_tokens is
+                None without a token counter
+        """
+        if self.token_counter is None:
+            if message_params["max_tokens"] is None:
+                raise ValueError("max_tokens=None needs a token_counter to choose the limit")
+            return message_params, None
+        counts = self.token_counter.count(message_params)
+        if counts["near_limit"]:
+            try:
+                exact = self.client.messages.count_tokens(**self.token_counter.exact_params(message_params))
+                counts = self.token_counter.record_exact(counts, exact.input_tokens)
+            except anthropic.APIError:
+                pass
+        return self._fit_max_tokens(message_params, counts, span), counts
+    
+    def _fit_max_tokens(self, message_params: Dict[str, Any], counts: Dict[str, Any], span: Span) -> Dict[str, Any]:
+        """Apply the token counter's max_tokens to a counted request and note the counts on its span."""
+        max_tokens = self.token_counter.max_tokens(message_params["max_tokens"], counts["input_tokens"])
+        span.set(estimated_input_tokens=counts["input_tokens"], max_tokens=max_tokens)
+        if max_tokens != message_params["max_tokens"]:
+            message_params = dict(message_params, max_tokens=max_tokens)
+        return message_params
+    
+    def _regrow_truncated(self, message_params: Dict[str, Any], counts: Optional[Dict[str, Any]],
+                          response, usage: Dict[str, int]) -> Optional[Dict[str, Any]]:
+        """
+        Learn from a response and decide whether to resend its request with a larger max_tokens.
+        
+        Returns:
+            The parameters to resend with if max_tokens cut off a tool_use block and the
+            limit can grow, otherwise None
+        """
+        if self.token_counter is None:
+            return None
+        self.token_counter.observe(counts, response.usage)
+        if response.stop_reason != "max_tokens" or not response.content or response.content[-1].type != "tool_use":
+            return None
+        max_tokens = self.token_counter.grow_max_tokens(message_params["max_tokens"], counts["input_tokens"])
+        if max_tokens is None:
+            return None
+        # The cut-off response is discarded, but its tokens were still used
+        self._add_usage(usage, response.usage)
+        usage["max_tokens_retries"] += 1
+        return dict(message_params, max_tokens=max_tokens)
+    
+    def _send_message(self, request_params: Dict[str, Any], usage: Optional[Dict[str, int]],
+                      priority: Optional[Priority], counts: Optional[Dict[str, Any]] = None,
+                      deadline: Optional[float] = None):
+        """Make one attempt of a Messages API request through the rate limiter."""
+        reservation = self._admit(request_params, usage, priority, counts)
+        response = None
+        try:
+            response = self.client.messages.create(**request_params, **self._request_timeout(deadline))
+        finally:
+            self._settle(reservation, response.usage if response is not None else None)
+        return response
+    
+    def _request_timeout(self, deadline: Optional[float]) -> Dict[str, float]:
+        """
+        The SDK request options that end a request at the turn's deadline (none without one).
+        
+        Raises:
+            TimeoutError: If the deadline has already passed
+        """
+        if deadline is None:
+            return {}
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(TIMEOUT_WARNING)
+        return {"timeout": remaining}
+    
+    def _route(self, message_params: Dict[str, Any], usage: Dict[str, int]) -> tuple:
+        """
+        Apply the router, if any, to a request for the instance's model.
+        
+        Returns:
+            A (request parameters, routing reason or None) tuple
+        """
+        if self.router is None or message_params["model"] != self.model:
+            return message_params, None
+        model, reason = self.router.route(message_params, self.model, usage["escalations"] > 0)
+        if model != message_params["model"]:
+            message_params = dict(message_params, model=model)
+        return message_params, reason
+    
+    def _check_routed(self, message_params: Dict[str, Any], response, started: float) -> Optional[str]:
+        """
+        Record a routed request with the router and check whether it must be escalated.
+        
+        Args:
+            message_params: The request parameters
+            response: The API response, or None if the request failed with an API error
+            started: perf_counter value when the request was sent
+        
+        Returns:
+            The escalation reason, or None if the response stands
+        """
+        reason = None
+        if message_params["model"] != self.model:
+            reason = "error" if response is None else self.router.escalation(message_params, response)
+        self.router.record(message_params["model"], self.model, time.perf_counter() - started,
+                           response.usage if response is not None else None, failed=reason is not None)
+        return reason
+    
+    def _escalate(self, reason: str, response, usage: Dict[str, int], span: Span) -> None:
+        """Count an escalation; the discarded response's tokens were still used."""
+        if response is not None:
+            self._add_usage(usage, response.usage)
+        usage["escalations"] += 1
+        self.router.record_escalation(reason)
+        span.set(escalated=reason, model=self.model)
+    
+    def _send_fitted(self, message_params: Dict[str, Any], usage: Dict[str, int],
+                     priority: Optional[Priority], span: Span, deadline: Optional[float] = None):
+        """Preflight a request and send it, resending it while max_tokens cuts off a tool_use."""
+        message_params, counts = self._preflight(message_params, span)
+        while True:
+            request_params = self._with_cache_control(message_params)
+            response = self.retry_policy.call(
+                lambda: self._send_message(request_params, usage, priority, counts, deadline), usage, deadline
+            )
+            regrown = self._regrow_truncated(message_params, counts, response, usage)
+            if regrown is None:
+                return response
+            message_params = regrown
+    
+    def _send_routed(self, message_params: Dict[str, Any], usage: Dict[str, int],
+                     priority: Optional[Priority], span: Span, deadline: Optional[float] = None):
+        """Send a routed request, escalating it to the instance's model if the fast model fails."""
+        started = time.perf_counter()
+        try:
+            response = self._send_fitted(message_params, usage, priority, span, deadline)
+        except anthropic.APIError:
+            if message_params["model"] == self.model:
+                self._check_routed(message_params, None, started)
+                raise
+            response = None
+        reason = self._check_routed(message_params, response, started)
+        if reason is None:
+            return response
+        
+        self._escalate(reason, response, usage, span)
+        message_params = dict(message_params, model=self.model)
+        started = time.perf_counter()
+        try:
+            response = self._send_fitted(message_params, usage, priority, span, deadline)
+        except anthropic.APIError:
+            self._check_routed(message_params, None, started)
+            raise
+        self._check_routed(message_params, response, started)
+        return response
+    
+    def _create_message(self, message_params: Dict[str, Any], usage: Optional[Dict[str, int]] = None,
+                        priority: Optional[Priority] = None, parent: Optional[Span] = None,
+                        deadline: Optional[float] = None):
+        """
+        Send a Messages API request, answering it from the response cache if possible.
+        
+        Every attempt waits for the rate limiter (if any); transient errors are
+        retried according to the retry policy. With a router, the request may go to
+        the router's fast model and be escalated to the instance's model.
+        
+        Args:
+            message_params: The request parameters
+            usage: Optional usage tally that counts the retries and the queue wait
+            priority: Priority in the rate limiter's queue; defaults to the instance's
+            parent: Optional span of the call the request belongs to
+            deadline: Optional time.monotonic() of the turn's deadline, which ends the request
+                (raising the SDK's timeout error) and its retries
+            
+        Returns:
+            The API response
+        """
+        if usage is None:
+            usage = self._new_usage()
+        message_params, route = self._route(message_params, usage)
+        with self._span("llm.model_call", parent, model=message_params["model"], stream=False) as span:
+            if route is not None:
+                span.set(route=route)
+            key, response = self._cached_response(message_params)
+            if response is not None:
+                usage["cached_responses"] += 1
+                span.set(response_cached=True)
+                return response
+            
+            retries, queue_wait = usage["retries"], usage["queue_wait"]
+            if route is None:
+                response = self._send_fitted(message_params, usage, priority, span, deadline)
+            else:
+                response = self._send_routed(message_params, usage, priority, span, deadline)
+            self._store_response(key, response)
+            self._trace_response(span, response, usage, retries, queue_wait)
+            return response
+        
+    @contextmanager
+    def _stream_message(self, message_params: Dict[str, Any], usage: Optional[Dict[str, int]] = None,
+                        parent: Optional[Span] = None, deadline: Optional[float] = None):
+        """
+        Open a streaming Messages API request.
+        
+        Opening the stream waits for the rate limiter (if any) and is retried
+        according to the retry policy; errors after the first event has arrived
+        are not. With a router, the request may go to the router's fast model; it
+        cannot be escalated, but a failed fast response keeps the rest of the call
+        on the instance's model.
+        
+        Args:
+            message_params: The request parameters
+            usage: Optional usage tally that counts the retries and the queue wait
+            parent: Optional span of the call the request belongs to
+            deadline: Optional time.monotonic() of the turn's deadline; no read of the stream
+                waits past it (the caller stops reading once it has passed)
+            
+        Returns:
+            A context manager yielding (the SDK's message stream, the request's span).
+            The caller sets the span's "ttft" attribute when the first text arrives.
+        """
+        if usage is None:
+            usage = self._new_usage()
+        message_params, route = self._route(message_params, usage)
+        retries, queue_wait = usage["retries"], usage["queue_wait"]
+        started = time.perf_counter()
+        
+        def open_stream(stack: ExitStack):
+            reservation = self._admit(request_params, usage, None, counts)
+            try:
+                stream = stack.enter_context(self.client.messages.stream(**request_params,
+                                                                         **self._request_timeout(deadline)))
+            except BaseException:
+                self._settle(reservation)
+                raise
+            stack.callback(lambda: self._settle(reservation, self._stream_usage(stream)))
+            return stream
+        
+        with self._span("llm.model_call", parent, model=message_params["model"], stream=True) as span:
+            if route is not None:
+                span.set(route=route)
+            message_params, counts = self._preflight(message_params, span)
+            request_params = self._with_cache_control(message_params)
+            with ExitStack() as stack:
+                stream = self.retry_policy.call(lambda: open_stream(stack), usage, deadline)
+                yield stream, span
+            response_usage = self._stream_usage(stream)
+            if response_usage is not None:
+                if self.token_counter is not None:
+                    self.token_counter.observe(counts, response_usage)
+                self._trace_response(span, stream.current_message_snapshot, usage, retries, queue_wait)
+                if route is not None:
+                    reason = self._check_routed(message_params, stream.current_message_snapshot, started)
+                    if reason is not None:
+                        usage["escalations"] += 1
+                        self.router.record_escalation(reason)
+                        span.set(escalated=reason)
+    
+    def _stream_usage(self, stream):
+        """The usage received so far on a message stream, or None before message_start."""
+        try:
+            return stream.current_message_snapshot.usage
+        except AssertionError:
+            return None
+    
+    def _compact_history(self, history: History) -> tuple:
+        """
+        Apply the history manager, if any, to the history passed to a call.
+        
+        Returns:
+            A (history, compaction report or None) tuple
+        """
+        if self.history_manager is None:
+            return history, None
+        return self.history_manager.compact(self, history)
+    
+    def _report_compaction(self, result: Dict[str, Any], compaction: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Add the history compaction report to a result dictionary."""
+        if compaction is not None:
+            result["history_compaction"] = compaction
+        return result
+    
     def generate(self, 
                 prompt: str, 
                 system: Optional[str] = None,
-                max_tokens: int = 1000,
+                max_tokens: Optional[int] = 1000,
                 temperature: float = 1.0,
-                history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+                history: Optional[History] = None,
+                stream: bool = False) -> Union[Dict[str, Any], ResponseStream]:
         """
         Generate a response from the language model.
         
         Args:
             prompt: The user prompt to send to the model
             system: Optional system prompt to control model behavior
-            max_tokens: Maximum number of tokens to generate
+            max_tokens: Maximum number of tokens to generate; None lets the token counter
+                choose it (see TokenCounter.max_tokens)
             temperature: Controls randomness (0-1)
-            history: Optional conversation history from previous calls
+            history: Optional conversation history from previous calls: the Conversation
+                returned in a previous result, or a list of messages
+            stream: If True, return a ResponseStream that yields text chunks as they
+                arrive; its `result` holds the dictionary described below
             
         Returns:
-            Dictionary containing the response and updated conversation history
+            Dictionary containing the response, token usage and updated conversation history
         """
         # Initialize history if not provided
         if history is None:
             history = []
+        history, compaction = self._compact_history(history)
             
         # Create user message
         user_message = {
@@ -128,29 +1195,43 @@ class LLM:
             ]
         }
         
-        # Add to history if it's a new conversation
-        if not history:
-            messages = [user_message]
-        else:
-            # Use existing history and add new user message
-            messages = history + [user_message]
+        # Fork the history (or start a new conversation) and add the new user message
+        conversation = Conversation.of(history)
+        conversation.append(user_message)
         
         message_params = {
             "model": self.model,
             "max_tokens": max_tokens,
             "temperature": temperature,
-            "messages": messages
+            "messages": conversation.as_list()
         }
         
         if system:
             message_params["system"] = system
             
-        response = self.client.messages.create(**message_params)
+        if stream:
+            return ResponseStream(self._stream_generate(conversation, message_params, compaction))
+            
+        usage = self._new_usage()
+        with self._span("llm.turn", method="generate", model=self.model) as turn:
+            response = self._create_message(message_params, usage, parent=turn)
+            result = self._generate_result(conversation, response, usage)
+            return self._end_turn(turn, self._report_compaction(result, compaction), 1)
         
+    def _generate_result(self, conversation: Conversation, response, usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        Build the result dictionary of generate from the API response.
+        
+        Args:
+            conversation: The conversation the request was made with; the response is appended to it
+            response: The Messages API response
+            usage: Optional usage tally of the request, e.g. with its retries
+            
+        Returns:
+            Dictionary containing the response, token usage and updated conversation history
+        """
         # Extract the text content from the response
-        response_text = ""
-        if response.content:
-            response_text = response.content[0].text
+        response_text = self._extract_text(response)
             
         # Create assistant message to add to history
         assistant_message = {
@@ -164,50 +1245,252 @@ class LLM:
         }
         
         # Update history with new messages
-        updated_history = messages + [assistant_message]
+        conversation.append(assistant_message)
+        
+        if usage is None:
+            usage = self._new_usage()
+        self._add_usage(usage, response.usage)
         
         return {
             "response": response_text,
-            "history": updated_history
+            "history": conversation,
+            "usage": usage
+        }
+    
+    def _stream_generate(self,
+                         conversation: Conversation,
+                         message_params: Dict[str, Any],
+                         compaction: Optional[Dict[str, Any]] = None):
+        """Generator behind generate(stream=True): yields text chunks and returns the final result."""
+        started = time.perf_counter()
+        time_to_first_token = None
+        usage = self._new_usage()
+        
+        with self._span("llm.turn", method="generate_stream", model=self.model) as turn:
+            with self._stream_message(message_params, usage, turn) as (stream, call):
+                for text in stream.text_stream:
+                    if time_to_first_token is None:
+                        time_to_first_token = time.perf_counter() - started
+                        call.set(ttft=time_to_first_token)
+                    yield text
+                response = stream.get_final_message()
+        
+            result = self._generate_result(conversation, response, usage)
+            result["timing"] = {
+                "time_to_first_token": time_to_first_token,
+                "total": time.perf_counter() - started
+            }
+            return self._end_turn(turn, self._report_compaction(result, compaction), 1)
+    
+    def generate_batch(self,
+                       prompts: List[str],
+                       system: Optional[str] = None,
+                       max_tokens: int = 1000,
+                       temperature: float = 1.0,
+                       mode: str = "batch",
+                       max_workers: int = 8,
+                       batch_size: int = 10000,
+                       poll_interval: float = 1.0,
+                       max_poll_interval: float = 60.0) -> Iterator[Dict[str, Any]]:
+        """
+        Generate responses for many independent prompts.
+        
+        In "batch" mode the prompts are submitted through the Message Batches API,
+        split into batches of at most batch_size requests. The batches are polled
+        with exponential backoff from poll_interval up to max_poll_interval, and the
+        results of each batch are yielded as soon as it ends. Prompts whose response
+        is in the response cache are yielded first and not submitted. Closing the
+        iterator early cancels the batches that are still running.
+        
+        In "local" mode the prompts are sent as regular requests over a pool of
+        max_workers threads, and each result is yielded as soon as its request completes.
+        
+        Results arrive in completion order. Use their "index" to match them to prompts.
+        
+        Args:
+            prompts: The user prompts, one request each
+            system: Optional system prompt shared by all requests
+            max_tokens: Maximum number of tokens to generate per request
+            temperature: Controls randomness (0-1)
+            mode: "batch" for the Message Batches API, "local" for concurrent regular requests
+            max_workers: Maximum number of concurrent requests in local mode
+            batch_size: Maximum number of requests per message batch
+            poll_interval: Initial seconds between status checks of running batches
+            max_poll_interval: Maximum seconds between status checks
+            
+        Returns:
+            An iterator of result dictionaries. Each has the keys generate returns plus
+            "index" (the position of the prompt) and "custom_id". A prompt that failed
+            instead has "index", "custom_id" and "error".
+        """
+        if mode not in ("batch", "local"):
+            raise ValueError(f"Unknown batch mode: {mode!r}. Use 'batch' or 'local'.")
+        
+        requests = [
+            (index, self._batch_params(prompt, system, max_tokens, temperature))
+            for index, prompt in enumerate(prompts)
+        ]
+        if mode == "local":
+            return self._local_batch(requests, max_workers)
+        return self._message_batches(requests, batch_size, poll_interval, max_poll_interval)
+    
+    def _batch_params(self, prompt: str, system: Optional[str], max_tokens: int, temperature: float) -> Dict[str, Any]:
+        """Build the request parameters for one prompt of a batch (the request generate would send)."""
+        message_params = {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
         }
+        if system:
+            message_params["system"] = system
+        return message_params
+    
+    def _batch_item(self, index: int, message_params: Dict[str, Any], response=None,
+                    error: Optional[str] = None, usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """Build the result for one prompt of a batch from its response or error message."""
+        item = {"index": index, "custom_id": f"prompt-{index}"}
+        if response is None:
+            item["error"] = error
+        else:
+            item.update(self._generate_result(Conversation(message_params["messages"]), response, usage))
+        return item
+    
+    def _local_batch_request(self, index: int, message_params: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one request of a local batch and build its result."""
+        usage = self._new_usage()
+        try:
+            response = self._create_message(message_params, usage, priority="batch")
+        except Exception as e:
+            return self._batch_item(index, message_params, error=str(e))
+        return self._batch_item(index, message_params, response, usage=usage)
+    
+    def _local_batch(self, requests: List[tuple], max_workers: int) -> Iterator[Dict[str, Any]]:
+        """Generator behind generate_batch(mode="local")."""
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="llm-batch")
+        futures = [
+            executor.submit(self._local_batch_request, index, message_params)
+            for index, message_params in requests
+        ]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Don't send the remaining requests if the caller stopped early
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _pending_batch_requests(self, requests: List[tuple]) -> tuple:
+        """
+        Split batch requests into cached results and requests to submit.
+        
+        Returns:
+            A (cached result items, {custom_id: (index, cache key, message_params)}) tuple
+        """
+        cached_items = []
+        pending = {}
+        for index, message_params in requests:
+            key, response = self._cached_response(message_params)
+            if response is not None:
+                cached_items.append(self._batch_item(index, message_params, response))
+            else:
+                pending[f"prompt-{index}"] = (index, key, message_params)
+        return cached_items, pending
+    
+    def _batch_chunks(self, pending: Dict[str, tuple], batch_size: int) -> List[List[Dict[str, Any]]]:
+        """Build the "requests" arguments of the message batches to create."""
+        entries = [
+            {"custom_id": custom_id, "params": self._with_cache_control(message_params)}
+            for custom_id, (_, _, message_params) in pending.items()
+        ]
+        return [entries[start:start + batch_size] for start in range(0, len(entries), max(1, batch_size))]
+    
+    def _batch_result_item(self, pending: Dict[str, tuple], entry) -> Optional[Dict[str, Any]]:
+        """Turn one line of a message batch's results into a result item."""
+        if entry.custom_id not in pending:
+            return None
+        index, key, message_params = pending[entry.custom_id]
+        result = entry.result
+        if result.type == "succeeded":
+            self._store_response(key, result.message)
+            return self._batch_item(index, message_params, result.message)
+        if result.type == "errored":
+            error = result.error.error
+            return self._batch_item(index, message_params, error=f"{error.type}: {error.message}")
+        return self._batch_item(index, message_params, error=f"Request {result.type}")
+    
+    def _message_batches(self, requests: List[tuple], batch_size: int,
+                         poll_interval: float, max_poll_interval: float) -> Iterator[Dict[str, Any]]:
+        """Generator behind generate_batch(mode="batch")."""
+        cached_items, pending = self._pending_batch_requests(requests)
+        yield from cached_items
+        
+        batches = self.client.messages.batches
+        running = []
+        try:
+            for chunk in self._batch_chunks(pending, batch_size):
+                running.append(self.retry_policy.call(lambda: batches.create(requests=chunk)).id)
+            
+            interval = poll_interval
+            while running:
+                for batch_id in list(running):
+                    batch = self.retry_policy.call(lambda: batches.retrieve(batch_id))
+                    if batch.processing_status != "ended":
+                        continue
+                    running.remove(batch_id)
+                    for entry in self.retry_policy.call(lambda: batches.results(batch_id)):
+                        item = self._batch_result_item(pending, entry)
+                        if item is not None:
+                            yield item
+                if running:
+                    time.sleep(interval)
+                    interval = min(interval * 2, max_poll_interval)
+        finally:
+            # Don't leave batches running if the caller stopped early
+            for batch_id in running:
+                try:
+                    batches.cancel(batch_id)
+                except anthropic.APIError:
+                    pass
     
     def generate_with_tools(self,
                            prompt: str,
                            system: Optional[str] = None,
-                           max_tokens: int = 1000,
+                           max_tokens: Optional[int] = 1000,
                            temperature: float = 0.7,
                            max_iterations: int = 5,
-                           history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+                           history: Optional[History] = None,
+                           timeout: Optional[float] = None) -> Dict[str, Any]:
         """
         Generate a response with tool use capability.
         
         Args:
             prompt: The user prompt to send to the model
             system: Optional system prompt to control model behavior
-            max_tokens: Maximum number of tokens to generate
+            max_tokens: Maximum number of tokens to generate; None lets the token counter
+                choose it (see TokenCounter.max_tokens)
             temperature: Controls randomness (0-1)
             max_iterations: Maximum number of tool use iterations
-            history: Optional conversation history from previous calls
+            history: Optional conversation history from previous calls: the Conversation
+                returned in a previous result, or a list of messages
+            timeout: Optional seconds the whole call may take. Tool calls still running or
+                queued then are cancelled and reported to the model as such, and no further
+                request is made; the result carries a warning. A model request still running
+                at the deadline is aborted with the SDK's timeout error.
             
         Returns:
-            Dictionary containing the final response, tool usage history, and updated conversation history
+            Dictionary containing the final response, tool usage history, token usage, and updated conversation history
         """
         if not self.tools:
             # If no tools are registered, fall back to regular generation
             return self.generate(prompt, system, max_tokens, temperature, history)
         
-        # Prepare tools in the format expected by Claude
-        tools = []
-        for name, tool_info in self.tools.items():
-            tools.append({
-                "name": name,
-                "description": tool_info["description"],
-                "input_schema": tool_info["input_schema"]
-            })
-        
         # Initialize history if not provided
         if history is None:
             history = []
+        history, compaction = self._compact_history(history)
+        
+        # Prepare tools in the format expected by Claude
+        tools = self._tool_definitions(prompt, history)
         
         # Create user message
         user_message = {
@@ -215,146 +1498,216 @@ class LLM:
             "content": prompt
         }
         
-        # Add to history if it's a new conversation or use existing history
-        if not history:
-            messages = [user_message]
-        else:
-            # Use existing history and add new user message
-            messages = history + [user_message]
+        # Fork the history (or start a new conversation) and add the new user message
+        conversation = Conversation.of(history)
+        conversation.append(user_message)
         
         tool_usage = []
+        usage = self._new_usage()
         iterations = 0
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        lane = _SerialToolLane()
         
-        while iterations < max_iterations:
-            iterations += 1
+        with self._span("llm.turn", method="generate_with_tools", model=self.model) as turn:
+            while iterations < max_iterations:
+                if iterations and self._deadline_passed(deadline):
+                    break
+                iterations += 1
             
-            # Create message parameters
-            message_params = {
-                "model": self.model,
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "messages": messages,
-                "tools": tools
-            }
+                # Create message parameters
+                message_params = {
+                    "model": self.model,
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                    "messages": conversation.as_list(),
+                    "tools": tools
+                }
             
-            if system:
-                message_params["system"] = system
-            
-            # Get response from Claude
-            response = self.client.messages.create(**message_params)
-            
-            # Check if the response contains tool calls
-            tool_calls = []
-            for content_block in response.content:
-                if hasattr(content_block, 'type') and content_block.type == "tool_use":
-                    tool_calls.append({
-                        "name": content_block.name,
-                        "input": content_block.input,
-                        "id": content_block.id
-                    })
-            
-            # Create assistant message to add to history
-            assistant_content = response.content
-            assistant_message = {
-                "role": "assistant",
-                "content": assistant_content
-            }
+                if system:
+                    message_params["system"] = system
             
-            # Add assistant response to messages
-            messages.append(assistant_message)
+                # Get response from Claude
+                response = self._create_message(message_params, usage, parent=turn, deadline=deadline)
+                self._add_usage(usage, response.usage)
             
-            if not tool_calls:
-                # No tool calls, return the final response
-                final_response = ""
-                for content_block in response.content:
-                    if hasattr(content_block, 'type') and content_block.type == "text":
-                        final_response += content_block.text
-                
-                return {
-                    "response": final_response,
-                    "tool_usage": tool_usage,
-                    "history": messages
+                # Check if the response contains tool calls
+                tool_calls = self._extract_tool_calls(response)
+            
+                # Create assistant message to add to history
+                assistant_content = response.content
+                assistant_message = {
+                    "role": "assistant",
+                    "content": assistant_content
                 }
             
-            # Process tool calls
-            for tool_call in tool_calls:
-                tool_name = tool_call["name"]
-                tool_input = tool_call["input"]
-                tool_id = tool_call["id"]
-                
-                if tool_name in self.tools:
-                    try:
-                        # Execute the tool
-                        tool_function = self.tools[tool_name]["function"]
-                        
-                        # Parse the input as needed
-                        if isinstance(tool_input, str):
-                            try:
-                                input_dict = json.loads(tool_input)
-                            except json.JSONDecodeError:
-                                input_dict = {"input": tool_input}
-                        else:
-                            input_dict = tool_input
-                            
-                        tool_result = tool_function(**input_dict)
-                        
-                        # Record tool usage
-                        tool_usage.append({
-                            "tool": tool_name,
-                            "input": tool_input,
-                            "output": tool_result,
-                            "id": tool_id
-                        })
-                        
-                        # Add tool result to messages
-                        tool_result_message = {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "tool_result",
-                                    "tool_use_id": tool_id,
-                                    "content": json.dumps(tool_result),
-                                }
-                            ]
-                        }
-                        
-                        messages.append(tool_result_message)
-                    except Exception as e:
-                        # Handle tool execution errors
-                        error_message = f"Error executing tool {tool_name}: {str(e)}"
-                        error_message_obj = {
-                            "role": "system",
-                            "content": error_message
+                # Add assistant response to the conversation
+                conversation.append(assistant_message)
+            
+                if not tool_calls:
+                    # No tool calls, return the final response
+                    return self._end_turn(turn, self._report_compaction({
+                        "response": self._extract_text(response),
+                        "tool_usage": tool_usage,
+                        "history": conversation,
+                        "usage": usage
+                    }, compaction), iterations)
+            
+                # Process tool calls and send every result back in a single user message,
+                # in the order the model requested them
+                turn_usage, tool_results = self._execute_tool_calls(tool_calls, turn, deadline, lane)
+                tool_usage.extend(turn_usage)
+                conversation.append({
+                    "role": "user",
+                    "content": tool_results
+                })
+                tools = self._expand_tools(tools, tool_calls)
+        
+            # If we've reached the maximum number of iterations (or the deadline), return the last response
+            return self._end_turn(turn, self._report_compaction({
+                "response": self._extract_text(response),
+                "tool_usage": tool_usage,
+                "history": conversation,
+                "usage": usage,
+                "warning": self._loop_warning(deadline)
+            }, compaction), iterations)
+    
+    def stream_with_tools(self,
+                          prompt: str,
+                          system: Optional[str] = None,
+                          max_tokens: Optional[int] = 1000,
+                          temperature: float = 0.7,
+                          max_iterations: int = 5,
+                          history: Optional[History] = None,
+                          timeout: Optional[float] = None) -> ResponseStream:
+        """
+        Streaming variant of generate_with_tools.
+        
+        Text deltas are yielded as they arrive. Each tool call is started as soon
+        as its tool_use block is complete, while the model is still streaming the
+        rest of the turn, so tool latency overlaps with generation. Tool results
+        are still sent back in request order in a single user message.
+        
+        Args:
+            prompt: The user prompt to send to the model
+            system: Optional system prompt to control model behavior
+            max_tokens: Maximum number of tokens to generate; None lets the token counter
+                choose it (see TokenCounter.max_tokens)
+            temperature: Controls randomness (0-1)
+            max_iterations: Maximum number of tool use iterations
+            history: Optional conversation history from previous calls: the Conversation
+                returned in a previous result, or a list of messages
+            timeout: Optional seconds the whole call may take (see generate_with_tools)
+        
+        Returns:
+            A ResponseStream of text chunks whose `result` is the same dictionary
+            generate_with_tools returns
+        """
+        return ResponseStream(self._stream_with_tools(
+            prompt, system, max_tokens, temperature, max_iterations, history, timeout
+        ))
+    
+    def _stream_with_tools(self, prompt, system, max_tokens, temperature, max_iterations, history, timeout=None):
+        """Generator behind stream_with_tools: yields text chunks and returns the final result."""
+        lane = _SerialToolLane()
+        try:
+            return (yield from self._stream_turn(
+                prompt, system, max_tokens, temperature, max_iterations, history, timeout, lane
+            ))
+        finally:
+            lane.close()
+    
+    def _stream_turn(self, prompt, system, max_tokens, temperature, max_iterations, history, timeout, lane):
+        """The turn of _stream_with_tools, with its tools' serial lane."""
+        if history is None:
+            history = []
+        history, compaction = self._compact_history(history)
+        tools = self._tool_definitions(prompt, history)
+        
+        conversation = Conversation.of(history)
+        conversation.add_user(prompt)
+        tool_usage = []
+        usage = self._new_usage()
+        iterations = 0
+        started = time.perf_counter()
+        time_to_first_token = None
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        
+        with self._span("llm.turn", method="stream_with_tools", model=self.model) as turn:
+            while iterations < max_iterations:
+                if iterations and self._deadline_passed(deadline):
+                    break
+                iterations += 1
+            
+                message_params = {
+                    "model": self.model,
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                    "messages": conversation.as_list()
+                }
+            
+                if tools:
+                    message_params["tools"] = tools
+            
+                if system:
+                    message_params["system"] = system
+            
+                # Dispatch each tool as soon as its block has been streamed completely
+                pending = []
+                call_started = time.perf_counter()
+                call_ttft = None
+                with self._stream_message(message_params, usage, turn, deadline) as (stream, call):
+                    for event in stream:
+                        if deadline is not None and time.monotonic() >= deadline:
+                            raise TimeoutError(TIMEOUT_WARNING)
+                        if event.type == "text":
+                            if time_to_first_token is None:
+                                time_to_first_token = time.perf_counter() - started
+                            if call_ttft is None:
+                                call_ttft = time.perf_counter() - call_started
+                                call.set(ttft=call_ttft)
+                            yield event.text
+                        elif event.type == "content_block_stop" and event.content_block.type == "tool_use":
+                            pending.append(self._submit_tool_call({
+                                "name": event.content_block.name,
+                                "input": event.content_block.input,
+                                "id": event.content_block.id
+                            }, turn, deadline, lane))
+                    response = stream.get_final_message()
+                self._add_usage(usage, response.usage)
+            
+                conversation.append({
+                    "role": "assistant",
+                    "content": response.content
+                })
+            
+                if not pending:
+                    return self._end_turn(turn, self._report_compaction({
+                        "response": self._extract_text(response),
+                        "tool_usage": tool_usage,
+                        "history": conversation,
+                        "usage": usage,
+                        "timing": {
+                            "time_to_first_token": time_to_first_token,
+                            "total": time.perf_counter() - started
                         }
-                        messages.append(error_message_obj)
-                        tool_usage.append({
-                            "tool": tool_name,
-                            "input": tool_input,
-                            "error": error_message
-                        })
-                else:
-                    # Tool not found
-                    error_message = f"Tool {tool_name} not found"
-                    error_message_obj = {
-                        "role": "system",
-                        "content": error_message
-                    }
-                    messages.append(error_message_obj)
-                    tool_usage.append({
-                        "tool": tool_name,
-                        "input": tool_input,
-                        "error": error_message
-                    })
-        
-        # If we've reached the maximum number of iterations, return the last response
-        final_response = ""
-        for content_block in response.content:
-            if hasattr(content_block, 'type') and content_block.type == "text":
-                final_response += content_block.text
+                    }, compaction), iterations)
+            
+                outcomes = [future.result() for future in pending]
+                tool_usage.extend(usage for usage, _ in outcomes)
+                conversation.append({
+                    "role": "user",
+                    "content": [block for _, block in outcomes]
+                })
+                tools = self._expand_tools(tools, self._extract_tool_calls(response))
         
-        return {
-            "response": final_response,
-            "tool_usage": tool_usage,
-            "history": messages,
-            "warning": "Maximum number of tool use iterations reached"
-        } 
\ No newline at end of file
+            return self._end_turn(turn, self._report_compaction({
+                "response": self._extract_text(response),
+                "tool_usage": tool_usage,
+                "history": conversation,
+                "usage": usage,
+                "timing": {
+                    "time_to_first_token": time_to_first_token,
+                    "total": time.perf_counter() - started
+                },
+                "warning": self._loop_warning(deadline)
+            }, compaction), iterations)
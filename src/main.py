@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+import threading
 from pathlib import Path
 
 # Add the project root to the Python path to make imports work
@@ -8,24 +9,59 @@ project_root = Path(__file__).parent.parent.absolute()
 sys.path.insert(0, str(project_root))
 
 from src.utils.environment import load_env_from_file
-# from src.utils.sample_tools import sample_tools as llm_tools
-# from src.utils.magic_tools import magic_tools as llm_tools
-# from src.utils.obsidian_tools import obsidian_tools as llm_tools
-# from src.utils.pokemon_tools import pokemon_tools as llm_tools
-# from src.utils.unit_calculator_tools import unit_calculator_tools as llm_tools
-from src.utils.patient_workflow import sample_tools as llm_tools
-# llm_tools = []
+from src.history import HistoryManager
 from src.llm import LLM
+from src.telemetry import JsonlSink
+from src.token_counter import TokenCounter
+from src.toolsets import ToolsetRegistry
 
 # Load environment variables from .env file
 env_vars = load_env_from_file('.env')
 
-# Create an instance of the LLM class
-llm = LLM()
+# Write a span for every turn, model call and tool call to LLM_TRACE_FILE, if set
+trace_file = os.environ.get('LLM_TRACE_FILE')
+telemetry = JsonlSink(trace_file) if trace_file else None
 
+# Record the API traffic to LLM_RECORD_FILE, or replay LLM_REPLAY_FILE (with recorded tool results)
+cassette = None
+if os.environ.get('LLM_RECORD_FILE'):
+    from src.cassette import Cassette
+    cassette = Cassette(os.environ['LLM_RECORD_FILE'], mode="record")
+elif os.environ.get('LLM_REPLAY_FILE'):
+    from src.cassette import Cassette
+    cassette = Cassette(os.environ['LLM_REPLAY_FILE'], stub_tools=True)
 
-for tool in llm_tools:
-    llm.register_tool(**tool)
+# The toolsets to enable (comma-separated names from src/toolsets.py), imported when the LLM is created
+TOOLSETS = [name.strip() for name in os.environ.get('LLM_TOOLSETS', 'patient_workflow').split(',') if name.strip()]
+toolsets = ToolsetRegistry()
+
+# The system prompt of every turn, chosen by the first enabled toolset
+SYSTEM_PROMPTS = {
+    "obsidian": """You are a helpful assistant with access to tools that can 
+create and update markdown files in a Obsidian vault. You can link a file in another
+file with the [[file_name]] syntax.
+""",
+    "magic": """You are an assistant to me. Do what ever I say. You have spells under your arsenal.  """,
+    "pokemon": "You are a pokemon trainer. You have can have pokemons. You can store and retrieve pokemons.",
+    "sample": """You are a helpful assistant that can use tools to help the user. You can give me time and weather""",
+    "unit_calculator": """You are a helpful assistant that can calculate the cost of appliances in the user's home.""",
+    "patient_workflow": """You are a helpful assistant that can use tools to help the user. You can create patients, add patient information, and check if a patient is eligible for a study. 
+If a patient is created, ask for age and then for gender. Once that is there check if they are eligible for the study. If they are, send a message to the patient. If they are not, say that they are not eligible for the study.
+"""
+}
+SYSTEM_PROMPT = SYSTEM_PROMPTS.get(TOOLSETS[0] if TOOLSETS else None, """You are a helpful assistant""")
+
+
+def create_llm():
+    """Create the LLM with the TOOLSETS registered; shared by this REPL and src/server.py."""
+    # Independent tool calls from one turn run concurrently, a tool call that takes longer than
+    # 30s is reported to the model as timed out, requests are counted before they are sent and
+    # the conversation history is compacted once it grows beyond 50k tokens
+    token_counter = TokenCounter()
+    llm = LLM(max_tool_workers=4, history_manager=HistoryManager(max_tokens=50000, token_counter=token_counter),
+              telemetry=telemetry, cassette=cassette, token_counter=token_counter, tool_timeout=30.0)
+    toolsets.enable(llm, TOOLSETS)
+    return llm
 
 
 def print_tool_usage(tool_usage):
@@ -44,26 +80,26 @@ def print_tool_usage(tool_usage):
         else:
             print(f"Output: {json.dumps(usage['output'], indent=2)}")
 
+def print_timing(result):
+    """Print latency and token usage for the last turn."""
+    timing = result.get('timing', {})
+    usage = result.get('usage', {})
+    ttft = timing.get('time_to_first_token')
+    ttft_text = f"{ttft:.2f}s" if ttft is not None else "n/a"
+    print(f"\n[first token {ttft_text}, total {timing.get('total', 0):.2f}s, "
+          f"{usage.get('input_tokens', 0)} input / {usage.get('output_tokens', 0)} output tokens]")
+    compaction = result.get('history_compaction')
+    if compaction and compaction['tokens_after'] < compaction['tokens_before']:
+        print(f"[history compacted from ~{compaction['tokens_before']} to ~{compaction['tokens_after']} tokens]")
+
 def main():
     """Main function to demonstrate the LLM with tools."""
     print("Claude with Tools Demo")
     print("Type 'exit' to quit\n")
     
-    # system_prompt = """You are a helpful assistant"""
-    # system_prompt = """You are a helpful assistant with access to tools that can 
-    # create and update markdown files in a Obsidian vault. You can link a file in another
-    # file with the [[file_name]] syntax.
-    # """
-
-    # system_prompt = """You are an assistant to me. Do what ever I say. You have spells under your arsenal.  """
-    # system_prompt = "You are a pokemon trainer. You have can have pokemons. You can store and retrieve pokemons."
-
-    # system_prompt = """You are a helpful assistant that can use tools to help the user. You can give me time and weather"""
-    # system_prompt = """You are a helpful assistant that can calculate the cost of appliances in the user's home."""
-
-    system_prompt = """You are a helpful assistant that can use tools to help the user. You can create patients, add patient information, and check if a patient is eligible for a study. 
-    If a patient is created, ask for age and then for gender. Once that is there check if they are eligible for the study. If they are, send a message to the patient. If they are not, say that they are not eligible for the study.
-    """
+    llm = create_llm()
+    # Import the SDK and create the client while the user types the first prompt
+    threading.Thread(target=lambda: llm.client, name="client-warmup", daemon=True).start()
     
     conversation_history = None
     
@@ -72,27 +108,27 @@ def main():
         if user_input.lower() in ['exit', 'quit']:
             break
         
-        # Use regular generate without tools
-        # result = llm.generate(
-        #     prompt=user_input,
-        #     system=system_prompt,
-        #     temperature=0.7,
-        #     history=conversation_history
-        # )
-        
-        # To use with tools (uncomment the below and comment out the above generate call)
-        result = llm.generate_with_tools(
+        # Without tools, llm.generate(..., stream=True) takes the same arguments
+        # (except max_iterations) and returns the same kind of stream
+        stream = llm.stream_with_tools(
             prompt=user_input,
-            system=system_prompt,
+            system=SYSTEM_PROMPT,
             max_iterations=50,
             temperature=0.7,
             history=conversation_history
         )
         
+        # Print tokens as they arrive
+        print("\nClaude: ", end="", flush=True)
+        for chunk in stream:
+            print(chunk, end="", flush=True)
+        print()
+        result = stream.result
+        
         # Update conversation history for next iteration
         conversation_history = result['history']
         
-        print(f"\nClaude: {result['response']}")
+        print_timing(result)
         
         # if 'tool_usage' in result and result['tool_usage']:
         #     print_tool_usage(result['tool_usage'])
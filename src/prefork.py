@@ -0,0 +1,512 @@
+import argparse
+import http.client
+import importlib
+import json
+import os
+import select
+import signal
+import sys
+import threading
+import time
+import traceback
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from src.llm import LLM
+from src.server import LLMServer
+from src.session_store import SessionStore
+
+# Response headers that describe one connection rather than the response
+HOP_BY_HOP_HEADERS = frozenset(["connection", "keep-alive", "transfer-encoding", "proxy-connection", "upgrade"])
+
+# Seconds a worker gets to report its port before it is killed (and forked again)
+WORKER_START_TIMEOUT = 60.0
+
+
+class PreforkServer:
+    """
+    Serves sessions from several worker processes behind one sticky proxy.
+    
+    The supervisor process forks worker processes after everything it has
+    imported (the LLM factory's module, the preload modules such as the SDK,
+    and any toolsets loaded beforehand) is loaded, so that code is shared
+    copy-on-write rather than imported again by every worker. Each worker builds its own LLM with
+    create_llm and runs an LLMServer on a private port, with its own
+    SessionStore on the shared sessions_db. The supervisor listens on
+    host:port and relays every request to the worker that owns the session
+    (crc32 of its id modulo the number of workers); it picks the ids of new
+    sessions itself, so a session's history and tool state stay in the memory
+    of one worker. Streamed turns are relayed as they arrive.
+    
+    The workers are forked by a manager process, itself forked before the
+    supervisor starts any thread, so no fork ever happens in a process with
+    running threads (whose locks the child could inherit held). The manager
+    stays single-threaded: it forks a worker again when one exits and reports
+    the workers' ports and exits to the supervisor over a pipe. Until a worker
+    is ready its sessions get 503 with Retry-After; the new worker loads them
+    from the shared SQLite store on first use, so only turns that were running
+    are lost. Since the tool calls of all workers run in parallel processes,
+    CPU-heavy tools are no longer serialized by one interpreter's GIL.
+    
+    Usage:
+        from src.main import SYSTEM_PROMPT, create_llm
+        with PreforkServer(create_llm, workers=4, system=SYSTEM_PROMPT, port=8080) as server:
+            server.wait()
+    """
+    
+    def __init__(self,
+                 create_llm: Callable[[], LLM],
+                 workers: Optional[int] = None,
+                 sessions_db: str = "sessions.db",
+                 max_sessions: int = 1000,
+                 host: str = "127.0.0.1",
+                 port: int = 8080,
+                 preload: Iterable[str] = ("anthropic",),
+                 **server_options: Any):
+        """
+        Initialize the supervisor.
+        
+        Args:
+            create_llm: Function returning the LLM (with its tools registered) of a worker;
+                called once in each worker after the fork
+            workers: Number of worker processes; defaults to the number of CPUs
+            sessions_db: SQLite file of the SessionStore the workers share
+            max_sessions: Sessions each worker keeps in memory
+            host: Interface the proxy binds to
+            port: Port the proxy binds to; 0 picks a free one
+            preload: Modules the supervisor imports before forking, which the LLM clients
+                would otherwise import lazily in every worker
+            **server_options: Further LLMServer arguments (system, max_concurrent, max_queue,
+                default_timeout, ...) for every worker
+        """
+        if not hasattr(os, "fork"):
+            raise ValueError("PreforkServer needs os.fork, which this platform does not have")
+        self.create_llm = create_llm
+        self.workers = workers or os.cpu_count() or 1
+        self.sessions_db = sessions_db
+        self.max_sessions = max_sessions
+        self.server_options = server_options
+        self.preload = list(preload)
+        self._workers: List[Dict[str, Any]] = [
+            {"index": index, "pid": None, "port": None, "started": None, "restarts": 0}
+            for index in range(self.workers)
+        ]
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._manager = None
+        self._commands = None
+        self._events = None
+        self._event_buffer = b""
+        self._monitor = None
+        self._thread = None
+        self._httpd = _ProxyHTTPServer((host, port), _ProxyHandler)
+        self._httpd.supervisor = self
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def worker_for(self, session_id: str) -> int:
+        """The index of the worker that owns a session."""
+        return zlib.crc32(session_id.encode("utf-8")) % self.workers
+    
+    def worker_port(self, index: int) -> Optional[int]:
+        """The port of a worker, or None while it is (re)starting."""
+        with self._lock:
+            return self._workers[index]["port"]
+    
+    def start(self) -> "PreforkServer":
+        """Fork the manager and its workers, wait until they are ready and start the proxy on a background thread."""
+        for module_name in self.preload:
+            importlib.import_module(module_name)
+        command_read, self._commands = os.pipe()
+        self._events, event_write = os.pipe()
+        self._manager = os.fork()
+        if self._manager == 0:
+            os.close(self._commands)
+            os.close(self._events)
+            code = 0
+            try:
+                self._run_manager(command_read, event_write)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        
+        os.close(command_read)
+        os.close(event_write)
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        while not all(worker["port"] for worker in self._workers):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._read_events(remaining):
+                break
+        self._monitor = threading.Thread(target=self._watch, name="prefork-monitor", daemon=True)
+        self._monitor.start()
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="prefork-proxy", daemon=True)
+        self._thread.start()
+        return self
+    
+    def wait(self) -> None:
+        """Block until stop is called (or Ctrl-C)."""
+        try:
+            while not self._stopping.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+    
+    def stop(self, timeout: float = 30.0) -> None:
+        """
+        Stop the proxy and the workers.
+        
+        Args:
+            timeout: Seconds the workers get to finish their running turns before they are killed
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+        self._httpd.server_close()
+        if self._manager is None:
+            return
+        # The manager stops the workers; its exit ends the monitor's event stream
+        os.write(self._commands, f"stop {timeout}\n".encode("ascii"))
+        os.close(self._commands)
+        deadline = time.monotonic() + timeout + 5.0
+        while not self._reap(self._manager):
+            if time.monotonic() >= deadline:
+                self._signal(self._manager, signal.SIGKILL)
+                os.waitpid(self._manager, 0)
+                break
+            time.sleep(0.05)
+        if self._monitor is not None:
+            self._monitor.join()
+        os.close(self._events)
+        self._manager = None
+    
+    def __enter__(self) -> "PreforkServer":
+        return self.start()
+    
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+    
+    def _run_manager(self, command_fd: int, event_fd: int) -> None:
+        """
+        Body of the manager process: fork the workers and fork them again when they exit.
+        
+        Reports "ready <index> <pid> <port>" and "exit <index> <pid>" lines on event_fd
+        until "stop <timeout>" arrives on command_fd (or the supervisor is gone).
+        """
+        # The proxy's socket belongs to the supervisor
+        self._httpd.socket.close()
+        stop_timeout = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_timeout.append(30.0))
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        workers: Dict[int, Dict[str, Any]] = {}
+        
+        def report(*fields) -> None:
+            os.write(event_fd, (" ".join(str(field) for field in fields) + "\n").encode("ascii"))
+        
+        def spawn(index: int) -> None:
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                for fd in (read_fd, command_fd, event_fd):
+                    os.close(fd)
+                code = 0
+                try:
+                    self._run_worker(write_fd)
+                except BaseException:
+                    traceback.print_exc()
+                    code = 1
+                finally:
+                    os._exit(code)
+            os.close(write_fd)
+            workers[pid] = {"index": index, "ready_fd": read_fd, "deadline": time.monotonic() + WORKER_START_TIMEOUT}
+        
+        def started(pid: int) -> None:
+            # Stop waiting for the worker to report its port
+            os.close(workers[pid]["ready_fd"])
+            workers[pid]["ready_fd"] = None
+        
+        for index in range(self.workers):
+            spawn(index)
+        while not stop_timeout:
+            waiting = {worker["ready_fd"]: pid for pid, worker in workers.items() if worker["ready_fd"] is not None}
+            readable, _, _ = select.select([command_fd, *waiting], [], [], 0.2)
+            for fd in readable:
+                if fd == command_fd:
+                    command = os.read(command_fd, 64).split()
+                    stop_timeout.append(float(command[1]) if command[:1] == [b"stop"] else 30.0)
+                    continue
+                pid = waiting[fd]
+                line = os.read(fd, 64)
+                started(pid)
+                if line.strip():
+                    report("ready", workers[pid]["index"], pid, int(line))
+                else:
+                    self._signal(pid, signal.SIGKILL)
+            for pid, worker in workers.items():
+                if worker["ready_fd"] is not None and time.monotonic() > worker["deadline"]:
+                    # The worker failed to start (or is stuck); it is forked again once it is gone
+                    started(pid)
+                    self._signal(pid, signal.SIGKILL)
+            for pid in [pid for pid in workers if self._reap(pid)]:
+                worker = workers.pop(pid)
+                if worker["ready_fd"] is not None:
+                    os.close(worker["ready_fd"])
+                report("exit", worker["index"], pid)
+                if not stop_timeout:
+                    spawn(worker["index"])
+        
+        for pid in workers:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + stop_timeout[0]
+        for pid in workers:
+            while not self._reap(pid):
+                if time.monotonic() >= deadline:
+                    self._signal(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    break
+                time.sleep(0.05)
+    
+    def _run_worker(self, ready_fd: int) -> None:
+        """Body of a worker process: serve an LLMServer until SIGTERM."""
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        
+        sessions = SessionStore(self.sessions_db, max_sessions=self.max_sessions)
+        server = LLMServer(self.create_llm(), sessions=sessions, host="127.0.0.1", port=0, **self.server_options)
+        server.start()
+        os.write(ready_fd, f"{server._httpd.server_address[1]}\n".encode("ascii"))
+        os.close(ready_fd)
+        while not stopping.wait(1.0):
+            pass
+        server.stop()
+        sessions.close()
+    
+    def _watch(self) -> None:
+        """Track the workers the manager reports until it exits."""
+        while self._read_events(None):
+            pass
+    
+    def _read_events(self, timeout: Optional[float]) -> bool:
+        """
+        Apply the manager's reports to the workers' pids and ports.
+        
+        Args:
+            timeout: Seconds to wait for a report, or None to wait until one arrives
+        
+        Returns:
+            False once the manager has exited
+        """
+        readable, _, _ = select.select([self._events], [], [], timeout)
+        if not readable:
+            return True
+        chunk = os.read(self._events, 4096)
+        if not chunk:
+            return False
+        *lines, self._event_buffer = (self._event_buffer + chunk).split(b"\n")
+        with self._lock:
+            for line in lines:
+                kind, index, pid, *port = line.decode("ascii").split()
+                worker = self._workers[int(index)]
+                if kind == "ready":
+                    worker.update(pid=int(pid), port=int(port[0]), started=time.time())
+                elif worker["pid"] in (None, int(pid)):
+                    worker["pid"] = worker["port"] = None
+                    worker["restarts"] += 1
+        return True
+    
+    def _reap(self, pid: int) -> bool:
+        """Whether a worker has exited (collecting its status)."""
+        try:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            return True
+        return done == pid
+    
+    def _signal(self, pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the workers' statistics.
+        
+        Returns:
+            Dictionary with, per worker, its pid, port, restarts and the stats of its
+            LLMServer (or the error fetching them), and the turn counters summed over workers
+        """
+        with self._lock:
+            workers = [dict(worker) for worker in self._workers]
+        totals: Dict[str, int] = {}
+        for worker in workers:
+            if worker["port"] is None:
+                worker["stats"] = None
+                continue
+            connection = http.client.HTTPConnection("127.0.0.1", worker["port"], timeout=5)
+            try:
+                connection.request("GET", "/v1/health")
+                worker["stats"] = json.loads(connection.getresponse().read())
+            except OSError as e:
+                worker["stats"] = {"error": f"{type(e).__name__}: {e}"}
+                continue
+            finally:
+                connection.close()
+            for name in ("turns", "completed", "failed", "rejected", "busy", "expired_in_queue",
+                         "deadline_exceeded", "cancelled", "running", "queued"):
+                totals[name] = totals.get(name, 0) + worker["stats"].get(name, 0)
+        return {"workers": workers, **totals}
+
+
+class _ProxyHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format: str, *args) -> None:
+        pass
+    
+    @property
+    def supervisor(self) -> PreforkServer:
+        return self.server.supervisor
+    
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0].rstrip("/") == "/v1/health":
+            self._send_json(200, self.supervisor.stats())
+        else:
+            self._forward()
+    
+    def do_POST(self) -> None:
+        self._forward()
+    
+    def do_DELETE(self) -> None:
+        self._forward()
+    
+    def _forward(self) -> None:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The body cannot be skipped without its length, so the connection cannot be reused
+            self.close_connection = True
+            self._send_json(400, {"error": "Invalid Content-Length header"})
+            return
+        body = self.rfile.read(length)
+        parts = self.path.split("?", 1)[0].strip("/").split("/")
+        if parts[:2] != ["v1", "sessions"]:
+            self._send_json(404, {"error": f"{self.command} {self.path} is not supported"})
+            return
+        if len(parts) == 2:
+            # Name new sessions here so they are created on the worker that will own them
+            try:
+                request = json.loads(body) if body else {}
+            except ValueError:
+                request = None
+            if not isinstance(request, dict):
+                self._send_json(400, {"error": "The request body must be a JSON object"})
+                return
+            request.setdefault("session_id", uuid.uuid4().hex)
+            session_id = str(request["session_id"])
+            body = json.dumps(request).encode("utf-8")
+        else:
+            session_id = parts[2]
+        
+        index = self.supervisor.worker_for(session_id)
+        port = self.supervisor.worker_port(index)
+        if port is None:
+            self._send_json(503, {"error": f"Worker {index} is restarting"}, {"Retry-After": "1"})
+            return
+        
+        upstream = http.client.HTTPConnection("127.0.0.1", port)
+        try:
+            upstream.request(self.command, self.path, body=body,
+                             headers={"Content-Type": "application/json", "Content-Length": str(len(body))})
+            response = upstream.getresponse()
+        except ConnectionRefusedError:
+            # The worker died and the monitor has not noticed yet
+            upstream.close()
+            self._send_json(503, {"error": f"Worker {index} is restarting"}, {"Retry-After": "1"})
+            return
+        except OSError as e:
+            upstream.close()
+            self._send_json(502, {"error": f"Worker {index} failed: {type(e).__name__}: {e}"})
+            return
+        
+        try:
+            self._relay(response)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away; closing the upstream connection cancels the worker's turn
+            self.close_connection = True
+        finally:
+            upstream.close()
+    
+    def _relay(self, response: http.client.HTTPResponse) -> None:
+        """Copy a worker's response to the client, streaming bodies of unknown length."""
+        self.send_response(response.status, response.reason)
+        for name, value in response.getheaders():
+            if name.lower() not in HOP_BY_HOP_HEADERS:
+                self.send_header(name, value)
+        length = response.getheader("Content-Length")
+        if length is None:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        if length is not None:
+            self.wfile.write(response.read())
+            return
+        while True:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve chat sessions from several worker processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-concurrent", type=int, default=8, help="turns that run at the same time per worker")
+    parser.add_argument("--max-queue", type=int, default=32, help="turns that may wait per worker before 503")
+    parser.add_argument("--timeout", type=float, default=60.0, help="default turn deadline in seconds")
+    parser.add_argument("--sessions-db", default="sessions.db", help="SQLite file the workers share")
+    parser.add_argument("--max-sessions", type=int, default=1000, help="sessions kept in memory per worker")
+    args = parser.parse_args()
+    
+    from src.main import SYSTEM_PROMPT, TOOLSETS, create_llm, toolsets
+    for name in TOOLSETS:
+        toolsets.load(name)
+    server = PreforkServer(create_llm, workers=args.workers, sessions_db=args.sessions_db,
+                           max_sessions=args.max_sessions, host=args.host, port=args.port,
+                           system=SYSTEM_PROMPT, max_concurrent=args.max_concurrent, max_queue=args.max_queue,
+                           default_timeout=args.timeout)
+    with server:
+        print(f"Serving on {server.base_url} with {server.workers} workers", file=sys.stderr)
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
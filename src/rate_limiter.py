@@ -0,0 +1,308 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from src.lazy_import import LazyModule
+from src.response_cache import _jsonable
+
+# Only acquire_async needs asyncio, so synchronous programs never import it
+asyncio = LazyModule("asyncio")
+
+# Named priorities; lower values are admitted first
+PRIORITIES = {
+    "interactive": 0,
+    "default": 50,
+    "batch": 100
+}
+
+Priority = Union[str, int]
+
+
+class _TokenBucket:
+    """A bucket holding up to burst_seconds' worth of a per-minute limit, refilled continuously."""
+    
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+    
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, cost: float) -> float:
+        """Seconds until the bucket holds cost (capped at its capacity), after refill()."""
+        missing = min(cost, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+    
+    def adjust(self, amount: float) -> None:
+        """Take amount out of the bucket (negative amounts put tokens back)."""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """
+    Client-side token buckets for the requests, input tokens and output tokens per minute.
+    
+    Share one RateLimiter between all LLM / AsyncLLM instances that use the same
+    API key. Before each request is sent, its input tokens are estimated from the
+    size of the request and its output tokens from a running average of earlier
+    responses (at most max_tokens). The request waits until all three buckets
+    hold enough. Once the response arrives, the buckets are corrected with the
+    actual usage. Requests that fail still count against the limits. This works
+    like the API's own continuously replenished limits, so requests queue on the
+    client instead of being rejected with 429s.
+    
+    Waiting requests are admitted strictly by priority ("interactive" before
+    "default" before "batch", or any int where lower is sooner), and first come
+    first served within a priority. The time each request spent queued is
+    added to result["usage"]["queue_wait"], and stats() summarizes it per priority.
+    
+    Usage:
+        limiter = RateLimiter(requests_per_minute=50, input_tokens_per_minute=40000,
+                              output_tokens_per_minute=8000)
+        repl = LLM(rate_limiter=limiter)                      # interactive
+        worker = LLM(rate_limiter=limiter, priority="batch")  # yields to the REPL
+    """
+    
+    def __init__(self,
+                 requests_per_minute: Optional[int] = None,
+                 input_tokens_per_minute: Optional[int] = None,
+                 output_tokens_per_minute: Optional[int] = None,
+                 burst_seconds: float = 60.0,
+                 chars_per_token: float = 4.0):
+        """
+        Initialize the limiter.
+        
+        Args:
+            requests_per_minute: Requests per minute, or None for no limit
+            input_tokens_per_minute: Input tokens per minute (cache reads excluded), or None
+            output_tokens_per_minute: Output tokens per minute, or None
+            burst_seconds: Seconds' worth of each limit that may be used at once. The API may
+                enforce a limit over intervals shorter than a minute, so lower values are safer.
+            chars_per_token: Characters per token used to estimate input tokens
+        """
+        self.chars_per_token = chars_per_token
+        self._buckets = {
+            name: _TokenBucket(limit, burst_seconds)
+            for name, limit in (
+                ("requests", requests_per_minute),
+                ("input_tokens", input_tokens_per_minute),
+                ("output_tokens", output_tokens_per_minute)
+            )
+            if limit
+        }
+        self._lock = threading.Lock()
+        self._queue: List[list] = []
+        self._order = itertools.count()
+        self._output_estimate: Optional[float] = None
+        self._stats: Dict[Priority, Dict[str, float]] = {}
+    
+    def estimate_input_tokens(self, message_params: Dict[str, Any]) -> int:
+        """
+        Estimate the input tokens of a request from its serialized size.
+        
+        Args:
+            message_params: Messages API request parameters
+        
+        Returns:
+            The estimated token count
+        """
+        material = [message_params.get(name) for name in ("system", "tools", "messages")]
+        encoded = json.dumps(material, separators=(",", ":"), ensure_ascii=False, default=_jsonable)
+        return int(len(encoded) / self.chars_per_token) + 1
+    
+    def _reservation(self, message_params: Dict[str, Any], priority: Priority,
+                     input_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Estimate what a request will take out of each bucket."""
+        if isinstance(priority, str):
+            if priority not in PRIORITIES:
+                raise ValueError(f"Unknown priority: {priority!r}. Use one of {sorted(PRIORITIES)} or an int.")
+            rank = PRIORITIES[priority]
+        else:
+            rank = priority
+        
+        max_tokens = message_params.get("max_tokens", 0)
+        with self._lock:
+            output_estimate = self._output_estimate
+        return {
+            "priority": priority,
+            "rank": rank,
+            "requests": 1,
+            "input_tokens": (input_tokens if input_tokens is not None else self.estimate_input_tokens(message_params))
+                            if "input_tokens" in self._buckets else 0,
+            "output_tokens": min(max_tokens, output_estimate) if output_estimate is not None else max_tokens,
+            "queue_wait": 0.0
+        }
+    
+    def _enqueue(self, reservation: Dict[str, Any], wake: Callable[[], None]) -> list:
+        with self._lock:
+            entry = [reservation["rank"], next(self._order), reservation, wake]
+            heapq.heappush(self._queue, entry)
+            return entry
+    
+    def _poll(self, entry: list) -> Optional[float]:
+        """
+        Try to admit a queued request.
+        
+        Returns:
+            0 if it was admitted, the seconds until the buckets refill enough if it
+            is next in line, or None if requests of higher or equal priority are ahead
+        """
+        with self._lock:
+            if self._queue[0] is not entry:
+                return None
+            reservation = entry[2]
+            now = time.monotonic()
+            wait = 0.0
+            for name, bucket in self._buckets.items():
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(reservation[name]))
+            if wait > 0:
+                return wait
+            
+            for name, bucket in self._buckets.items():
+                bucket.adjust(reservation[name])
+            heapq.heappop(self._queue)
+            self._wake_next()
+            return 0.0
+    
+    def _remove(self, entry: list) -> None:
+        """Take a request that gave up waiting out of the queue."""
+        with self._lock:
+            if entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._wake_next()
+    
+    def _wake_next(self) -> None:
+        """Let the request now at the head of the queue check the buckets (lock held)."""
+        if self._queue:
+            self._queue[0][3]()
+    
+    def _admitted(self, reservation: Dict[str, Any], started: float) -> Dict[str, Any]:
+        reservation["queue_wait"] = time.monotonic() - started
+        with self._lock:
+            stats = self._stats.setdefault(reservation["priority"], {
+                "admitted": 0, "queue_wait_total": 0.0, "queue_wait_max": 0.0
+            })
+            stats["admitted"] += 1
+            stats["queue_wait_total"] += reservation["queue_wait"]
+            stats["queue_wait_max"] = max(stats["queue_wait_max"], reservation["queue_wait"])
+        return reservation
+    
+    def acquire(self, message_params: Dict[str, Any], priority: Priority = "interactive",
+                input_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Block until a request may be sent.
+        
+        Args:
+            message_params: The request parameters
+            priority: "interactive", "default", "batch" or an int (lower is sooner)
+            input_tokens: The request's input tokens if already counted (e.g. by a
+                TokenCounter); otherwise they are estimated
+        
+        Returns:
+            A reservation to pass to settle once the request has finished; its
+            "queue_wait" holds the seconds spent waiting
+        """
+        reservation = self._reservation(message_params, priority, input_tokens)
+        started = time.monotonic()
+        if not self._buckets:
+            return self._admitted(reservation, started)
+        
+        wakeup = threading.Event()
+        entry = self._enqueue(reservation, wakeup.set)
+        try:
+            while True:
+                wait = self._poll(entry)
+                if wait == 0:
+                    return self._admitted(reservation, started)
+                wakeup.wait(wait)
+                wakeup.clear()
+        except BaseException:
+            self._remove(entry)
+            raise
+    
+    async def aacquire(self, message_params: Dict[str, Any], priority: Priority = "interactive",
+                       input_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Coroutine version of acquire; waits without blocking the event loop.
+        
+        Args:
+            message_params: The request parameters
+            priority: "interactive", "default", "batch" or an int (lower is sooner)
+            input_tokens: The request's input tokens if already counted, see acquire
+        
+        Returns:
+            A reservation to pass to settle, see acquire
+        """
+        reservation = self._reservation(message_params, priority, input_tokens)
+        started = time.monotonic()
+        if not self._buckets:
+            return self._admitted(reservation, started)
+        
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        entry = self._enqueue(reservation, lambda: loop.call_soon_threadsafe(wakeup.set))
+        try:
+            while True:
+                wait = self._poll(entry)
+                if wait == 0:
+                    return self._admitted(reservation, started)
+                try:
+                    await asyncio.wait_for(wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+        except BaseException:
+            self._remove(entry)
+            raise
+    
+    def settle(self, reservation: Dict[str, Any], usage: Any = None) -> None:
+        """
+        Correct the buckets with the actual usage of a finished request.
+        
+        Args:
+            reservation: The reservation returned by acquire
+            usage: The `usage` object of the response, or None if the request failed
+        """
+        if usage is None:
+            return
+        input_tokens = (getattr(usage, "input_tokens", None) or 0) + \
+            (getattr(usage, "cache_creation_input_tokens", None) or 0)
+        output_tokens = getattr(usage, "output_tokens", None) or 0
+        with self._lock:
+            if self._output_estimate is None:
+                self._output_estimate = float(output_tokens)
+            else:
+                self._output_estimate = 0.8 * self._output_estimate + 0.2 * output_tokens
+            for name, actual in (("input_tokens", input_tokens), ("output_tokens", output_tokens)):
+                if name in self._buckets:
+                    self._buckets[name].adjust(actual - reservation[name])
+            self._wake_next()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the queueing statistics.
+        
+        Returns:
+            Dictionary with the number of waiting requests and, per priority, the
+            admitted requests and their mean and maximum queue wait in seconds
+        """
+        with self._lock:
+            return {
+                "waiting": len(self._queue),
+                "priorities": {
+                    priority: {
+                        "admitted": stats["admitted"],
+                        "queue_wait_mean": stats["queue_wait_total"] / stats["admitted"],
+                        "queue_wait_max": stats["queue_wait_max"]
+                    }
+                    for priority, stats in self._stats.items()
+                }
+            }
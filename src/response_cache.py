@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Request parameters that determine the response. Anything else (e.g. timeouts or
+# extra headers) does not take part in the cache key.
+KEY_PARAMS = (
+    "model", "system", "messages", "tools", "tool_choice", "temperature",
+    "max_tokens", "stop_sequences", "top_p", "top_k", "thinking"
+)
+
+
+def _jsonable(value: Any) -> Any:
+    """json.dumps fallback for SDK model objects stored in conversation history."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def request_key(message_params: Dict[str, Any]) -> str:
+    """
+    Compute a stable hash of the parameters that determine a response.
+    
+    Args:
+        message_params: Messages API request parameters
+    
+    Returns:
+        A hex sha256 digest
+    """
+    material = {name: message_params[name] for name in KEY_PARAMS if name in message_params}
+    encoded = json.dumps(material, sort_keys=True, separators=(",", ":"), default=_jsonable)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    A two-tier cache for Messages API responses.
+    
+    Responses are kept in a bounded in-memory LRU and, if a path is given, in a
+    SQLite file that survives restarts. Both tiers honour the TTL; the file tier
+    is trimmed to max_disk_entries / max_disk_bytes by evicting the least
+    recently used rows. By default only requests with temperature 0 are cached,
+    since other requests are not expected to be reproducible.
+    
+    Usage:
+        cache = ResponseCache(max_entries=512, path=".cache/responses.sqlite", ttl=86400)
+        llm = LLM(response_cache=cache)
+    """
+    
+    def __init__(self,
+                 max_entries: int = 256,
+                 path: Optional[str] = None,
+                 ttl: Optional[float] = None,
+                 max_disk_entries: int = 10000,
+                 max_disk_bytes: Optional[int] = None,
+                 deterministic_only: bool = True):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_entries: Maximum number of responses kept in memory
+            path: Optional SQLite file for the persistent tier
+            ttl: Seconds after which an entry expires; None keeps entries until evicted
+            max_disk_entries: Maximum number of rows in the SQLite tier
+            max_disk_bytes: Optional maximum total size of the stored responses in the SQLite tier
+            deterministic_only: Only cache requests made with temperature 0
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.deterministic_only = deterministic_only
+        
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.commit()
+    
+    def applies_to(self, message_params: Dict[str, Any]) -> bool:
+        """
+        Check whether a request is eligible for caching.
+        
+        Args:
+            message_params: Messages API request parameters
+        
+        Returns:
+            True if the response to this request may be cached
+        """
+        if not self.deterministic_only:
+            return True
+        return message_params.get("temperature", 1.0) == 0
+    
+    def key(self, message_params: Dict[str, Any]) -> str:
+        """Compute the cache key for a request."""
+        return request_key(message_params)
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached response.
+        
+        Args:
+            key: The cache key
+        
+        Returns:
+            The cached response as a JSON-compatible dictionary, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if self.ttl is None or now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+            
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = json.loads(row[0]), row[1]
+                    if self.ttl is None or now - created <= self.ttl:
+                        self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, created, value)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+            
+            self.misses += 1
+            return None
+    
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """
+        Store a response.
+        
+        Args:
+            key: The cache key
+            value: The response as a JSON-compatible dictionary
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is not None:
+                encoded = json.dumps(value, separators=(",", ":"))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, encoded, len(encoded), now, now)
+                )
+                self._evict_disk()
+                self._db.commit()
+    
+    def _remember(self, key: str, created: float, value: Dict[str, Any]) -> None:
+        """Insert into the memory tier, dropping the least recently used entries beyond max_entries."""
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def _evict_disk(self) -> None:
+        """Trim the SQLite tier to its TTL and size limits."""
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        
+        count, total_size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        excess = max(0, count - self.max_disk_entries)
+        if excess:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (excess,)
+            )
+            total_size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        
+        if self.max_disk_bytes is not None:
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+            for key, size in rows:
+                if total_size <= self.max_disk_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total_size -= size
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the hit and miss counters.
+        
+        Returns:
+            A dictionary with hits, misses, hit_rate and per-tier hits
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "memory_entries": len(self._memory)
+        }
+    
+    def clear(self) -> None:
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+    
+    def close(self) -> None:
+        """Close the SQLite tier."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,298 @@
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from src.telemetry import _percentile
+
+# Prices in USD per million (input, output) tokens, matched on the start of the model name
+PRICES = {
+    "claude-3-7-sonnet": (3.0, 15.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+    "claude-3-opus": (15.0, 75.0),
+    "claude-3-haiku": (0.25, 1.25)
+}
+
+# A classifier gets the features of a request and returns the probability that the
+# fast model handles it well, or the name of the model to use
+Classifier = Callable[[Dict[str, Any]], Union[float, str]]
+
+
+def request_features(message_params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Describe a Messages API request for routing.
+    
+    Args:
+        message_params: The request parameters
+    
+    Returns:
+        Dictionary with the number of "messages" and "tools", "tool_results_only"
+        (whether the last message only carries tool results, i.e. the request is a
+        tool loop follow-up), the number of "tool_results" and "tool_errors" in it,
+        "prompt_chars" (text characters of the last message), "system_chars" and
+        "max_tokens"
+    """
+    messages = message_params.get("messages") or ()
+    content = messages[-1]["content"] if messages else ""
+    prompt_chars = 0
+    tool_results = 0
+    tool_errors = 0
+    other_blocks = 0
+    if isinstance(content, str):
+        prompt_chars = len(content)
+    else:
+        for block in content:
+            block_type = block.get("type") if isinstance(block, dict) else getattr(block, "type", None)
+            if block_type == "tool_result":
+                tool_results += 1
+                tool_errors += bool(block.get("is_error")) if isinstance(block, dict) else 0
+                continue
+            other_blocks += 1
+            if block_type == "text":
+                prompt_chars += len(block["text"] if isinstance(block, dict) else block.text)
+    system = message_params.get("system") or ""
+    if isinstance(system, list):
+        system_chars = sum(len(block.get("text", "")) for block in system)
+    else:
+        system_chars = len(system)
+    return {
+        "messages": len(messages),
+        "tools": len(message_params.get("tools") or ()),
+        "tool_results_only": tool_results > 0 and other_blocks == 0,
+        "tool_results": tool_results,
+        "tool_errors": tool_errors,
+        "prompt_chars": prompt_chars,
+        "system_chars": system_chars,
+        "max_tokens": message_params.get("max_tokens", 0)
+    }
+
+
+class ModelRouter:
+    """
+    Picks the model for each request of a call, sending simple ones to a faster model.
+    
+    Without a classifier, a request goes to fast_model when it is a tool loop
+    follow-up whose tool results are all successful (the model only has to
+    acknowledge or format them), or when its prompt is at most short_prompt_chars
+    long and it offers at most max_fast_tools tools. With a classifier, a request
+    goes to fast_model when the classifier's probability is at least
+    min_confidence; lower confidence keeps the LLM's own model. Everything else
+    uses the LLM's model.
+    
+    A request answered by fast_model is escalated, i.e. sent again to the LLM's
+    model, when the fast model fails: the request raises an API error, the
+    response is cut off by max_tokens, calls a tool that was not offered, leaves
+    out a required tool input or is empty. After an escalation the rest of the
+    call stays on the LLM's model. Streaming requests are routed but cannot be
+    escalated once text has been yielded; a failed one is counted and keeps
+    the rest of the call on the LLM's model.
+    
+    stats() reports requests, tokens and latency per model, how often each rule
+    routed a request, the escalations by reason and the estimated savings
+    against sending everything to the LLM's model (using PRICES).
+    
+    Usage:
+        router = ModelRouter(fast_model="claude-3-5-haiku-20241022")
+        llm = LLM(router=router)
+        router.stats()["savings"]
+    """
+    
+    def __init__(self,
+                 fast_model: str = "claude-3-5-haiku-20241022",
+                 classifier: Optional[Classifier] = None,
+                 min_confidence: float = 0.7,
+                 short_prompt_chars: int = 200,
+                 max_fast_tools: int = 5,
+                 prices: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_samples: int = 1000):
+        """
+        Initialize the router.
+        
+        Args:
+            fast_model: The model simple requests are sent to
+            classifier: Optional function of request_features returning the probability
+                that fast_model handles the request well (or a model name); replaces the
+                built-in rules
+            min_confidence: Lowest classifier probability that routes to fast_model
+            short_prompt_chars: Prompts up to this many characters count as simple;
+                0 routes only tool loop follow-ups
+            max_fast_tools: Short prompts offering more tools than this stay on the LLM's model
+            prices: USD per million (input, output) tokens by model name prefix; defaults to PRICES
+            max_samples: Number of most recent latencies kept per model for the percentiles
+        """
+        self.fast_model = fast_model
+        self.classifier = classifier
+        self.min_confidence = min_confidence
+        self.short_prompt_chars = short_prompt_chars
+        self.max_fast_tools = max_fast_tools
+        self.prices = prices if prices is not None else PRICES
+        self.max_samples = max_samples
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._routes: Dict[str, int] = {}
+        self._escalations: Dict[str, int] = {}
+        self._savings = {"fast_requests": 0, "fast_input_tokens": 0, "fast_output_tokens": 0,
+                         "cost_usd": 0.0, "default_cost_usd": 0.0}
+        self._lock = threading.Lock()
+    
+    def route(self, message_params: Dict[str, Any], default_model: str, escalated: bool = False) -> Tuple[str, str]:
+        """
+        Pick the model for a request.
+        
+        Args:
+            message_params: The request parameters
+            default_model: The LLM's model
+            escalated: Whether an earlier request of the same call was escalated
+        
+        Returns:
+            A (model, reason) tuple
+        """
+        if escalated:
+            model, reason = default_model, "escalated"
+        elif self.classifier is not None:
+            model, reason = self._classify(request_features(message_params), default_model)
+        else:
+            model, reason = self._rules(request_features(message_params), default_model)
+        with self._lock:
+            self._routes[reason] = self._routes.get(reason, 0) + 1
+        return model, reason
+    
+    def _rules(self, features: Dict[str, Any], default_model: str) -> Tuple[str, str]:
+        if features["tool_results_only"]:
+            if features["tool_errors"]:
+                return default_model, "tool_error"
+            return self.fast_model, "tool_follow_up"
+        if features["prompt_chars"] <= self.short_prompt_chars and features["tools"] <= self.max_fast_tools:
+            return self.fast_model, "short_prompt"
+        return default_model, "default"
+    
+    def _classify(self, features: Dict[str, Any], default_model: str) -> Tuple[str, str]:
+        decision = self.classifier(features)
+        if isinstance(decision, str):
+            return decision, "classifier"
+        if decision >= self.min_confidence:
+            return self.fast_model, "classifier"
+        return default_model, "low_confidence"
+    
+    def escalation(self, message_params: Dict[str, Any], response) -> Optional[str]:
+        """
+        Check a fast model response for failures that call for the LLM's model.
+        
+        Args:
+            message_params: The request parameters
+            response: The API response
+        
+        Returns:
+            The reason to escalate ("max_tokens", "unknown_tool", "invalid_tool_input"
+            or "empty_response"), or None if the response is usable
+        """
+        if response.stop_reason == "max_tokens":
+            return "max_tokens"
+        schemas = {tool["name"]: tool.get("input_schema") or {} for tool in message_params.get("tools") or ()}
+        has_text = False
+        for block in response.content:
+            if block.type == "tool_use":
+                if block.name not in schemas:
+                    return "unknown_tool"
+                tool_input = block.input if isinstance(block.input, dict) else {}
+                if any(name not in tool_input for name in schemas[block.name].get("required", ())):
+                    return "invalid_tool_input"
+            elif block.type == "text" and block.text.strip():
+                has_text = True
+        if not has_text and not any(block.type == "tool_use" for block in response.content):
+            return "empty_response"
+        return None
+    
+    def record_escalation(self, reason: str) -> None:
+        """Count an escalation of a fast model request."""
+        with self._lock:
+            self._escalations[reason] = self._escalations.get(reason, 0) + 1
+    
+    def _price(self, model: str) -> Optional[Tuple[float, float]]:
+        for prefix, price in self.prices.items():
+            if model.startswith(prefix):
+                return price
+        return None
+    
+    def _cost(self, price: Optional[Tuple[float, float]], input_tokens: int, output_tokens: int) -> float:
+        if price is None:
+            return 0.0
+        return (input_tokens * price[0] + output_tokens * price[1]) / 1e6
+    
+    def record(self, model: str, default_model: str, duration: float, usage=None,
+               failed: bool = False) -> None:
+        """
+        Record the outcome of a routed request.
+        
+        Args:
+            model: The model the request was sent to
+            default_model: The LLM's model
+            duration: Seconds the request took, retries included
+            usage: The `usage` object of the response, or None if the request failed
+            failed: Whether escalation found the response unusable
+        """
+        input_tokens = 0
+        output_tokens = 0
+        if usage is not None:
+            input_tokens = (getattr(usage, "input_tokens", None) or 0) + \
+                (getattr(usage, "cache_creation_input_tokens", None) or 0) + \
+                (getattr(usage, "cache_read_input_tokens", None) or 0)
+            output_tokens = getattr(usage, "output_tokens", None) or 0
+        cost = self._cost(self._price(model), input_tokens, output_tokens)
+        with self._lock:
+            stats = self._models.get(model)
+            if stats is None:
+                stats = self._models[model] = {
+                    "requests": 0, "failed": 0, "input_tokens": 0, "output_tokens": 0,
+                    "cost_usd": 0.0, "latencies": deque(maxlen=self.max_samples)
+                }
+            stats["requests"] += 1
+            stats["failed"] += usage is None or failed
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cost_usd"] += cost
+            stats["latencies"].append(duration)
+            
+            savings = self._savings
+            savings["cost_usd"] += cost
+            if model != default_model:
+                # Failed fast requests are pure overhead: the default model answers them anyway
+                if not failed and usage is not None:
+                    savings["fast_requests"] += 1
+                    savings["fast_input_tokens"] += input_tokens
+                    savings["fast_output_tokens"] += output_tokens
+                    savings["default_cost_usd"] += self._cost(self._price(default_model), input_tokens, output_tokens)
+            else:
+                savings["default_cost_usd"] += cost
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the routing statistics.
+        
+        Returns:
+            Dictionary with "models" (requests, failed requests, tokens, cost
+            and mean / p95 latency in ms per model), "routes" (requests per routing reason),
+            "escalations" (per reason) and "savings" (requests and tokens answered by the
+            fast model, the actual cost, the cost had every request used the LLM's model,
+            and the difference)
+        """
+        with self._lock:
+            models = {}
+            for model, stats in self._models.items():
+                latencies = sorted(stats["latencies"])
+                models[model] = {key: value for key, value in stats.items() if key != "latencies"}
+                models[model]["cost_usd"] = round(stats["cost_usd"], 6)
+                models[model]["latency_ms"] = {
+                    "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+                    "p95": round(_percentile(latencies, 0.95) * 1000, 3)
+                } if latencies else {}
+            savings = dict(self._savings)
+            savings["saved_usd"] = savings["default_cost_usd"] - savings["cost_usd"]
+            for key in ("cost_usd", "default_cost_usd", "saved_usd"):
+                savings[key] = round(savings[key], 6)
+            return {
+                "models": models,
+                "routes": dict(self._routes),
+                "escalations": dict(self._escalations),
+                "savings": savings
+            }
+
@@ -0,0 +1,503 @@
+import argparse
+import json
+import math
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+from src.llm import LLM
+from src.session_store import Session, SessionStore, use_state
+from src.telemetry import _percentile
+
+# Seconds between keep-alive comments on an idle event stream
+HEARTBEAT_INTERVAL = 15.0
+
+# Session ids a client (or a routing proxy such as PreforkServer) may choose
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
+
+class LLMServer:
+    """
+    Serves generate_with_tools turns for many sessions from one LLM.
+    
+    Every session keeps its own history and tool state (see SessionLocal) in
+    a SessionStore, which saves it after each turn. Turns run on a pool of
+    max_concurrent workers; up to max_queue more wait for a worker, and further turns are
+    rejected with 503 and a Retry-After estimate (backpressure) instead of
+    piling up. Each turn has a deadline (the request's "timeout", at most
+    max_timeout): a turn still queued at its deadline never starts, and a turn
+    still running is cancelled at the next streamed chunk, when the tool calls
+    it waits for are cancelled (see ToolExecutor), or by aborting the model
+    request it is waiting for at the deadline, while the client gets a 504
+    (or an "error" event). A second turn for a session that is busy gets
+    409. The history of a session only advances when a turn completes.
+    
+    Endpoints (JSON bodies; a turn streams server-sent events "text", "done" and
+    "error" unless "stream" is false):
+    
+        POST   /v1/sessions                 create a session -> {"session_id": ...}
+                                            (optionally with the "session_id" to use)
+        POST   /v1/sessions/<id>/turns      {"prompt": ..., "stream": true, "timeout": 60}
+        DELETE /v1/sessions/<id>            forget a session
+        GET    /v1/health                   load and counters
+    
+    Usage:
+        server = LLMServer(llm, system="You are a helpful assistant", port=8080)
+        server.serve_forever()
+    """
+    
+    def __init__(self,
+                 llm: LLM,
+                 system: Optional[str] = None,
+                 max_concurrent: int = 8,
+                 max_queue: int = 32,
+                 default_timeout: float = 60.0,
+                 max_timeout: float = 600.0,
+                 max_iterations: int = 10,
+                 sessions: Optional[SessionStore] = None,
+                 host: str = "127.0.0.1",
+                 port: int = 8080):
+        """
+        Initialize the server.
+        
+        Args:
+            llm: The LLM, with its tools registered, that answers every session
+            system: System prompt of every turn
+            max_concurrent: Turns that run at the same time
+            max_queue: Turns that may wait for a free worker before new ones get 503
+            default_timeout: Deadline in seconds of turns that do not set "timeout"
+            max_timeout: Longest deadline a turn may ask for
+            max_iterations: max_iterations of every generate_with_tools turn
+            sessions: Where sessions are kept; defaults to an in-memory SessionStore
+            host: Interface to bind to
+            port: Port to bind to; 0 picks a free one
+        """
+        self.llm = llm
+        self.system = system
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout
+        self.max_iterations = max_iterations
+        self.sessions = sessions if sessions is not None else SessionStore()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="llm-server")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._latencies = deque(maxlen=10000)
+        self._counters = {"turns": 0, "completed": 0, "failed": 0, "rejected": 0, "busy": 0,
+                          "expired_in_queue": 0, "deadline_exceeded": 0, "cancelled": 0}
+        self._httpd = _HTTPServer((host, port), _Handler)
+        self._httpd.llm_server = self
+        self._thread = None
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def serve_forever(self) -> None:
+        """Serve requests on the calling thread until stop is called."""
+        self._httpd.serve_forever()
+    
+    def start(self) -> "LLMServer":
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name="llm-server-http", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self) -> None:
+        """Stop accepting requests and wait for the running turns."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._executor.shutdown(wait=True)
+        if self._thread is not None:
+            self._thread.join()
+    
+    def __enter__(self) -> "LLMServer":
+        return self.start()
+    
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+    
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+    
+    def admit(self) -> Optional[float]:
+        """
+        Reserve a place for a turn.
+        
+        Returns:
+            None if the turn was admitted, otherwise the seconds after which to retry
+        """
+        with self._lock:
+            if self._pending < self.max_concurrent + self.max_queue:
+                self._pending += 1
+                self._counters["turns"] += 1
+                return None
+            self._counters["rejected"] += 1
+            latencies = list(self._latencies)[-100:]
+            mean = sum(latencies) / len(latencies) if latencies else 1.0
+            waiting = self._pending - self.max_concurrent + 1
+            return max(1.0, mean * waiting / self.max_concurrent)
+    
+    def submit(self, session: Session, prompt: str, deadline: float) -> Tuple[queue.Queue, threading.Event]:
+        """
+        Run an admitted turn on the worker pool.
+        
+        The session's lock must be held; it is released when the turn ends.
+        
+        Returns:
+            The queue receiving the turn's ("text", chunk), ("done", summary) and
+            ("error", (status, message)) events, and the event that cancels the turn
+        """
+        events: queue.Queue = queue.Queue()
+        cancelled = threading.Event()
+        self._executor.submit(self._run_turn, session, prompt, deadline, events, cancelled)
+        return events, cancelled
+    
+    def _run_turn(self, session: Session, prompt: str, deadline: float,
+                  events: queue.Queue, cancelled: threading.Event) -> None:
+        started = time.monotonic()
+        ran = saved = False
+        try:
+            if cancelled.is_set() or started >= deadline:
+                self._count("expired_in_queue")
+                events.put(("error", (504, "Deadline exceeded while queued")))
+                return
+            with self._lock:
+                self._running += 1
+            ran = True
+            try:
+                with use_state(session.state):
+                    # Tool calls still running at the deadline are cancelled with the turn
+                    stream = self.llm.stream_with_tools(prompt, system=self.system, history=session.history,
+                                                        max_iterations=self.max_iterations,
+                                                        timeout=max(0.0, deadline - time.monotonic()))
+                    for chunk in stream:
+                        if cancelled.is_set():
+                            stream.close()
+                            self._count("cancelled")
+                            return
+                        events.put(("text", chunk))
+                    result = stream.result
+                if cancelled.is_set():
+                    self._count("cancelled")
+                    return
+            finally:
+                with self._lock:
+                    self._running -= 1
+            session.history = result["history"]
+            session.turns += 1
+            self.sessions.save(session)
+            saved = True
+            duration = time.monotonic() - started
+            with self._lock:
+                self._counters["completed"] += 1
+                self._latencies.append(duration)
+            events.put(("done", self._summary(result, duration)))
+        except Exception as e:
+            if cancelled.is_set():
+                self._count("cancelled")
+            elif time.monotonic() >= deadline:
+                # The model request still running at the deadline was aborted
+                self._count("deadline_exceeded")
+                events.put(("error", (504, "Deadline exceeded")))
+            else:
+                self._count("failed")
+                events.put(("error", (502, f"{type(e).__name__}: {e}")))
+        finally:
+            if ran and not saved:
+                # Tools of an unfinished turn may still have changed the session's state
+                self._save_quietly(session)
+            session.last_used = time.monotonic()
+            session.lock.release()
+            with self._lock:
+                self._pending -= 1
+    
+    def _save_quietly(self, session: Session) -> None:
+        try:
+            self.sessions.save(session)
+        except Exception:
+            # The turn has already reported its own outcome
+            pass
+    
+    def _summary(self, result: Dict[str, Any], duration: float) -> Dict[str, Any]:
+        summary = {
+            "response": result["response"],
+            "tool_calls": [
+                {"tool": usage["tool"], "error": usage["error"]} if "error" in usage else {"tool": usage["tool"]}
+                for usage in result["tool_usage"]
+            ],
+            "usage": result["usage"],
+            "duration": round(duration, 4)
+        }
+        if "warning" in result:
+            summary["warning"] = result["warning"]
+        return summary
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the server's load and counters.
+        
+        Returns:
+            Dictionary with the running and queued turns, the turn counters, the
+            session store's and tool executor's statistics and the p50 / p99 duration
+            of recent turns in seconds
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                **self._counters
+            }
+        stats["sessions"] = self.sessions.stats()
+        stats["tools"] = self.llm.tool_executor.stats()
+        if latencies:
+            stats["turn_p50"] = round(_percentile(latencies, 0.50), 4)
+            stats["turn_p99"] = round(_percentile(latencies, 0.99), 4)
+        return stats
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Let bursts of connections wait in the accept backlog rather than be refused
+    request_queue_size = 256
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format: str, *args) -> None:
+        pass
+    
+    @property
+    def app(self) -> LLMServer:
+        return self.server.llm_server
+    
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_json(status, {"error": message}, headers)
+    
+    def _content_length(self) -> Optional[int]:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return None
+        return length if length >= 0 else None
+    
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        length = self._content_length()
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            return None
+        return body if isinstance(body, dict) else None
+    
+    def _route(self) -> Tuple[str, Optional[str]]:
+        parts = self.path.split("?", 1)[0].strip("/").split("/")
+        if parts[:2] == ["v1", "sessions"]:
+            if len(parts) == 2:
+                return "sessions", None
+            if len(parts) == 3:
+                return "session", parts[2]
+            if len(parts) == 4 and parts[3] == "turns":
+                return "turns", parts[2]
+        if parts == ["v1", "health"]:
+            return "health", None
+        return "", None
+    
+    def do_GET(self) -> None:
+        route, _ = self._route()
+        if route == "health":
+            self._send_json(200, self.app.stats())
+        else:
+            self._error(404, f"GET {self.path} is not supported")
+    
+    def do_DELETE(self) -> None:
+        route, session_id = self._route()
+        if route != "session":
+            self._error(404, f"DELETE {self.path} is not supported")
+        elif self.app.sessions.delete(session_id):
+            self._send_json(200, {"session_id": session_id, "deleted": True})
+        else:
+            self._error(404, f"Session {session_id} not found")
+    
+    def do_POST(self) -> None:
+        route, session_id = self._route()
+        if self._content_length() is None:
+            # The body cannot be skipped without its length, so the connection cannot be reused
+            self.close_connection = True
+            self._error(400, "Invalid Content-Length header")
+            return
+        body = self._read_json()
+        if body is None:
+            self._error(400, "The request body must be a JSON object")
+        elif route == "sessions":
+            self._create_session(body)
+        elif route == "turns":
+            self._turn(session_id, body)
+        else:
+            self._error(404, f"POST {self.path} is not supported")
+    
+    def _create_session(self, body: Dict[str, Any]) -> None:
+        session_id = body.get("session_id")
+        if session_id is not None and not (isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id)):
+            self._error(400, "\"session_id\" must be 1-128 letters, digits, \"-\" or \"_\"")
+            return
+        try:
+            session = self.app.sessions.create(session_id)
+        except ValueError as e:
+            self._error(409, str(e))
+            return
+        self._send_json(201, {"session_id": session.id})
+    
+    def _turn(self, session_id: str, body: Dict[str, Any]) -> None:
+        app = self.app
+        prompt = body.get("prompt")
+        if not isinstance(prompt, str) or not prompt:
+            self._error(400, "\"prompt\" must be a non-empty string")
+            return
+        timeout = body.get("timeout", app.default_timeout)
+        # json accepts NaN and Infinity; a NaN deadline would never pass
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or \
+                not math.isfinite(timeout) or timeout <= 0:
+            self._error(400, "\"timeout\" must be a positive number of seconds")
+            return
+        timeout = min(float(timeout), app.max_timeout)
+        try:
+            session = app.sessions.checkout(session_id)
+        except ValueError as e:
+            app._count("busy")
+            self._error(409, str(e))
+            return
+        if session is None:
+            self._error(404, f"Session {session_id} not found")
+            return
+        retry_after = app.admit()
+        if retry_after is not None:
+            session.lock.release()
+            self._error(503, "Server is at capacity", {"Retry-After": str(int(retry_after + 0.999))})
+            return
+        
+        deadline = time.monotonic() + timeout
+        events, cancelled = app.submit(session, prompt, deadline)
+        if body.get("stream", True):
+            self._stream_events(events, cancelled, deadline)
+        else:
+            self._collect_events(events, cancelled, deadline)
+    
+    def _next_event(self, events: queue.Queue, deadline: float, heartbeat: float) -> Optional[Tuple[str, Any]]:
+        """The next event of a turn; ("deadline", None) once the deadline passes, None on a heartbeat."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return "deadline", None
+        try:
+            return events.get(timeout=min(remaining, heartbeat))
+        except queue.Empty:
+            return None if time.monotonic() < deadline else ("deadline", None)
+    
+    def _collect_events(self, events: queue.Queue, cancelled: threading.Event, deadline: float) -> None:
+        while True:
+            event = self._next_event(events, deadline, HEARTBEAT_INTERVAL)
+            if event is None or event[0] == "text":
+                continue
+            kind, data = event
+            if kind == "done":
+                self._send_json(200, data)
+            elif kind == "error":
+                self._error(*data)
+            else:
+                cancelled.set()
+                self.app._count("deadline_exceeded")
+                self._error(504, "Deadline exceeded")
+            return
+    
+    def _stream_events(self, events: queue.Queue, cancelled: threading.Event, deadline: float) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        
+        def send(kind: str, data: Dict[str, Any]) -> None:
+            self.wfile.write(f"event: {kind}\ndata: {json.dumps(data, default=str)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        
+        try:
+            while True:
+                event = self._next_event(events, deadline, HEARTBEAT_INTERVAL)
+                if event is None:
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                    continue
+                kind, data = event
+                if kind == "text":
+                    send("text", {"text": data})
+                elif kind == "done":
+                    send("done", data)
+                    return
+                elif kind == "error":
+                    send("error", {"status": data[0], "error": data[1]})
+                    return
+                else:
+                    cancelled.set()
+                    self.app._count("deadline_exceeded")
+                    send("error", {"status": 504, "error": "Deadline exceeded"})
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away; stop the turn at its next chunk
+            cancelled.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve chat sessions over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-concurrent", type=int, default=8, help="turns that run at the same time")
+    parser.add_argument("--max-queue", type=int, default=32, help="turns that may wait before new ones get 503")
+    parser.add_argument("--timeout", type=float, default=60.0, help="default turn deadline in seconds")
+    parser.add_argument("--sessions-db", default="sessions.db", help="SQLite file the sessions are saved in")
+    parser.add_argument("--max-sessions", type=int, default=1000, help="sessions kept in memory")
+    args = parser.parse_args()
+    
+    from src.main import SYSTEM_PROMPT, create_llm
+    sessions = SessionStore(args.sessions_db, max_sessions=args.max_sessions)
+    server = LLMServer(create_llm(), system=SYSTEM_PROMPT, max_concurrent=args.max_concurrent,
+                       max_queue=args.max_queue, default_timeout=args.timeout, sessions=sessions,
+                       host=args.host, port=args.port)
+    print(f"Serving on {server.base_url} ({os.cpu_count()} CPUs)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        sessions.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Union
+
+from src.conversation import Conversation
+from src.response_cache import _jsonable
+# SessionLocal lives in tool_state so tool modules can use it without this module's imports
+from src.tool_state import SessionLocal, current_state, use_state
+
+
+class Session:
+    """One user's conversation and tool state. Only one turn of a session runs at a time."""
+    
+    def __init__(self,
+                 session_id: str,
+                 history: Optional[List[Dict[str, Any]]] = None,
+                 state: Optional[Dict[str, Any]] = None,
+                 turns: int = 0):
+        self.id = session_id
+        self.history = Conversation(history)
+        self.state = state if state is not None else {}
+        self.turns = turns
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        # Serialized size in bytes when last saved or loaded, counted against max_bytes
+        self.size = 0
+        self.deleted = False
+
+
+def encode_session(session: Session) -> bytes:
+    """Serialize a session's history, tool state and turn count as zlib-compressed compact JSON."""
+    record = {"history": session.history.as_list(), "state": session.state, "turns": session.turns}
+    payload = json.dumps(record, separators=(",", ":"), ensure_ascii=False, default=_jsonable)
+    return zlib.compress(payload.encode("utf-8"), 6)
+
+
+def decode_session(session_id: str, data: bytes) -> Session:
+    """Rebuild a session from encode_session output."""
+    record = json.loads(zlib.decompress(data))
+    return Session(session_id, record["history"], record["state"], record["turns"])
+
+
+class SQLiteBackend:
+    """
+    Stores encoded sessions in one SQLite table.
+    
+    Any object with the same load / save / delete / count / close methods can be
+    passed to SessionStore instead.
+    """
+    
+    def __init__(self, path: str = "sessions.db"):
+        """
+        Open (or create) the database.
+        
+        Args:
+            path: Database file; ":memory:" keeps it in memory
+        """
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data BLOB NOT NULL, updated REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+    
+    def load(self, session_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+    
+    def save(self, session_id: str, data: bytes) -> None:
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO sessions (id, data, updated) VALUES (?, ?, ?)",
+                                     (session_id, data, time.time()))
+    
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+    
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+    
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class SessionStore:
+    """
+    Sessions kept in memory under a budget and persisted in a backend.
+    
+    A session is loaded from the backend the first time it is used after a
+    restart or an eviction, and saved after each of its turns. Sessions
+    beyond max_sessions or max_bytes (their serialized size), and sessions
+    idle for longer than ttl, are evicted from memory least recently used
+    first; a session with a turn running is never evicted. Without a backend
+    an evicted session is gone, as with a plain in-memory registry.
+    
+    Usage:
+        store = SessionStore("sessions.db", max_sessions=1000)
+        session = store.checkout(session_id) or store.create()
+        ...
+        with use_state(session.state):
+            result = llm.generate_with_tools(prompt, history=session.history)
+        session.history = result["history"]
+        store.save(session)
+        session.lock.release()
+    """
+    
+    def __init__(self,
+                 backend: Union[SQLiteBackend, str, None] = None,
+                 max_sessions: int = 1000,
+                 max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = 3600.0):
+        """
+        Initialize the store.
+        
+        Args:
+            backend: A SQLiteBackend (or compatible object), a SQLite database path, or
+                None to keep sessions in memory only
+            max_sessions: Sessions kept in memory
+            max_bytes: Optional budget for the serialized size of the sessions in memory
+            ttl: Seconds without use after which a session is evicted from memory, or None
+        """
+        self.backend = SQLiteBackend(backend) if isinstance(backend, str) else backend
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"created": 0, "hits": 0, "loads": 0, "misses": 0, "saves": 0, "evictions": 0}
+    
+    def create(self, session_id: Optional[str] = None) -> Session:
+        """
+        Create a new, empty session.
+        
+        Args:
+            session_id: Optional id for the session (e.g. chosen by a routing proxy);
+                a random one by default
+        
+        Returns:
+            The session
+        
+        Raises:
+            ValueError: If a session with session_id already exists
+        """
+        session = Session(session_id or uuid.uuid4().hex)
+        with self._lock:
+            if session_id is not None and (session_id in self._sessions or (
+                    self.backend is not None and self.backend.load(session_id) is not None)):
+                raise ValueError(f"Session {session_id} already exists")
+            self._counters["created"] += 1
+            self._sessions[session.id] = session
+            self._evict()
+        self.save(session)
+        return session
+    
+    def get(self, session_id: str) -> Optional[Session]:
+        """
+        Get a session, loading it from the backend if it is not in memory.
+        
+        The session may be evicted (and loaded again as a new copy) as soon as
+        it is returned; use checkout to run a turn on it.
+        
+        Returns:
+            The session, or None if it does not exist
+        """
+        with self._lock:
+            session = self._resident(session_id)
+            if session is not None:
+                self._evict()
+            return session
+    
+    def checkout(self, session_id: str) -> Optional[Session]:
+        """
+        Get a session with its lock held, to run a turn on it.
+        
+        The lock is taken before the store's lock is released, so the session
+        cannot be evicted in between and every turn of a session runs on the same
+        copy. Release session.lock (after saving the session) when the turn ends.
+        
+        Returns:
+            The session, or None if it does not exist
+        
+        Raises:
+            ValueError: If the session is already running a turn
+        """
+        with self._lock:
+            session = self._resident(session_id)
+            if session is None:
+                return None
+            if not session.lock.acquire(blocking=False):
+                raise ValueError(f"Session {session_id} is already running a turn")
+            self._evict()
+            return session
+    
+    def _resident(self, session_id: str) -> Optional[Session]:
+        """The session in memory, loaded from the backend if needed, marked as just used (lock held)."""
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._counters["hits"] += 1
+            self._sessions.move_to_end(session_id)
+        else:
+            data = self.backend.load(session_id) if self.backend is not None else None
+            if data is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["loads"] += 1
+            session = decode_session(session_id, data)
+            session.size = len(data)
+            self._sessions[session_id] = session
+            self._bytes += session.size
+        session.last_used = time.monotonic()
+        return session
+    
+    def save(self, session: Session) -> None:
+        """Persist a session after a turn (its history, tool state and turn count)."""
+        data = encode_session(session) if self.backend is not None or self.max_bytes is not None else b""
+        with self._lock:
+            if session.deleted:
+                return
+            if self.backend is not None:
+                self.backend.save(session.id, data)
+            self._counters["saves"] += 1
+            if self._sessions.get(session.id) is session:
+                self._bytes += len(data) - session.size
+            session.size = len(data)
+            self._evict()
+    
+    def delete(self, session_id: str) -> bool:
+        """
+        Forget a session, in memory and in the backend.
+        
+        Returns:
+            True if the session existed
+        """
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                session.deleted = True
+                self._bytes -= session.size
+            stored = self.backend.delete(session_id) if self.backend is not None else False
+        return session is not None or stored
+    
+    def _evict(self) -> None:
+        """Evict idle and least recently used sessions until the store is within budget (lock held)."""
+        now = time.monotonic()
+        count, size = len(self._sessions), self._bytes
+        evicted = []
+        for session in self._sessions.values():
+            over = count > self.max_sessions or (self.max_bytes is not None and size > self.max_bytes)
+            idle = self.ttl is not None and now - session.last_used > self.ttl
+            if not over and not idle:
+                break
+            if session.lock.locked():
+                continue
+            evicted.append(session)
+            count -= 1
+            size -= session.size
+        for session in evicted:
+            del self._sessions[session.id]
+            self._bytes -= session.size
+        self._counters["evictions"] += len(evicted)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the store's statistics.
+        
+        Returns:
+            Dictionary with the sessions and serialized bytes in memory, the sessions in
+            the backend, and counters of created sessions, memory hits, backend loads,
+            misses (unknown ids), saves and evictions
+        """
+        with self._lock:
+            stats = {"resident": len(self._sessions), "resident_bytes": self._bytes, **self._counters}
+        if self.backend is not None:
+            stats["stored"] = self.backend.count()
+        return stats
+    
+    def close(self) -> None:
+        """Close the backend."""
+        if self.backend is not None:
+            self.backend.close()
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
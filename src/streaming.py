@@ -0,0 +1,51 @@
+from typing import Any, Dict, Generator, Iterator, Optional
+
+class ResponseStream:
+    """
+    An iterator over the text chunks of a streamed response.
+    
+    Iterate over it to receive text as it arrives. Once the stream is exhausted
+    the final result dictionary (the same one the non-streaming call returns) is
+    available as `result`; reading `result` early drains the remaining chunks.
+    
+    Usage:
+        stream = llm.stream_with_tools("What's the weather in Paris?")
+        for chunk in stream:
+            print(chunk, end="", flush=True)
+        history = stream.result["history"]
+    """
+    
+    def __init__(self, generator: Generator[str, None, Dict[str, Any]]):
+        """
+        Initialize the stream.
+        
+        Args:
+            generator: A generator that yields text chunks and returns the final result
+        """
+        self._generator = generator
+        self._result = None
+        self._done = False
+    
+    def __iter__(self) -> Iterator[str]:
+        return self
+    
+    def __next__(self) -> str:
+        try:
+            return next(self._generator)
+        except StopIteration as stop:
+            self._result = stop.value
+            self._done = True
+            raise
+    
+    @property
+    def result(self) -> Optional[Dict[str, Any]]:
+        """The final result dictionary, available once the stream is exhausted."""
+        if not self._done:
+            for _ in self:
+                pass
+        return self._result
+    
+    def close(self) -> None:
+        """Stop the stream early and release the underlying HTTP response."""
+        self._generator.close()
+        self._done = True
@@ -0,0 +1,289 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+
+class Span:
+    """
+    A timed operation: a whole call ("llm.turn"), one API request ("llm.model_call")
+    or one tool execution ("llm.tool_call").
+    
+    Spans are created by TelemetrySink.start_span or Span.child and handed to the
+    sink as a dictionary when they end:
+    
+        {"name": ..., "trace_id": ..., "span_id": ..., "parent_id": ...,
+         "start": <epoch seconds>, "duration": <seconds>, "attributes": {...},
+         "error": <only if the operation raised>}
+    """
+    
+    def __init__(self, sink: "TelemetrySink", name: str, trace_id: Optional[str] = None,
+                 parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.sink = sink
+        self.name = name
+        self.trace_id = trace_id or os.urandom(8).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._ended = False
+    
+    def child(self, name: str, **attributes) -> "Span":
+        """Start a span for an operation that is part of this one."""
+        return Span(self.sink, name, self.trace_id, self.span_id, attributes)
+    
+    def set(self, **attributes) -> None:
+        """Add or overwrite attributes."""
+        self.attributes.update(attributes)
+    
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """Finish the span and pass it to the sink; later calls do nothing."""
+        if self._ended:
+            return
+        self._ended = True
+        record = {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": time.perf_counter() - self._started,
+            "attributes": self.attributes
+        }
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        self.sink.record(record)
+    
+    def __enter__(self) -> "Span":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end(exc)
+
+
+class _NoopSpan(Span):
+    """The span handed out by disabled sinks: no ids, no clock reads, nothing recorded."""
+    
+    def __init__(self):
+        self.attributes = {}
+    
+    def child(self, name: str, **attributes) -> "Span":
+        return self
+    
+    def set(self, **attributes) -> None:
+        pass
+    
+    def end(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class TelemetrySink:
+    """
+    Receives the spans emitted by LLM and AsyncLLM.
+    
+    This base class is the default and discards everything; its spans are a
+    shared no-op object, so an LLM without telemetry pays no tracing cost.
+    Subclasses set enabled = True and implement record().
+    
+    Usage:
+        metrics = MetricsSink()
+        llm = LLM(telemetry=MultiSink(metrics, JsonlSink("traces.jsonl")))
+        llm.generate_with_tools("What's the weather in Paris?")
+        metrics.summary()["histograms"]["llm.model_call.duration"]["p95"]
+    """
+    
+    enabled = False
+    
+    def start_span(self, name: str, **attributes) -> Span:
+        """
+        Start a root span (a new trace).
+        
+        Args:
+            name: The span name, e.g. "llm.turn"
+            **attributes: Initial attributes
+        
+        Returns:
+            The span; end it, or use it as a context manager
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes=attributes)
+    
+    def record(self, span: Dict[str, Any]) -> None:
+        """Handle a finished span."""
+    
+    def close(self) -> None:
+        """Flush and release any resources."""
+
+
+class MultiSink(TelemetrySink):
+    """Forwards every span to several sinks."""
+    
+    def __init__(self, *sinks: TelemetrySink):
+        self.sinks = [sink for sink in sinks if sink.enabled]
+        self.enabled = bool(self.sinks)
+    
+    def record(self, span: Dict[str, Any]) -> None:
+        for sink in self.sinks:
+            sink.record(span)
+    
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a sorted, non-empty list."""
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class MetricsSink(TelemetrySink):
+    """
+    Aggregates spans into in-memory histograms and counters.
+    
+    Every span contributes its duration to the histogram "<name>.duration" and
+    each numeric attribute to "<name>.<attribute>" (e.g.
+    "llm.model_call.input_tokens", "llm.turn.iterations"). Boolean attributes
+    that are true increment the counter "<name>.<attribute>" (e.g.
+    "llm.turn.max_iterations_reached"). For the attributes in group_by the
+    duration is also recorded per value, e.g. "llm.tool_call.duration[tool=get_weather]".
+    Histograms keep the most recent max_samples values.
+    """
+    
+    enabled = True
+    
+    def __init__(self, max_samples: int = 10000, group_by: Sequence[str] = ("tool", "model")):
+        """
+        Initialize the sink.
+        
+        Args:
+            max_samples: Number of most recent values each histogram keeps for its percentiles
+            group_by: String attributes to break the duration histograms down by
+        """
+        self.max_samples = max_samples
+        self.group_by = tuple(group_by)
+        self._histograms: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def _observe(self, key: str, value: float) -> None:
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = deque(maxlen=self.max_samples)
+            self._counts[key] = 0
+        histogram.append(value)
+        self._counts[key] += 1
+    
+    def record(self, span: Dict[str, Any]) -> None:
+        name = span["name"]
+        with self._lock:
+            self._observe(f"{name}.duration", span["duration"])
+            if "error" in span:
+                self._counters[f"{name}.errors"] = self._counters.get(f"{name}.errors", 0) + 1
+            for key, value in span["attributes"].items():
+                if isinstance(value, bool):
+                    if value:
+                        self._counters[f"{name}.{key}"] = self._counters.get(f"{name}.{key}", 0) + 1
+                elif isinstance(value, (int, float)):
+                    self._observe(f"{name}.{key}", value)
+                elif key in self.group_by and isinstance(value, str):
+                    self._observe(f"{name}.duration[{key}={value}]", span["duration"])
+    
+    def summary(self) -> Dict[str, Any]:
+        """
+        Get the current metrics.
+        
+        Returns:
+            Dictionary with "histograms" (count, mean, p50, p95, p99 and max per
+            metric) and "counters"
+        """
+        with self._lock:
+            histograms = {key: (sorted(values), self._counts[key]) for key, values in self._histograms.items()}
+            counters = dict(self._counters)
+        return {
+            "histograms": {
+                key: {
+                    "count": count,
+                    "mean": sum(ordered) / len(ordered),
+                    "p50": _percentile(ordered, 0.50),
+                    "p95": _percentile(ordered, 0.95),
+                    "p99": _percentile(ordered, 0.99),
+                    "max": ordered[-1]
+                }
+                for key, (ordered, count) in sorted(histograms.items())
+            },
+            "counters": dict(sorted(counters.items()))
+        }
+    
+    def reset(self) -> None:
+        """Forget all recorded values."""
+        with self._lock:
+            self._histograms.clear()
+            self._counts.clear()
+            self._counters.clear()
+
+
+class JsonlSink(TelemetrySink):
+    """
+    Appends every span to a JSON Lines file, one object per line.
+    
+    Lines are buffered and written every flush_every spans and on close().
+    """
+    
+    enabled = True
+    
+    def __init__(self, path: str, flush_every: int = 1):
+        """
+        Initialize the sink.
+        
+        Args:
+            path: The file to append to; its directory is created if needed
+            flush_every: Number of spans to buffer before writing them out
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self._file = open(path, "a", encoding="utf-8")
+        self._pending = 0
+        self._lock = threading.Lock()
+    
+    def record(self, span: Dict[str, Any]) -> None:
+        line = json.dumps(span, default=str) + "\n"
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line)
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._file.flush()
+                self._pending = 0
+    
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def read_spans(path: str) -> Iterable[Dict[str, Any]]:
+    """
+    Read the spans written by a JsonlSink.
+    
+    Args:
+        path: The JSONL file
+    
+    Returns:
+        An iterator of span dictionaries
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,274 @@
+import json
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, Optional
+
+from src.response_cache import _jsonable, request_key
+
+# Request parameters accepted by the count_tokens endpoint
+COUNT_PARAMS = ("model", "system", "messages", "tools", "tool_choice", "thinking")
+
+
+class TokenCounter:
+    """
+    Input token accounting for requests, done before they are sent.
+    
+    Every message, tool definition and system prompt is estimated once from
+    its serialized size and the estimate is cached by object identity, so
+    counting a request whose history is a Conversation only sums cached numbers
+    for the messages it has seen before. The cache keeps the max_entries most
+    recently counted objects alive (an id is only reused once its object is
+    gone), so its bound is kept small: a few long conversations, not every
+    message a server has seen. The estimates are calibrated with the
+    input tokens the API reports for each response (a running ratio of actual to
+    estimated tokens). When a request's estimate comes within exact_margin of the
+    context window, the LLM asks the count_tokens endpoint instead; those exact
+    counts are cached per request and also feed the calibration.
+    
+    With the counts, the LLM rejects requests that cannot fit in the context
+    window before sending them, lowers max_tokens to what is left of the window,
+    picks max_tokens for calls made with max_tokens=None (the p95 of recent
+    output lengths times output_headroom when adaptive_max_tokens is set), and
+    resends a request whose tool_use block was cut off by max_tokens with a
+    larger limit. The counts are passed to the rate limiter and to telemetry
+    ("estimated_input_tokens" on "llm.model_call" spans).
+    
+    Usage:
+        counter = TokenCounter(context_window=200000)
+        llm = LLM(token_counter=counter,
+                  history_manager=HistoryManager(max_tokens=50000, token_counter=counter))
+        counter.stats()
+    """
+    
+    def __init__(self,
+                 context_window: int = 200000,
+                 max_output_tokens: int = 8192,
+                 min_output_tokens: int = 256,
+                 adaptive_max_tokens: bool = True,
+                 output_headroom: float = 1.5,
+                 exact_margin: float = 0.1,
+                 chars_per_token: float = 4.0,
+                 max_entries: int = 4096):
+        """
+        Initialize the counter.
+        
+        Args:
+            context_window: Tokens the model accepts, input and output together
+            max_output_tokens: Largest max_tokens the model accepts, and the limit chosen for
+                max_tokens=None without adaptive_max_tokens (or before any output was seen)
+            min_output_tokens: Requests leaving less than this for the output are rejected
+            adaptive_max_tokens: Choose max_tokens=None as the recent p95 output length times
+                output_headroom
+            output_headroom: Factor applied to the p95 output length
+            exact_margin: Use the count_tokens endpoint when the estimate plus max_tokens is
+                within this share of the context window; 0 never calls it
+            chars_per_token: Characters per token of the local estimate, before calibration
+            max_entries: Number of messages and tool definitions whose estimates are cached (least
+                recently counted first out)
+        """
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        self.min_output_tokens = min_output_tokens
+        self.adaptive_max_tokens = adaptive_max_tokens
+        self.output_headroom = output_headroom
+        self.exact_margin = exact_margin
+        self.chars_per_token = chars_per_token
+        self.max_entries = max_entries
+        self.scale = 1.0
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._exact: OrderedDict = OrderedDict()
+        self._outputs = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "exact_counts": 0, "rejected": 0, "truncation_retries": 0}
+    
+    def _estimate(self, value: Any) -> int:
+        if isinstance(value, str):
+            return int(len(value) / self.chars_per_token) + 1
+        encoded = json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=_jsonable)
+        return int(len(encoded) / self.chars_per_token) + 1
+    
+    def _raw_count(self, values: Optional[Iterable[Any]]) -> int:
+        """Sum the raw estimates of messages or tool definitions, computing each once per object."""
+        total = 0
+        hits = 0
+        missing = []
+        with self._lock:
+            entries = self._entries
+            for value in values or ():
+                # An entry keeps its object alive, so a matching id is the same object
+                entry = entries.get(id(value))
+                if entry is not None and entry[0] is value:
+                    total += entry[1]
+                    hits += 1
+                    entries.move_to_end(id(value))
+                else:
+                    missing.append(value)
+            self._counters["hits"] += hits
+        if not missing:
+            return total
+        
+        estimates = [(value, self._estimate(value)) for value in missing]
+        with self._lock:
+            self._counters["misses"] += len(missing)
+            for value, tokens in estimates:
+                entries[id(value)] = (value, tokens)
+                total += tokens
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+        return total
+    
+    def count_messages(self, messages: Iterable[Dict[str, Any]]) -> int:
+        """
+        Estimate the input tokens of a list of messages.
+        
+        Args:
+            messages: A Conversation or a list of Messages API messages
+        
+        Returns:
+            The calibrated estimate
+        """
+        return int(self._raw_count(messages) * self.scale) + 1
+    
+    def count(self, message_params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Estimate the input tokens of a request.
+        
+        Args:
+            message_params: Messages API request parameters
+        
+        Returns:
+            Dictionary with the calibrated "input_tokens", the uncalibrated "raw" estimate,
+            "exact" (whether input_tokens came from count_tokens) and "near_limit" (whether
+            the request should be counted exactly, see exact_margin)
+        """
+        system = message_params.get("system")
+        raw = self._raw_count(message_params.get("messages")) + self._raw_count(message_params.get("tools"))
+        if system:
+            raw += self._estimate(system) if isinstance(system, str) else self._raw_count(system)
+        counts = {"input_tokens": int(raw * self.scale) + 1, "raw": raw, "exact": False, "near_limit": False}
+        
+        requested = message_params.get("max_tokens")
+        needed = counts["input_tokens"] + min(self.max_output_tokens if requested is None else requested,
+                                              self.max_output_tokens)
+        if self.exact_margin and needed >= self.context_window * (1 - self.exact_margin):
+            # Only requests near the limit pay for hashing the whole request
+            counts["key"] = request_key(self.exact_params(message_params))
+            with self._lock:
+                exact = self._exact.get(counts["key"])
+            if exact is not None:
+                counts.update(input_tokens=exact, exact=True)
+            else:
+                counts["near_limit"] = True
+        return counts
+    
+    def exact_params(self, message_params: Dict[str, Any]) -> Dict[str, Any]:
+        """The parameters of a request that the count_tokens endpoint accepts."""
+        return {name: message_params[name] for name in COUNT_PARAMS if name in message_params}
+    
+    def record_exact(self, counts: Dict[str, Any], input_tokens: int) -> Dict[str, Any]:
+        """
+        Store the count_tokens result for a request.
+        
+        Args:
+            counts: The result of count for the request
+            input_tokens: The input tokens reported by count_tokens
+        
+        Returns:
+            The counts with the exact number
+        """
+        with self._lock:
+            self._counters["exact_counts"] += 1
+            self._exact[counts["key"]] = input_tokens
+            while len(self._exact) > 1000:
+                self._exact.popitem(last=False)
+            self._calibrate(counts["raw"], input_tokens)
+        return dict(counts, input_tokens=input_tokens, exact=True, near_limit=False)
+    
+    def _calibrate(self, raw: int, actual: int) -> None:
+        """Move the estimate scale towards actual / raw (lock held)."""
+        if raw > 0 and actual > 0:
+            self.scale = 0.8 * self.scale + 0.2 * (actual / raw)
+    
+    def max_tokens(self, requested: Optional[int], input_tokens: int) -> int:
+        """
+        Pick the max_tokens of a request.
+        
+        Args:
+            requested: The max_tokens the caller asked for, or None to let the counter choose
+            input_tokens: The request's input tokens, as counted
+        
+        Returns:
+            requested, lowered to what is left of the context window if needed (an explicit
+            limit is never raised). For None, the recent p95 output length times
+            output_headroom if adaptive_max_tokens is set, else max_output_tokens, within
+            the same bounds.
+        
+        Raises:
+            ValueError: If less than min_output_tokens of the context window is left
+        """
+        available = self.context_window - input_tokens
+        if available < self.min_output_tokens:
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise ValueError(
+                f"Request of about {input_tokens} input tokens leaves {max(available, 0)} of the "
+                f"{self.context_window}-token context window for the response; compact the "
+                f"history (HistoryManager) or shorten the prompt"
+            )
+        chosen = requested
+        if chosen is None:
+            chosen = self.max_output_tokens
+            if self.adaptive_max_tokens:
+                with self._lock:
+                    outputs = sorted(self._outputs)
+                if outputs:
+                    p95 = outputs[min(len(outputs) - 1, int(0.95 * len(outputs)))]
+                    chosen = min(max(int(p95 * self.output_headroom), self.min_output_tokens),
+                                 self.max_output_tokens)
+        return min(chosen, available)
+    
+    def grow_max_tokens(self, current: int, input_tokens: int) -> Optional[int]:
+        """
+        Pick a larger max_tokens for a request whose tool_use block was cut off.
+        
+        Args:
+            current: The max_tokens the request was sent with
+            input_tokens: The request's input tokens, as counted
+        
+        Returns:
+            Twice current within the model's and the context window's limits, or None
+            if the limit cannot grow
+        """
+        grown = min(current * 2, self.max_output_tokens, self.context_window - input_tokens)
+        if grown <= current:
+            return None
+        with self._lock:
+            self._counters["truncation_retries"] += 1
+        return grown
+    
+    def observe(self, counts: Optional[Dict[str, Any]], usage: Any) -> None:
+        """
+        Learn from the usage the API reported for a request.
+        
+        Args:
+            counts: The result of count for the request, or None if it was not counted
+            usage: The `usage` object of the response
+        """
+        actual = (getattr(usage, "input_tokens", None) or 0) + \
+            (getattr(usage, "cache_creation_input_tokens", None) or 0) + \
+            (getattr(usage, "cache_read_input_tokens", None) or 0)
+        with self._lock:
+            self._outputs.append(getattr(usage, "output_tokens", None) or 0)
+            if counts is not None and not counts["exact"]:
+                self._calibrate(counts["raw"], actual)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the counter's statistics.
+        
+        Returns:
+            Dictionary with the cached estimates, cache hits and misses, the calibration
+            scale, count_tokens calls, rejected requests and max_tokens truncation retries
+        """
+        with self._lock:
+            return {"cached": len(self._entries), "scale": round(self.scale, 4), **self._counters}
@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from src.lazy_import import LazyModule
+
+# Only the coroutine lookups need asyncio, so synchronous programs never import it
+asyncio = LazyModule("asyncio")
+
+CachePolicy = Union[str, Dict[str, Any]]
+
+
+class ToolResultCache:
+    """
+    Memoizes the results of one tool.
+    
+    The policy passed to LLM.register_tool(cache=...) decides how long a result
+    stays valid:
+    
+        "pure"                       results never change for the same input
+        {"ttl": 300}                 results are valid for 300 seconds
+        {"mtime": path_for_input}    results are valid while the file returned by
+                                     path_for_input(input_dict) keeps its mtime and size
+    
+    Any policy dictionary may also set "max_entries" (default 1024). Concurrent
+    calls with identical input are coalesced: one of them runs the tool and the
+    others wait for its result. Exceptions are never cached.
+    """
+    
+    def __init__(self, policy: CachePolicy):
+        """
+        Initialize the cache.
+        
+        Args:
+            policy: "pure" or a policy dictionary as described above
+        """
+        if policy == "pure":
+            policy = {}
+        elif not isinstance(policy, dict):
+            raise ValueError(f"Unknown tool cache policy: {policy!r}")
+        
+        self.ttl: Optional[float] = policy.get("ttl")
+        self.path_for_input: Optional[Callable[[Dict[str, Any]], str]] = policy.get("mtime")
+        self.max_entries: int = policy.get("max_entries", 1024)
+        
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self._async_in_flight: Dict[str, "asyncio.Future"] = {}
+    
+    def _key(self, input_dict: Dict[str, Any]) -> str:
+        return json.dumps(input_dict, sort_keys=True, separators=(",", ":"), default=str)
+    
+    def _version(self, input_dict: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        """The (mtime, size) of the file an mtime policy depends on, or None if it is missing."""
+        try:
+            stat = os.stat(self.path_for_input(input_dict))
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _lookup(self, key: str, version: Any) -> Tuple[bool, Any]:
+        """Return (found, result) for a key. Must be called with the lock held."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        stored_at, stored_version, result = entry
+        expired = self.ttl is not None and time.monotonic() - stored_at > self.ttl
+        if expired or stored_version != version:
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, result
+    
+    def _store(self, key: str, version: Any, result: Any) -> None:
+        """Store a result. Must be called with the lock held."""
+        self._entries[key] = (time.monotonic(), version, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def call(self, function: Callable, input_dict: Dict[str, Any]) -> Tuple[Any, bool]:
+        """
+        Return the cached result for input_dict or run the tool.
+        
+        Args:
+            function: The tool function
+            input_dict: The keyword arguments for the tool
+        
+        Returns:
+            A (result, cache_hit) tuple
+        """
+        key = self._key(input_dict)
+        version = self._version(input_dict) if self.path_for_input else None
+        
+        with self._lock:
+            found, result = self._lookup(key, version)
+            if found:
+                self.hits += 1
+                return result, True
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                self.misses += 1
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                # Another thread is already running the tool with this input
+                self.hits += 1
+                self.coalesced += 1
+        
+        if not leader:
+            return future.result(), True
+        
+        try:
+            result = function(**input_dict)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        
+        with self._lock:
+            self._store(key, version, result)
+            del self._in_flight[key]
+        future.set_result(result)
+        return result, False
+    
+    async def acall(self, function: Callable, input_dict: Dict[str, Any]) -> Tuple[Any, bool]:
+        """
+        Coroutine version of call for `async def` tools.
+        
+        Args:
+            function: The tool coroutine function
+            input_dict: The keyword arguments for the tool
+        
+        Returns:
+            A (result, cache_hit) tuple
+        """
+        key = self._key(input_dict)
+        version = self._version(input_dict) if self.path_for_input else None
+        
+        with self._lock:
+            found, result = self._lookup(key, version)
+            if found:
+                self.hits += 1
+                return result, True
+            future = self._async_in_flight.get(key)
+            if future is None:
+                self.misses += 1
+            else:
+                # Another task is already running the tool with this input
+                self.hits += 1
+                self.coalesced += 1
+        
+        if future is not None:
+            return await asyncio.shield(future), True
+        
+        future = asyncio.get_running_loop().create_future()
+        self._async_in_flight[key] = future
+        try:
+            result = await function(**input_dict)
+        except BaseException as e:
+            del self._async_in_flight[key]
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                # Mark the exception as retrieved when nobody else was waiting for it
+                future.exception()
+            else:
+                future.cancel()
+            raise
+        
+        with self._lock:
+            self._store(key, version, result)
+        del self._async_in_flight[key]
+        future.set_result(result)
+        return result, False
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the hit and miss counters.
+        
+        Returns:
+            A dictionary with hits, misses, coalesced calls and hit_rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+    
+    def clear(self) -> None:
+        """Drop every cached result."""
+        with self._lock:
+            self._entries.clear()
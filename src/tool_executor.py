@@ -0,0 +1,488 @@
+import asyncio
+import contextvars
+import functools
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.telemetry import _percentile
+
+# Where a tool's function runs: on the thread handling the tool call, on the executor's
+# thread pool or in one of its worker processes
+BACKENDS = ("inline", "thread", "process")
+
+# Execution and queue wait times kept per backend for stats()
+MAX_SAMPLES = 10000
+
+
+class ToolTimeoutError(TimeoutError):
+    """A tool call that did not finish within its timeout, or before the turn's deadline."""
+    
+    def __init__(self, timeout: Optional[float] = None, deadline_exceeded: bool = False):
+        self.timeout = timeout
+        self.deadline_exceeded = deadline_exceeded
+        if deadline_exceeded:
+            message = "was cancelled because the turn's deadline passed"
+        elif timeout is not None:
+            message = f"timed out after {timeout:g}s"
+        else:
+            message = "timed out"
+        super().__init__(message)
+
+
+def _serve_tool_calls(connection) -> None:
+    """Main loop of a worker process: run (function, arguments) jobs and send back their outcomes."""
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, OSError, KeyboardInterrupt):
+            return
+        except Exception as e:
+            # The job could not be unpickled here, e.g. the function's module fails to import
+            outcome = ("error", e)
+        else:
+            function, arguments = job
+            try:
+                outcome = ("result", function(**arguments))
+            except Exception as e:
+                outcome = ("error", e)
+        try:
+            connection.send(outcome)
+        except Exception as e:
+            connection.send(("error", TypeError(f"The tool's {outcome[0]} cannot be sent back: {e}")))
+
+
+class _WorkerProcess:
+    """A worker process and the parent's end of the pipe it receives jobs on."""
+    
+    def __init__(self, context):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_serve_tool_calls, args=(child,), name="llm-tool-process",
+                                       daemon=True)
+        self.process.start()
+        child.close()
+    
+    def stop(self, kill: bool = False) -> None:
+        self.connection.close()
+        if kill:
+            self.process.kill()
+        self.process.join(None if kill else 5.0)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class _BackendStats:
+    """Counters, queue depth and timings of one backend (guarded by the executor's lock)."""
+    
+    def __init__(self):
+        self.counters = {"calls": 0, "errors": 0, "timeouts": 0, "cancelled": 0, "abandoned": 0, "killed": 0}
+        self.queued = 0
+        self.max_queued = 0
+        self.running = 0
+        self.durations = deque(maxlen=MAX_SAMPLES)
+        self.waits = deque(maxlen=MAX_SAMPLES)
+    
+    def enqueue(self) -> None:
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+    
+    def start(self, enqueued: float, started: float) -> None:
+        self.queued -= 1
+        self.running += 1
+        self.waits.append(started - enqueued)
+    
+    def finish(self, started: float) -> None:
+        self.running -= 1
+        self.durations.append(time.monotonic() - started)
+
+
+class ToolExecutor:
+    """
+    Runs tool functions inline, on a thread pool or in worker processes, with timeouts.
+    
+    inline   The function runs on the calling thread. It cannot be interrupted, so
+             it has no timeout; a call whose deadline has already passed is not started.
+    thread   The function runs on one of max_threads daemon threads, in a copy of the
+             caller's context (so SessionLocal tool state carries over). At its timeout
+             the caller gets a ToolTimeoutError; a thread cannot be stopped, so it
+             finishes the call in the background and its result is discarded (still
+             holding the call's exclusive lock, if it has one).
+    process  The function and its arguments are pickled to one of max_processes worker
+             processes, so CPU-heavy tools do not hold this interpreter's GIL. At its
+             timeout the worker is killed and later replaced. The function must be a
+             module-level function, its result picklable, and it neither sees nor
+             changes the caller's tool state.
+    
+    A call waits at most its timeout and at most until its deadline, both counting
+    the time it spends queued for a free thread or process; calls still queued
+    then never start. stats() reports, per backend, the calls, errors, timeouts,
+    deadline cancellations, current and peak queue depth and execution and queue
+    wait times. arun is the coroutine version of run, used by AsyncLLM.
+    
+    Usage:
+        executor = ToolExecutor(max_threads=8, max_processes=4)
+        executor.run(score_patient, {"name": "Ada"}, backend="process", timeout=5.0)
+    """
+    
+    def __init__(self, max_threads: int = 8, max_processes: Optional[int] = None, start_method: Optional[str] = None):
+        """
+        Initialize the executor. Threads and processes are started when calls need them.
+        
+        Args:
+            max_threads: Threads of the "thread" backend, including those still running
+                calls that timed out
+            max_processes: Worker processes of the "process" backend; defaults to the number of CPUs
+            start_method: multiprocessing start method of the workers; defaults to "forkserver"
+                where available (forking a process with running threads is unsafe), else "spawn"
+        """
+        if max_threads < 1:
+            raise ValueError("max_threads must be at least 1")
+        self.max_threads = max_threads
+        self.max_processes = max(1, max_processes or os.cpu_count() or 1)
+        self.start_method = start_method
+        self._lock = threading.Lock()
+        self._process_available = threading.Condition(self._lock)
+        self._stats = {backend: _BackendStats() for backend in BACKENDS}
+        self._thread_jobs = queue.SimpleQueue()
+        self._threads = 0
+        self._context = None
+        self._idle_processes: List[_WorkerProcess] = []
+        self._processes = 0
+        self._closed = False
+    
+    def run(self,
+            function: Callable,
+            arguments: Dict[str, Any],
+            backend: str = "inline",
+            timeout: Optional[float] = None,
+            deadline: Optional[float] = None,
+            exclusive: Optional[threading.Lock] = None) -> Any:
+        """
+        Call function(**arguments) on a backend.
+        
+        Args:
+            function: The tool function
+            arguments: Its keyword arguments
+            backend: "inline", "thread" or "process"
+            timeout: Optional seconds the call may take (not enforced inline)
+            deadline: Optional time.monotonic() by which the call must end, e.g. the turn's deadline
+            exclusive: Optional lock held while the function runs, so that calls sharing it never
+                overlap. On the thread backend it stays held after the call times out, until the
+                abandoned function returns. Waiting for it counts against timeout and deadline.
+        
+        Returns:
+            The function's result
+        
+        Raises:
+            ToolTimeoutError: If the call did not finish in time
+            ValueError: If the backend is unknown or the executor is shut down
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown tool backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+        if self._closed:
+            raise ValueError("The tool executor is shut down")
+        stats = self._stats[backend]
+        end, expired = self._end(timeout if backend != "inline" else None, deadline)
+        with self._lock:
+            stats.counters["calls"] += 1
+        held = None
+        try:
+            if end is not None and time.monotonic() >= end:
+                raise expired
+            if exclusive is not None:
+                if not exclusive.acquire(timeout=-1 if end is None else max(0.0, end - time.monotonic())):
+                    raise expired
+                held = exclusive
+            if backend == "thread":
+                # The thread that runs the call releases the lock once the function returns
+                held = None
+                return self._run_thread(stats, function, arguments, end, expired, exclusive)
+            if backend == "process":
+                return self._run_process(stats, function, arguments, end, expired)
+            started = time.monotonic()
+            with self._lock:
+                stats.running += 1
+            try:
+                return function(**arguments)
+            finally:
+                with self._lock:
+                    stats.finish(started)
+        except ToolTimeoutError as e:
+            with self._lock:
+                stats.counters["cancelled" if e.deadline_exceeded else "timeouts"] += 1
+            raise
+        except Exception:
+            with self._lock:
+                stats.counters["errors"] += 1
+            raise
+        finally:
+            if held is not None:
+                held.release()
+    
+    async def arun(self,
+                   function: Callable,
+                   arguments: Dict[str, Any],
+                   backend: str = "inline",
+                   timeout: Optional[float] = None,
+                   deadline: Optional[float] = None,
+                   exclusive: Optional[threading.Lock] = None) -> Any:
+        """
+        Coroutine version of run for event loops.
+        
+        A thread backend call is queued to the executor's threads in a copy of the
+        caller's context and its future is awaited, so no other thread blocks waiting
+        for it. Inline and process calls go through run on the event loop's default
+        executor. Arguments, result and errors are those of run.
+        """
+        loop = asyncio.get_running_loop()
+        if backend != "thread":
+            call = functools.partial(contextvars.copy_context().run, self.run, function, arguments, backend,
+                                     timeout, deadline, exclusive)
+            return await loop.run_in_executor(None, call)
+        if self._closed:
+            raise ValueError("The tool executor is shut down")
+        stats = self._stats[backend]
+        end, expired = self._end(timeout, deadline)
+        with self._lock:
+            stats.counters["calls"] += 1
+        try:
+            if end is not None and time.monotonic() >= end:
+                raise expired
+            if exclusive is not None and not exclusive.acquire(blocking=False):
+                # Held by a call that timed out and still runs; wait for it off the event loop
+                limit = -1 if end is None else max(0.0, end - time.monotonic())
+                waiter = loop.run_in_executor(None, exclusive.acquire, True, limit)
+                try:
+                    acquired = await asyncio.shield(waiter)
+                except asyncio.CancelledError:
+                    waiter.add_done_callback(lambda waiter: waiter.result() and exclusive.release())
+                    raise
+                if not acquired:
+                    raise expired
+            # The thread that runs the call releases the lock once the function returns
+            future = self._queue_thread(stats, function, arguments, exclusive)
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                       None if end is None else max(0.0, end - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                finished = self._stop_waiting(stats, future, exclusive)
+            if not finished:
+                raise expired
+            return future.result()
+        except ToolTimeoutError as e:
+            with self._lock:
+                stats.counters["cancelled" if e.deadline_exceeded else "timeouts"] += 1
+            raise
+        except Exception:
+            with self._lock:
+                stats.counters["errors"] += 1
+            raise
+    
+    def _end(self, timeout: Optional[float], deadline: Optional[float]) -> Tuple[Optional[float], ToolTimeoutError]:
+        """When a call must end, and the error it gets if it does not."""
+        end = time.monotonic() + timeout if timeout is not None else None
+        if deadline is not None and (end is None or deadline < end):
+            return deadline, ToolTimeoutError(timeout, deadline_exceeded=True)
+        return end, ToolTimeoutError(timeout)
+    
+    def _run_thread(self, stats: _BackendStats, function: Callable, arguments: Dict[str, Any],
+                    end: Optional[float], expired: ToolTimeoutError, exclusive: Optional[threading.Lock] = None) -> Any:
+        future = self._queue_thread(stats, function, arguments, exclusive)
+        wait([future], None if end is None else max(0.0, end - time.monotonic()))
+        if not self._stop_waiting(stats, future, exclusive):
+            raise expired
+        return future.result()
+    
+    def _queue_thread(self, stats: _BackendStats, function: Callable, arguments: Dict[str, Any],
+                      exclusive: Optional[threading.Lock] = None) -> Future:
+        """Queue a call to the thread backend, in a copy of the caller's context, and return its future."""
+        future = Future()
+        enqueued = time.monotonic()
+        call = contextvars.copy_context().run
+        with self._lock:
+            stats.enqueue()
+            # Threads still running timed-out calls stay busy, so count them against max_threads
+            if self._threads < min(self.max_threads, stats.queued + stats.running):
+                self._threads += 1
+                threading.Thread(target=self._serve_thread_calls, name=f"llm-tool-thread-{self._threads}",
+                                 daemon=True).start()
+        self._thread_jobs.put((future, lambda: call(self._timed, stats, enqueued, function, arguments, exclusive)))
+        return future
+    
+    def _stop_waiting(self, stats: _BackendStats, future: Future, exclusive: Optional[threading.Lock] = None) -> bool:
+        """Cancel a thread call that is still queued or abandon a running one; whether it had finished."""
+        with self._lock:
+            # Only a queued call can be cancelled; one that finished after the wait keeps its result
+            cancelled = future.cancel()
+            if cancelled:
+                stats.queued -= 1
+            elif not future.done():
+                stats.counters["abandoned"] += 1
+                return False
+        if cancelled:
+            if exclusive is not None:
+                exclusive.release()
+            return False
+        return True
+    
+    def _timed(self, stats: _BackendStats, enqueued: float, function: Callable, arguments: Dict[str, Any],
+               exclusive: Optional[threading.Lock] = None) -> Any:
+        started = time.monotonic()
+        with self._lock:
+            stats.start(enqueued, started)
+        try:
+            return function(**arguments)
+        finally:
+            with self._lock:
+                stats.finish(started)
+            if exclusive is not None:
+                exclusive.release()
+    
+    def _serve_thread_calls(self) -> None:
+        while True:
+            job = self._thread_jobs.get()
+            if job is None:
+                return
+            future, call = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(call())
+            except BaseException as e:
+                future.set_exception(e)
+    
+    def _run_process(self, stats: _BackendStats, function: Callable, arguments: Dict[str, Any],
+                     end: Optional[float], expired: ToolTimeoutError) -> Any:
+        worker, started = self._acquire_process(stats, end, expired)
+        healthy = False
+        try:
+            try:
+                worker.connection.send((function, arguments))
+            except Exception:
+                # Nothing was sent (pickling failed), so the worker can take the next job
+                healthy = True
+                raise
+            if not worker.connection.poll(None if end is None else max(0.0, end - time.monotonic())):
+                with self._lock:
+                    stats.counters["killed"] += 1
+                raise expired
+            try:
+                kind, value = worker.connection.recv()
+            except (EOFError, OSError):
+                worker.process.join(1.0)
+                raise RuntimeError(f"The tool's worker process exited (exit code {worker.process.exitcode})")
+            healthy = True
+            if kind == "error":
+                raise value
+            return value
+        finally:
+            with self._lock:
+                stats.finish(started)
+            self._release_process(worker, healthy)
+    
+    def _acquire_process(self, stats: _BackendStats, end: Optional[float],
+                         expired: ToolTimeoutError) -> Tuple[_WorkerProcess, float]:
+        """Take an idle worker, start a new one, or wait (at most until end) for one to be free."""
+        enqueued = time.monotonic()
+        with self._process_available:
+            stats.enqueue()
+            worker = None
+            while worker is None:
+                if self._idle_processes:
+                    worker = self._idle_processes.pop()
+                    if not worker.process.is_alive():
+                        worker.stop()
+                        self._processes -= 1
+                        worker = None
+                    continue
+                if self._closed:
+                    stats.queued -= 1
+                    raise ValueError("The tool executor is shut down")
+                if self._processes < self.max_processes:
+                    self._processes += 1
+                    break
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    stats.queued -= 1
+                    raise expired
+                self._process_available.wait(remaining)
+            started = time.monotonic()
+            stats.start(enqueued, started)
+        if worker is None:
+            try:
+                worker = _WorkerProcess(self._get_context())
+            except Exception:
+                with self._process_available:
+                    self._processes -= 1
+                    stats.finish(started)
+                    self._process_available.notify()
+                raise
+        return worker, started
+    
+    def _release_process(self, worker: _WorkerProcess, healthy: bool) -> None:
+        with self._process_available:
+            keep = healthy and not self._closed
+            if keep:
+                self._idle_processes.append(worker)
+            else:
+                self._processes -= 1
+            self._process_available.notify()
+        if not keep:
+            worker.stop(kill=not healthy)
+    
+    def _get_context(self):
+        if self._context is None:
+            import multiprocessing
+            start_method = self.start_method
+            if start_method is None:
+                start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._context = multiprocessing.get_context(start_method)
+        return self._context
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the counters, queue depth and timings of every backend.
+        
+        Returns:
+            A dictionary mapping each backend to its calls, errors, timeouts, deadline
+            cancellations ("cancelled"), timed-out calls left running ("abandoned", threads)
+            or killed ("killed", processes), current "queued" / "running" calls, the peak
+            "max_queued", and the p50 / p99 execution and queue wait times in seconds
+        """
+        with self._lock:
+            report = {}
+            for backend, stats in self._stats.items():
+                durations = sorted(stats.durations)
+                waits = sorted(stats.waits)
+                entry = {**stats.counters, "queued": stats.queued, "max_queued": stats.max_queued,
+                         "running": stats.running}
+                if durations:
+                    entry["execution_p50"] = round(_percentile(durations, 0.50), 6)
+                    entry["execution_p99"] = round(_percentile(durations, 0.99), 6)
+                if waits:
+                    entry["queue_wait_p50"] = round(_percentile(waits, 0.50), 6)
+                    entry["queue_wait_p99"] = round(_percentile(waits, 0.99), 6)
+                report[backend] = entry
+            report["thread"]["threads"] = self._threads
+            report["process"]["processes"] = self._processes
+        return report
+    
+    def shutdown(self) -> None:
+        """Stop the threads and the idle worker processes; busy workers stop after their current call."""
+        with self._process_available:
+            self._closed = True
+            threads = self._threads
+            idle, self._idle_processes = self._idle_processes, []
+            self._processes -= len(idle)
+            self._process_available.notify_all()
+        for _ in range(threads):
+            self._thread_jobs.put(None)
+        for worker in idle:
+            worker.stop()
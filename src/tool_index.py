@@ -0,0 +1,259 @@
+import math
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from src.tool_manifest import ToolManifest
+
+# Words too common in tool descriptions and prompts to tell tools apart
+STOPWORDS = frozenset(
+    "a all an and any are as at be by can do for from get has have how i in is it its me my of on or "
+    "please set that the this to use used using was what when where which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase search terms.
+    
+    snake_case and camelCase identifiers are split into words, stopwords are
+    dropped, accents and a plural "s" are removed, so "list_trainer_pokemon"
+    matches "which Pokémons does this trainer have".
+    """
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    terms = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def _schema_text(schema: Dict[str, Any]) -> List[str]:
+    """The property names, descriptions and enum values of an input schema, nested ones included."""
+    parts = []
+    for name, prop in (schema.get("properties") or {}).items():
+        parts.append(name)
+        if isinstance(prop, dict):
+            parts.append(prop.get("description", ""))
+            parts.extend(str(value) for value in prop.get("enum", ()))
+            parts.extend(_schema_text(prop))
+            if isinstance(prop.get("items"), dict):
+                parts.extend(_schema_text(prop["items"]))
+    return parts
+
+
+def used_tools(messages: Optional[Iterable[Dict[str, Any]]]) -> Set[str]:
+    """The names of the tools called in a conversation."""
+    names = set()
+    for message in messages or ():
+        content = message["content"] if message["role"] == "assistant" else None
+        if isinstance(content, str) or not content:
+            continue
+        for block in content:
+            if isinstance(block, dict):
+                if block.get("type") == "tool_use":
+                    names.add(block["name"])
+            elif getattr(block, "type", None) == "tool_use":
+                names.add(block.name)
+    return names
+
+
+class ToolIndex:
+    """
+    Offers each call only the registered tools relevant to its prompt.
+    
+    The index ranks the tools of the manifest with BM25 over their names,
+    descriptions and input schema fields (the name counts name_weight times)
+    and offers the (at most) top_k tools that match the prompt of each call. Tools named in pinned and
+    tools already called in the conversation are always offered. When nothing
+    in the prompt matches, every tool is offered. The offered tools keep their
+    registration order and stay the same for all iterations of a call, so the
+    prompt-cache prefix of the tool loop stays stable.
+    
+    If the model calls a registered tool that was not offered, it runs and is
+    offered for the rest of the call; if it calls a tool that does not exist,
+    the tools that best match the call's name and input are added. Registries
+    with at most top_k tools are always sent whole. The index is rebuilt when
+    the registry changes.
+    
+    Usage:
+        llm = LLM(tool_index=ToolIndex(top_k=8, pinned=["get_current_time"]))
+        llm.tool_index.stats()
+    """
+    
+    def __init__(self,
+                 top_k: int = 8,
+                 pinned: Sequence[str] = (),
+                 expand_k: int = 3,
+                 name_weight: int = 3,
+                 k1: float = 1.2,
+                 b: float = 0.75):
+        """
+        Initialize the index.
+        
+        Args:
+            top_k: Number of best-matching tools offered per call, besides the pinned ones
+            pinned: Names of tools offered on every call
+            expand_k: Number of best matches added when the model calls an unknown tool
+            name_weight: How many times a tool's name counts in its document
+            k1: BM25 term frequency saturation
+            b: BM25 document length normalization
+        """
+        self.top_k = top_k
+        self.pinned = tuple(pinned)
+        self.expand_k = expand_k
+        self.name_weight = name_weight
+        self.k1 = k1
+        self.b = b
+        self._manifest: Optional[ToolManifest] = None
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        self._average_length = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"selections": 0, "offered": 0, "registered": 0, "full_fallbacks": 0,
+                          "expanded_omitted": 0, "expanded_unknown": 0}
+    
+    def _build(self, manifest: ToolManifest) -> None:
+        """Index the tool definitions of a manifest (lock held)."""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for position, definition in enumerate(manifest.definitions):
+            terms = tokenize(definition["name"]) * self.name_weight
+            terms += tokenize(definition.get("description", ""))
+            terms += tokenize(" ".join(_schema_text(definition.get("input_schema") or {})))
+            frequencies: Dict[str, int] = {}
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+            for term, frequency in frequencies.items():
+                postings.setdefault(term, []).append((position, frequency))
+            lengths.append(len(terms))
+        self._manifest = manifest
+        self._postings = postings
+        self._lengths = lengths
+        self._average_length = sum(lengths) / len(lengths) if lengths else 0.0
+    
+    def search(self, manifest: ToolManifest, query: str) -> List[Tuple[str, float]]:
+        """
+        Rank the tools of a manifest for a query.
+        
+        Args:
+            manifest: The LLM's tool manifest
+            query: Text to match against the tools
+        
+        Returns:
+            (tool name, BM25 score) tuples of the matching tools, best first
+        """
+        with self._lock:
+            if self._manifest is not manifest:
+                self._build(manifest)
+            postings, lengths, average_length = self._postings, self._lengths, self._average_length
+        
+        count = len(lengths)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            matches = postings.get(term)
+            if not matches:
+                continue
+            idf = math.log(1 + (count - len(matches) + 0.5) / (len(matches) + 0.5))
+            for position, frequency in matches:
+                norm = self.k1 * (1 - self.b + self.b * lengths[position] / average_length)
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(manifest.names[position], score) for position, score in ranked]
+    
+    def select(self, manifest: ToolManifest, query: str,
+               history: Optional[Iterable[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Pick the tools to offer on a call.
+        
+        Args:
+            manifest: The LLM's tool manifest
+            query: The call's prompt
+            history: The conversation so far; the tools it called stay offered
+        
+        Returns:
+            The tool definitions for the "tools" request parameter, in registration order
+        """
+        if len(manifest) <= self.top_k:
+            return manifest.as_list()
+        
+        keep = set(self.pinned) | used_tools(history)
+        matches = self.search(manifest, query)
+        keep.update(name for name, _ in matches[:self.top_k])
+        offered = [definition for definition in manifest.definitions if definition["name"] in keep]
+        full = not matches
+        if full:
+            offered = manifest.as_list()
+        with self._lock:
+            self._counters["selections"] += 1
+            self._counters["offered"] += len(offered)
+            self._counters["registered"] += len(manifest)
+            self._counters["full_fallbacks"] += full
+        return offered
+    
+    def expand(self, manifest: ToolManifest, offered: List[Dict[str, Any]],
+               tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Add tools after the model called ones that were not offered.
+        
+        Args:
+            manifest: The LLM's tool manifest
+            offered: The tool definitions offered so far in the call
+            tool_calls: The tool calls of the last response ("name" and "input")
+        
+        Returns:
+            offered, or a new list with the registered tools the model called and the best
+            matches for the tools it called that do not exist
+        """
+        names = {definition["name"] for definition in offered}
+        registered = set(manifest.names)
+        add = set()
+        omitted = unknown = 0
+        for tool_call in tool_calls:
+            name = tool_call["name"]
+            if name in names or name in add:
+                continue
+            if name in registered:
+                add.add(name)
+                omitted += 1
+            else:
+                unknown += 1
+                tool_input = tool_call.get("input")
+                query = f"{name} {' '.join(tool_input) if isinstance(tool_input, dict) else ''}"
+                candidates = [match for match, _ in self.search(manifest, query) if match not in names]
+                add.update(candidates[:self.expand_k])
+        if omitted or unknown:
+            with self._lock:
+                self._counters["expanded_omitted"] += omitted
+                self._counters["expanded_unknown"] += unknown
+        if not add:
+            return offered
+        names |= add
+        return [definition for definition in manifest.definitions if definition["name"] in names]
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the index's statistics.
+        
+        Returns:
+            Dictionary with the number of selections, the mean number of tools offered and
+            registered per selection, selections that offered every tool because nothing
+            matched, and the tool calls that expanded the offered set (omitted registered
+            tools and unknown tools)
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        selections = counters.pop("selections")
+        offered = counters.pop("offered")
+        registered = counters.pop("registered")
+        return {
+            "selections": selections,
+            "mean_offered": round(offered / selections, 2) if selections else 0.0,
+            "mean_registered": round(registered / selections, 2) if selections else 0.0,
+            **counters
+        }
@@ -0,0 +1,49 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Tuple
+
+class ToolManifest:
+    """
+    A frozen, pre-serialized snapshot of the registered tools.
+    
+    The manifest is built once from the tool registry and reused for every
+    request until the registry changes. Tool definitions keep registration order
+    and are never mutated afterwards, so every request sends byte-for-byte the
+    same "tools" array, which keeps the prompt-cache prefix stable.
+    """
+    
+    def __init__(self, tools: Dict[str, Dict[str, Any]], prompt_caching: bool = False):
+        """
+        Build the manifest.
+        
+        Args:
+            tools: The LLM tool registry (name -> tool info)
+            prompt_caching: Whether to put a cache_control breakpoint on the last tool
+        """
+        definitions = []
+        for name, tool_info in tools.items():
+            definitions.append({
+                "name": name,
+                "description": tool_info["description"],
+                "input_schema": tool_info["input_schema"]
+            })
+        if prompt_caching and definitions:
+            definitions[-1] = dict(definitions[-1], cache_control={"type": "ephemeral"})
+        
+        self.prompt_caching = prompt_caching
+        self.definitions: Tuple[Dict[str, Any], ...] = tuple(definitions)
+        self.names: Tuple[str, ...] = tuple(tools)
+        self.json: str = json.dumps(definitions, separators=(",", ":"), ensure_ascii=False)
+        self.digest: str = hashlib.sha256(self.json.encode("utf-8")).hexdigest()
+    
+    def __len__(self) -> int:
+        return len(self.definitions)
+    
+    def as_list(self) -> List[Dict[str, Any]]:
+        """
+        Return the tool definitions for the "tools" request parameter.
+        
+        The list is a fresh shallow copy; the definitions inside it are shared and
+        must be treated as read-only.
+        """
+        return list(self.definitions)
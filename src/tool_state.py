@@ -0,0 +1,70 @@
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+# The tool state of the session whose turn is running in the current context
+_current_state: ContextVar[Optional[Dict[str, Any]]] = ContextVar("session_state", default=None)
+# The tool state used outside any session (e.g. by the single-user REPL)
+_default_state: Dict[str, Any] = {}
+
+
+@contextmanager
+def use_state(state: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Make SessionLocal tool state refer to a session's state in this context.
+    
+    LLM runs tool calls with a copy of the calling context, so tools called
+    during a turn inside this block see the same state.
+    
+    Args:
+        state: The session's tool state dictionary
+    """
+    token = _current_state.set(state)
+    try:
+        yield state
+    finally:
+        _current_state.reset(token)
+
+
+def current_state() -> Dict[str, Any]:
+    """The tool state of the current session, or the process-wide state outside a session."""
+    state = _current_state.get()
+    return _default_state if state is None else state
+
+
+class SessionLocal(MutableMapping):
+    """
+    A module-level dictionary whose contents belong to the current session.
+    
+    Replaces a tool module's global store, e.g. patients = SessionLocal("patients"),
+    without changing the tools that use it: every session sees (and persists)
+    its own "patients" entry of its state. Values must be JSON-serializable.
+    """
+    
+    def __init__(self, name: str):
+        self.name = name
+    
+    def _data(self) -> Dict[Any, Any]:
+        return current_state().setdefault(self.name, {})
+    
+    def __getitem__(self, key):
+        return self._data()[key]
+    
+    def __setitem__(self, key, value) -> None:
+        self._data()[key] = value
+    
+    def __delitem__(self, key) -> None:
+        del self._data()[key]
+    
+    def __contains__(self, key) -> bool:
+        return key in self._data()
+    
+    def __iter__(self):
+        return iter(self._data())
+    
+    def __len__(self) -> int:
+        return len(self._data())
+    
+    def __repr__(self) -> str:
+        return f"SessionLocal({self.name!r}, {self._data()!r})"
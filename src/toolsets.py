@@ -0,0 +1,128 @@
+import importlib
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+# Toolsets shipped with the project: name -> "module:attribute" of its list of tool definitions
+BUILTIN_TOOLSETS = {
+    "patient_workflow": "src.utils.patient_workflow:sample_tools",
+    "sample": "src.utils.sample_tools:sample_tools",
+    "magic": "src.utils.magic_tools:magic_tools",
+    "obsidian": "src.utils.obsidian_tools:obsidian_tools",
+    "pokemon": "src.utils.pokemon_tools:pokemon_tools",
+    "unit_calculator": "src.utils.unit_calculator_tools:unit_calculator_tools"
+}
+
+# Entry point group under which installed packages publish toolsets, e.g. in their pyproject.toml:
+#     [project.entry-points.llm_toolsets]
+#     crm = "my_package.crm_tools:crm_tools"
+ENTRY_POINT_GROUP = "llm_toolsets"
+
+
+class ToolsetRegistry:
+    """
+    Finds toolsets by name and imports each one only when it is first used.
+    
+    A toolset is a module attribute holding a list of register_tool keyword
+    dictionaries (name, function, description, input_schema, ...). Names are
+    looked up in the manifest first and then among the ENTRY_POINT_GROUP entry
+    points of the installed packages, which are only scanned when a name is
+    not in the manifest (or available() is called). Nothing is imported until
+    a toolset is loaded, so unused toolsets cost nothing at startup.
+    
+    Usage:
+        toolsets = ToolsetRegistry()
+        toolsets.enable(llm, ["patient_workflow", "pokemon"])
+    """
+    
+    def __init__(self, manifest: Union[Dict[str, str], str, None] = None, entry_points: bool = True):
+        """
+        Initialize the registry.
+        
+        Args:
+            manifest: Mapping of toolset names to "module:attribute" targets, or the path of a
+                JSON file holding one; defaults to BUILTIN_TOOLSETS
+            entry_points: Whether to look up names missing from the manifest among the
+                ENTRY_POINT_GROUP entry points
+        """
+        if isinstance(manifest, str):
+            with open(manifest, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        self.manifest: Dict[str, str] = dict(BUILTIN_TOOLSETS if manifest is None else manifest)
+        self.entry_points = entry_points
+        self._discovered: Optional[Dict[str, str]] = None
+        self._loaded: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+    
+    def _discover(self) -> Dict[str, str]:
+        """The toolsets published as entry points (scanned once)."""
+        if self._discovered is None:
+            discovered = {}
+            if self.entry_points:
+                from importlib import metadata
+                found = metadata.entry_points()
+                group = found.select(group=ENTRY_POINT_GROUP) if hasattr(found, "select") \
+                    else found.get(ENTRY_POINT_GROUP, [])
+                discovered = {entry_point.name: entry_point.value for entry_point in group}
+            self._discovered = discovered
+        return self._discovered
+    
+    def available(self) -> Dict[str, str]:
+        """
+        List the toolsets that can be enabled.
+        
+        Returns:
+            Mapping of toolset names to their "module:attribute" targets
+        """
+        with self._lock:
+            return {**self._discover(), **self.manifest}
+    
+    def load(self, name: str) -> List[Dict[str, Any]]:
+        """
+        Import a toolset (once) and return its tool definitions.
+        
+        Args:
+            name: The toolset's name
+        
+        Returns:
+            The toolset's list of register_tool keyword dictionaries
+        
+        Raises:
+            ValueError: If no toolset has this name, or its target is not a list
+        """
+        with self._lock:
+            if name in self._loaded:
+                return self._loaded[name]
+            target = self.manifest.get(name) or self._discover().get(name)
+            if target is None:
+                known = ", ".join(sorted({**self._discover(), **self.manifest})) or "none"
+                raise ValueError(f"Unknown toolset {name!r} (available: {known})")
+            module_name, _, attribute = target.partition(":")
+            tools = getattr(importlib.import_module(module_name), attribute or "tools")
+            if not isinstance(tools, list):
+                raise ValueError(f"Toolset {name!r} ({target}) is not a list of tool definitions")
+            self._loaded[name] = tools
+            return tools
+    
+    def enable(self, llm, names: Iterable[str]) -> List[str]:
+        """
+        Load toolsets and register their tools with an LLM.
+        
+        Args:
+            llm: The LLM (or AsyncLLM) to register the tools with
+            names: Names of the toolsets to enable
+        
+        Returns:
+            The names of the registered tools
+        """
+        registered = []
+        for name in names:
+            for tool in self.load(name):
+                llm.register_tool(**tool)
+                registered.append(tool["name"])
+        return registered
+    
+    def loaded(self) -> List[str]:
+        """The names of the toolsets imported so far."""
+        with self._lock:
+            return list(self._loaded)
@@ -1,5 +1,8 @@
+import logging
 from typing import Dict, Any
 
+logger = logging.getLogger(__name__)
+
 def kill(person_name: str) -> Dict[str, Any]:
     """
     A function that simulates casting a killing spell on a person.
@@ -11,7 +14,7 @@ def kill(person_name: str) -> Dict[str, Any]:
         A dictionary with information about the spell cast
     """
     message = f"Avada kedavra {person_name}"
-    print(message)
+    logger.info(message)
     
     return {
         "spell": "Avada kedavra",
@@ -31,7 +34,7 @@ def disarm(person_name: str) -> Dict[str, Any]:
         A dictionary with information about the spell cast
     """
     message = f"Expelliarmus! {person_name}'s wand flies away."
-    print(message)
+    logger.info(message)
     
     return {
         "spell": "Expelliarmus",
@@ -1,10 +1,13 @@
 import os
 import datetime
+import logging
 from typing import Dict, Any, Optional
 
 # Predefined folder for Obsidian notes
 OBSIDIAN_VAULT_PATH = "/Users/neo/Desktop/test/"  # This can be changed to your actual Obsidian vault path
 
+logger = logging.getLogger(__name__)
+
 def ensure_vault_exists():
     """
     Ensure that the Obsidian vault directory exists.
@@ -12,7 +15,7 @@ def ensure_vault_exists():
     """
     if not os.path.exists(OBSIDIAN_VAULT_PATH):
         os.makedirs(OBSIDIAN_VAULT_PATH)
-        print(f"Created Obsidian vault directory at {OBSIDIAN_VAULT_PATH}")
+        logger.info("Created Obsidian vault directory at %s", OBSIDIAN_VAULT_PATH)
 
 def create_markdown_file(filename: str, content: str) -> Dict[str, Any]:
     """
@@ -48,26 +51,37 @@ def create_markdown_file(filename: str, content: str) -> Dict[str, Any]:
         "size": len(content)
     }
 
-def read_markdown_file(filepath: str) -> Dict[str, Any]:
+def resolve_note_path(filepath: str) -> str:
     """
-    Read the contents of a markdown file from the Obsidian vault.
+    Resolve a note path the way read_markdown_file does.
     
     Args:
         filepath: The path to the file (relative to the vault or absolute)
         
     Returns:
-        A dictionary with the file content and metadata
+        The path of the file on disk
     """
-    ensure_vault_exists()
-    
     # If only filename is provided, assume it's in the vault
     if not os.path.dirname(filepath):
         # Add .md extension if not present
         if not filepath.endswith('.md'):
             filepath = f"{filepath}.md"
-        file_path = os.path.join(OBSIDIAN_VAULT_PATH, filepath)
-    else:
-        file_path = filepath
+        return os.path.join(OBSIDIAN_VAULT_PATH, filepath)
+    return filepath
+
+def read_markdown_file(filepath: str) -> Dict[str, Any]:
+    """
+    Read the contents of a markdown file from the Obsidian vault.
+    
+    Args:
+        filepath: The path to the file (relative to the vault or absolute)
+        
+    Returns:
+        A dictionary with the file content and metadata
+    """
+    ensure_vault_exists()
+    
+    file_path = resolve_note_path(filepath)
     
     # Check if file exists
     if not os.path.exists(file_path):
@@ -158,6 +172,8 @@ obsidian_tools = [
     {
         "name": "read_markdown_file",
         "function": read_markdown_file,
+        # Reuse the result until the note changes on disk
+        "cache": {"mtime": lambda tool_input: resolve_note_path(tool_input["filepath"])},
         "description": "Read the contents of a markdown file from the Obsidian vault",
         "input_schema": {
             "type": "object",
@@ -1,8 +1,12 @@
 import datetime
-import requests
 import json
+import logging
 from typing import Optional, Dict, Any
 
+from src.tool_state import SessionLocal
+
+logger = logging.getLogger(__name__)
+
 def get_current_time() -> str:
     """
     Get the current date and time.
@@ -38,7 +42,8 @@ def get_weather(location: str, units: str = "metric") -> Dict[str, Any]:
     
     return weather_data 
 
-patients = dict()
+# Patient records of the current session (process-wide outside a server session)
+patients = SessionLocal("patients")
 
 def create_patient(name: str) -> None:
     patients[name] = {}
@@ -56,7 +61,7 @@ def is_eligible_for_study(name: str) -> bool:
 
 
 def send_message_to_patient(name: str, message: str) -> None:
-    print(f"Sending message to {name}: {message}")
+    logger.info("Sending message to %s: %s", name, message)
 
 
 def pradeep_test(name: str) -> None:
@@ -68,6 +73,7 @@ sample_tools = [
     {
         "name": "create_patient",
         "function": create_patient,
+        "thread_safe": False,
         "description": "Create a new patient record",
         "input_schema": {
             "type": "object",
@@ -83,6 +89,7 @@ sample_tools = [
     {
         "name": "add_patient_gender",
         "function": add_patient_gender,
+        "thread_safe": False,
         "description": "Add gender information to a patient record",
         "input_schema": {
             "type": "object",
@@ -102,6 +109,7 @@ sample_tools = [
     {
         "name": "add_patient_age",
         "function": add_patient_age,
+        "thread_safe": False,
         "description": "Add age information to a patient record",
         "input_schema": {
             "type": "object",
@@ -121,6 +129,7 @@ sample_tools = [
     {
         "name": "is_eligible_for_study",
         "function": is_eligible_for_study,
+        "thread_safe": False,
         "description": "Check if a patient is eligible for a study",
         "input_schema": {
             "type": "object",
@@ -1,7 +1,12 @@
+import logging
 from typing import Dict, Any, List
 
-# Store Pokémon on the belt
-pokemon_belt = {}
+from src.tool_state import SessionLocal
+
+# Store Pokémon on the belt, one per session
+pokemon_belt = SessionLocal("pokemon_belt")
+
+logger = logging.getLogger(__name__)
 
 def list_pokemon_types() -> Dict[str, Any]:
     """
@@ -10,9 +15,8 @@ def list_pokemon_types() -> Dict[str, Any]:
     Returns:
         A dictionary with the list of Pokémon types
     """
-    print("[TOOL CALLED] list_pokemon_types")
     types = ["Fire", "Water", "Grass"]
-    print(f"Available Pokémon types: {', '.join(types)}")
+    logger.info("Available Pokémon types: %s", ", ".join(types))
     
     return {
         "types": types,
@@ -31,12 +35,11 @@ def have_pokemon(pokemon_name: str, pokemon_type: str, trainer_name: str) -> Dic
     Returns:
         A dictionary with information about the added Pokémon
     """
-    print(f"[TOOL CALLED] have_pokemon with {pokemon_name}, {pokemon_type}, {trainer_name}")
     # Validate the Pokémon type
     valid_types = ["Fire", "Water", "Grass"]
     if pokemon_type not in valid_types:
         message = f"Invalid Pokémon type: {pokemon_type}. Valid types are: {', '.join(valid_types)}"
-        print(message)
+        logger.info(message)
         return {
             "status": "error",
             "message": message
@@ -48,7 +51,7 @@ def have_pokemon(pokemon_name: str, pokemon_type: str, trainer_name: str) -> Dic
     
     pokemon_belt[trainer_name][pokemon_name] = pokemon_type
     message = f"{trainer_name} now has {pokemon_name} ({pokemon_type})!"
-    print(message)
+    logger.info(message)
     
     return {
         "pokemon": pokemon_name,
@@ -69,7 +72,6 @@ def get_advantageous_type(pokemon_type: str) -> Dict[str, Any]:
     Returns:
         A dictionary with information about the advantageous type
     """
-    print(f"[TOOL CALLED] get_advantageous_type with {pokemon_type}")
     # Define type advantages
     type_advantages = {
         "Fire": "Water",
@@ -81,7 +83,7 @@ def get_advantageous_type(pokemon_type: str) -> Dict[str, Any]:
     valid_types = ["Fire", "Water", "Grass"]
     if pokemon_type not in valid_types:
         message = f"Invalid Pokémon type: {pokemon_type}. Valid types are: {', '.join(valid_types)}"
-        print(message)
+        logger.info(message)
         return {
             "status": "error",
             "message": message
@@ -90,7 +92,7 @@ def get_advantageous_type(pokemon_type: str) -> Dict[str, Any]:
     # Get the advantageous type
     advantageous_type = type_advantages[pokemon_type]
     message = f"{advantageous_type} type has an advantage against {pokemon_type} type!"
-    print(message)
+    logger.info(message)
     
     return {
         "original_type": pokemon_type,
@@ -108,12 +110,11 @@ def list_trainer_pokemon(trainer_name: str) -> Dict[str, Any]:
     Returns:
         A dictionary with information about the trainer's Pokémon
     """
-    print(f"[TOOL CALLED] list_trainer_pokemon with {trainer_name}")
     
     # Check if trainer exists
     if trainer_name not in pokemon_belt:
         message = f"Trainer {trainer_name} has no Pokémon yet!"
-        print(message)
+        logger.info(message)
         return {
             "trainer": trainer_name,
             "pokemon": {},
@@ -126,7 +127,7 @@ def list_trainer_pokemon(trainer_name: str) -> Dict[str, Any]:
     pokemon_list = [f"{name} ({type_})" for name, type_ in trainer_pokemon.items()]
     
     message = f"{trainer_name}'s Pokémon: {', '.join(pokemon_list)}" if pokemon_list else f"{trainer_name} has no Pokémon yet!"
-    print(message)
+    logger.info(message)
     
     return {
         "trainer": trainer_name,
@@ -141,6 +142,7 @@ pokemon_tools = [
     {
         "name": "list_pokemon_types",
         "function": list_pokemon_types,
+        "cache": "pure",
         "description": "List all available Pokémon types",
         "input_schema": {
             "type": "object",
@@ -151,6 +153,7 @@ pokemon_tools = [
     {
         "name": "have_pokemon",
         "function": have_pokemon,
+        "thread_safe": False,
         "description": "Add a Pokémon to a trainer's collection",
         "input_schema": {
             "type": "object",
@@ -174,6 +177,7 @@ pokemon_tools = [
     {
         "name": "get_advantageous_type",
         "function": get_advantageous_type,
+        "cache": "pure",
         "description": "Get the type that has an advantage against a given type",
         "input_schema": {
             "type": "object",
@@ -189,6 +193,7 @@ pokemon_tools = [
     {
         "name": "list_trainer_pokemon",
         "function": list_trainer_pokemon,
+        "thread_safe": False,
         "description": "List all Pokémon that a given trainer has",
         "input_schema": {
             "type": "object",
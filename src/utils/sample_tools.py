@@ -1,5 +1,4 @@
 import datetime
-import requests
 import json
 from typing import Optional, Dict, Any
 
@@ -53,6 +52,7 @@ sample_tools = [
     {
         "name": "get_weather",
         "function": get_weather,
+        "cache": {"ttl": 300},
         "description": "Get the current weather for a location",
         "input_schema": {
             "type": "object",
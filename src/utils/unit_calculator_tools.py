@@ -1,4 +1,6 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, MutableMapping
+
+from src.tool_state import SessionLocal
 
 # Static data: 10 sample appliances with approximate cost per hour (in USD)
 APPLIANCES = [
@@ -14,8 +16,8 @@ APPLIANCES = [
     {"name": "Dishwasher", "cost_per_hour": 0.20},
 ]
 
-# Module-level hashmap to store user appliance usage
-user_appliance_usages: Dict[str, Dict[str, Any]] = {}
+# Module-level hashmap to store user appliance usage, one per session
+user_appliance_usages: MutableMapping[str, Dict[str, Any]] = SessionLocal("user_appliance_usages")
 
 def add_or_update_appliance_usage(name: str, hours_per_day: float, count: int) -> Dict[str, Any]:
     """
@@ -72,6 +74,7 @@ unit_calculator_tools = [
     {
         "name": "add_or_update_appliance_usage",
         "function": add_or_update_appliance_usage,
+        "thread_safe": False,
         "description": "Add or update an appliance usage entry (hours per day and count) in the user's appliance list.",
         "input_schema": {
             "type": "object",
@@ -95,6 +98,7 @@ unit_calculator_tools = [
     {
         "name": "calculate_monthly_appliance_cost",
         "function": calculate_monthly_appliance_cost,
+        "thread_safe": False,
         "description": "Calculate the total monthly cost for all appliances in the user's appliance list.",
         "input_schema": {
             "type": "object",
@@ -105,6 +109,7 @@ unit_calculator_tools = [
     {
         "name": "list_user_appliances",
         "function": list_user_appliances,
+        "thread_safe": False,
         "description": "List all appliances currently in the user's appliance list.",
         "input_schema": {
             "type": "object",
@@ -0,0 +1,228 @@
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+# A compiled validator returns None for a valid value, or a short description of the first problem
+Validator = Callable[[Any], Optional[str]]
+
+_TYPE_NAMES = {
+    str: "string",
+    bool: "boolean",
+    int: "integer",
+    float: "number",
+    list: "array",
+    dict: "object",
+    type(None): "null"
+}
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "string": lambda value: isinstance(value, str),
+    "boolean": lambda value: isinstance(value, bool),
+    "integer": lambda value: (isinstance(value, int) and not isinstance(value, bool)) or
+                             (isinstance(value, float) and value.is_integer()),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "array": lambda value: isinstance(value, list),
+    "object": lambda value: isinstance(value, dict),
+    "null": lambda value: value is None
+}
+
+
+def _type_name(value: Any) -> str:
+    return _TYPE_NAMES.get(type(value), type(value).__name__)
+
+
+def _at(path: str, message: str) -> str:
+    return f"{path}: {message}" if path else message
+
+
+def _short(value: Any) -> str:
+    text = repr(value)
+    return text if len(text) <= 40 else text[:37] + "..."
+
+
+def compile_schema(schema: Dict[str, Any], additional_properties: bool = True) -> Validator:
+    """
+    Compile a tool's JSON input schema into a validator function.
+    
+    The schema is walked once and turned into a chain of closures, so validating an
+    input only runs the checks that apply to it. Supported keywords: type (a name
+    or a list of names), enum, const, properties, required, additionalProperties,
+    items, minItems, maxItems, minLength, maxLength, pattern, minimum, maximum,
+    exclusiveMinimum, exclusiveMaximum, anyOf and oneOf (as anyOf). Other keywords
+    (format, $ref, ...) are ignored, so a schema never rejects more than it says.
+    
+    Args:
+        schema: The tool's input_schema
+        additional_properties: Whether top-level properties the schema does not list are
+            accepted when the schema does not say; False for functions without **kwargs
+    
+    Returns:
+        A function mapping an input to None if it is valid, or to a message such as
+        "age: expected integer, got string" for the first problem found
+    """
+    return _compile(schema or {}, "", additional_properties)
+
+
+def _compile(schema: Dict[str, Any], path: str, additional_properties: bool) -> Validator:
+    checks: List[Validator] = []
+    
+    types = schema.get("type")
+    if types is not None:
+        names = [types] if isinstance(types, str) else list(types)
+        type_checks = [_TYPE_CHECKS[name] for name in names if name in _TYPE_CHECKS]
+        expected = " or ".join(names)
+        if type_checks:
+            def check_type(value):
+                for type_check in type_checks:
+                    if type_check(value):
+                        return None
+                return _at(path, f"expected {expected}, got {_type_name(value)}")
+            checks.append(check_type)
+    
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+        
+        def check_enum(value):
+            if value not in allowed:
+                return _at(path, f"{_short(value)} is not one of {', '.join(map(repr, allowed))}")
+            return None
+        checks.append(check_enum)
+    
+    if "const" in schema:
+        constant = schema["const"]
+        
+        def check_const(value):
+            return None if value == constant else _at(path, f"must be {constant!r}")
+        checks.append(check_const)
+    
+    if "properties" in schema or "required" in schema or "additionalProperties" in schema:
+        checks.append(_compile_object(schema, path, additional_properties))
+    
+    if "items" in schema or "minItems" in schema or "maxItems" in schema:
+        checks.append(_compile_array(schema, path))
+    
+    if "minLength" in schema or "maxLength" in schema or "pattern" in schema:
+        checks.append(_compile_string(schema, path))
+    
+    if any(key in schema for key in ("minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum")):
+        checks.append(_compile_number(schema, path))
+    
+    alternatives = schema.get("anyOf") or schema.get("oneOf")
+    if alternatives:
+        compiled = [_compile(alternative, path, additional_properties) for alternative in alternatives]
+        
+        def check_alternatives(value):
+            errors = []
+            for alternative in compiled:
+                error = alternative(value)
+                if error is None:
+                    return None
+                errors.append(error)
+            return errors[0] if len(errors) == 1 else _at(path, "matches none of the allowed schemas")
+        checks.append(check_alternatives)
+    
+    if not checks:
+        return lambda value: None
+    if len(checks) == 1:
+        return checks[0]
+    
+    def check_all(value):
+        for check in checks:
+            error = check(value)
+            if error is not None:
+                return error
+        return None
+    return check_all
+
+
+def _compile_object(schema: Dict[str, Any], path: str, additional_properties: bool) -> Validator:
+    properties = {
+        name: _compile(subschema, f"{path}.{name}" if path else name, True)
+        for name, subschema in (schema.get("properties") or {}).items()
+        if isinstance(subschema, dict)
+    }
+    required = tuple(schema.get("required", ()))
+    extra = schema.get("additionalProperties", additional_properties)
+    extra_check = _compile(extra, path, True) if isinstance(extra, dict) else None
+    
+    def check_object(value):
+        if not isinstance(value, dict):
+            return None
+        for name in required:
+            if name not in value:
+                return _at(path, f"missing required property {name!r}")
+        for name, item in value.items():
+            check = properties.get(name)
+            if check is not None:
+                error = check(item)
+                if error is not None:
+                    return error
+            elif extra is False:
+                known = ", ".join(properties) or "none"
+                return _at(path, f"unexpected property {name!r} (expected: {known})")
+            elif extra_check is not None:
+                error = extra_check(item)
+                if error is not None:
+                    return error
+        return None
+    return check_object
+
+
+def _compile_array(schema: Dict[str, Any], path: str) -> Validator:
+    items = schema.get("items")
+    item_check = _compile(items, f"{path}[]", True) if isinstance(items, dict) else None
+    min_items = schema.get("minItems")
+    max_items = schema.get("maxItems")
+    
+    def check_array(value):
+        if not isinstance(value, list):
+            return None
+        if min_items is not None and len(value) < min_items:
+            return _at(path, f"expected at least {min_items} items, got {len(value)}")
+        if max_items is not None and len(value) > max_items:
+            return _at(path, f"expected at most {max_items} items, got {len(value)}")
+        if item_check is not None:
+            for item in value:
+                error = item_check(item)
+                if error is not None:
+                    return error
+        return None
+    return check_array
+
+
+def _compile_string(schema: Dict[str, Any], path: str) -> Validator:
+    min_length = schema.get("minLength")
+    max_length = schema.get("maxLength")
+    pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+    
+    def check_string(value):
+        if not isinstance(value, str):
+            return None
+        if min_length is not None and len(value) < min_length:
+            return _at(path, f"expected at least {min_length} characters")
+        if max_length is not None and len(value) > max_length:
+            return _at(path, f"expected at most {max_length} characters")
+        if pattern is not None and not pattern.search(value):
+            return _at(path, f"{_short(value)} does not match {pattern.pattern!r}")
+        return None
+    return check_string
+
+
+def _compile_number(schema: Dict[str, Any], path: str) -> Validator:
+    bounds = []
+    if "minimum" in schema:
+        bounds.append((lambda value, limit: value >= limit, schema["minimum"], ">="))
+    if "maximum" in schema:
+        bounds.append((lambda value, limit: value <= limit, schema["maximum"], "<="))
+    if "exclusiveMinimum" in schema:
+        bounds.append((lambda value, limit: value > limit, schema["exclusiveMinimum"], ">"))
+    if "exclusiveMaximum" in schema:
+        bounds.append((lambda value, limit: value < limit, schema["exclusiveMaximum"], "<"))
+    
+    def check_number(value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        for within, limit, operator in bounds:
+            if not within(value, limit):
+                return _at(path, f"expected a value {operator} {limit}, got {value}")
+        return None
+    return check_number
@@ -0,0 +1,26 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from benchmarks.fake_server import FakeAnthropicServer
+from src.client import close_clients
+
+
+@pytest.fixture
+def fake_server():
+    """Start a FakeAnthropicServer with the given responder; the clients are closed afterwards."""
+    servers = []
+    
+    def start(responder=None, **options):
+        server = FakeAnthropicServer(responder, **options).__enter__()
+        servers.append(server)
+        return server
+    
+    yield start
+    close_clients()
+    for server in servers:
+        server.__exit__(None, None, None)
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from benchmarks.fake_server import make_message
+from src.client import RetryPolicy
+from src.llm import LLM
+from src.response_cache import ResponseCache
+
+
+def echo(request):
+    prompt = request["messages"][-1]["content"][0]["text"]
+    if prompt.startswith("fail"):
+        raise RuntimeError(f"cannot answer {prompt}")
+    return make_message([{"type": "text", "text": f"echo: {prompt}"}])
+
+
+def shuffle_results(fake, expire):
+    """Once the batch is created, return its results in reverse order and expire some of them."""
+    deadline = time.monotonic() + 5
+    while not fake.batches:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    batch = next(iter(fake.batches.values()))
+    batch["results"] = [(custom_id, {"type": "expired"} if custom_id in expire else result)
+                        for custom_id, result in reversed(batch["results"])]
+
+
+def run_batch(llm, prompts, **options):
+    items = []
+    thread = threading.Thread(target=lambda: items.extend(llm.generate_batch(prompts, poll_interval=0.05, **options)))
+    thread.start()
+    return thread, items
+
+
+def test_results_are_matched_to_prompts_by_custom_id(fake_server):
+    fake = fake_server(echo, batch_latency=0.3)
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False)
+    prompts = ["zero", "one", "fail two", "three", "four"]
+    
+    thread, items = run_batch(llm, prompts)
+    shuffle_results(fake, expire={"prompt-3"})
+    thread.join(10)
+    
+    assert [item["index"] for item in items] == [4, 3, 2, 1, 0]
+    by_index = {item["index"]: item for item in items}
+    assert sorted(by_index) == list(range(len(prompts)))
+    assert by_index[0]["response"] == "echo: zero"
+    assert by_index[1]["response"] == "echo: one"
+    assert by_index[4]["response"] == "echo: four"
+    assert by_index[2]["error"] == "api_error: cannot answer fail two"
+    assert by_index[3]["error"] == "Request expired"
+    assert all(item["custom_id"] == f"prompt-{item['index']}" for item in items)
+    assert "response" not in by_index[2] and "response" not in by_index[3]
+
+
+def test_cached_prompts_are_not_submitted(fake_server):
+    fake = fake_server(echo)
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False,
+              response_cache=ResponseCache())
+    list(llm.generate_batch(["zero", "one"], temperature=0, poll_interval=0.01))
+    submitted = len(fake.requests)
+    
+    items = list(llm.generate_batch(["one", "two", "zero"], temperature=0, poll_interval=0.01))
+    
+    assert len(fake.requests) == submitted + 1
+    assert {item["index"]: item["response"] for item in items} == {0: "echo: one", 1: "echo: two", 2: "echo: zero"}
+
+
+def test_local_mode_matches_results_by_index(fake_server):
+    fake = fake_server(echo)
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False,
+              retry_policy=RetryPolicy(max_retries=0))
+    items = list(llm.generate_batch(["zero", "fail one", "two"], mode="local"))
+    by_index = {item["index"]: item for item in items}
+    assert by_index[0]["response"] == "echo: zero" and by_index[2]["response"] == "echo: two"
+    assert "error" in by_index[1]
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError, match="Unknown batch mode"):
+        LLM(api_key="fake").generate_batch(["zero"], mode="stream")
@@ -0,0 +1,111 @@
+import json
+import time
+
+import httpx
+import pytest
+
+from benchmarks.fake_server import make_message
+from src.cassette import Cassette, _RecordingStream, interaction_key, read_cassette
+from src.llm import LLM
+
+BODY = {"model": "fake-model", "max_tokens": 100, "stream": True,
+        "messages": [{"role": "user", "content": [{"type": "text", "text": "Count to three"}]}]}
+
+
+def three_blocks(request):
+    return make_message([{"type": "text", "text": word} for word in ("one", "two", "three")])
+
+
+def test_interaction_key_ignores_json_key_order_and_whitespace():
+    compact = json.dumps(BODY, separators=(",", ":")).encode()
+    reordered = json.dumps(dict(reversed(list(BODY.items()))), indent=2).encode()
+    assert interaction_key("POST", "/v1/messages", compact) == interaction_key("POST", "/v1/messages", reordered)
+    
+    changed = json.dumps(dict(BODY, max_tokens=101)).encode()
+    assert interaction_key("POST", "/v1/messages", compact) != interaction_key("POST", "/v1/messages", changed)
+    assert interaction_key("POST", "/v1/messages", compact) != interaction_key("POST", "/v1/complete", compact)
+    assert interaction_key("GET", "/v1/models", b"not json") == interaction_key("GET", "/v1/models", b"not json")
+    assert interaction_key("GET", "/v1/models", b"not json") != interaction_key("GET", "/v1/models", b"not  json")
+
+
+def test_recording_stream_notes_when_chunks_arrive():
+    def slow_body():
+        for chunk in (b"a", b"b", b"c"):
+            time.sleep(0.05)
+            yield chunk
+    recorded = []
+    stream = _RecordingStream(slow_body(), time.monotonic(), recorded.append)
+    
+    assert b"".join(stream) == b"abc"
+    stream.close()
+    
+    chunks = recorded[0]
+    assert [text for _, text in chunks] == ["a", "b", "c"]
+    offsets = [offset for offset, _ in chunks]
+    assert offsets == sorted(offsets) and offsets[0] >= 0.05 and offsets[-1] >= 0.15
+
+
+def timed_post(transport, base_url, body):
+    """POST a streaming request and return the body and the arrival time of each chunk."""
+    with httpx.Client(transport=transport, base_url=base_url) as client:
+        started = time.monotonic()
+        with client.stream("POST", "/v1/messages", content=body,
+                           headers={"content-type": "application/json"}) as response:
+            chunks = [(time.monotonic() - started, chunk) for chunk in response.iter_bytes()]
+    return response.status_code, b"".join(chunk for _, chunk in chunks), [offset for offset, _ in chunks]
+
+
+def test_replay_reproduces_the_body_and_chunk_timing(fake_server, tmp_path):
+    fake = fake_server(three_blocks, block_latency=0.1)
+    path = str(tmp_path / "traffic.jsonl.gz")
+    recorder = Cassette(path, mode="record")
+    status, recorded_body, _ = timed_post(recorder.transport(), fake.base_url, json.dumps(BODY).encode())
+    recorder.close()
+    assert status == 200 and recorder.stats() == {"recorded": 1}
+    
+    interaction = next(read_cassette(path))
+    assert interaction["request"]["last_message"] == BODY["messages"][-1]
+    recorded_offsets = [offset for offset, _ in interaction["chunks"]]
+    assert recorded_offsets[-1] >= 0.25
+    
+    # The same request, serialized differently, against a server that does not exist
+    replay = Cassette(path, strict=True)
+    status, replayed_body, offsets = timed_post(replay.transport(), "http://127.0.0.1:9",
+                                                json.dumps(BODY, indent=1, sort_keys=True).encode())
+    
+    assert status == 200
+    assert replayed_body == recorded_body
+    assert replay.stats() == {"interactions": 1, "exact": 1, "fallback": 0, "misses": 0}
+    assert offsets[-1] >= recorded_offsets[-1] - 0.01
+    assert offsets[-1] == pytest.approx(recorded_offsets[-1], abs=0.1)
+
+
+def test_replay_speed_and_misses(fake_server, tmp_path):
+    fake = fake_server(three_blocks, block_latency=0.1)
+    path = str(tmp_path / "traffic.jsonl")
+    recorder = Cassette(path, mode="record")
+    timed_post(recorder.transport(), fake.base_url, json.dumps(BODY).encode())
+    recorder.close()
+    
+    instant = Cassette(path, speed=0, strict=True)
+    _, _, offsets = timed_post(instant.transport(), "http://127.0.0.1:9", json.dumps(BODY).encode())
+    assert offsets[-1] < 0.1
+    status, body, _ = timed_post(instant.transport(), "http://127.0.0.1:9",
+                                 json.dumps(dict(BODY, max_tokens=5)).encode())
+    assert status == 404 and b"No recorded response" in body
+    assert instant.stats()["misses"] == 1
+
+
+def test_llm_replays_a_recorded_stream(fake_server, tmp_path):
+    fake = fake_server(three_blocks, block_latency=0.05)
+    path = str(tmp_path / "traffic.jsonl")
+    recorder = Cassette(path, mode="record")
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False, cassette=recorder)
+    recorded = list(llm.generate("Count to three", temperature=0, stream=True))
+    recorder.close()
+    
+    replay = Cassette(path, speed=0, strict=True)
+    llm = LLM(api_key="fake", client_options={"base_url": "http://127.0.0.1:9"}, prompt_caching=False,
+              cassette=replay)
+    assert list(llm.generate("Count to three", temperature=0, stream=True)) == recorded
+    assert replay.stats()["exact"] == 1
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+
+from src import client
+from src.client import RetryPolicy, anthropic, close_clients, get_client
+from src.llm import LLM
+
+
+async def async_client():
+    return get_client("fake", base_url="http://127.0.0.1:9", asynchronous=True)
+
+
+def test_clients_are_shared_per_settings():
+    assert get_client("fake", base_url="http://127.0.0.1:9") is get_client("fake", base_url="http://127.0.0.1:9")
+    assert get_client("fake", base_url="http://127.0.0.1:9") is not get_client("other", base_url="http://127.0.0.1:9")
+    close_clients()
+
+
+def test_async_clients_of_closed_loops_are_dropped():
+    first = asyncio.run(async_client())
+    for _ in range(20):
+        latest = asyncio.run(async_client())
+    assert latest is not first
+    assert len(client._clients) == 1
+    close_clients()
+
+
+def scripted_faults(*faults):
+    """Fail the first requests with the given (status, headers) faults, in order."""
+    remaining = list(faults)
+    return lambda request: remaining.pop(0) if remaining else None
+
+
+def make_llm(fake, **policy):
+    return LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False,
+               retry_policy=RetryPolicy(**policy))
+
+
+@pytest.mark.parametrize("status", [429, 529])
+def test_retry_after_is_honoured(fake_server, status):
+    fake = fake_server(faults=scripted_faults((status, {"retry-after": "0.3"})))
+    llm = make_llm(fake, initial_backoff=0.0)
+    
+    started = time.monotonic()
+    result = llm.generate("Hello")
+    
+    assert time.monotonic() - started >= 0.3
+    assert result["usage"]["retries"] == 1
+    assert fake.faults_sent == 1 and len(fake.requests) == 2
+
+
+def test_retry_after_is_capped(fake_server):
+    fake = fake_server(faults=scripted_faults((429, {"retry-after": "120"}), (529, {"retry-after-ms": "90000"})))
+    llm = make_llm(fake, max_retry_after=0.1)
+    
+    started = time.monotonic()
+    result = llm.generate("Hello")
+    
+    assert time.monotonic() - started < 2
+    assert result["usage"]["retries"] == 2
+
+
+@pytest.mark.parametrize("status, error", [(400, "BadRequestError"), (401, "AuthenticationError"),
+                                           (404, "NotFoundError"), (422, "UnprocessableEntityError")])
+def test_client_errors_are_not_retried(fake_server, status, error):
+    fake = fake_server(faults=scripted_faults((status, {})))
+    llm = make_llm(fake, initial_backoff=0.0)
+    
+    with pytest.raises(anthropic.APIStatusError) as raised:
+        llm.generate("Hello")
+    
+    assert type(raised.value).__name__ == error
+    assert fake.faults_sent == 1 and len(fake.requests) == 1
+
+
+def test_x_should_retry_overrides_the_status(fake_server):
+    fake = fake_server(faults=scripted_faults((529, {"x-should-retry": "false"})))
+    with pytest.raises(anthropic.APIStatusError):
+        make_llm(fake, initial_backoff=0.0).generate("Hello")
+    assert len(fake.requests) == 1
+    
+    fake = fake_server(faults=scripted_faults((400, {"x-should-retry": "true"})))
+    assert make_llm(fake, initial_backoff=0.0).generate("Hello")["usage"]["retries"] == 1
+
+
+def test_retries_stop_after_max_retries(fake_server):
+    fake = fake_server(faults=lambda request: (529, {}))
+    with pytest.raises(anthropic.APIStatusError):
+        make_llm(fake, max_retries=2, initial_backoff=0.0).generate("Hello")
+    assert fake.faults_sent == 3
+
+
+def test_backoff_doubles_up_to_max_backoff():
+    policy = RetryPolicy(initial_backoff=0.5, max_backoff=3.0, jitter=False)
+    error = ConnectionError()
+    assert [policy.delay(retry, error) for retry in range(5)] == [0.5, 1.0, 2.0, 3.0, 3.0]
+    jittered = RetryPolicy(initial_backoff=0.5, max_backoff=3.0)
+    assert all(0 <= jittered.delay(4, error) <= 3.0 for _ in range(100))
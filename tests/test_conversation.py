@@ -0,0 +1,63 @@
+from benchmarks.fake_server import tool_loop_responder
+from src.conversation import Conversation
+from src.llm import LLM
+
+
+def messages(*texts):
+    return [{"role": "user" if index % 2 == 0 else "assistant", "content": text} for index, text in enumerate(texts)]
+
+
+def test_fork_shares_prefix_and_appends_independently():
+    base = Conversation(messages("a", "b"))
+    left, right = base.fork(), base.fork()
+    left.add_user("left")
+    right.add_user("right")
+    right.add_assistant("right again")
+    
+    assert [message["content"] for message in base] == ["a", "b"]
+    assert [message["content"] for message in left] == ["a", "b", "left"]
+    assert [message["content"] for message in right] == ["a", "b", "right", "right again"]
+    assert left.as_list() == messages("a", "b") + [{"role": "user", "content": "left"}]
+
+
+def test_parent_appends_do_not_leak_into_forks():
+    base = Conversation(messages("a"))
+    fork = base.fork()
+    base.add_assistant("base only")
+    fork.add_assistant("fork only")
+    
+    assert [message["content"] for message in base] == ["a", "base only"]
+    assert [message["content"] for message in fork] == ["a", "fork only"]
+    assert fork[-1]["content"] == "fork only"
+    assert base[1]["content"] == "base only"
+
+
+def test_deep_fork_chains_stay_isolated():
+    conversation = Conversation(messages("root"))
+    forks = []
+    for index in range(Conversation._max_depth * 2):
+        fork = conversation.fork()
+        conversation.add_assistant(f"main {index}")
+        fork.add_assistant(f"fork {index}")
+        forks.append((index, fork))
+    
+    assert len(conversation) == 1 + Conversation._max_depth * 2
+    for index, fork in forks:
+        assert len(fork) == index + 2
+        assert fork[-1]["content"] == f"fork {index}"
+        assert [message["content"] for message in fork][:-1] == \
+            ["root"] + [f"main {earlier}" for earlier in range(index)]
+
+
+def test_calls_never_extend_the_history_they_were_given(fake_server):
+    fake = fake_server(tool_loop_responder([], final_text="Hi"))
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False)
+    first = llm.generate_with_tools("Hello")["history"]
+    
+    rome = llm.generate_with_tools("And in Rome?", history=first)["history"]
+    london = llm.generate_with_tools("And in London?", history=first)["history"]
+    
+    assert len(first) == 2
+    assert rome[2]["content"][0]["text"] == "And in Rome?"
+    assert london[2]["content"][0]["text"] == "And in London?"
+    assert len(rome) == len(london) == 4
@@ -0,0 +1,104 @@
+import pytest
+
+from src.history import HistoryManager
+from src.llm import LLM
+
+
+def tool_turn(index: int, calls: int = 2, result_chars: int = 2000):
+    """A prompt, `calls` tool rounds with large results, and a final answer."""
+    messages = [{"role": "user", "content": f"Question {index}"}]
+    for call in range(calls):
+        tool_use_id = f"toolu_{index}_{call}"
+        messages.append({"role": "assistant", "content": [
+            {"type": "text", "text": f"Looking up {index}.{call}"},
+            {"type": "tool_use", "id": tool_use_id, "name": "lookup", "input": {"query": f"{index}.{call}"}}
+        ]})
+        content = f"result {index}.{call} " * (result_chars // 12)
+        messages.append({"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": tool_use_id, "content": content}
+        ]})
+    messages.append({"role": "assistant", "content": [{"type": "text", "text": f"Answer {index}"}]})
+    return messages
+
+
+def check_pairs(messages):
+    """Every tool_use is answered in the next message and every tool_result answers the message before it."""
+    first = messages[0]
+    assert first["role"] == "user"
+    assert not any(isinstance(block, dict) and block.get("type") == "tool_result"
+                   for block in (first["content"] if isinstance(first["content"], list) else []))
+    for index, message in enumerate(messages):
+        if index:
+            assert message["role"] != messages[index - 1]["role"], "roles must alternate"
+        if isinstance(message["content"], str):
+            continue
+        results = [block["tool_use_id"] for block in message["content"] if block.get("type") == "tool_result"]
+        previous = messages[index - 1]["content"] if index else []
+        uses = [block["id"] for block in previous if isinstance(previous, list) and block.get("type") == "tool_use"]
+        assert results == ([] if message["role"] == "assistant" else uses)
+        if message["role"] == "assistant":
+            asked = [block["id"] for block in message["content"] if block.get("type") == "tool_use"]
+            if asked:
+                following = messages[index + 1]["content"]
+                assert [block["tool_use_id"] for block in following] == asked
+
+
+HISTORY = [message for index in range(8) for message in tool_turn(index, calls=index % 3 + 1)]
+
+
+@pytest.mark.parametrize("max_tokens", [1100, 1250, 1600, 1800, 2100, 2600])
+def test_trimming_keeps_tool_use_and_tool_result_together(max_tokens):
+    manager = HistoryManager(max_tokens=max_tokens, target_tokens=max_tokens, summarize=False, stub_chars=50,
+                             keep_recent_turns=1)
+    assert manager.estimate_tokens(HISTORY) > max_tokens
+    
+    kept, report = manager.compact(None, HISTORY)
+    
+    check_pairs(kept)
+    assert report["tokens_after"] <= max_tokens
+    assert report["dropped_messages"] == len(HISTORY) - len(kept)
+    assert kept[-1] == HISTORY[-1]
+    # Whole turns are dropped, so the kept ones start at a prompt
+    assert kept[0]["content"].startswith("Question ")
+
+
+def test_a_single_turn_over_budget_is_left_whole():
+    history = tool_turn(0, calls=6)
+    kept, report = HistoryManager(max_tokens=100, summarize=False).compact(None, history)
+    assert kept == history
+    check_pairs(kept)
+
+
+def manager_budget():
+    """A budget the history exceeds but fits once its old tool results are stubbed."""
+    manager = HistoryManager(stub_chars=20)
+    turns = manager._split_turns(HISTORY)
+    stubbed, _ = manager._stub_tool_results(turns[:-1])
+    return manager.estimate_tokens([message for turn in stubbed for message in turn] + turns[-1]) + 10
+
+
+def test_stubbing_keeps_every_block():
+    manager = HistoryManager(max_tokens=manager_budget(), summarize=False, stub_chars=20, keep_recent_turns=1)
+    kept, report = manager.compact(None, HISTORY)
+    
+    assert report["stubbed_tool_results"] > 0 and report["dropped_messages"] == 0
+    assert len(kept) == len(HISTORY)
+    check_pairs(kept)
+    stubbed = kept[2]["content"][0]
+    assert stubbed["tool_use_id"] == "toolu_0_0" and stubbed["content"].startswith("[elided ")
+
+
+def test_summary_is_merged_into_the_first_kept_prompt(fake_server):
+    fake = fake_server()
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False)
+    manager = HistoryManager(max_tokens=1600, target_tokens=1600, stub_chars=50, keep_recent_turns=1)
+    
+    kept, report = manager.compact(llm, HISTORY)
+    
+    check_pairs(kept)
+    assert report["summarized_messages"] == 28 and len(kept) == len(HISTORY) - 28
+    first = kept[0]["content"]
+    assert first[0]["text"] == "[Summary of the earlier conversation]\nHello!"
+    assert first[1]["text"].startswith("Question ")
+    # The summary request saw the original tool results, not the stubs
+    assert "result 0.0 result 0.0" in fake.requests[0]["messages"][0]["content"]
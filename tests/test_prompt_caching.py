@@ -0,0 +1,93 @@
+import copy
+
+from benchmarks.fake_server import tool_loop_responder
+from src.llm import LLM
+
+# The API accepts at most this many cache_control breakpoints per request
+MAX_BREAKPOINTS = 4
+
+
+def breakpoints(params):
+    """The locations of the cache_control markers of a request."""
+    found = [f"tools[{index}]" for index, tool in enumerate(params.get("tools") or []) if "cache_control" in tool]
+    system = params.get("system")
+    if isinstance(system, list):
+        found += [f"system[{index}]" for index, block in enumerate(system) if "cache_control" in block]
+    for index, message in enumerate(params["messages"]):
+        if isinstance(message["content"], list):
+            found += [f"messages[{index}][{position}]" for position, block in enumerate(message["content"])
+                      if isinstance(block, dict) and "cache_control" in block]
+    return found
+
+
+def add(a: int, b: int) -> int:
+    return a + b
+
+
+def make_llm(base_url="http://127.0.0.1:9", prompt_caching=True):
+    llm = LLM(api_key="fake", client_options={"base_url": base_url}, prompt_caching=prompt_caching)
+    llm.register_tool(name="add", function=add, description="Add two numbers")
+    llm.register_tool(name="subtract", function=lambda a, b: a - b, description="Subtract two numbers")
+    return llm
+
+
+def test_breakpoints_go_on_the_last_tool_system_and_turn():
+    llm = make_llm()
+    params = {
+        "model": llm.model,
+        "max_tokens": 100,
+        "system": "You are a calculator",
+        "tools": [{"name": "add", "input_schema": {}}, {"name": "subtract", "input_schema": {}}],
+        "messages": [
+            {"role": "user", "content": "Add 1 and 2"},
+            {"role": "assistant", "content": [{"type": "text", "text": "3"}]},
+            {"role": "user", "content": "And 3 and 4?"}
+        ]
+    }
+    original = copy.deepcopy(params)
+    
+    built = llm._with_cache_control(params)
+    
+    assert breakpoints(built) == ["tools[1]", "system[0]", "messages[2][0]"]
+    assert built["system"] == [{"type": "text", "text": "You are a calculator", "cache_control": {"type": "ephemeral"}}]
+    assert built["messages"][2]["content"] == [{"type": "text", "text": "And 3 and 4?",
+                                                "cache_control": {"type": "ephemeral"}}]
+    assert params == original
+
+
+def test_system_blocks_get_one_breakpoint_on_the_last_block():
+    llm = make_llm()
+    system = [{"type": "text", "text": "Rules"}, {"type": "text", "text": "Examples"}]
+    built = llm._with_cache_control({"system": system, "messages": [{"role": "user", "content": "Hi"}]})
+    assert breakpoints(built) == ["system[1]", "messages[0][0]"]
+    
+    marked = [{"type": "text", "text": "Rules", "cache_control": {"type": "ephemeral"}}, {"type": "text", "text": "x"}]
+    built = llm._with_cache_control({"system": marked, "messages": [{"role": "user", "content": "Hi"}]})
+    assert breakpoints(built) == ["system[0]", "messages[0][0]"]
+
+
+def test_tool_loop_requests_stay_within_the_breakpoint_limit(fake_server):
+    fake = fake_server(tool_loop_responder([{"name": "add", "input": {"a": 1, "b": 2}},
+                                            [{"name": "add", "input": {"a": 3, "b": 4}},
+                                             {"name": "subtract", "input": {"a": 5, "b": 1}}]]))
+    llm = make_llm(fake.base_url)
+    
+    result = llm.generate_with_tools("Calculate", system="You are a calculator")
+    
+    assert len(fake.requests) == 3
+    for request in fake.requests:
+        last = len(request["messages"]) - 1
+        found = breakpoints(request)
+        assert len(found) <= MAX_BREAKPOINTS
+        # The conversation breakpoint moves to the last block of the last (user) turn
+        assert found == ["tools[1]", "system[0]", f"messages[{last}][{len(request['messages'][last]['content']) - 1}]"]
+        assert request["messages"][last]["role"] == "user"
+    # The history keeps no markers
+    assert breakpoints({"messages": result["history"].as_list()}) == []
+
+
+def test_no_breakpoints_without_prompt_caching(fake_server):
+    fake = fake_server(tool_loop_responder([{"name": "add", "input": {"a": 1, "b": 2}}]))
+    llm = make_llm(fake.base_url, prompt_caching=False)
+    llm.generate_with_tools("Calculate", system="You are a calculator")
+    assert all(breakpoints(request) == [] for request in fake.requests)
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from src.rate_limiter import RateLimiter
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the condition"
+        time.sleep(0.005)
+
+
+def queue_requests(limiter, priorities):
+    """Queue one request per priority, in order, and return the order they are admitted in."""
+    admitted = []
+    threads = []
+    for index, priority in enumerate(priorities):
+        def acquire(index=index, priority=priority):
+            limiter.acquire({"max_tokens": 10, "messages": []}, priority)
+            admitted.append(index)
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        threads.append(thread)
+        # Make the queueing order deterministic
+        wait_for(lambda: limiter.stats()["waiting"] == index + 1)
+    for thread in threads:
+        thread.join(10)
+    return admitted
+
+
+def test_requests_wait_for_the_bucket_to_refill():
+    # One request of burst, refilled at 10 per second
+    limiter = RateLimiter(requests_per_minute=600, burst_seconds=0.1)
+    started = time.monotonic()
+    for _ in range(4):
+        limiter.acquire({"max_tokens": 10, "messages": []})
+    assert time.monotonic() - started >= 0.25
+    assert limiter.stats()["priorities"]["interactive"]["admitted"] == 4
+
+
+def test_higher_priority_is_admitted_first():
+    limiter = RateLimiter(requests_per_minute=600, burst_seconds=0.1)
+    limiter.acquire({"max_tokens": 10, "messages": []})  # empty the bucket
+    
+    admitted = queue_requests(limiter, ["batch", "default", "batch", "interactive", 10])
+    
+    assert admitted == [3, 4, 1, 0, 2]
+    assert limiter.stats()["waiting"] == 0
+
+
+def test_equal_priorities_are_first_come_first_served():
+    limiter = RateLimiter(requests_per_minute=600, burst_seconds=0.1)
+    limiter.acquire({"max_tokens": 10, "messages": []})
+    assert queue_requests(limiter, ["default"] * 4) == [0, 1, 2, 3]
+
+
+def test_settle_returns_overestimated_tokens():
+    limiter = RateLimiter(output_tokens_per_minute=6000, burst_seconds=1.0)  # 100 tokens of burst
+    reservation = limiter.acquire({"max_tokens": 100, "messages": []})
+    assert reservation["output_tokens"] == 100
+    
+    class Usage:
+        input_tokens = 0
+        output_tokens = 10
+    limiter.settle(reservation, Usage())
+    
+    # 90 of the 100 reserved tokens came back, and later requests are estimated from the usage
+    started = time.monotonic()
+    second = limiter.acquire({"max_tokens": 100, "messages": []})
+    assert second["output_tokens"] == 10
+    assert time.monotonic() - started < 0.05
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError, match="Unknown priority"):
+        RateLimiter(requests_per_minute=60).acquire({"max_tokens": 10, "messages": []}, "urgent")
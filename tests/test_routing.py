@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.routing import ModelRouter
+
+DEFAULT = "claude-3-7-sonnet-20250219"
+FAST = "claude-3-5-haiku-20241022"
+TOOL = {"name": "lookup", "description": "Look something up",
+        "input_schema": {"type": "object", "properties": {"query": {"type": "string"}}, "required": ["query"]}}
+
+
+def tool_result(is_error=False):
+    return {"type": "tool_result", "tool_use_id": "toolu_1", "content": "42", "is_error": is_error}
+
+
+def request(content, tools=0):
+    return {"model": DEFAULT, "max_tokens": 100, "messages": [{"role": "user", "content": content}],
+            "tools": [dict(TOOL, name=f"tool_{i}") for i in range(tools)]}
+
+
+@pytest.mark.parametrize("params, expected", [
+    (request("What is 2 + 2?"), (FAST, "short_prompt")),
+    (request([{"type": "text", "text": "What is 2 + 2?"}]), (FAST, "short_prompt")),
+    (request("x" * 200), (FAST, "short_prompt")),
+    (request("x" * 201), (DEFAULT, "default")),
+    (request("What is 2 + 2?", tools=5), (FAST, "short_prompt")),
+    (request("What is 2 + 2?", tools=6), (DEFAULT, "default")),
+    (request([tool_result()], tools=10), (FAST, "tool_follow_up")),
+    (request([tool_result(), tool_result()], tools=10), (FAST, "tool_follow_up")),
+    (request([tool_result(), tool_result(is_error=True)]), (DEFAULT, "tool_error")),
+    # Tool results with a new question are not a plain follow-up
+    (request([tool_result(), {"type": "text", "text": "x" * 300}]), (DEFAULT, "default")),
+])
+def test_rules(params, expected):
+    router = ModelRouter(fast_model=FAST)
+    assert router.route(params, DEFAULT) == expected
+    assert router.stats()["routes"] == {expected[1]: 1}
+
+
+def test_escalated_calls_and_the_classifier_override_the_rules():
+    params = request("What is 2 + 2?")
+    assert ModelRouter(fast_model=FAST).route(params, DEFAULT, escalated=True) == (DEFAULT, "escalated")
+    assert ModelRouter(fast_model=FAST, classifier=lambda features: 0.9).route(params, DEFAULT) == \
+        (FAST, "classifier")
+    assert ModelRouter(fast_model=FAST, classifier=lambda features: 0.5).route(params, DEFAULT) == \
+        (DEFAULT, "low_confidence")
+    assert ModelRouter(fast_model=FAST, classifier=lambda features: "other-model").route(params, DEFAULT) == \
+        ("other-model", "classifier")
+
+
+def text(value):
+    return SimpleNamespace(type="text", text=value)
+
+
+def tool_use(name="lookup", tool_input=None):
+    return SimpleNamespace(type="tool_use", id="toolu_1", name=name,
+                           input={"query": "answer"} if tool_input is None else tool_input)
+
+
+@pytest.mark.parametrize("content, stop_reason, expected", [
+    ([text("4")], "end_turn", None),
+    ([text("Let me look."), tool_use()], "tool_use", None),
+    ([tool_use()], "tool_use", None),
+    ([text("4")], "max_tokens", "max_tokens"),
+    ([tool_use(name="search")], "tool_use", "unknown_tool"),
+    ([tool_use(tool_input={})], "tool_use", "invalid_tool_input"),
+    ([tool_use(tool_input="query")], "tool_use", "invalid_tool_input"),
+    ([], "end_turn", "empty_response"),
+    ([text("  \n")], "end_turn", "empty_response"),
+])
+def test_escalation(content, stop_reason, expected):
+    params = dict(request("Look up the answer"), tools=[TOOL])
+    response = SimpleNamespace(content=content, stop_reason=stop_reason)
+    assert ModelRouter(fast_model=FAST).escalation(params, response) == expected
+
+
+def usage(input_tokens, output_tokens, cache_read_input_tokens=0):
+    return SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens,
+                           cache_creation_input_tokens=0, cache_read_input_tokens=cache_read_input_tokens)
+
+
+def test_record_accounts_savings_against_the_default_model():
+    router = ModelRouter(fast_model=FAST)
+    # Fast: 1000 * 0.8 + 100 * 4 = $0.0012, which would have cost 1000 * 3 + 100 * 15 = $0.0045
+    router.record(FAST, DEFAULT, 0.1, usage(600, 100, cache_read_input_tokens=400))
+    # An escalated fast request only adds its cost
+    router.record(FAST, DEFAULT, 0.1, usage(1000, 100), failed=True)
+    router.record(FAST, DEFAULT, 0.1, None)
+    # Default: 2000 * 3 + 200 * 15 = $0.009
+    router.record(DEFAULT, DEFAULT, 0.3, usage(2000, 200))
+    
+    stats = router.stats()
+    assert stats["savings"] == {"fast_requests": 1, "fast_input_tokens": 1000, "fast_output_tokens": 100,
+                                "cost_usd": 0.0114, "default_cost_usd": 0.0135, "saved_usd": 0.0021}
+    assert stats["models"][FAST]["requests"] == 3
+    assert stats["models"][FAST]["failed"] == 2
+    assert stats["models"][FAST]["input_tokens"] == 2000
+    assert stats["models"][DEFAULT]["cost_usd"] == 0.009
+    assert stats["models"][DEFAULT]["latency_ms"] == {"mean": 300.0, "p95": 300.0}
+
+
+def test_record_without_a_price_counts_tokens_but_no_cost():
+    router = ModelRouter(fast_model="unknown-fast", prices={})
+    router.record("unknown-fast", "unknown-default", 0.1, usage(1000, 100))
+    savings = router.stats()["savings"]
+    assert savings["fast_requests"] == 1 and savings["fast_input_tokens"] == 1000
+    assert savings["cost_usd"] == savings["default_cost_usd"] == savings["saved_usd"] == 0
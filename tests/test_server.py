@@ -0,0 +1,61 @@
+import http.client
+import json
+
+import pytest
+
+from src.llm import LLM
+from src.server import LLMServer
+
+
+@pytest.fixture
+def server(fake_server):
+    fake = fake_server()
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False)
+    with LLMServer(llm, system="You are a helpful assistant", port=0) as server:
+        yield server
+
+
+def request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection(server.base_url.split("//")[1], timeout=10)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"null")
+    finally:
+        connection.close()
+
+
+def create_session(server):
+    status, body = request(server, "POST", "/v1/sessions", "{}")
+    assert status == 201
+    return body["session_id"]
+
+
+@pytest.mark.parametrize("timeout", ["NaN", "Infinity", "-Infinity", "-1", "0", "true", "\"5\"", "null"])
+def test_invalid_turn_timeouts_are_rejected(server, timeout):
+    session_id = create_session(server)
+    body = f'{{"prompt": "Hello", "stream": false, "timeout": {timeout}}}'
+    
+    status, response = request(server, "POST", f"/v1/sessions/{session_id}/turns", body)
+    
+    assert status == 400
+    assert response["error"] == "\"timeout\" must be a positive number of seconds"
+    assert server.stats()["turns"] == 0
+    # The session was not left checked out
+    status, _ = request(server, "POST", f"/v1/sessions/{session_id}/turns",
+                        json.dumps({"prompt": "Hello", "stream": False, "timeout": 5}))
+    assert status == 200
+
+
+def test_turn_with_default_timeout(server):
+    session_id = create_session(server)
+    status, response = request(server, "POST", f"/v1/sessions/{session_id}/turns",
+                               json.dumps({"prompt": "Hello", "stream": False}))
+    assert status == 200
+    assert response["response"] == "Hello!"
+
+
+def test_invalid_content_length_is_rejected(server):
+    status, response = request(server, "POST", "/v1/sessions", None, {"Content-Length": "abc"})
+    assert status == 400
+    assert response["error"] == "Invalid Content-Length header"
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+from src.session_store import SessionLocal, SessionStore, use_state
+
+patients = SessionLocal("patients")
+
+
+def test_least_recently_used_sessions_are_evicted():
+    store = SessionStore(max_sessions=2)
+    first = store.create("first")
+    store.create("second")
+    store.get("first")
+    store.create("third")
+    
+    assert store.get("second") is None
+    assert store.get("first") is first
+    assert store.get("third") is not None
+    assert store.stats()["evictions"] == 1
+
+
+def test_idle_sessions_expire():
+    store = SessionStore(ttl=0.05)
+    store.create("idle")
+    time.sleep(0.1)
+    store.create("fresh")
+    assert store.get("idle") is None
+    assert store.get("fresh") is not None
+
+
+def test_byte_budget_evicts_sessions():
+    size = SessionStore(max_bytes=0).create("probe").size
+    store = SessionStore(max_bytes=2 * size)
+    store.create("first")
+    store.create("second")
+    store.create("third")
+    assert store.get("first") is None
+    assert store.get("second") is not None and store.get("third") is not None
+    assert store.stats()["resident_bytes"] == 2 * size
+
+
+def test_a_session_running_a_turn_is_never_evicted():
+    store = SessionStore(max_sessions=1)
+    busy = store.checkout(store.create("busy").id)
+    store.create("other")
+    assert store.get("busy") is busy
+    with pytest.raises(ValueError, match="already running a turn"):
+        store.checkout("busy")
+    busy.lock.release()
+    assert store.checkout("busy") is busy
+
+
+def test_sessions_survive_eviction_and_restarts(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path, max_sessions=1)
+    session = store.checkout(store.create("ada").id)
+    with use_state(session.state):
+        patients["Ada"] = {"age": 36}
+    session.history.add_user("Hello")
+    session.turns += 1
+    store.save(session)
+    session.lock.release()
+    store.create("other")  # evicts "ada"
+    
+    loaded = store.get("ada")
+    assert loaded is not session
+    assert loaded.turns == 1
+    assert loaded.history.as_list() == [{"role": "user", "content": "Hello"}]
+    store.close()
+    
+    restarted = SessionStore(path)
+    session = restarted.get("ada")
+    with use_state(session.state):
+        assert patients["Ada"] == {"age": 36}
+    assert "Ada" not in patients  # outside the session
+    assert restarted.stats()["loads"] == 1
+    
+    assert restarted.delete("ada")
+    assert restarted.get("ada") is None
+    restarted.close()
+
+
+def test_session_ids_are_unique(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"), max_sessions=1)
+    store.create("ada")
+    store.create("other")
+    with pytest.raises(ValueError, match="already exists"):
+        store.create("ada")
+    store.close()
+
+
+def test_saving_a_deleted_session_does_not_bring_it_back(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    session = store.checkout(store.create("ada").id)
+    store.delete("ada")
+    store.save(session)
+    session.lock.release()
+    assert store.get("ada") is None
+    store.close()
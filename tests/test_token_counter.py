@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_server import make_message
+from src.llm import LLM
+from src.token_counter import TokenCounter
+
+
+def usage(output_tokens):
+    return SimpleNamespace(input_tokens=100, output_tokens=output_tokens)
+
+
+@pytest.mark.parametrize("requested, input_tokens, expected", [
+    (1000, 1000, 1000),     # fits
+    (1000, 9500, 500),      # lowered to what is left of the window
+    (50, 1000, 50),         # an explicit limit is never raised, even below min_output_tokens
+    (None, 1000, 4000),     # max_output_tokens before any output was seen
+    (None, 7000, 3000),     # ... within the window
+])
+def test_max_tokens_fits_the_context_window(requested, input_tokens, expected):
+    counter = TokenCounter(context_window=10000, max_output_tokens=4000, min_output_tokens=256)
+    assert counter.max_tokens(requested, input_tokens) == expected
+
+
+def test_max_tokens_rejects_requests_that_leave_no_room():
+    counter = TokenCounter(context_window=10000, min_output_tokens=256)
+    with pytest.raises(ValueError, match="context window"):
+        counter.max_tokens(1000, 9800)
+    with pytest.raises(ValueError):
+        counter.max_tokens(None, 12000)
+    assert counter.stats()["rejected"] == 2
+
+
+def test_adaptive_max_tokens_uses_recent_p95_output_with_headroom():
+    counter = TokenCounter(context_window=100000, max_output_tokens=4000, min_output_tokens=256,
+                           output_headroom=1.5)
+    for output_tokens in range(10, 1010, 10):   # 10 .. 1000, p95 is 960
+        counter.observe(None, usage(output_tokens))
+    assert counter.max_tokens(None, 1000) == 1440
+    assert counter.max_tokens(None, 99000) == 1000
+    assert counter.max_tokens(700, 1000) == 700
+    
+    short = TokenCounter(max_output_tokens=4000, min_output_tokens=256)
+    short.observe(None, usage(20))
+    assert short.max_tokens(None, 1000) == 256
+    
+    long = TokenCounter(max_output_tokens=4000)
+    long.observe(None, usage(8000))
+    assert long.max_tokens(None, 1000) == 4000
+    
+    fixed = TokenCounter(max_output_tokens=4000, adaptive_max_tokens=False)
+    fixed.observe(None, usage(20))
+    assert fixed.max_tokens(None, 1000) == 4000
+
+
+@pytest.mark.parametrize("current, input_tokens, expected", [
+    (500, 1000, 1000),      # doubled
+    (3000, 1000, 4000),     # up to max_output_tokens
+    (2000, 7000, 3000),     # up to what is left of the window
+    (4000, 1000, None),     # already at max_output_tokens
+    (3000, 7000, None),     # already using the rest of the window
+])
+def test_grow_max_tokens(current, input_tokens, expected):
+    counter = TokenCounter(context_window=10000, max_output_tokens=4000)
+    assert counter.grow_max_tokens(current, input_tokens) == expected
+    assert counter.stats()["truncation_retries"] == (expected is not None)
+
+
+def test_cut_off_tool_use_is_resent_with_twice_the_max_tokens(fake_server):
+    def responder(request):
+        if not any(message["role"] == "user" and isinstance(message["content"], list) and
+                   message["content"][0].get("type") == "tool_result" for message in request["messages"]):
+            # The tool call only fits in 800 tokens
+            stop_reason = "tool_use" if request["max_tokens"] >= 800 else "max_tokens"
+            return make_message([{"type": "tool_use", "id": "toolu_1", "name": "echo", "input": {"text": "hi"}}],
+                                stop_reason=stop_reason, output_tokens=min(request["max_tokens"], 700))
+        return make_message([{"type": "text", "text": "Done."}])
+    fake = fake_server(responder)
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False,
+              token_counter=TokenCounter(max_output_tokens=1000))
+    llm.register_tool(name="echo", function=lambda text: text, description="Echo the text")
+    
+    result = llm.generate_with_tools("Echo hi", max_tokens=200)
+    
+    assert result["response"] == "Done."
+    assert [request["max_tokens"] for request in fake.requests] == [200, 400, 800, 200]
+    assert result["usage"]["max_tokens_retries"] == 2
+    assert llm.token_counter.stats()["truncation_retries"] == 2
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from src.tool_cache import ToolResultCache
+
+
+class Counter:
+    """A tool that counts its calls."""
+    
+    def __init__(self, delay: float = 0.0):
+        self.calls = 0
+        self.delay = delay
+    
+    def __call__(self, value):
+        self.calls += 1
+        time.sleep(self.delay)
+        return f"{value}-{self.calls}"
+
+
+def test_pure_results_are_reused_per_input():
+    cache, tool = ToolResultCache("pure"), Counter()
+    assert cache.call(tool, {"value": "a"}) == ("a-1", False)
+    assert cache.call(tool, {"value": "a"}) == ("a-1", True)
+    assert cache.call(tool, {"value": "b"}) == ("b-2", False)
+    assert cache.stats() == {"hits": 1, "misses": 2, "coalesced": 0, "hit_rate": 1 / 3}
+
+
+def test_ttl_expires_results():
+    cache, tool = ToolResultCache({"ttl": 0.1}), Counter()
+    cache.call(tool, {"value": "a"})
+    assert cache.call(tool, {"value": "a"}) == ("a-1", True)
+    time.sleep(0.15)
+    assert cache.call(tool, {"value": "a"}) == ("a-2", False)
+
+
+def test_mtime_policy_follows_the_file(tmp_path):
+    path = tmp_path / "notes.md"
+    path.write_text("one")
+    cache = ToolResultCache({"mtime": lambda input_dict: str(tmp_path / input_dict["value"])})
+    
+    def read(value):
+        return (tmp_path / value).read_text()
+    
+    assert cache.call(read, {"value": "notes.md"}) == ("one", False)
+    assert cache.call(read, {"value": "notes.md"}) == ("one", True)
+    path.write_text("two!")
+    assert cache.call(read, {"value": "notes.md"}) == ("two!", False)
+    # Same size, newer mtime
+    path.write_text("three")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.call(read, {"value": "notes.md"}) == ("three", False)
+    path.unlink()
+    with pytest.raises(FileNotFoundError):
+        cache.call(read, {"value": "notes.md"})
+
+
+def test_max_entries_evicts_least_recently_used():
+    cache, tool = ToolResultCache({"max_entries": 2}), Counter()
+    cache.call(tool, {"value": "a"})
+    cache.call(tool, {"value": "b"})
+    cache.call(tool, {"value": "a"})
+    cache.call(tool, {"value": "c"})
+    assert cache.call(tool, {"value": "a"})[1]
+    assert not cache.call(tool, {"value": "b"})[1]
+
+
+def test_exceptions_are_not_cached():
+    cache, attempts = ToolResultCache("pure"), []
+    
+    def flaky(value):
+        attempts.append(value)
+        if len(attempts) == 1:
+            raise RuntimeError("first call fails")
+        return value
+    
+    with pytest.raises(RuntimeError):
+        cache.call(flaky, {"value": "a"})
+    assert cache.call(flaky, {"value": "a"}) == ("a", False)
+
+
+def test_concurrent_identical_calls_are_coalesced():
+    cache, tool = ToolResultCache("pure"), Counter(delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.call(tool, {"value": "a"})))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert tool.calls == 1
+    assert sorted(results) == [("a-1", False)] + [("a-1", True)] * 4
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_concurrent_identical_coroutines_are_coalesced():
+    cache, calls = ToolResultCache("pure"), []
+    
+    async def lookup(value):
+        calls.append(value)
+        await asyncio.sleep(0.1)
+        return value.upper()
+    
+    async def main():
+        return await asyncio.gather(*(cache.acall(lookup, {"value": "a"}) for _ in range(5)))
+    
+    results = asyncio.run(main())
+    assert calls == ["a"]
+    assert sorted(results) == [("A", False)] + [("A", True)] * 4
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError, match="Unknown tool cache policy"):
+        ToolResultCache("forever")
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from benchmarks.fake_server import tool_loop_responder
+from src.llm import LLM, _SerialToolLane
+
+
+class Tracker:
+    """Records how many calls of a group of tools run at the same time."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+    
+    def tool(self, name: str):
+        def run(seconds: float) -> str:
+            with self.lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            time.sleep(seconds)
+            with self.lock:
+                self.running -= 1
+            return name
+        return run
+
+
+def make_llm(base_url: str = "http://127.0.0.1:9", max_tool_workers: int = 4):
+    safe, unsafe = Tracker(), Tracker()
+    llm = LLM(api_key="fake", client_options={"base_url": base_url}, prompt_caching=False,
+              max_tool_workers=max_tool_workers)
+    for name in ("slow", "fast", "medium"):
+        llm.register_tool(name=name, function=safe.tool(name), description=f"The {name} tool")
+    for name in ("first_unsafe", "second_unsafe"):
+        llm.register_tool(name=name, function=unsafe.tool(name), description=f"The {name} tool", thread_safe=False)
+    return llm, safe, unsafe
+
+
+TOOL_CALLS = [
+    {"name": "slow", "input": {"seconds": 0.3}},
+    {"name": "first_unsafe", "input": {"seconds": 0.1}},
+    {"name": "fast", "input": {"seconds": 0.0}},
+    {"name": "second_unsafe", "input": {"seconds": 0.1}},
+    {"name": "medium", "input": {"seconds": 0.15}}
+]
+
+
+def test_results_keep_the_order_of_the_tool_calls():
+    llm, safe, unsafe = make_llm()
+    tool_calls = [dict(call, id=f"toolu_{index}") for index, call in enumerate(TOOL_CALLS)]
+    
+    started = time.monotonic()
+    tool_usage, blocks = llm._execute_tool_calls(tool_calls, lane=_SerialToolLane())
+    elapsed = time.monotonic() - started
+    
+    assert [block["tool_use_id"] for block in blocks] == [call["id"] for call in tool_calls]
+    assert [usage["output"] for usage in tool_usage] == [call["name"] for call in tool_calls]
+    assert all(block["type"] == "tool_result" and not block.get("is_error") for block in blocks)
+    # The thread-safe tools overlapped, the thread_safe=False ones never did
+    assert safe.max_running > 1
+    assert unsafe.max_running == 1
+    assert elapsed < 0.3 + 0.1 + 0.1 + 0.15
+
+
+def test_unsafe_tools_never_overlap_across_calls():
+    llm, _, unsafe = make_llm()
+    lane = _SerialToolLane()
+    tool_calls = [{"name": name, "input": {"seconds": 0.05}, "id": f"toolu_{name}_{index}"}
+                  for index in range(3) for name in ("first_unsafe", "second_unsafe")]
+    threads = [threading.Thread(target=llm._execute_tool_calls, args=(tool_calls[index::2],), kwargs={"lane": lane})
+               for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert unsafe.max_running == 1
+
+
+def test_tool_results_are_sent_in_one_user_message(fake_server):
+    fake = fake_server(tool_loop_responder([TOOL_CALLS]))
+    llm, _, _ = make_llm(fake.base_url)
+    
+    result = llm.generate_with_tools("Go")
+    
+    history = result["history"]
+    tool_use_ids = [block["id"] for block in history[1]["content"] if block["type"] == "tool_use"]
+    assert history[2]["role"] == "user"
+    assert [block["tool_use_id"] for block in history[2]["content"]] == tool_use_ids
+    assert [usage["tool"] for usage in result["tool_usage"]] == [call["name"] for call in TOOL_CALLS]
+    assert result["response"] == "Done."
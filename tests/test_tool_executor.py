@@ -0,0 +1,229 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+import pytest
+
+from benchmarks.fake_server import tool_loop_responder
+from src.async_llm import AsyncLLM
+from src.llm import LLM, TIMEOUT_WARNING
+from src.tool_executor import ToolExecutor, ToolTimeoutError
+
+
+# Module-level so that the process backend can pickle them
+def add(a: int, b: int) -> int:
+    return a + b
+
+
+def sleep(seconds: float) -> str:
+    time.sleep(seconds)
+    return "done"
+
+
+def fail(message: str) -> None:
+    raise KeyError(message)
+
+
+request_id = ContextVar("request_id", default=None)
+
+
+def where() -> tuple:
+    return threading.current_thread().name, request_id.get()
+
+
+def nap() -> tuple:
+    time.sleep(0.2)
+    return where()
+
+
+class RecordingExecutor(ThreadPoolExecutor):
+    """An event loop default executor that notes how long each of its jobs takes."""
+    
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.durations = []
+    
+    def submit(self, function, *args, **kwargs):
+        def timed():
+            started = time.monotonic()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.durations.append(time.monotonic() - started)
+        return super().submit(timed)
+
+
+@pytest.fixture
+def executor():
+    executor = ToolExecutor(max_threads=2, max_processes=1)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.parametrize("backend", ["inline", "thread", "process"])
+def test_backends_return_results_and_raise_errors(executor, backend):
+    assert executor.run(add, {"a": 1, "b": 2}, backend) == 3
+    with pytest.raises(KeyError, match="boom"):
+        executor.run(fail, {"message": "boom"}, backend)
+    stats = executor.stats()[backend]
+    assert stats["calls"] == 2 and stats["errors"] == 1
+
+
+def test_thread_timeout_abandons_the_call(executor):
+    started = time.monotonic()
+    with pytest.raises(ToolTimeoutError, match="timed out after 0.1s") as raised:
+        executor.run(sleep, {"seconds": 1.0}, "thread", timeout=0.1)
+    assert time.monotonic() - started < 0.5
+    assert not raised.value.deadline_exceeded
+    stats = executor.stats()["thread"]
+    assert stats["timeouts"] == 1 and stats["abandoned"] == 1
+
+
+def test_deadline_cancels_queued_calls():
+    executor = ToolExecutor(max_threads=1)
+    try:
+        busy = threading.Thread(target=executor.run, args=(sleep, {"seconds": 0.5}, "thread"))
+        busy.start()
+        time.sleep(0.05)
+        with pytest.raises(ToolTimeoutError, match="deadline passed") as raised:
+            executor.run(add, {"a": 1, "b": 2}, "thread", deadline=time.monotonic() + 0.1)
+        assert raised.value.deadline_exceeded
+        busy.join()
+        stats = executor.stats()["thread"]
+        # The queued call never started, so it was cancelled rather than abandoned
+        assert stats["cancelled"] == 1 and stats["abandoned"] == 0 and stats["queued"] == 0
+    finally:
+        executor.shutdown()
+
+
+def test_inline_calls_past_their_deadline_never_start(executor):
+    calls = []
+    with pytest.raises(ToolTimeoutError):
+        executor.run(calls.append, {"object": 1}, "inline", deadline=time.monotonic() - 1)
+    assert calls == []
+
+
+def test_exclusive_lock_is_held_until_an_abandoned_call_returns(executor):
+    lock = threading.Lock()
+    with pytest.raises(ToolTimeoutError):
+        executor.run(sleep, {"seconds": 0.3}, "thread", timeout=0.05, exclusive=lock)
+    assert lock.locked()
+    # The next call sharing the lock waits for the abandoned one
+    started = time.monotonic()
+    assert executor.run(add, {"a": 1, "b": 2}, "thread", timeout=2.0, exclusive=lock) == 3
+    assert time.monotonic() - started >= 0.15
+    assert not lock.locked()
+
+
+def test_process_timeout_kills_the_worker(executor):
+    assert executor.run(add, {"a": 1, "b": 2}, "process") == 3
+    started = time.monotonic()
+    with pytest.raises(ToolTimeoutError):
+        executor.run(sleep, {"seconds": 30}, "process", timeout=0.2)
+    assert time.monotonic() - started < 5
+    stats = executor.stats()["process"]
+    assert stats["killed"] == 1 and stats["processes"] == 0
+    # A new worker replaces the killed one
+    assert executor.run(add, {"a": 2, "b": 2}, "process") == 4
+
+
+def test_unknown_backend_and_shutdown(executor):
+    with pytest.raises(ValueError, match="Unknown tool backend"):
+        executor.run(add, {"a": 1, "b": 2}, "gpu")
+    executor.shutdown()
+    with pytest.raises(ValueError, match="shut down"):
+        executor.run(add, {"a": 1, "b": 2}, "thread")
+
+
+def test_arun_awaits_thread_calls_on_the_executors_threads(executor):
+    default_executor = RecordingExecutor()
+    
+    async def main():
+        asyncio.get_running_loop().set_default_executor(default_executor)
+        request_id.set("req-1")
+        assert await executor.arun(add, {"a": 1, "b": 2}, "thread") == 3
+        thread, seen = await executor.arun(where, {}, "thread")
+        assert thread.startswith("llm-tool-thread") and seen == "req-1"
+        with pytest.raises(KeyError, match="boom"):
+            await executor.arun(fail, {"message": "boom"}, "thread")
+        with pytest.raises(ToolTimeoutError, match="timed out after 0.1s"):
+            await executor.arun(sleep, {"seconds": 1.0}, "thread", timeout=0.1)
+    
+    asyncio.run(main())
+    assert default_executor.durations == []
+    stats = executor.stats()["thread"]
+    assert stats["calls"] == 4 and stats["errors"] == 1 and stats["timeouts"] == 1 and stats["abandoned"] == 1
+
+
+def test_arun_waits_for_the_exclusive_lock_without_blocking_the_loop(executor):
+    lock = threading.Lock()
+    
+    async def main():
+        with pytest.raises(ToolTimeoutError):
+            await executor.arun(sleep, {"seconds": 0.3}, "thread", timeout=0.05, exclusive=lock)
+        assert lock.locked()
+        ticks = []
+        
+        async def tick():
+            while lock.locked():
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+        
+        started = time.monotonic()
+        result, _ = await asyncio.gather(executor.arun(add, {"a": 1, "b": 2}, "thread", timeout=2.0, exclusive=lock),
+                                         tick())
+        assert result == 3 and time.monotonic() - started >= 0.15
+        assert len(ticks) > 5
+    
+    asyncio.run(main())
+    assert not lock.locked()
+
+
+def test_async_llm_runs_thread_tools_on_the_executor(fake_server):
+    fake = fake_server(tool_loop_responder([[{"name": "nap", "input": {}}, {"name": "nap", "input": {}}]]))
+    llm = AsyncLLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False,
+                   max_tool_workers=2)
+    llm.register_tool(name="nap", function=nap, description="Where the tool runs", backend="thread",
+                      input_schema={"type": "object", "properties": {}}, thread_safe=False)
+    
+    default_executor = RecordingExecutor()
+    
+    async def main():
+        asyncio.get_running_loop().set_default_executor(default_executor)
+        request_id.set("req-2")
+        return await llm.generate_with_tools("Where?")
+    
+    result = asyncio.run(main())
+    
+    assert result["response"] == "Done."
+    # The client may use the default executor, but no thread waits there for a tool call
+    assert all(duration < 0.1 for duration in default_executor.durations)
+    assert [usage["output"][0].startswith("llm-tool-thread") for usage in result["tool_usage"]] == [True, True]
+    assert [usage["output"][1] for usage in result["tool_usage"]] == ["req-2", "req-2"]
+
+
+def test_timed_out_tools_are_reported_to_the_model(fake_server):
+    fake = fake_server(tool_loop_responder([{"name": "sleep", "input": {"seconds": 1.0}}]))
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False)
+    llm.register_tool(name="sleep", function=sleep, description="Sleep", backend="thread", timeout=0.1)
+    
+    result = llm.generate_with_tools("Sleep")
+    
+    assert result["tool_usage"][0]["timed_out"]
+    assert result["tool_usage"][0]["error"] == "Tool sleep timed out after 0.1s"
+    assert result["response"] == "Done."
+
+
+def test_turn_timeout_cancels_pending_tools(fake_server):
+    fake = fake_server(tool_loop_responder([{"name": "sleep", "input": {"seconds": 1.0}}]))
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False)
+    llm.register_tool(name="sleep", function=sleep, description="Sleep", backend="thread")
+    
+    started = time.monotonic()
+    result = llm.generate_with_tools("Sleep", timeout=0.3)
+    
+    assert time.monotonic() - started < 0.9
+    assert result["warning"] == TIMEOUT_WARNING
+    assert "deadline passed" in result["tool_usage"][0]["error"]
@@ -0,0 +1,107 @@
+from benchmarks.fake_server import tool_loop_responder
+from src.llm import LLM
+from src.tool_index import ToolIndex, tokenize
+from src.tool_manifest import ToolManifest
+
+
+def schema(**properties):
+    return {"type": "object", "properties": {name: {"type": "string", "description": description}
+                                             for name, description in properties.items()}}
+
+
+TOOLS = {
+    "get_weather": ("Get the weather forecast for a city", schema(city="The city name")),
+    "convert_units": ("Convert a value between units of length, mass or temperature",
+                      schema(value="The value", from_unit="Unit to convert from", to_unit="Unit to convert to")),
+    "list_trainer_pokemon": ("List the Pokémon a trainer owns", schema(trainer="The trainer's name")),
+    "get_pokemon_stats": ("Base stats of a Pokémon species", schema(species="The species name")),
+    "book_appointment": ("Book a doctor appointment for a patient",
+                         schema(patient_id="The patient", date="Appointment date")),
+    "get_current_time": ("Get the current time", schema(timezone="IANA timezone")),
+    "send_email": ("Send an email message", schema(to="Recipient address", body="Message text")),
+}
+
+
+def manifest(tools=TOOLS):
+    return ToolManifest({name: {"description": description, "input_schema": input_schema}
+                         for name, (description, input_schema) in tools.items()})
+
+
+def names(definitions):
+    return [definition["name"] for definition in definitions]
+
+
+def test_tokenize_splits_identifiers_and_normalizes_words():
+    assert tokenize("list_trainer_pokemon") == ["list", "trainer", "pokemon"]
+    assert tokenize("Which Pokémons does this trainer have?") == ["pokemon", "doe", "trainer"]
+    assert tokenize("getCurrentTime") == ["current", "time"]
+
+
+def test_search_ranks_by_bm25():
+    index = ToolIndex()
+    tools = manifest()
+    ranked = index.search(tools, "weather forecast in Paris")
+    assert ranked[0][0] == "get_weather"
+    assert len(ranked) == 1
+    
+    # "pokemon" matches both Pokémon tools; the trainer names only one of them
+    ranked = index.search(tools, "which pokemon does trainer Ash have")
+    assert [name for name, _ in ranked] == ["list_trainer_pokemon", "get_pokemon_stats"]
+    assert ranked[0][1] > ranked[1][1] > 0
+    
+    # Matching the name counts more than matching a schema field
+    ranked = dict(index.search(tools, "time"))
+    assert ranked["get_current_time"] > ranked.get("book_appointment", 0)
+    assert index.search(tools, "zebra") == []
+
+
+def test_select_offers_top_k_pinned_and_used_tools_in_registration_order():
+    index = ToolIndex(top_k=2, pinned=["get_current_time"])
+    tools = manifest()
+    history = [{"role": "user", "content": "Email Bob"},
+               {"role": "assistant", "content": [{"type": "tool_use", "id": "toolu_1", "name": "send_email",
+                                                  "input": {"to": "bob", "body": "hi"}}]}]
+    
+    offered = index.select(tools, "which pokemon does trainer Ash have", history)
+    
+    assert names(offered) == ["list_trainer_pokemon", "get_pokemon_stats", "get_current_time", "send_email"]
+    assert names(index.select(tools, "zebra")) == list(TOOLS)
+    assert names(ToolIndex(top_k=10).select(tools, "zebra")) == list(TOOLS)
+    stats = index.stats()
+    assert stats["selections"] == 2 and stats["full_fallbacks"] == 1
+    assert stats["mean_offered"] == (4 + 7) / 2
+
+
+def test_expand_adds_called_tools_that_were_not_offered():
+    index = ToolIndex(top_k=1, expand_k=1)
+    tools = manifest()
+    offered = index.select(tools, "weather in Paris")
+    assert names(offered) == ["get_weather"]
+    
+    assert index.expand(tools, offered, [{"name": "get_weather", "input": {"city": "Paris"}}]) is offered
+    expanded = index.expand(tools, offered, [{"name": "send_email", "input": {"to": "bob"}},
+                                             {"name": "send_email", "input": {"to": "ann"}}])
+    assert names(expanded) == ["get_weather", "send_email"]
+    # An unknown tool brings in the best matches for its name and input
+    expanded = index.expand(tools, offered, [{"name": "fahrenheit_to_celsius", "input": {"temperature": 70}}])
+    assert names(expanded) == ["get_weather", "convert_units"]
+    assert index.stats()["expanded_omitted"] == 1 and index.stats()["expanded_unknown"] == 1
+
+
+def test_llm_runs_a_tool_that_was_not_offered_and_offers_it_afterwards(fake_server):
+    fake = fake_server(tool_loop_responder([{"name": "send_email", "input": {"to": "bob", "body": "hi"}},
+                                            {"name": "get_weather", "input": {"city": "Paris"}}]))
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False,
+              tool_index=ToolIndex(top_k=1))
+    sent = []
+    for name, (description, input_schema) in TOOLS.items():
+        llm.register_tool(name=name, function=lambda _name=name, **kwargs: sent.append(_name) or "ok",
+                          description=description, input_schema=input_schema)
+    
+    result = llm.generate_with_tools("What is the weather forecast?")
+    
+    assert result["response"] == "Done."
+    assert sent == ["send_email", "get_weather"]
+    assert [names(request["tools"]) for request in fake.requests] == [
+        ["get_weather"], ["get_weather", "send_email"], ["get_weather", "send_email"]
+    ]
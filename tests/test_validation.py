@@ -0,0 +1,70 @@
+import pytest
+
+from benchmarks.fake_server import tool_loop_responder
+from src.llm import LLM
+from src.validation import compile_schema
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string", "minLength": 1, "pattern": "^[A-Z]"},
+        "age": {"type": "integer", "minimum": 0, "maximum": 150},
+        "unit": {"enum": ["kg", "lb"]},
+        "tags": {"type": "array", "items": {"type": "string"}, "maxItems": 2},
+        "weight": {"anyOf": [{"type": "number"}, {"type": "null"}]}
+    },
+    "required": ["name", "age"]
+}
+
+
+@pytest.mark.parametrize("value, error", [
+    ({"name": "Ada", "age": 36}, None),
+    ({"name": "Ada", "age": 36.0, "unit": "kg", "tags": ["a"], "weight": None}, None),
+    ({"name": "Ada"}, "missing required property 'age'"),
+    ({"name": "Ada", "age": "36"}, "age: expected integer, got string"),
+    ({"name": "Ada", "age": True}, "age: expected integer, got boolean"),
+    ({"name": "Ada", "age": 200}, "age: expected a value <= 150, got 200"),
+    ({"name": "ada", "age": 36}, "name: 'ada' does not match '^[A-Z]'"),
+    ({"name": "", "age": 36}, "name: expected at least 1 characters"),
+    ({"name": "Ada", "age": 36, "unit": "g"}, "unit: 'g' is not one of 'kg', 'lb'"),
+    ({"name": "Ada", "age": 36, "tags": ["a", 1]}, "tags[]: expected string, got integer"),
+    ({"name": "Ada", "age": 36, "tags": ["a", "b", "c"]}, "tags: expected at most 2 items, got 3"),
+    ({"name": "Ada", "age": 36, "weight": "heavy"}, "weight: matches none of the allowed schemas"),
+    ([], "expected object, got array")
+])
+def test_compiled_schema_reports_the_first_problem(value, error):
+    assert compile_schema(SCHEMA)(value) == error
+
+
+def test_additional_properties():
+    schema = {"type": "object", "properties": {"a": {"type": "integer"}}}
+    assert compile_schema(schema)({"a": 1, "b": 2}) is None
+    assert compile_schema(schema, additional_properties=False)({"a": 1, "b": 2}) == \
+        "unexpected property 'b' (expected: a)"
+    nested = {"type": "object", "properties": {"a": {"type": "integer"}}, "additionalProperties": {"type": "string"}}
+    assert compile_schema(nested)({"a": 1, "b": 2}) == "expected string, got integer"
+
+
+def test_unknown_keywords_are_ignored():
+    assert compile_schema({"type": "string", "format": "email", "$ref": "#/x"})("not an email") is None
+
+
+def test_invalid_tool_input_is_returned_to_the_model(fake_server):
+    calls = []
+    
+    def add(a: int, b: int) -> int:
+        calls.append((a, b))
+        return a + b
+    
+    fake = fake_server(tool_loop_responder([{"name": "add", "input": {"a": 1, "b": "two"}},
+                                            {"name": "add", "input": {"a": 1, "c": 2}},
+                                            {"name": "add", "input": {"a": 1, "b": 2}}]))
+    llm = LLM(api_key="fake", client_options={"base_url": fake.base_url}, prompt_caching=False)
+    llm.register_tool(name="add", function=add, description="Add two numbers")
+    
+    tool_usage = llm.generate_with_tools("Add")["tool_usage"]
+    
+    assert calls == [(1, 2)]
+    assert tool_usage[0]["error"] == "Invalid input for tool add: b: expected integer, got string"
+    assert tool_usage[1]["error"] == "Invalid input for tool add: missing required property 'b'"
+    assert tool_usage[2]["output"] == 3